@@ -0,0 +1,19 @@
+import os
+import django
+
+__author__ = 'Manas'
+
+
+def collect_media_garbage():
+    # setup django environment
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "selp.settings")
+    from mytravelog.models.media_tombstone import MediaTombstone
+    django.setup()
+
+    # pictures that are no longer used are only recorded as tombstones when they are deleted
+    return MediaTombstone.objects.collect_garbage()
+
+if __name__ == "__main__":
+
+    print str(collect_media_garbage()) + " unused media files were deleted."
+    print "End of media garbage collection script."
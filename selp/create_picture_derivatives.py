@@ -0,0 +1,34 @@
+import os
+import django
+
+__author__ = 'Manas'
+
+
+def create_picture_derivatives():
+    # setup django environment
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "selp.settings")
+    from mytravelog.models.album import Album
+    from mytravelog.models.log_picture import LogPicture
+    from mytravelog.models.user_profile import UserProfile
+    from mytravelog.utils.derivatives import create_derivatives, get_picture_info_fields
+    django.setup()
+
+    # derivatives are created whenever pictures are uploaded, so this is only needed for pictures uploaded before
+    # derivatives existed, or after changing the derivative sizes or formats
+    picture_fields = [(LogPicture, 'picture'), (Album, 'cover_picture'), (UserProfile, 'profile_picture'),
+                      (UserProfile, 'cover_picture')]
+    created_count = 0
+    for model, field_name in picture_fields:
+        # default pictures are shared by all users and have absolute names, so they are served as they are
+        for instance in model.objects.exclude(**{field_name + '__startswith': '/'}).exclude(**{field_name: ''}):
+            picture_info = create_derivatives(getattr(instance, field_name))
+            if picture_info is not None:
+                # pages only use the derivatives of pictures whose width is stored
+                model.objects.filter(id=instance.id).update(**get_picture_info_fields(field_name, picture_info))
+                created_count += 1
+    return created_count
+
+if __name__ == "__main__":
+
+    print "Derivatives were created for " + str(create_picture_derivatives()) + " pictures."
+    print "End of picture derivatives script."
@@ -0,0 +1,63 @@
+from multiprocessing import Pool
+import os
+import sys
+import django
+
+__author__ = 'Manas'
+
+
+def read_picture_info(name):
+    # runs in the worker processes, which only write files, so that all database updates are made by the parent. The
+    # derivatives are created along with the picture info, since pages only use the derivatives of pictures whose
+    # width is stored
+    from mytravelog.models.log_picture import LogPicture
+    from mytravelog.utils.derivatives import create_derivatives
+
+    return name, create_derivatives(LogPicture(picture=name).picture)
+
+
+def create_picture_placeholders(process_count=None):
+    # setup django environment
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "selp.settings")
+    from django.db import connection
+    from mytravelog.models.album import Album
+    from mytravelog.models.log_picture import LogPicture
+    from mytravelog.models.user_profile import UserProfile
+    from mytravelog.utils.derivatives import get_picture_info_field_name, get_picture_info_fields
+    django.setup()
+
+    # placeholders are created along with the derivatives of uploaded pictures, so this is only needed for pictures
+    # uploaded before placeholders existed. Default pictures are shared by all users and have absolute names, so they
+    # have no placeholders. Profile pictures have no placeholder, but their width is stored all the same
+    picture_fields = [(LogPicture, 'picture'), (Album, 'cover_picture'), (UserProfile, 'profile_picture'),
+                      (UserProfile, 'cover_picture')]
+    names = set()
+    for model, field_name in picture_fields:
+        names.update(model.objects.filter(**{get_picture_info_field_name(field_name, 'width'): 0})
+                     .exclude(**{field_name + '__startswith': '/'}).exclude(**{field_name: ''})
+                     .values_list(field_name, flat=True))
+
+    # the database connection is not shared with the worker processes
+    connection.close()
+    pool = Pool(process_count)
+    created_count = 0
+    try:
+        # pictures are decoded in parallel, and the pictures sharing each file are updated as soon as it is decoded
+        for name, picture_info in pool.imap_unordered(read_picture_info, names, chunksize=8):
+            if picture_info is None:
+                continue
+            for model, field_name in picture_fields:
+                model.objects.filter(**{field_name: name, get_picture_info_field_name(field_name, 'width'): 0})\
+                    .update(**get_picture_info_fields(field_name, picture_info))
+            created_count += 1
+    finally:
+        pool.close()
+        pool.join()
+    return created_count
+
+if __name__ == "__main__":
+
+    # the number of processes can be provided as an argument, and defaults to the number of cpus
+    process_count = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    print "Placeholders were created for " + str(create_picture_placeholders(process_count)) + " pictures."
+    print "End of picture placeholders script."
@@ -0,0 +1,20 @@
+import os
+import django
+
+__author__ = 'Manas'
+
+
+def evict_heatmap_tiles():
+    # setup django environment
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "selp.settings")
+    from django.conf import settings
+    from mytravelog.utils.heatmap import evict_cached_tiles
+    django.setup()
+
+    # web workers only evict tiles every so often, so the cache is trimmed right away on top of that
+    return evict_cached_tiles(getattr(settings, 'HEATMAP_TILE_CACHE_SIZE', 100 * 1024 * 1024))
+
+if __name__ == "__main__":
+
+    print str(evict_heatmap_tiles()) + " cached heatmap tiles were deleted."
+    print "End of heatmap tile eviction script."
@@ -0,0 +1,64 @@
+from multiprocessing import Pool
+import os
+import sys
+import django
+
+__author__ = 'Manas'
+
+
+def read_picture_dhash(name):
+    # runs in the worker processes, which only read the pictures, so that all database updates are made by the parent
+    from mytravelog.utils.perceptual_hash import compute_picture_dhash
+    from mytravelog.utils.storage import picture_storage
+
+    return name, compute_picture_dhash(picture_storage, name)
+
+
+def create_picture_dhashes(process_count=None):
+    # setup django environment
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "selp.settings")
+    from django.db import connection
+    from mytravelog.models.log_picture import LogPicture, get_dhash_fields
+    django.setup()
+
+    # hashes are computed along with the derivatives of uploaded pictures, so this is only needed for pictures
+    # uploaded before hashes existed
+    names = set(LogPicture.objects.filter(dhash__isnull=True).exclude(picture='').values_list('picture', flat=True))
+
+    # the database connection is not shared with the worker processes
+    connection.close()
+    pool = Pool(process_count)
+    hashed_count = 0
+    try:
+        # pictures are hashed in parallel, and the pictures sharing each file are updated as soon as it is hashed
+        for name, dhash in pool.imap_unordered(read_picture_dhash, names, chunksize=8):
+            if dhash is None:
+                continue
+            LogPicture.objects.filter(picture=name, dhash__isnull=True).update(**get_dhash_fields(dhash))
+            hashed_count += 1
+    finally:
+        pool.close()
+        pool.join()
+    return hashed_count
+
+
+def find_duplicate_pictures():
+    # setup django environment
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "selp.settings")
+    from mytravelog.models.log_picture import LogPicture
+    django.setup()
+
+    return LogPicture.objects.get_duplicate_groups()
+
+if __name__ == "__main__":
+
+    # the number of processes can be provided as an argument, and defaults to the number of cpus
+    process_count = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    print "Hashes were created for " + str(create_picture_dhashes(process_count)) + " pictures."
+    duplicate_groups = find_duplicate_pictures()
+    for duplicate_group in duplicate_groups:
+        print "Near-duplicate pictures:"
+        for log_picture_id, log_id, name in duplicate_group:
+            print "    picture " + str(log_picture_id) + " of log " + str(log_id) + ": " + name
+    print str(len(duplicate_groups)) + " groups of near-duplicate pictures were found."
+    print "End of duplicate pictures script."
@@ -0,0 +1,56 @@
+import os
+import django
+
+__author__ = 'Manas'
+
+
+def move_pictures_to_blob_storage():
+    # setup django environment
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "selp.settings")
+    from mytravelog.models.album import Album
+    from mytravelog.models.log_picture import LogPicture
+    from mytravelog.models.user_profile import UserProfile
+    from mytravelog.utils.derivatives import create_derivatives, delete_derivatives, get_picture_info_fields
+    from mytravelog.utils.storage import BLOBS_DIR, picture_storage
+    django.setup()
+
+    # pictures uploaded before pictures were stored under the hash of their content are stored again, which
+    # also shares the files of identical pictures
+    picture_fields = [(LogPicture, 'picture'), (Album, 'cover_picture'), (UserProfile, 'profile_picture'),
+                      (UserProfile, 'cover_picture')]
+    moved_names = set()
+    moved_count = 0
+    for model, field_name in picture_fields:
+        # default pictures are shared by all users and have absolute names, so they are left where they are
+        instances = model.objects.exclude(**{field_name + '__startswith': BLOBS_DIR + '/'})\
+            .exclude(**{field_name + '__startswith': '/'}).exclude(**{field_name: ''})
+        for instance in instances:
+            picture = getattr(instance, field_name)
+            old_name = picture.name
+            try:
+                old_file = picture.storage.open(old_name, 'rb')
+            except (IOError, OSError):
+                continue
+            try:
+                new_name = picture.storage.save(old_name, old_file)
+            finally:
+                old_file.close()
+            # the row is updated directly, so that the post_save receivers don't delete the old file, which may be
+            # used by other pictures moved later on. Pages only use the derivatives of pictures whose width is stored
+            picture.name = new_name
+            picture_info = create_derivatives(picture)
+            moved_fields = get_picture_info_fields(field_name, picture_info) if picture_info is not None else {}
+            model.objects.filter(id=instance.id).update(**dict(moved_fields, **{field_name: new_name}))
+            moved_names.add(old_name)
+            moved_count += 1
+
+    # the old files aren't shared blobs, so they are deleted right away
+    for name in moved_names:
+        delete_derivatives(name)
+        picture_storage.delete(name)
+    return moved_count
+
+if __name__ == "__main__":
+
+    print str(move_pictures_to_blob_storage()) + " pictures were moved to the blob storage."
+    print "End of picture moving script."
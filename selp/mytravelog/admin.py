@@ -1,5 +1,6 @@
 from django.contrib import admin
-from mytravelog.models import city, user_profile, album, log, log_picture, like, comment, follower
+from mytravelog.models import city, user_profile, album, log, log_picture, like, comment, follower, city_visit, country, \
+    grid_cell_rollup, heatmap_tile, pending_upload, stored_blob, media_tombstone, chunked_upload, trip_import
 
 
 # Register your models here.
@@ -10,4 +11,12 @@ admin.site.register(log.Log)
 admin.site.register(log_picture.LogPicture)
 admin.site.register(like.Like)
 admin.site.register(comment.Comment)
-admin.site.register(follower.Follower)
\ No newline at end of file
+admin.site.register(follower.Follower)
+admin.site.register(city_visit.CityVisit)
+admin.site.register(country.Country)
+admin.site.register(grid_cell_rollup.GridCellRollup)
+admin.site.register(pending_upload.PendingUpload)
+admin.site.register(stored_blob.StoredBlob)
+admin.site.register(media_tombstone.MediaTombstone)
+admin.site.register(chunked_upload.ChunkedUpload)
+admin.site.register(trip_import.TripImport)
\ No newline at end of file
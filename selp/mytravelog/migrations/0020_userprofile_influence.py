@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytravelog', '0019_auto_20141205_1131'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='influence',
+            field=models.FloatField(default=0),
+            preserve_default=True,
+        ),
+    ]
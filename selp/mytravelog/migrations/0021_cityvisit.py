@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def populate_city_visits(apps, schema_editor):
+    # count the logs of every user in every city, and recompute travel stats from these counts
+    Log = apps.get_model('mytravelog', 'Log')
+    CityVisit = apps.get_model('mytravelog', 'CityVisit')
+    UserProfile = apps.get_model('mytravelog', 'UserProfile')
+    city_log_counts = Log.objects.values_list('user_profile_id', 'city_id').annotate(log_count=models.Count('id'))\
+        .order_by()
+    CityVisit.objects.bulk_create([CityVisit(user_profile_id=user_profile_id, city_id=city_id, log_count=log_count)
+                                   for user_profile_id, city_id, log_count in city_log_counts])
+    for user_profile in UserProfile.objects.all():
+        visits = CityVisit.objects.filter(user_profile=user_profile)
+        user_profile.city_count = visits.count()
+        user_profile.country_count = visits.values('city__country_name').distinct().count()
+        user_profile.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytravelog', '0020_userprofile_influence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CityVisit',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('log_count', models.IntegerField(default=0)),
+                ('city', models.ForeignKey(to='mytravelog.City')),
+                ('user_profile', models.ForeignKey(to='mytravelog.UserProfile')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='cityvisit',
+            unique_together=set([('user_profile', 'city')]),
+        ),
+        migrations.RunPython(populate_city_visits),
+    ]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def populate_countries(apps, schema_editor):
+    # create a country for every distinct country name of the existing cities, along with its rollups
+    City = apps.get_model('mytravelog', 'City')
+    Country = apps.get_model('mytravelog', 'Country')
+    Log = apps.get_model('mytravelog', 'Log')
+    CityVisit = apps.get_model('mytravelog', 'CityVisit')
+    country_rows = City.objects.values_list('country_name', 'country_url_name')\
+        .annotate(tourist_count=models.Sum('tourist_count')).order_by('-tourist_count', 'country_name')
+    rank = 1
+    for name, url_name, tourist_count in country_rows:
+        country = Country.objects.create(name=name,
+                                         url_name=url_name,
+                                         rank=rank,
+                                         tourist_count=tourist_count,
+                                         log_count=Log.objects.filter(city__country_name=name).count(),
+                                         visitor_count=CityVisit.objects.filter(city__country_name=name)
+                                         .values('user_profile').distinct().count())
+        City.objects.filter(country_name=name).update(country=country)
+        rank += 1
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytravelog', '0021_cityvisit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Country',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(unique=True, max_length=128)),
+                ('url_name', models.CharField(max_length=128)),
+                ('rank', models.IntegerField(default=-1)),
+                ('tourist_count', models.BigIntegerField(default=0)),
+                ('log_count', models.IntegerField(default=0)),
+                ('visitor_count', models.IntegerField(default=0)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AddField(
+            model_name='city',
+            name='country',
+            field=models.ForeignKey(blank=True, to='mytravelog.Country', null=True),
+            preserve_default=True,
+        ),
+        migrations.RunPython(populate_countries),
+    ]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+from mytravelog.utils.bitset import positions_to_bitset, bitset_to_bytes
+
+
+def populate_visited_bitsets(apps, schema_editor):
+    UserProfile = apps.get_model('mytravelog', 'UserProfile')
+    CityVisit = apps.get_model('mytravelog', 'CityVisit')
+    for user_profile in UserProfile.objects.all():
+        visited = CityVisit.objects.filter(user_profile=user_profile).values_list('city_id', 'city__country_id')
+        user_profile.visited_city_bitset = bitset_to_bytes(positions_to_bitset(
+            [city_id for city_id, country_id in visited]))
+        user_profile.visited_country_bitset = bitset_to_bytes(positions_to_bitset(
+            [country_id for city_id, country_id in visited if country_id is not None]))
+        user_profile.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytravelog', '0022_country'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='visited_city_bitset',
+            field=models.BinaryField(default=b''),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='visited_country_bitset',
+            field=models.BinaryField(default=b''),
+            preserve_default=True,
+        ),
+        migrations.RunPython(populate_visited_bitsets),
+    ]
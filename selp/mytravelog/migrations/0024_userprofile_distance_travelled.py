@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+from mytravelog.utils.geo import get_path_distances
+
+
+def populate_distance_travelled(apps, schema_editor):
+    UserProfile = apps.get_model('mytravelog', 'UserProfile')
+    Log = apps.get_model('mytravelog', 'Log')
+    path = list(Log.objects.order_by('user_profile_id', 'created_at', 'id')
+                .values_list('user_profile_id', 'latitude', 'longitude'))
+    ids, distances = get_path_distances([row[0] for row in path],
+                                        [float(row[1]) for row in path],
+                                        [float(row[2]) for row in path])
+    for user_profile_id, distance in zip(ids.tolist(), distances.tolist()):
+        UserProfile.objects.filter(id=user_profile_id).update(distance_travelled=round(distance, 3))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytravelog', '0023_userprofile_visited_bitsets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='distance_travelled',
+            field=models.FloatField(default=0),
+            preserve_default=True,
+        ),
+        migrations.RunPython(populate_distance_travelled),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+from mytravelog.utils.geo import get_grid_cell_id
+
+
+def populate_grid_cell_ids(apps, schema_editor):
+    # LOG_GRID_LEVEL at the time of this migration
+    grid_level = 10
+    Log = apps.get_model('mytravelog', 'Log')
+    for log_id, latitude, longitude in Log.objects.values_list('id', 'latitude', 'longitude'):
+        Log.objects.filter(id=log_id).update(grid_cell_id=get_grid_cell_id(latitude, longitude, grid_level))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytravelog', '0024_userprofile_distance_travelled'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='log',
+            name='grid_cell_id',
+            field=models.IntegerField(default=0, db_index=True),
+            preserve_default=True,
+        ),
+        migrations.RunPython(populate_grid_cell_ids),
+    ]
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+from mytravelog.utils.geo import get_grid_cell_id
+
+
+def populate_grid_cell_rollups(apps, schema_editor):
+    # MIN_CLUSTER_LEVEL and MAX_CLUSTER_LEVEL at the time of this migration
+    levels = range(2, 11)
+    Log = apps.get_model('mytravelog', 'Log')
+    GridCellRollup = apps.get_model('mytravelog', 'GridCellRollup')
+    rollups = {}
+    for log_id, latitude, longitude, score in Log.objects.values_list('id', 'latitude', 'longitude', 'score'):
+        for level in levels:
+            key = (level, get_grid_cell_id(latitude, longitude, level))
+            rollup = rollups.get(key)
+            if rollup is None:
+                rollup = rollups[key] = GridCellRollup(level=key[0], cell_id=key[1], log_count=0, latitude_sum=0,
+                                                       longitude_sum=0, top_log_id=log_id, top_log_score=score)
+            rollup.log_count += 1
+            rollup.latitude_sum += float(latitude)
+            rollup.longitude_sum += float(longitude)
+            if score > rollup.top_log_score:
+                rollup.top_log_id = log_id
+                rollup.top_log_score = score
+    GridCellRollup.objects.bulk_create(rollups.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytravelog', '0025_log_grid_cell_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GridCellRollup',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('level', models.IntegerField()),
+                ('cell_id', models.IntegerField()),
+                ('log_count', models.IntegerField(default=0)),
+                ('latitude_sum', models.FloatField(default=0)),
+                ('longitude_sum', models.FloatField(default=0)),
+                ('top_log_id', models.IntegerField()),
+                ('top_log_score', models.DecimalField(max_digits=100, decimal_places=7)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='gridcellrollup',
+            unique_together=set([('level', 'cell_id')]),
+        ),
+        migrations.RunPython(populate_grid_cell_rollups),
+    ]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.utils.encoding import smart_str
+
+from mytravelog.utils.city_parser.city_parser import read_city_coordinates, coordinates
+
+
+def populate_city_coordinates(apps, schema_editor):
+    City = apps.get_model('mytravelog', 'City')
+    city_coordinates = read_city_coordinates(coordinates)
+    for city in City.objects.all():
+        if smart_str(city.name) in city_coordinates:
+            city.latitude, city.longitude = city_coordinates[smart_str(city.name)]
+            city.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytravelog', '0026_gridcellrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='city',
+            name='latitude',
+            field=models.DecimalField(null=True, max_digits=7, decimal_places=4, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='city',
+            name='longitude',
+            field=models.DecimalField(null=True, max_digits=7, decimal_places=4, blank=True),
+            preserve_default=True,
+        ),
+        migrations.RunPython(populate_city_coordinates),
+    ]
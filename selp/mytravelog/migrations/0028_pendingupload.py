@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytravelog', '0027_city_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingUpload',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('file_name', models.CharField(max_length=255)),
+                ('spool_path', models.CharField(max_length=255)),
+                ('status', models.CharField(default=b'pending', max_length=16, choices=[(b'pending', b'Pending'), (b'processing', b'Processing'), (b'failed', b'Failed')])),
+                ('error', models.CharField(default=b'', max_length=255, blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('log', models.ForeignKey(to='mytravelog.Log')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
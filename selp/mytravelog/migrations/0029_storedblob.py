@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import mytravelog.utils.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytravelog', '0028_pendingupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(unique=True, max_length=255)),
+                ('reference_count', models.IntegerField(default=0)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterField(
+            model_name='album',
+            name='cover_picture',
+            field=models.ImageField(default=b'/media/mytravelog/cover_pictures/default_cover_picture.png', storage=mytravelog.utils.storage.ContentAddressedStorage(), upload_to=b'mytravelog/cover_pictures', blank=True),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='logpicture',
+            name='picture',
+            field=models.ImageField(storage=mytravelog.utils.storage.ContentAddressedStorage(), upload_to=b'mytravelog/log_pictures'),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='cover_picture',
+            field=models.ImageField(default=b'/media/mytravelog/cover_pictures/default_cover_picture.png', storage=mytravelog.utils.storage.ContentAddressedStorage(), upload_to=b'mytravelog/cover_pictures', blank=True),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='profile_picture',
+            field=models.ImageField(default=b'/media/mytravelog/profile_pictures/default_profile_picture.png', storage=mytravelog.utils.storage.ContentAddressedStorage(), upload_to=b'mytravelog/profile_pictures', blank=True),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytravelog', '0030_mediatombstone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='is_hidden',
+            field=models.BooleanField(default=False, db_index=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='is_hidden',
+            field=models.BooleanField(default=False, db_index=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='is_hidden',
+            field=models.BooleanField(default=False, db_index=True),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytravelog', '0032_picture_placeholders'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedUpload',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('file_name', models.CharField(max_length=255)),
+                ('spool_path', models.CharField(max_length=255)),
+                ('size', models.IntegerField()),
+                ('received_size', models.IntegerField(default=0)),
+                ('is_header_checked', models.BooleanField(default=False)),
+                ('status', models.CharField(default=b'uploading', max_length=16, choices=[(b'uploading', b'Uploading'), (b'finalized', b'Finalized'), (b'failed', b'Failed')])),
+                ('error', models.CharField(default=b'', max_length=255, blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user_profile', models.ForeignKey(to='mytravelog.UserProfile')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytravelog', '0033_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripImport',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('spool_dir', models.CharField(max_length=255)),
+                ('status', models.CharField(default=b'pending', max_length=16, choices=[(b'pending', b'Pending'), (b'reading', b'Reading'), (b'saving', b'Saving'), (b'done', b'Done'), (b'failed', b'Failed')])),
+                ('error', models.CharField(default=b'', max_length=255, blank=True)),
+                ('photo_count', models.IntegerField(default=0)),
+                ('read_count', models.IntegerField(default=0)),
+                ('saved_count', models.IntegerField(default=0)),
+                ('skipped_count', models.IntegerField(default=0)),
+                ('log_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('album', models.ForeignKey(on_delete=django.db.models.deletion.SET_NULL, blank=True, to='mytravelog.Album', null=True)),
+                ('user_profile', models.ForeignKey(to='mytravelog.UserProfile')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='is_archive',
+            field=models.BooleanField(default=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='trip_import',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.SET_NULL, blank=True, to='mytravelog.TripImport', null=True),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='log',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytravelog', '0034_trip_import'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logpicture',
+            name='dhash',
+            field=models.BigIntegerField(null=True, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='logpicture',
+            name='dhash_band_0',
+            field=models.IntegerField(db_index=True, null=True, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='logpicture',
+            name='dhash_band_1',
+            field=models.IntegerField(db_index=True, null=True, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='logpicture',
+            name='dhash_band_2',
+            field=models.IntegerField(db_index=True, null=True, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='logpicture',
+            name='dhash_band_3',
+            field=models.IntegerField(db_index=True, null=True, blank=True),
+            preserve_default=True,
+        ),
+    ]
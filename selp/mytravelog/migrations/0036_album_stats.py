@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def populate_album_stats(apps, schema_editor):
+    Album = apps.get_model('mytravelog', 'Album')
+    Log = apps.get_model('mytravelog', 'Log')
+    LogPicture = apps.get_model('mytravelog', 'LogPicture')
+    for album in Album.objects.all():
+        album_logs = Log.objects.filter(album=album, is_hidden=False)
+        Album.objects.filter(id=album.id).update(
+            duration=(album.end_date - album.start_date).days,
+            log_count=album_logs.count(),
+            picture_count=LogPicture.objects.filter(log__album=album, log__is_hidden=False).count(),
+            city_count=album_logs.order_by().values('city').distinct().count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytravelog', '0035_logpicture_dhash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='city_count',
+            field=models.IntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='duration',
+            field=models.IntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='log_count',
+            field=models.IntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='picture_count',
+            field=models.IntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.RunPython(populate_album_stats),
+    ]
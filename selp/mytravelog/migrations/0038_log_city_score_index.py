@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytravelog', '0037_log_user_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='log',
+            index_together=set([('city', 'score', 'id'), ('user_profile', 'created_at')]),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management import call_command
+from django.db import models, migrations
+
+
+def create_cache_table(apps, schema_editor):
+    # the table of the database cache (see CACHES in settings.py), existing tables are left untouched
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+def drop_cache_table(apps, schema_editor):
+    schema_editor.execute('DROP TABLE IF EXISTS mytravelog_cache')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytravelog', '0038_log_city_score_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, drop_cache_table),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytravelog', '0039_create_cache_table'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='log',
+            index_together=set([('user_profile', 'created_at'), ('city', 'score', 'id'), ('album', 'created_at')]),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytravelog', '0041_heatmap_tile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tripimport',
+            name='stored_names',
+            field=models.TextField(default=b'', blank=True),
+            preserve_default=True,
+        ),
+    ]
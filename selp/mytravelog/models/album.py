@@ -1,9 +1,9 @@
-import os
-
-from django.db import models
+from django.db import models, transaction
 from django.dispatch.dispatcher import receiver
 
 from mytravelog.models.user_profile import UserProfile
+from mytravelog.utils.derivatives import create_derivatives, get_picture_info_fields, MISSING_PICTURE_INFO
+from mytravelog.utils.storage import picture_storage, delete_picture
 
 
 __author__ = 'Manas'
@@ -11,12 +11,58 @@ __author__ = 'Manas'
 
 class AlbumManager(models.Manager):
 
+    def get_queryset(self):
+        # hidden albums are waiting to be purged, and are left out everywhere in the meantime
+        return super(AlbumManager, self).get_queryset().filter(is_hidden=False)
+
+    def hide_album(self, album):
+        """
+        Hides the album and all its logs right away, instead of deleting them during the request. They
+        are deleted later on by purge_hidden_objects, in bounded batches. The hidden album is renamed
+        after its id, so that the user can create an album with the same name before it is purged.
+        """
+        # imported inside method to prevent circular dependencies
+        from mytravelog.models.log import Log
+
+        with transaction.atomic():
+            self.filter(id=album.id).update(is_hidden=True, name=get_hidden_album_name(album))
+            Log.objects.hide_logs(Log.objects.filter(album_id=album.id))
+
     def get_user_albums_with_duration(self, user_profile):
-        user_albums = self.filter(user_profile=user_profile)
-        for album in user_albums:
-            duration = (album.end_date - album.start_date).days
-            album.duration = duration
-        return user_albums
+        # the duration is stored along with the dates of each album
+        return self.filter(user_profile=user_profile)
+
+    def update_stats(self, album_ids):
+        """
+        Recomputes the number of visible logs, pictures and distinct cities of the albums with the provided ids (None
+        ids, of logs without an album, are ignored), with two grouped queries for all of them. This is called whenever
+        logs are added to, moved out of or hidden from albums, and whenever their pictures change, so that album pages
+        and lists never have to count them.
+        """
+        # imported inside method to prevent circular dependencies
+        from mytravelog.models.log import Log
+        from mytravelog.models.log_picture import LogPicture
+
+        album_ids = list(set(album_id for album_id in album_ids if album_id is not None))
+        if len(album_ids) == 0:
+            return
+        log_stats = dict((row['album_id'], row) for row in Log.objects.filter(album_id__in=album_ids).order_by()
+                         .values('album_id').annotate(log_count=models.Count('id'),
+                                                      city_count=models.Count('city', distinct=True)))
+        picture_counts = dict(LogPicture.objects.filter(log__album_id__in=album_ids, log__is_hidden=False).order_by()
+                              .values('log__album_id').annotate(picture_count=models.Count('id'))
+                              .values_list('log__album_id', 'picture_count'))
+        for album_id in album_ids:
+            stats = log_stats.get(album_id, {})
+            self.model.all_objects.filter(id=album_id).update(log_count=stats.get('log_count', 0),
+                                                              city_count=stats.get('city_count', 0),
+                                                              picture_count=picture_counts.get(album_id, 0))
+
+
+def get_hidden_album_name(album):
+    # the suffix is kept whole within the maximum length of the name, so that hidden names never collide
+    suffix = ' (deleted ' + str(album.id) + ')'
+    return album.name[:Album._meta.get_field('name').max_length - len(suffix)] + suffix
 
 
 class Album(models.Model):
@@ -28,12 +74,26 @@ class Album(models.Model):
     url_name = models.CharField(max_length=128, null=False)
     start_date = models.DateField(max_length=128, null=False)
     end_date = models.DateField(max_length=128, null=False)
-    cover_picture = models.ImageField(upload_to='mytravelog/cover_pictures', blank=True, default='/media/mytravelog/cover_pictures/default_cover_picture.png')
+    cover_picture = models.ImageField(upload_to='mytravelog/cover_pictures', storage=picture_storage, blank=True, default='/media/mytravelog/cover_pictures/default_cover_picture.png')
+    # intrinsic size and placeholder of the cover picture (see get_picture_info), set once its derivatives are created
+    cover_picture_width = models.IntegerField(null=False, default=0)
+    cover_picture_height = models.IntegerField(null=False, default=0)
+    cover_picture_placeholder = models.TextField(null=False, blank=True, default='')
+    # stats of the album: its duration in days is set whenever it is saved, and the number of its logs, pictures and
+    # distinct cities are updated by update_stats
+    duration = models.IntegerField(null=False, default=0)
+    log_count = models.IntegerField(null=False, default=0)
+    picture_count = models.IntegerField(null=False, default=0)
+    city_count = models.IntegerField(null=False, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_At = models.DateTimeField(auto_now=True)
+    # set when the album is deleted, until it is purged in the background
+    is_hidden = models.BooleanField(null=False, default=False, db_index=True)
 
     # Managers
     objects = AlbumManager()
+    # includes hidden albums
+    all_objects = models.Manager()
 
     def __unicode__(self):
         return self.name + ": " + self.user_profile.user.get_full_name()
@@ -43,12 +103,36 @@ class Album(models.Model):
         ordering = ['-created_at']
 
 
-# auto delete non-default file when imagefield is deleted
-from django.db.models.signals import post_delete
+# auto delete non-default file when imagefield is deleted or changed (unless other pictures share it), create or
+# delete the resized derivatives of the picture, and keep the duration up to date
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
 from django.dispatch.dispatcher import receiver
 
+@receiver(pre_save, sender=Album)
+def update_duration(sender, instance, **kwargs):
+    # the dates may still be strings, as they are only converted to dates when they are saved
+    start_date = sender._meta.get_field('start_date').to_python(instance.start_date)
+    end_date = sender._meta.get_field('end_date').to_python(instance.end_date)
+    instance.duration = (end_date - start_date).days
+
+
 @receiver(post_delete, sender=Album)
 def auto_delete_file(sender, instance, **kwargs):
-    # Pass false so ImageField doesn't save the model.
-    if os.path.basename(instance.cover_picture.name) != 'default_cover_picture.png':
-        instance.cover_picture.delete(False)
\ No newline at end of file
+    delete_picture(instance.cover_picture)
+
+
+@receiver(post_init, sender=Album)
+def remember_loaded_cover_picture(sender, instance, **kwargs):
+    instance.loaded_cover_picture_name = instance.cover_picture.name
+
+
+@receiver(post_save, sender=Album)
+def update_cover_picture_derivatives(sender, instance, **kwargs):
+    if instance.cover_picture.name != instance.loaded_cover_picture_name:
+        delete_picture(instance.cover_picture, instance.loaded_cover_picture_name)
+        picture_info = create_derivatives(instance.cover_picture) or MISSING_PICTURE_INFO
+        picture_info_fields = get_picture_info_fields('cover_picture', picture_info)
+        Album.objects.filter(id=instance.id).update(**picture_info_fields)
+        for field_name, value in picture_info_fields.items():
+            setattr(instance, field_name, value)
+        instance.loaded_cover_picture_name = instance.cover_picture.name
@@ -0,0 +1,174 @@
+import os
+import uuid
+
+from django.conf import settings
+from django.db import models
+from django.db.models.fields.related import ForeignKey
+from django.utils import timezone
+
+from mytravelog.models.user_profile import UserProfile
+from mytravelog.utils.upload_limits import MAX_HEADER_SIZE, get_max_file_size, get_file_size_error, \
+    check_image_header, is_archive_name, get_max_archive_size, get_archive_size_error
+
+
+__author__ = 'Manas'
+
+UPLOADING = 'uploading'
+FINALIZED = 'finalized'
+FAILED = 'failed'
+STATUS_CHOICES = (
+    (UPLOADING, 'Uploading'),
+    (FINALIZED, 'Finalized'),
+    (FAILED, 'Failed')
+)
+
+
+class ChunkedUploadManager(models.Manager):
+
+    def start_upload(self, user_profile, file_name, size):
+        """
+        Creates an empty file of the upload in the spool directory, to which the chunks of the picture are written
+        as they are received. Zip archives of photos can be uploaded as well, to be imported as trips. They may be
+        larger than pictures, and have no image header to check.
+        :param user_profile: user profile uploading the picture
+        :param file_name: name of the picture being uploaded
+        :param size: total size of the picture in bytes
+        :return: tuple of (the new ChunkedUpload, None), or (None, error message) if the picture is too large
+        """
+        is_archive = is_archive_name(file_name)
+        if is_archive and size > get_max_archive_size():
+            return None, get_archive_size_error()
+        if not is_archive and size > get_max_file_size():
+            return None, get_file_size_error()
+        spool_dir = settings.UPLOAD_SPOOL_DIR
+        if not os.path.exists(spool_dir):
+            try:
+                os.makedirs(spool_dir)
+            except OSError:
+                # created by another worker in the meantime
+                pass
+        spool_path = os.path.join(spool_dir, uuid.uuid4().hex)
+        open(spool_path, 'wb').close()
+        chunked_upload = self.create(user_profile=user_profile, file_name=os.path.basename(file_name),
+                                     spool_path=spool_path, size=size, is_archive=is_archive,
+                                     is_header_checked=is_archive)
+        return chunked_upload, None
+
+    def receive_chunk(self, chunked_upload, offset, data):
+        """
+        Writes the chunk at the provided offset of the upload, which must be the number of bytes received so far,
+        so that chunks that were sent again (e.g. after a dropped connection) are never counted twice. The image
+        header is checked as soon as it is received, and the upload fails if it shows too many pixels.
+        :return: an error message if the chunk could not be written, else None. In both cases, the client resumes
+        the upload from the received_size of the upload.
+        """
+        if chunked_upload.status != UPLOADING:
+            return "This picture is not being uploaded anymore"
+        if offset != chunked_upload.received_size:
+            return "This part of the picture was not expected"
+        received_size = offset + len(data)
+        if received_size > chunked_upload.size:
+            return "This picture is larger than announced"
+
+        # the chunk is written before received_size is advanced, so that finalize_upload never sees a partly written
+        # file. A chunk sent again by a concurrent request holds the same bytes of the picture, so writing it twice
+        # is harmless, and only the first request advances received_size
+        try:
+            with open(chunked_upload.spool_path, 'r+b') as spool_file:
+                spool_file.seek(offset)
+                spool_file.write(data)
+        except (IOError, OSError):
+            return "Your picture " + chunked_upload.file_name + " could not be saved"
+        if self.filter(id=chunked_upload.id, status=UPLOADING, received_size=offset)\
+                .update(received_size=received_size, updated_at=timezone.now()) == 0:
+            return "This part of the picture was not expected"
+        chunked_upload.received_size = received_size
+
+        if not chunked_upload.is_header_checked:
+            with open(chunked_upload.spool_path, 'rb') as spool_file:
+                header = spool_file.read(min(received_size, MAX_HEADER_SIZE))
+            is_complete = received_size >= MAX_HEADER_SIZE or received_size == chunked_upload.size
+            error, chunked_upload.is_header_checked = check_image_header(header, is_complete)
+            if error is not None:
+                chunked_upload.status = FAILED
+                chunked_upload.error = error
+                chunked_upload.save(update_fields=['status', 'error'])
+                return error
+            if chunked_upload.is_header_checked:
+                chunked_upload.save(update_fields=['is_header_checked'])
+        return None
+
+    def finalize_upload(self, chunked_upload):
+        """
+        Marks the upload as complete once all of its chunks were received, so that it can be attached to a log.
+        :return: an error message if the upload can't be finalized, else None
+        """
+        if chunked_upload.status == FAILED:
+            return chunked_upload.error
+        if chunked_upload.received_size != chunked_upload.size:
+            return "Your picture " + chunked_upload.file_name + " was not completely uploaded"
+        self.filter(id=chunked_upload.id, status=UPLOADING).update(status=FINALIZED, updated_at=timezone.now())
+        chunked_upload.status = FINALIZED
+        return None
+
+    def get_finalized_uploads(self, user_profile, chunked_upload_ids, include_archives=False):
+        finalized_uploads = self.filter(user_profile=user_profile, status=FINALIZED, id__in=chunked_upload_ids)
+        if not include_archives:
+            finalized_uploads = finalized_uploads.filter(is_archive=False)
+        return list(finalized_uploads)
+
+    def delete_stale_uploads(self, max_age):
+        """
+        Deletes the uploads (and their files) that were last updated more than max_age ago but were never attached
+        to a log, e.g. because the user gave up on the upload.
+        :param max_age: timedelta
+        :return: number of deleted uploads
+        """
+        stale_uploads = self.filter(updated_at__lt=timezone.now() - max_age)
+        stale_upload_count = stale_uploads.count()
+        stale_uploads.delete()
+        return stale_upload_count
+
+
+class ChunkedUpload(models.Model):
+    """
+    A picture uploaded in chunks, which can be resumed from the last received chunk if the connection drops. Once
+    finalized, it is attached to a log by create_log or edit_log, which turn it into a PendingUpload without
+    copying its file.
+    """
+
+    # Relations
+    user_profile = ForeignKey(UserProfile)
+
+    # Attributes
+    # name of the uploaded file, and path of the file in the spool directory
+    file_name = models.CharField(max_length=255, null=False)
+    spool_path = models.CharField(max_length=255, null=False)
+    # total size of the file in bytes, and number of bytes received so far, which is the offset of the next chunk
+    size = models.IntegerField(null=False)
+    received_size = models.IntegerField(null=False, default=0)
+    is_header_checked = models.BooleanField(null=False, default=False)
+    # zip archive of photos to be imported as a trip, instead of a picture
+    is_archive = models.BooleanField(null=False, default=False)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, null=False, default=UPLOADING)
+    error = models.CharField(max_length=255, null=False, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Managers
+    objects = ChunkedUploadManager()
+
+    def __unicode__(self):
+        return self.file_name + " (" + str(self.received_size) + "/" + str(self.size) + ", " + self.status + ")"
+
+
+# delete the spooled file along with the upload, unless it was attached to a log
+from django.db.models.signals import post_delete
+from django.dispatch.dispatcher import receiver
+
+@receiver(post_delete, sender=ChunkedUpload)
+def delete_spooled_file(sender, instance, **kwargs):
+    try:
+        os.remove(instance.spool_path)
+    except OSError:
+        pass
@@ -1,8 +1,47 @@
 from re import sub
 from django.db import models
 
+from mytravelog.models.country import Country
+from mytravelog.utils.geo import to_unit_vector, get_chord_length
+from mytravelog.utils.kd_tree import KDTree
+
+# logs are only placed in a city if they are posted within this distance (in km) of the city's centre
+CITY_RADIUS = 100
+
+# k-d tree of the centres of all cities, built on first use and dropped whenever a city is saved or deleted
+_city_tree = None
+
+
+class CityManager(models.Manager):
+
+    def get_city_tree(self):
+        global _city_tree
+        if _city_tree is None:
+            cities = self.filter(latitude__isnull=False, longitude__isnull=False)\
+                .values_list('id', 'latitude', 'longitude')
+            _city_tree = KDTree([to_unit_vector(latitude, longitude) for city_id, latitude, longitude in cities],
+                                [city_id for city_id, latitude, longitude in cities])
+        return _city_tree
+
+    def get_nearest_city_id(self, latitude, longitude, max_distance=CITY_RADIUS):
+        """
+        Returns the id of the city whose centre is nearest to the provided coordinates, or None if
+        there is no city within max_distance kilometres.
+        """
+        city_id, squared_chord_length = self.get_city_tree().get_nearest(to_unit_vector(latitude, longitude))
+        if city_id is None or squared_chord_length > get_chord_length(max_distance) ** 2:
+            return None
+        return city_id
+
+    def get_nearest_city(self, latitude, longitude, max_distance=CITY_RADIUS):
+        city_id = self.get_nearest_city_id(latitude, longitude, max_distance)
+        if city_id is None:
+            return None
+        return self.filter(id=city_id).first()
+
 
 class City(models.Model):
+    country = models.ForeignKey(Country, null=True, blank=True)
     name = models.CharField(max_length=128, null=False, unique=True)
     url_name = models.CharField(max_length=128, null=False)
     country_name = models.CharField(max_length=128, null=False)
@@ -11,6 +50,12 @@ class City(models.Model):
     tourist_growth = models.DecimalField(max_digits=4, decimal_places=1, null=False)
     description = models.CharField(max_length=2500, null=False)
     rank = models.IntegerField(max_length=10, null=False, default=-1)
+    # centre of the city, used to find the city of a log from its coordinates
+    latitude = models.DecimalField(max_digits=7, decimal_places=4, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=7, decimal_places=4, null=True, blank=True)
+
+    # Managers
+    objects = CityManager()
 
     def __unicode__(self):
         return self.name
@@ -21,13 +66,17 @@ class City(models.Model):
         url_name = sub(r'\s', '_', name)
         country_name = kwargs.get('country_name')
         country_url_name = sub('\s', '_', country_name)
-        City.objects.create(name=name,
+        country = Country.objects.get_or_create_country(country_name)
+        City.objects.create(country=country,
+                            name=name,
                             url_name=url_name,
                             country_name=country_name,
                             country_url_name=country_url_name,
                             tourist_count=kwargs.get('tourist_count'),
                             tourist_growth=kwargs.get('tourist_growth'),
-                            description=kwargs.get('description'))
+                            description=kwargs.get('description'),
+                            latitude=kwargs.get('latitude'),
+                            longitude=kwargs.get('longitude'))
 
         # get all cities and update their ranks
         cities = City.objects.order_by('-tourist_count')
@@ -35,4 +84,19 @@ class City(models.Model):
         for city in cities:
             city.rank = rank
             city.save()
-            rank += 1
\ No newline at end of file
+            rank += 1
+
+        # add the city's tourists to its country and re-rank all countries
+        Country.objects.add_tourists(country.id, kwargs.get('tourist_count'))
+        Country.objects.update_country_ranks()
+
+
+# drop the k-d tree whenever cities change, so that it is built again on its next use
+from django.db.models.signals import post_save, post_delete
+from django.dispatch.dispatcher import receiver
+
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+def reset_city_tree(sender, **kwargs):
+    global _city_tree
+    _city_tree = None
@@ -0,0 +1,132 @@
+from django.db import models, transaction, IntegrityError
+from django.db.models.expressions import F
+
+from mytravelog.models.city import City
+from mytravelog.models.country import Country
+from mytravelog.models.user_profile import UserProfile
+from mytravelog.utils.bitset import positions_to_bitset, bitset_to_bytes
+
+
+__author__ = 'Manas'
+
+
+class CityVisitManager(models.Manager):
+
+    def add_visit(self, user_profile_id, city_id, log_count=1):
+        """
+        Records more logs posted by the user in the city. If these are the user's first logs in
+        the city (and possibly its country), then the user's travel stats are incremented. The
+        visitor count of the country is incremented as well, if the user is a new visitor.
+        :param user_profile_id: id of the user profile who posted the logs
+        :param city_id: id of the city where the logs were posted
+        :param log_count: number of added logs
+        """
+        with transaction.atomic():
+            updated = self.filter(user_profile_id=user_profile_id, city_id=city_id)\
+                .update(log_count=F('log_count') + log_count)
+            if updated == 0:
+                try:
+                    # the savepoint keeps the outer transaction usable if the row was created in the meantime
+                    with transaction.atomic():
+                        self.create(user_profile_id=user_profile_id, city_id=city_id, log_count=log_count)
+                except IntegrityError:
+                    # another request added the first visit at the same time, and has updated the travel stats
+                    self.filter(user_profile_id=user_profile_id, city_id=city_id)\
+                        .update(log_count=F('log_count') + log_count)
+                    return
+                country_id = City.objects.filter(id=city_id).values_list('country_id', flat=True).first()
+                is_new_country = not self.is_country_visited(user_profile_id, city_id, country_id)
+                UserProfile.objects.filter(id=user_profile_id).update(
+                    city_count=F('city_count') + 1,
+                    country_count=F('country_count') + (1 if is_new_country else 0))
+                if is_new_country:
+                    Country.objects.add_visitor(country_id)
+                self.update_user_bitsets(user_profile_id)
+
+    def remove_visit(self, user_profile_id, city_id, log_count=1):
+        """
+        Removes logs posted by the user in the city. If they were the user's last logs in the
+        city (and possibly its country), then the user's travel stats are decremented, and so
+        is the visitor count of the country.
+        :param user_profile_id: id of the user profile who posted the logs
+        :param city_id: id of the city where the logs were posted
+        :param log_count: number of removed logs
+        """
+        with transaction.atomic():
+            updated = self.filter(user_profile_id=user_profile_id, city_id=city_id, log_count__gt=log_count)\
+                .update(log_count=F('log_count') - log_count)
+            if updated == 0:
+                visits = self.filter(user_profile_id=user_profile_id, city_id=city_id)
+                if visits.exists():
+                    visits.delete()
+                    country_id = City.objects.filter(id=city_id).values_list('country_id', flat=True).first()
+                    is_last_in_country = not self.is_country_visited(user_profile_id, city_id, country_id)
+                    UserProfile.objects.filter(id=user_profile_id).update(
+                        city_count=F('city_count') - 1,
+                        country_count=F('country_count') - (1 if is_last_in_country else 0))
+                    if is_last_in_country:
+                        Country.objects.remove_visitor(country_id)
+                    self.update_user_bitsets(user_profile_id)
+
+    def is_country_visited(self, user_profile_id, city_id, country_id):
+        """
+        Checks if the user has logs in any other city of the provided country, which is the country of the city.
+        """
+        if country_id is None:
+            return False
+        return self.filter(user_profile_id=user_profile_id, city__country_id=country_id)\
+            .exclude(city_id=city_id).exists()
+
+    def rebuild_user_visits(self, user_profile):
+        """
+        Recreates all visits of the provided user from their logs. Only needed to repair the
+        table, since visits are otherwise kept up to date whenever logs are created or deleted.
+        """
+        # imported inside method to prevent circular dependencies
+        from mytravelog.models.log import Log
+
+        city_log_counts = Log.objects.filter(user_profile=user_profile).values_list('city_id')\
+            .annotate(log_count=models.Count('id')).order_by()
+        with transaction.atomic():
+            self.filter(user_profile=user_profile).delete()
+            self.bulk_create([CityVisit(user_profile=user_profile, city_id=city_id, log_count=log_count)
+                              for city_id, log_count in city_log_counts])
+            self.update_user_bitsets(user_profile.id)
+
+    def update_user_bitsets(self, user_profile_id):
+        """
+        Recomputes the visited city and country bitsets of the user from their visits. This only
+        happens when a city is visited for the first time or not visited anymore, and a user can
+        visit at most as many cities as there are in the database.
+        """
+        visited = self.filter(user_profile_id=user_profile_id).values_list('city_id', 'city__country_id')
+        city_bitset = positions_to_bitset([city_id for city_id, country_id in visited])
+        country_bitset = positions_to_bitset([country_id for city_id, country_id in visited if country_id is not None])
+        UserProfile.objects.filter(id=user_profile_id).update(visited_city_bitset=bitset_to_bytes(city_bitset),
+                                                              visited_country_bitset=bitset_to_bytes(country_bitset))
+
+    def get_visited_cities(self, user_profile):
+        return City.objects.filter(cityvisit__user_profile=user_profile).order_by('name')
+
+    def get_common_cities(self, user_profile_1, user_profile_2):
+        common_city_ids = self.filter(user_profile=user_profile_2).values('city_id')
+        return self.get_visited_cities(user_profile_1).filter(id__in=common_city_ids)
+
+
+class CityVisit(models.Model):
+
+    # Relations
+    user_profile = models.ForeignKey(UserProfile)
+    city = models.ForeignKey(City)
+
+    # Attributes
+    log_count = models.IntegerField(null=False, default=0)
+
+    # Managers
+    objects = CityVisitManager()
+
+    def __unicode__(self):
+        return self.user_profile.user.username + ": " + self.city.name
+
+    class Meta():
+        unique_together = ('user_profile', 'city')
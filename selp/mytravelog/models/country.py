@@ -0,0 +1,56 @@
+from re import sub
+from django.db import models
+from django.db.models.expressions import F
+
+
+__author__ = 'Manas'
+
+
+class CountryManager(models.Manager):
+
+    def get_or_create_country(self, name):
+        country, created = self.get_or_create(name=name, defaults={'url_name': sub(r'\s', '_', name)})
+        return country
+
+    def add_log(self, city_id, log_count=1):
+        self.filter(city__id=city_id).update(log_count=F('log_count') + log_count)
+
+    def remove_log(self, city_id, log_count=1):
+        self.filter(city__id=city_id).update(log_count=F('log_count') - log_count)
+
+    def add_visitor(self, country_id):
+        self.filter(id=country_id).update(visitor_count=F('visitor_count') + 1)
+
+    def remove_visitor(self, country_id):
+        self.filter(id=country_id).update(visitor_count=F('visitor_count') - 1)
+
+    def add_tourists(self, country_id, tourist_count):
+        self.filter(id=country_id).update(tourist_count=F('tourist_count') + tourist_count)
+
+    def update_country_ranks(self):
+        # rank countries by their total tourist count, just like cities
+        rank = 1
+        for country in self.order_by('-tourist_count', 'name'):
+            if country.rank != rank:
+                country.rank = rank
+                country.save(update_fields=['rank'])
+            rank += 1
+
+
+class Country(models.Model):
+
+    # Attributes
+    name = models.CharField(max_length=128, null=False, unique=True)
+    url_name = models.CharField(max_length=128, null=False)
+    rank = models.IntegerField(null=False, default=-1)
+
+    # Rollups, kept up to date whenever cities are added and logs are created or deleted
+    tourist_count = models.BigIntegerField(null=False, default=0)
+    log_count = models.IntegerField(null=False, default=0)
+    visitor_count = models.IntegerField(null=False, default=0)
+
+    # Managers
+    objects = CountryManager()
+
+    def __unicode__(self):
+        return self.name
@@ -45,6 +45,13 @@ class FollowerManager(models.Manager):
     def get_follower_count(self, user_profile):
         return self.filter(following_user_profile=user_profile).count()
 
+    def get_following_count(self, user_profile):
+        return self.filter(follower_user_profile=user_profile).count()
+
+    def get_follower_edges(self):
+        # (follower, following) user profile id pairs, streamed so that large graphs are never fully hydrated
+        return self.values_list('follower_user_profile_id', 'following_user_profile_id').iterator()
+
     def get_follower(self, follower_user_profile, following_user_profile):
         try:
             follower = self.get(follower_user_profile=follower_user_profile,
@@ -0,0 +1,168 @@
+from django.db import models, transaction
+from django.db.models.expressions import F
+from django.db.models.query_utils import Q
+
+from mytravelog.models.heatmap_tile import HeatmapTile
+from mytravelog.utils.geo import get_grid_cell_id, get_grid_cell_ranges, get_child_cell_ranges
+
+
+__author__ = 'Manas'
+
+# map markers are clustered by the grid cells at these levels, level l splits the world into 2^l by 2^l cells
+MIN_CLUSTER_LEVEL = 2
+MAX_CLUSTER_LEVEL = 10
+
+
+class GridCellRollupManager(models.Manager):
+
+    def add_log(self, log_id, latitude, longitude, score):
+        """
+        Adds the log to the rollups of the grid cells containing it at every cluster level.
+        The log becomes the top log of a cell if its score is higher than the cell's top log.
+        """
+        self.add_logs([(log_id, latitude, longitude, score)])
+
+    def add_logs(self, logs):
+        """
+        Adds the logs to the rollups of the grid cells containing them, just like add_log, but with a single
+        update of each cell for all the logs it contains.
+        :param logs: list of (log id, latitude, longitude, score) tuples
+        """
+        # log count, latitude sum, longitude sum and (score, id) of the top log added to each (level, cell id)
+        added = {}
+        for log_id, latitude, longitude, score in logs:
+            latitude = float(latitude)
+            longitude = float(longitude)
+            for level in range(MIN_CLUSTER_LEVEL, MAX_CLUSTER_LEVEL + 1):
+                key = (level, get_grid_cell_id(latitude, longitude, level))
+                log_count, latitude_sum, longitude_sum, top_log = added.get(key, (0, 0.0, 0.0, None))
+                if top_log is None or score > top_log[0]:
+                    top_log = (score, log_id)
+                added[key] = (log_count + 1, latitude_sum + latitude, longitude_sum + longitude, top_log)
+
+        with transaction.atomic():
+            for (level, cell_id), (log_count, latitude_sum, longitude_sum, top_log) in added.items():
+                top_log_score, top_log_id = top_log
+                cells = self.filter(level=level, cell_id=cell_id)
+                updated = cells.update(log_count=F('log_count') + log_count,
+                                       latitude_sum=F('latitude_sum') + latitude_sum,
+                                       longitude_sum=F('longitude_sum') + longitude_sum)
+                if updated == 0:
+                    self.create(level=level, cell_id=cell_id, log_count=log_count, latitude_sum=latitude_sum,
+                                longitude_sum=longitude_sum, top_log_id=top_log_id, top_log_score=top_log_score)
+                else:
+                    cells.filter(top_log_score__lt=top_log_score).update(top_log_id=top_log_id,
+                                                                          top_log_score=top_log_score)
+            HeatmapTile.objects.mark_changed([(latitude, longitude) for _, latitude, longitude, _ in logs])
+
+    def update_log_score(self, log_id, latitude, longitude, score):
+        """
+        Makes the log the top log of the grid cells containing it, wherever its new score is higher than
+        the top log's score. If the score of a log decreases, it stays the top log of its cells until the
+        rollups are rebuilt.
+        """
+        with transaction.atomic():
+            for level in range(MIN_CLUSTER_LEVEL, MAX_CLUSTER_LEVEL + 1):
+                cells = self.filter(level=level, cell_id=get_grid_cell_id(latitude, longitude, level))
+                cells.filter(top_log_id=log_id).update(top_log_score=score)
+                cells.filter(top_log_score__lt=score).update(top_log_id=log_id, top_log_score=score)
+
+    def remove_log(self, log_id, latitude, longitude):
+        """
+        Removes the log from the rollups of the grid cells containing it at every cluster level. Cells
+        without any logs left are deleted, and cells whose top log was removed look up their new top log.
+        """
+        # imported inside method to prevent circular dependencies
+        from mytravelog.models.log import Log, LOG_GRID_LEVEL
+
+        latitude = float(latitude)
+        longitude = float(longitude)
+        with transaction.atomic():
+            for level in range(MIN_CLUSTER_LEVEL, MAX_CLUSTER_LEVEL + 1):
+                cell_id = get_grid_cell_id(latitude, longitude, level)
+                cells = self.filter(level=level, cell_id=cell_id)
+                cells.update(log_count=F('log_count') - 1,
+                             latitude_sum=F('latitude_sum') - latitude,
+                             longitude_sum=F('longitude_sum') - longitude)
+                cells.filter(log_count__lte=0).delete()
+                if cells.filter(top_log_id=log_id).exists():
+                    # logs are indexed by their cell at LOG_GRID_LEVEL, which nests inside the cells of all
+                    # cluster levels
+                    child_cell_query = Q()
+                    for first_cell_id, last_cell_id in get_child_cell_ranges(cell_id, level, LOG_GRID_LEVEL):
+                        child_cell_query |= Q(grid_cell_id__range=(first_cell_id, last_cell_id))
+                    top_log = Log.objects.filter(child_cell_query).exclude(id=log_id)\
+                        .order_by('-score', '-id').values_list('id', 'score').first()
+                    if top_log is not None:
+                        cells.update(top_log_id=top_log[0], top_log_score=top_log[1])
+            HeatmapTile.objects.mark_changed([(latitude, longitude)])
+
+    def rebuild_rollups(self):
+        """
+        Recreates the rollups of all grid cells from all logs. Rollups are otherwise kept up to date whenever
+        logs are created, moved, scored or deleted, but the top logs of cells have to be picked again once
+        log scores have decreased.
+        """
+        # imported inside method to prevent circular dependencies
+        from mytravelog.models.log import Log
+
+        rollups = {}
+        for log_id, latitude, longitude, score in Log.objects.values_list('id', 'latitude', 'longitude', 'score'):
+            latitude = float(latitude)
+            longitude = float(longitude)
+            for level in range(MIN_CLUSTER_LEVEL, MAX_CLUSTER_LEVEL + 1):
+                key = (level, get_grid_cell_id(latitude, longitude, level))
+                rollup = rollups.get(key)
+                if rollup is None:
+                    rollups[key] = GridCellRollup(level=key[0], cell_id=key[1], log_count=1, latitude_sum=latitude,
+                                                  longitude_sum=longitude, top_log_id=log_id, top_log_score=score)
+                else:
+                    rollup.log_count += 1
+                    rollup.latitude_sum += latitude
+                    rollup.longitude_sum += longitude
+                    if score > rollup.top_log_score:
+                        rollup.top_log_id = log_id
+                        rollup.top_log_score = score
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(rollups.values(), batch_size=500)
+
+    def get_clusters_in_bbox(self, min_latitude, min_longitude, max_latitude, max_longitude, level):
+        """
+        Returns the rollups of all grid cells at the provided level that overlap the bounding box,
+        which crosses the antimeridian if min_longitude is greater than max_longitude.
+        """
+        # imported inside method to prevent circular dependencies
+        from mytravelog.models.log import MAX_GRID_CELL_RANGES
+
+        cell_query = Q()
+        for first_cell_id, last_cell_id in get_grid_cell_ranges(min_latitude, min_longitude, max_latitude,
+                                                                max_longitude, level, MAX_GRID_CELL_RANGES):
+            cell_query |= Q(cell_id__range=(first_cell_id, last_cell_id))
+        return self.filter(cell_query, level=level)
+
+
+class GridCellRollup(models.Model):
+
+    # Attributes
+    level = models.IntegerField(null=False)
+    cell_id = models.IntegerField(null=False)
+    log_count = models.IntegerField(null=False, default=0)
+    # sums of log coordinates, used to compute the centroid of the logs in the cell
+    latitude_sum = models.FloatField(null=False, default=0)
+    longitude_sum = models.FloatField(null=False, default=0)
+    # not a foreign key, so that rollups are not deleted along with their top log
+    top_log_id = models.IntegerField(null=False)
+    top_log_score = models.DecimalField(max_digits=100, decimal_places=7, null=False)
+
+    # Managers
+    objects = GridCellRollupManager()
+
+    def __unicode__(self):
+        return str(self.level) + ": " + str(self.cell_id)
+
+    class Meta():
+        unique_together = ('level', 'cell_id')
+
+    def get_centroid(self):
+        return self.latitude_sum / self.log_count, self.longitude_sum / self.log_count
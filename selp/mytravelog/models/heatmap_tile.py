@@ -0,0 +1,62 @@
+import time
+from django.db import models, transaction, IntegrityError
+
+from mytravelog.utils.heatmap import get_tiles_drawing_point
+
+
+__author__ = 'Manas'
+
+# tiles are marked as changed this many seconds ahead, so that a tile rendered before the transaction adding or
+# removing logs is committed is rendered again as well
+TILE_CHANGE_MARGIN = 5
+
+
+class HeatmapTileManager(models.Manager):
+
+    def mark_changed(self, points):
+        """
+        Records that logs were added or removed at the points, so that only the cached heatmap tiles they are
+        drawn on (see get_tiles_drawing_point) are rendered again on their next request.
+        :param points: list of (latitude, longitude) tuples of the added or removed logs
+        """
+        tiles = set()
+        for latitude, longitude in points:
+            tiles.update(get_tiles_drawing_point(latitude, longitude))
+        changed_at = time.time() + TILE_CHANGE_MARGIN
+        with transaction.atomic():
+            for zoom, x, y in tiles:
+                updated = self.filter(zoom=zoom, x=x, y=y).update(changed_at=changed_at)
+                if updated == 0:
+                    try:
+                        # the savepoint keeps the outer transaction usable if the row was created in the meantime
+                        with transaction.atomic():
+                            self.create(zoom=zoom, x=x, y=y, changed_at=changed_at)
+                    except IntegrityError:
+                        self.filter(zoom=zoom, x=x, y=y).update(changed_at=changed_at)
+
+    def has_changed_since(self, zoom, x, y, rendered_at):
+        """
+        Checks if logs drawn on the tile were added or removed since its logs were read to render it.
+        :param rendered_at: time (in seconds since the epoch) at which the logs of the cached tile were read
+        """
+        return self.filter(zoom=zoom, x=x, y=y, changed_at__gte=rendered_at).exists()
+
+
+class HeatmapTile(models.Model):
+    """
+    A heatmap tile whose logs have changed. Tiles are only rendered again if they have changed since they were
+    rendered, and the rows of tiles rendered since they last changed are deleted along with evicted tiles.
+    """
+
+    # Attributes
+    zoom = models.IntegerField(null=False)
+    x = models.IntegerField(null=False)
+    y = models.IntegerField(null=False)
+    # seconds since the epoch, to be compared with the modification times of cached tiles
+    changed_at = models.FloatField(null=False, db_index=True)
+
+    # Managers
+    objects = HeatmapTileManager()
+
+    class Meta():
+        unique_together = ('zoom', 'x', 'y')
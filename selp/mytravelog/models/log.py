@@ -1,27 +1,143 @@
+import calendar
+from collections import Counter, defaultdict
 import datetime
-from django.db import models
+from decimal import Decimal
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Count, F
 from django.db.models.fields.related import ForeignKey
 import math
 from django.db.models.query_utils import Q
+from django.utils import timezone
+import numpy as np
 
 from mytravelog.models.album import Album
 from mytravelog.models.city import City
+from mytravelog.models.country import Country
+from mytravelog.models.trip_import import TripImport
 from mytravelog.models.user_profile import UserProfile
+from mytravelog.utils.geo import haversine_distance, get_grid_cell_id, get_grid_cell_ranges, get_bounding_box, \
+    haversine_distances
 
 
 __author__ = 'Manas'
 
+# logs are indexed by the grid cell containing them at this level, i.e. cells of 360/2^10 by 180/2^10 degrees
+LOG_GRID_LEVEL = 10
+# bounding boxes spanning more rows of grid cells than this are only narrowed down to their rows
+MAX_GRID_CELL_RANGES = 50
+# logs are looked up in chunks of this many ids, to stay below the query parameter limit of sqlite
+MAX_QUERY_IDS = 500
+# number of top logs of each city whose ids are cached, i.e. the logs of the first page of the city page and the
+# first log of the next page
+CITY_TOP_LOG_COUNT = 11
+
 
 class LogManager(models.Manager):
 
-    def get_user_logs(self, requested_user_profile):
-        return self.filter(user_profile=requested_user_profile)
+    def get_queryset(self):
+        # hidden logs are waiting to be purged, and are left out everywhere in the meantime
+        return super(LogManager, self).get_queryset().filter(is_hidden=False)
+
+    def hide_log(self, log):
+        """
+        Hides the log right away (see hide_logs), instead of deleting it along with its pictures, likes
+        and comments during the request. The log and everything that belongs to it are deleted later on
+        by purge_hidden_objects.
+        """
+        self.hide_logs(self.filter(id=log.id))
+        Album.objects.update_stats([log.album_id])
+
+    def hide_logs(self, logs):
+        """
+        Hides the visible logs of the queryset, and removes them right away from the visited cities and
+        countries, travel stats and distance travelled of their authors, the log counts of their countries
+        and the grid cell rollups, just like the post_delete receivers of Log do for a deleted log. The
+        updates are set-based, so only deleting the rows and files is left to purge_hidden_objects.
+        """
+        # imported inside method to prevent circular dependencies
+        from mytravelog.models.city_visit import CityVisit
+        from mytravelog.models.grid_cell_rollup import GridCellRollup
+
+        rows = list(logs.order_by().values_list('id', 'user_profile_id', 'city_id', 'latitude', 'longitude'))
+        if len(rows) == 0:
+            return
+        with transaction.atomic():
+            for index in range(0, len(rows), MAX_QUERY_IDS):
+                self.filter(id__in=[row[0] for row in rows[index:index + MAX_QUERY_IDS]]).update(is_hidden=True)
+            # the logs are hidden first, so that new top logs of the grid cells and distances leave them out
+            visit_log_counts = Counter((user_profile_id, city_id) for _, user_profile_id, city_id, _, _ in rows)
+            for (user_profile_id, city_id), log_count in visit_log_counts.items():
+                CityVisit.objects.remove_visit(user_profile_id, city_id, log_count)
+            for city_id, log_count in Counter(city_id for _, _, city_id, _, _ in rows).items():
+                Country.objects.remove_log(city_id, log_count)
+            for log_id, _, _, latitude, longitude in rows:
+                GridCellRollup.objects.remove_log(log_id, latitude, longitude)
+            user_profile_ids = list(set(user_profile_id for _, user_profile_id, _, _, _ in rows))
+            UserProfile.objects.update_distance_travelled(user_profile_ids)
 
-    def get_city_logs(self, requested_city):
-        return self.filter(city=requested_city)
+        for user_profile_id in user_profile_ids:
+            self.invalidate_user_map_info(user_profile_id)
+        self.invalidate_city_top_logs(list(set(city_id for _, _, city_id, _, _ in rows)))
 
-    def get_album_logs(self, requested_album):
-        return self.filter(album=requested_album)
+    def get_user_logs(self, requested_user_profile, before_log=None):
+        """
+        Returns the logs of the user, newest first. Pages are read with a keyset on (created_at, id), i.e. the logs
+        posted before before_log, which is served by the (user_profile, created_at) index however deep into the
+        timeline the page is.
+        :return: queryset of Logs, to be sliced to the size of a page
+        """
+        user_logs = self.filter(user_profile=requested_user_profile)
+        if before_log is not None:
+            user_logs = user_logs.filter(Q(created_at__lt=before_log.created_at) |
+                                         Q(created_at=before_log.created_at, id__lt=before_log.id))
+        return user_logs.order_by('-created_at', '-id')
+
+    def get_city_logs(self, requested_city, before=None):
+        """
+        Returns the logs posted in the city, highest score first. Pages are read with a keyset on (score, id), i.e.
+        the logs ranked after before, which is served by the (city, score, id) index however deep into the city
+        logs the page is.
+        :param before: tuple of (score, id) of the last log of the previous page, or None for the first page
+        :return: queryset of Logs, to be sliced to the size of a page
+        """
+        city_logs = self.filter(city=requested_city)
+        if before is not None:
+            score, log_id = before
+            city_logs = city_logs.filter(Q(score__lt=score) | Q(score=score, id__lt=log_id))
+        return city_logs.order_by('-score', '-id')
+
+    def get_city_top_logs(self, city_id):
+        """
+        Returns the CITY_TOP_LOG_COUNT logs of the city with the highest scores. Their ids are cached until a log
+        of the city is created, moved, scored, hidden or deleted (or for at most CITY_TOP_LOGS_CACHE_TIMEOUT seconds),
+        so that the city logs are not ranked again every time the city page is shown.
+        :return: list of Logs, highest score first
+        """
+        cache_key = get_city_top_logs_cache_key(city_id)
+        top_log_ids = cache.get(cache_key)
+        if top_log_ids is None:
+            top_log_ids = list(self.get_city_logs(city_id).values_list('id', flat=True)[:CITY_TOP_LOG_COUNT])
+            cache.set(cache_key, top_log_ids, getattr(settings, 'CITY_TOP_LOGS_CACHE_TIMEOUT', 60 * 60))
+        top_logs = self.select_related('city', 'user_profile__user').in_bulk(top_log_ids)
+        # skip logs hidden or deleted in the meantime
+        return [top_logs[log_id] for log_id in top_log_ids if log_id in top_logs]
+
+    def get_album_logs(self, requested_album, before_log=None):
+        """
+        Returns the logs of the album, newest first. Pages are read with a keyset on (created_at, id), i.e. the logs
+        posted before before_log, which is served by the (album, created_at) index however deep into the album the
+        page is.
+        :return: queryset of Logs, to be sliced to the size of a page
+        """
+        album_logs = self.filter(album=requested_album)
+        if before_log is not None:
+            album_logs = album_logs.filter(Q(created_at__lt=before_log.created_at) |
+                                           Q(created_at=before_log.created_at, id__lt=before_log.id))
+        return album_logs.order_by('-created_at', '-id')
 
     def get_log_by_id(self, log_id):
         try:
@@ -33,41 +149,222 @@ class LogManager(models.Manager):
     def get_users_logs(self, user_profiles):
         return self.filter(user_profile__in=user_profiles)
 
+    def get_previous_user_log(self, log):
+        # logs posted by the same user at the same time are ordered by id
+        return self.filter(Q(user_profile_id=log.user_profile_id) &
+                           (Q(created_at__lt=log.created_at) | Q(created_at=log.created_at, id__lt=log.id)))\
+            .order_by('-created_at', '-id').first()
+
+    def get_next_user_log(self, log):
+        return self.filter(Q(user_profile_id=log.user_profile_id) &
+                           (Q(created_at__gt=log.created_at) | Q(created_at=log.created_at, id__gt=log.id)))\
+            .order_by('created_at', 'id').first()
+
+    def get_logs_in_bbox(self, min_latitude, min_longitude, max_latitude, max_longitude):
+        """
+        Returns all logs inside the bounding box, which crosses the antimeridian if min_longitude
+        is greater than max_longitude. The indexed grid cell ids are used to narrow down the logs
+        first, and then the logs are filtered by their exact coordinates.
+        """
+        cell_query = Q()
+        for first_cell_id, last_cell_id in get_grid_cell_ranges(min_latitude, min_longitude, max_latitude,
+                                                                max_longitude, LOG_GRID_LEVEL, MAX_GRID_CELL_RANGES):
+            cell_query |= Q(grid_cell_id__range=(first_cell_id, last_cell_id))
+
+        if float(min_longitude) <= float(max_longitude):
+            longitude_query = Q(longitude__gte=min_longitude, longitude__lte=max_longitude)
+        else:
+            longitude_query = Q(longitude__gte=min_longitude) | Q(longitude__lte=max_longitude)
+        return self.filter(cell_query).filter(longitude_query,
+                                              latitude__gte=min_latitude, latitude__lte=max_latitude)
+
+    def get_logs_near(self, latitude, longitude, radius, offset=0, limit=None):
+        """
+        Returns the logs within radius kilometres of the point, ordered by their distance to it. The logs are
+        narrowed down to the bounding box of the circle using the indexed grid cell ids first, and then the exact
+        distances of all remaining logs are computed at once. Only the requested page of logs is fetched in full,
+        and each of them has its distance (in kilometres) attached.
+        :param offset: number of nearer logs to skip
+        :param limit: maximum number of logs to return, or None to return all of them
+        :return: tuple of (list of logs, total number of logs within the radius)
+        """
+        rows = self.get_logs_in_bbox(*get_bounding_box(latitude, longitude, radius))\
+            .values_list('id', 'latitude', 'longitude')
+        if len(rows) == 0:
+            return [], 0
+        log_ids, latitudes, longitudes = zip(*rows)
+        log_ids = np.asarray(log_ids, dtype=np.int64)
+        distances = haversine_distances(latitude, longitude, latitudes, longitudes)
+        within_radius = distances <= float(radius)
+        log_ids = log_ids[within_radius]
+        distances = distances[within_radius]
+
+        # logs at the same distance are ordered by id, so that pages don't overlap
+        order = np.lexsort((log_ids, distances))
+        order = order[offset:] if limit is None else order[offset:offset + limit]
+        page_logs = self.select_related('city', 'user_profile__user').in_bulk(log_ids[order].tolist())
+        logs = []
+        for log_id, distance in zip(log_ids[order].tolist(), distances[order].tolist()):
+            # skip logs deleted in the meantime
+            if log_id in page_logs:
+                log = page_logs[log_id]
+                log.distance = distance
+                logs.append(log)
+        return logs, len(log_ids)
+
+    def get_user_map_info(self, user_profile_id):
+        """
+        Returns the info of all logs posted by the user that is needed to mark them on the world map,
+        along with an ETag computed from it. The info is serialized as parallel arrays, where city_indices
+        point into the cities table, and is cached until one of the user's logs is created, edited or deleted.
+        :param user_profile_id: id of the user profile whose logs are requested
+        :return: dict with 'content' (JSON string) and 'etag' keys
+        """
+        cache_key = get_user_map_info_cache_key(user_profile_id)
+        map_info = cache.get(cache_key)
+        if map_info is None:
+            ids, latitudes, longitudes, timestamps, city_indices, cities = [], [], [], [], [], []
+            city_positions = {}
+            rows = self.filter(user_profile_id=user_profile_id).order_by('created_at', 'id')\
+                .values_list('id', 'latitude', 'longitude', 'created_at', 'city__name')
+            for log_id, latitude, longitude, created_at, city_name in rows:
+                if city_name not in city_positions:
+                    city_positions[city_name] = len(cities)
+                    cities.append(city_name)
+                ids.append(log_id)
+                latitudes.append(float(latitude))
+                longitudes.append(float(longitude))
+                timestamps.append(calendar.timegm(created_at.utctimetuple()))
+                city_indices.append(city_positions[city_name])
+            content = json.dumps({
+                'user_logs_info': {
+                    'ids': ids,
+                    'latitudes': latitudes,
+                    'longitudes': longitudes,
+                    'timestamps': timestamps,
+                    'city_indices': city_indices,
+                    'cities': cities
+                }
+            }, separators=(',', ':'))
+            map_info = {
+                'content': content,
+                'etag': '"' + hashlib.md5(content).hexdigest() + '"'
+            }
+            cache.set(cache_key, map_info, getattr(settings, 'USER_MAP_INFO_CACHE_TIMEOUT', 24 * 60 * 60))
+        return map_info
+
+    def update_scores(self):
+        """
+        Scores all logs again. The likes and comments of all logs are counted in two grouped queries, and only the
+        scores that changed are written, with queryset updates that skip the save receivers of logs, so the grid cell
+        rollups have to be rebuilt afterwards (see update_log_scores.py).
+        :return: number of logs whose score changed
+        """
+        # imported inside method to prevent circular dependencies
+        from mytravelog.models.like import Like
+        from mytravelog.models.comment import Comment
+
+        # only consider likes and comments made by other users, and not the user who created the log
+        interaction_counts = defaultdict(int)
+        for interactions in (Like.objects.exclude(liker_user_profile=F('log__user_profile')),
+                             Comment.objects.exclude(commenter_user_profile=F('log__user_profile'))):
+            for log_id, count in interactions.values_list('log').annotate(count=Count('id')).order_by():
+                interaction_counts[log_id] += count
+
+        changed_count = 0
+        changed_city_ids = set()
+        with transaction.atomic():
+            for log_id, created_at, score, city_id in self.values_list('id', 'created_at', 'score', 'city_id'):
+                new_score = Decimal(repr(compute_log_score(created_at, interaction_counts[log_id])))
+                if new_score != score:
+                    self.filter(id=log_id).update(score=new_score)
+                    changed_count += 1
+                    changed_city_ids.add(city_id)
+        self.invalidate_city_top_logs(changed_city_ids)
+        return changed_count
+
+    @staticmethod
+    def invalidate_user_map_info(user_profile_id):
+        cache.delete(get_user_map_info_cache_key(user_profile_id))
+
+    @staticmethod
+    def invalidate_city_top_logs(city_ids):
+        cache.delete_many([get_city_top_logs_cache_key(city_id) for city_id in city_ids])
+
     @staticmethod
     def attach_additional_info_to_logs(requested_user_logs, current_user_profile):
         # imported inside method to prevent circular dependencies
         from mytravelog.models.log_picture import LogPicture
         from mytravelog.models.like import Like
         from mytravelog.models.comment import Comment
+        from mytravelog.models.pending_upload import PendingUpload
+
+        # fetch the pictures, likes and comments of all logs at once, instead of querying them log by log
+        log_ids = [log.id for log in requested_user_logs]
+        pending_upload_counts = {}
+        for start in range(0, len(log_ids), MAX_QUERY_IDS):
+            pending_upload_counts.update(PendingUpload.objects.get_pending_upload_counts(
+                log_ids[start:start + MAX_QUERY_IDS]))
+        log_pictures = group_by_log_id(log_ids, LogPicture.objects.order_by('id'))
+        likes = group_by_log_id(log_ids, Like.objects.select_related('liker_user_profile__user'))
+        comments = group_by_log_id(log_ids, Comment.objects.select_related('commenter_user_profile__user'))
+        current_user_profile_id = current_user_profile.id if current_user_profile is not None else None
 
         for log in requested_user_logs:
             # attach pictures
-            log_pictures = LogPicture.objects.filter(log=log)
-            log.pictures = log_pictures
+            log.pictures = log_pictures.get(log.id, [])
+            # attach the number of pictures that are still being processed, which are shown as placeholders
+            log.pending_upload_count = pending_upload_counts.get(log.id, 0)
             # attach likes and check if current user liked a log or not
-            likes = Like.objects.filter(log=log)
-            log.likes = likes
+            log.likes = likes.get(log.id, [])
             log.liked = False
-            for like in likes:
-                if current_user_profile is not None:
-                    if like.liker_user_profile == current_user_profile:
-                        log.liked = True
+            for like in log.likes:
+                if current_user_profile_id is not None and like.liker_user_profile_id == current_user_profile_id:
+                    log.liked = True
             # attach comments and check if current user can delete it or not
-            comments = Comment.objects.filter(log=log)
-            log.comments = comments
-            for comment in comments:
-                comment.can_delete = False
-                if current_user_profile is not None:
-                    if comment.commenter_user_profile == current_user_profile:
-                        comment.can_delete = True
+            log.comments = comments.get(log.id, [])
+            for comment in log.comments:
+                comment.can_delete = current_user_profile_id is not None and \
+                    comment.commenter_user_profile_id == current_user_profile_id
             # attach edit permission
-            if log.user_profile == current_user_profile:
-                log.can_edit = True
-            else:
-                log.can_edit = False
+            log.can_edit = log.user_profile_id == current_user_profile_id
         return requested_user_logs
 
 
+def get_user_map_info_cache_key(user_profile_id):
+    return 'mytravelog_log_map_info_' + str(user_profile_id)
+
+
+def get_city_top_logs_cache_key(city_id):
+    return 'mytravelog_city_top_logs_' + str(city_id)
+
+
+def compute_log_score(created_at, interaction_count):
+    """
+    Returns the score of a log created at the provided time, with interaction_count likes and comments by
+    other users: log_score = log10(z) + (creation_time_since_epoch/45000), where z = interaction_count
+    (z=1 if interaction_count == 0)
+    """
+    log_created_at = created_at.replace(tzinfo=None)  # remove time zone awareness
+    creation_time_since_epoch = (log_created_at - datetime.datetime(1970, 1, 1)).total_seconds() / 45000
+    z = interaction_count
+    if z == 0:
+        z = 1
+    return round(math.log(z, 10) + creation_time_since_epoch, 7)
+
+
+def group_by_log_id(log_ids, queryset):
+    """
+    Returns the objects of the queryset that belong to the provided logs, as a dict of lists keyed by log id.
+    The objects keep the order of the queryset within each list.
+    """
+    grouped = {}
+    for start in range(0, len(log_ids), MAX_QUERY_IDS):
+        for obj in queryset.filter(log_id__in=log_ids[start:start + MAX_QUERY_IDS]):
+            grouped.setdefault(obj.log_id, []).append(obj)
+    return grouped
+
+
 class Log(models.Model):
 
     # Relations
@@ -79,18 +376,30 @@ class Log(models.Model):
     latitude = models.DecimalField(max_digits=7, decimal_places=4, null=False)
     longitude = models.DecimalField(max_digits=7, decimal_places=4, null=False)
     description = models.CharField(max_length=1000, null=False)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # the time the log is created, or the time its first photo was taken if it was imported from photos
+    created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     score = models.DecimalField(max_digits=100, decimal_places=7, null=False)
+    # id of the grid cell (at LOG_GRID_LEVEL) containing the log, set whenever the log is saved
+    grid_cell_id = models.IntegerField(null=False, default=0, db_index=True)
+    # set when the log is deleted, until it is purged in the background
+    is_hidden = models.BooleanField(null=False, default=False, db_index=True)
+    # trip import that created the log, if any
+    trip_import = ForeignKey(TripImport, null=True, blank=True, on_delete=models.SET_NULL)
 
     # Managers
     objects = LogManager()
+    # includes hidden logs
+    all_objects = models.Manager()
 
     def __unicode__(self):
         return self.city.name + ": " + self.user_profile.user.get_full_name()
 
     class Meta():
         ordering = ['-created_at']
+        # serve the pages of user timelines (see get_user_logs), city pages (see get_city_logs) and albums (see
+        # get_album_logs)
+        index_together = [('user_profile', 'created_at'), ('city', 'score', 'id'), ('album', 'created_at')]
 
     # score function: log_score = log10(z) + (creation_time_since_epoch/45000)
     # where z = num_likes + num_comments (z=1 if (num_likes + num_comments) == 0)
@@ -102,10 +411,155 @@ class Log(models.Model):
         # only consider likes and comments made my other users, and not the user who created the log
         num_comments = Comment.objects.filter(Q(log=self) & ~Q(commenter_user_profile=self.user_profile)).count()
         num_likes = Like.objects.filter(Q(log=self) & ~Q(liker_user_profile=self.user_profile)).count()
-        log_created_at = self.created_at.replace(tzinfo=None)  # remove time zone awareness
-        creation_time_since_epoch = (log_created_at - datetime.datetime(1970, 1, 1)).total_seconds() / 45000
-        z = (num_likes + num_comments)
-        if z == 0:
-            z = 1
-        score = round(math.log(z, 10) + creation_time_since_epoch, 7)
-        return score
\ No newline at end of file
+        return compute_log_score(self.created_at, num_likes + num_comments)
+
+# keep the grid cell ids and rollups of logs, the visited cities, distance travelled and cached map
+# info of log authors, and the country rollups, album stats and cached top logs of cities up to date
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
+from django.dispatch.dispatcher import receiver
+
+@receiver(post_init, sender=Log)
+def remember_loaded_city(sender, instance, **kwargs):
+    # used to detect city, location and score changes on save without querying the previous row
+    instance.loaded_city_id = instance.city_id
+    instance.loaded_album_id = instance.album_id
+    instance.loaded_location = (instance.latitude, instance.longitude)
+    instance.loaded_score = instance.score
+
+
+@receiver(post_save, sender=Log)
+def update_album_stats_on_save(sender, instance, created, **kwargs):
+    # connected before update_city_visits_on_save, which updates the loaded city
+    if created:
+        Album.objects.update_stats([instance.album_id])
+    elif instance.loaded_album_id != instance.album_id or instance.loaded_city_id != instance.city_id:
+        Album.objects.update_stats([instance.loaded_album_id, instance.album_id])
+    instance.loaded_album_id = instance.album_id
+
+
+@receiver(post_delete, sender=Log)
+def update_album_stats_on_delete(sender, instance, **kwargs):
+    Album.objects.update_stats([instance.album_id])
+
+
+@receiver(post_save, sender=Log)
+def invalidate_city_top_logs_on_save(sender, instance, created, **kwargs):
+    # connected before update_city_visits_on_save, which updates the loaded city
+    if created:
+        Log.objects.invalidate_city_top_logs([instance.city_id])
+    elif instance.loaded_city_id != instance.city_id:
+        Log.objects.invalidate_city_top_logs([instance.loaded_city_id, instance.city_id])
+    elif instance.loaded_score != instance.score:
+        Log.objects.invalidate_city_top_logs([instance.city_id])
+
+
+@receiver(post_delete, sender=Log)
+def invalidate_city_top_logs_on_delete(sender, instance, **kwargs):
+    Log.objects.invalidate_city_top_logs([instance.city_id])
+
+
+@receiver(post_save, sender=Log)
+def update_city_visits_on_save(sender, instance, created, **kwargs):
+    # imported inside method to prevent circular dependencies
+    from mytravelog.models.city_visit import CityVisit
+
+    if created:
+        CityVisit.objects.add_visit(instance.user_profile_id, instance.city_id)
+        Country.objects.add_log(instance.city_id)
+    elif instance.loaded_city_id != instance.city_id:
+        CityVisit.objects.remove_visit(instance.user_profile_id, instance.loaded_city_id)
+        Country.objects.remove_log(instance.loaded_city_id)
+        CityVisit.objects.add_visit(instance.user_profile_id, instance.city_id)
+        Country.objects.add_log(instance.city_id)
+    instance.loaded_city_id = instance.city_id
+
+
+@receiver(post_delete, sender=Log)
+def update_city_visits_on_delete(sender, instance, **kwargs):
+    # hidden logs were removed from the stats when they were hidden (see hide_logs)
+    if instance.is_hidden:
+        return
+    # imported inside method to prevent circular dependencies
+    from mytravelog.models.city_visit import CityVisit
+
+    CityVisit.objects.remove_visit(instance.user_profile_id, instance.city_id)
+    Country.objects.remove_log(instance.city_id)
+
+
+@receiver(post_save, sender=Log)
+def update_distance_travelled_on_save(sender, instance, created, **kwargs):
+    if created:
+        if Log.objects.get_next_user_log(instance) is not None:
+            # not the latest log of the user, which only happens if created_at was set manually
+            UserProfile.objects.update_distance_travelled([instance.user_profile_id])
+        else:
+            # extend the user's path with the segment from their previous latest log
+            previous_log = Log.objects.get_previous_user_log(instance)
+            if previous_log is not None:
+                UserProfile.objects.add_distance_travelled(instance.user_profile_id, haversine_distance(
+                    previous_log.latitude, previous_log.longitude, instance.latitude, instance.longitude))
+    elif instance.loaded_location != (instance.latitude, instance.longitude):
+        UserProfile.objects.update_distance_travelled([instance.user_profile_id])
+
+
+@receiver(post_delete, sender=Log)
+def update_distance_travelled_on_delete(sender, instance, **kwargs):
+    # hidden logs were removed from the stats when they were hidden (see hide_logs)
+    if instance.is_hidden:
+        return
+    if Log.objects.get_next_user_log(instance) is not None:
+        # a past log was deleted, so the path has to be recomputed
+        UserProfile.objects.update_distance_travelled([instance.user_profile_id])
+    else:
+        # the latest log was deleted, so only its segment is removed from the path
+        previous_log = Log.objects.get_previous_user_log(instance)
+        if previous_log is not None:
+            UserProfile.objects.add_distance_travelled(instance.user_profile_id, -haversine_distance(
+                previous_log.latitude, previous_log.longitude, instance.latitude, instance.longitude))
+
+
+@receiver(post_save, sender=Log)
+def invalidate_map_info_on_save(sender, instance, **kwargs):
+    Log.objects.invalidate_user_map_info(instance.user_profile_id)
+
+
+@receiver(post_delete, sender=Log)
+def invalidate_map_info_on_delete(sender, instance, **kwargs):
+    Log.objects.invalidate_user_map_info(instance.user_profile_id)
+
+
+@receiver(pre_save, sender=Log)
+def update_grid_cell_id(sender, instance, **kwargs):
+    instance.grid_cell_id = get_grid_cell_id(instance.latitude, instance.longitude, LOG_GRID_LEVEL)
+
+
+@receiver(post_save, sender=Log)
+def update_grid_cell_rollups_on_save(sender, instance, created, **kwargs):
+    # imported inside method to prevent circular dependencies
+    from mytravelog.models.grid_cell_rollup import GridCellRollup
+
+    if created:
+        GridCellRollup.objects.add_log(instance.id, instance.latitude, instance.longitude, instance.score)
+    elif instance.loaded_location != (instance.latitude, instance.longitude):
+        GridCellRollup.objects.remove_log(instance.id, instance.loaded_location[0], instance.loaded_location[1])
+        GridCellRollup.objects.add_log(instance.id, instance.latitude, instance.longitude, instance.score)
+    elif instance.loaded_score != instance.score:
+        GridCellRollup.objects.update_log_score(instance.id, instance.latitude, instance.longitude, instance.score)
+
+
+@receiver(post_delete, sender=Log)
+def update_grid_cell_rollups_on_delete(sender, instance, **kwargs):
+    # hidden logs were removed from the stats when they were hidden (see hide_logs)
+    if instance.is_hidden:
+        return
+    # imported inside method to prevent circular dependencies
+    from mytravelog.models.grid_cell_rollup import GridCellRollup
+
+    GridCellRollup.objects.remove_log(instance.id, instance.latitude, instance.longitude)
+
+
+@receiver(post_save, sender=Log)
+def remember_saved_location_and_score(sender, instance, **kwargs):
+    # connected after all other receivers, so that they can compare the saved location and score with the loaded ones
+    instance.loaded_location = (instance.latitude, instance.longitude)
+    instance.loaded_score = instance.score
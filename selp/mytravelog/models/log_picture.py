@@ -1,23 +1,186 @@
 from django.db import models
+from django.db.models import Q
 from django.db.models.fields.related import ForeignKey
+from mytravelog.models.album import Album
 from mytravelog.models.log import Log
+from mytravelog.utils.derivatives import create_derivatives, MISSING_PICTURE_INFO
+from mytravelog.utils.perceptual_hash import compute_picture_dhash, get_hash_bands, get_hamming_distance, \
+    to_signed, HASH_BANDS, HASH_MASK, MAX_DUPLICATE_DISTANCE
+from mytravelog.utils.purge import raw_delete
+from mytravelog.utils.storage import picture_storage, delete_picture, delete_pictures
 
 __author__ = 'Manas'
 
+# the distinct hashes sharing a band are compared pairwise, so bands shared by more hashes than this (e.g. the all
+# clear or all set bands of flat, dark or overexposed pictures) are left out of the dedup report
+MAX_BAND_BUCKET_HASHES = 1000
+
+
+class LogPictureManager(models.Manager):
+
+    def delete_log_pictures(self, log, log_picture_ids):
+        """
+        Deletes the pictures of the log with the provided ids with a single query, ignoring the ids of pictures of
+        other logs. The pictures are released all at once (see delete_pictures), so that the number of queries
+        doesn't depend on the number of deleted pictures.
+        :return: number of deleted pictures
+        """
+        log_pictures = self.filter(log=log, id__in=log_picture_ids)
+        names = list(log_pictures.values_list('picture', flat=True))
+        if len(names) > 0:
+            raw_delete(log_pictures)
+            delete_pictures(names)
+            Album.objects.update_stats([log.album_id])
+        return len(names)
+
+    def get_album_pictures(self, album, before_id=None):
+        """
+        Returns the pictures of the visible logs of the album, newest first. Pages are read with a keyset on the picture
+        id (the pictures before before_id), so every page is read with the same indexed query however deep into the
+        album it is, unlike an offset which reads and skips all the previous pictures.
+        :return: queryset of LogPictures, to be sliced to the size of a page
+        """
+        album_pictures = self.filter(log__album=album, log__is_hidden=False)
+        if before_id is not None:
+            album_pictures = album_pictures.filter(id__lt=before_id)
+        return album_pictures.order_by('-id')
+
+    def get_near_duplicates(self, dhash, max_distance=MAX_DUPLICATE_DISTANCE, **filters):
+        """
+        Returns the pictures (matching the provided filters) whose hashes differ from dhash in at most max_distance
+        bits. Only the pictures sharing a band with dhash are read, through the band indexes, and then compared to it,
+        instead of every picture. Besides the similar pictures, a band of an unrelated hash matches by chance with a
+        probability of 1/2^16, so out of N pictures about HASH_BANDS * N / 2^16 candidates are compared (e.g. 60 out of
+        a million), which still grows linearly with N but 16000 times slower than a full scan.
+        Note that max_distance must be lower than HASH_BANDS for every near-duplicate to share a band with dhash.
+        :return: list of LogPictures
+        """
+        band_query = Q()
+        for index, band in enumerate(get_hash_bands(dhash)):
+            band_query |= Q(**{'dhash_band_' + str(index): band})
+        candidates = self.filter(band_query, **filters).only('id', 'log', 'picture', 'dhash')
+        return [candidate for candidate in candidates if get_hamming_distance(dhash, candidate.dhash) <= max_distance]
+
+    def get_duplicate_log_ids(self, user_profile, dhashes, max_distance=MAX_DUPLICATE_DISTANCE):
+        """
+        Returns the ids of the visible logs of the user with pictures that are near-duplicates of any of the provided
+        hashes (None hashes, of pictures that could not be read, are ignored).
+        :return: sorted list of log ids
+        """
+        log_ids = set()
+        for dhash in dhashes:
+            if dhash is not None:
+                log_ids.update(log_picture.log_id for log_picture in
+                               self.get_near_duplicates(dhash, max_distance, log__user_profile=user_profile,
+                                                        log__is_hidden=False))
+        return sorted(log_ids)
+
+    def get_duplicate_groups(self, max_distance=MAX_DUPLICATE_DISTANCE, max_bucket_hashes=MAX_BAND_BUCKET_HASHES):
+        """
+        Returns the groups of near-duplicate pictures among all hashed pictures, for the offline dedup report. Pictures
+        with identical hashes are grouped first, and then the distinct hashes sharing a band are compared, one band
+        bucket at a time. Buckets of more than max_bucket_hashes distinct hashes are skipped, since comparing them
+        pairwise is quadratic, so pictures that only share such a band are not grouped (unless their hashes are
+        identical). Pictures are grouped transitively, i.e. two pictures in a group may differ in more than
+        max_distance bits if a third one is close to both of them.
+        Note that max_distance (MAX_DUPLICATE_DISTANCE, 3 bits) is bounded by HASH_BANDS, since near-duplicates must
+        share a band to be compared. Re-encoded or resized photos often differ in more bits than that, and are missed.
+        :return: list of groups, each a list of (log picture id, log id, picture name) tuples sorted by id
+        """
+        parents = {}
+
+        def find(dhash):
+            while parents.setdefault(dhash, dhash) != dhash:
+                parents[dhash] = parents[parents[dhash]]
+                dhash = parents[dhash]
+            return dhash
+
+        shared_dhashes = self.filter(dhash__isnull=False).values('dhash')\
+            .annotate(picture_count=models.Count('id')).filter(picture_count__gt=1).values_list('dhash', flat=True)
+        for dhash in shared_dhashes.iterator():
+            find(dhash)
+
+        for index in range(HASH_BANDS):
+            field_name = 'dhash_band_' + str(index)
+            shared_bands = self.filter(dhash__isnull=False).values(field_name)\
+                .annotate(hash_count=models.Count('dhash', distinct=True)).filter(hash_count__gt=1)\
+                .values_list(field_name, 'hash_count')
+            for band, hash_count in shared_bands.iterator():
+                if hash_count > max_bucket_hashes:
+                    continue
+                # identical hashes are already in the same group, so each distinct hash is compared once
+                dhashes = list(self.filter(**{field_name: band}).values_list('dhash', flat=True).distinct())
+                for position, dhash in enumerate(dhashes):
+                    for other_dhash in dhashes[position + 1:]:
+                        if get_hamming_distance(dhash, other_dhash) <= max_distance:
+                            parents[find(dhash)] = find(other_dhash)
+
+        groups = {}
+        rows = self.filter(dhash__isnull=False).order_by('id').values_list('id', 'log_id', 'picture', 'dhash')
+        for log_picture_id, log_id, name, dhash in rows.iterator():
+            if dhash in parents:
+                groups.setdefault(find(dhash), []).append((log_picture_id, log_id, name))
+        return [group for group in groups.values() if len(group) > 1]
+
+
+def get_dhash_fields(dhash):
+    """
+    Returns the values of the hash and band fields of a LogPicture with the provided hash (or None if the picture could
+    not be read, in which case it is never found as a duplicate).
+    """
+    bands = get_hash_bands(dhash) if dhash is not None else [None] * HASH_BANDS
+    fields = dict(('dhash_band_' + str(index), band) for index, band in enumerate(bands))
+    fields['dhash'] = to_signed(dhash & HASH_MASK) if dhash is not None else None
+    return fields
+
 
 class LogPicture(models.Model):
     log = ForeignKey(Log)
-    picture = models.ImageField(upload_to='mytravelog/log_pictures', null=False)
+    picture = models.ImageField(upload_to='mytravelog/log_pictures', storage=picture_storage, null=False)
+    # intrinsic size and placeholder of the picture (see get_picture_info), set once its derivatives are created
+    width = models.IntegerField(null=False, default=0)
+    height = models.IntegerField(null=False, default=0)
+    placeholder = models.TextField(null=False, blank=True, default='')
+    # 64 bit perceptual hash of the picture (see compute_dhash), and its bands, which are indexed to find near-duplicates
+    dhash = models.BigIntegerField(null=True, blank=True)
+    dhash_band_0 = models.IntegerField(null=True, blank=True, db_index=True)
+    dhash_band_1 = models.IntegerField(null=True, blank=True, db_index=True)
+    dhash_band_2 = models.IntegerField(null=True, blank=True, db_index=True)
+    dhash_band_3 = models.IntegerField(null=True, blank=True, db_index=True)
+
+    # Managers
+    objects = LogPictureManager()
 
     def __unicode__(self):
         return self.log.city.name + ": " + str(self.id)
 
 
-# auto delete file when imagefield is deleted
-from django.db.models.signals import post_delete
+# auto delete file when imagefield is deleted (unless other pictures share it), create or delete the resized
+# derivatives, placeholder and perceptual hash of the picture, and keep the picture count of its album up to date
+from django.db.models.signals import post_save, post_delete
 from django.dispatch.dispatcher import receiver
 
 @receiver(post_delete, sender=LogPicture)
 def auto_delete_file(sender, instance, **kwargs):
-    # Pass false so ImageField doesn't save the model.
-    instance.picture.delete(False)
\ No newline at end of file
+    delete_picture(instance.picture)
+
+
+@receiver(post_delete, sender=LogPicture)
+def update_album_stats_on_delete(sender, instance, **kwargs):
+    Album.objects.update_stats(Log.all_objects.filter(id=instance.log_id).values_list('album_id', flat=True))
+
+
+@receiver(post_save, sender=LogPicture)
+def create_picture_derivatives(sender, instance, created, **kwargs):
+    if created:
+        picture_info = dict(create_derivatives(instance.picture) or MISSING_PICTURE_INFO)
+        picture_info.update(get_dhash_fields(compute_picture_dhash(instance.picture.storage, instance.picture.name)))
+        LogPicture.objects.filter(id=instance.id).update(**picture_info)
+        for field_name, value in picture_info.items():
+            setattr(instance, field_name, value)
+
+
+@receiver(post_save, sender=LogPicture)
+def update_album_stats_on_save(sender, instance, created, **kwargs):
+    if created:
+        Album.objects.update_stats(Log.all_objects.filter(id=instance.log_id).values_list('album_id', flat=True))
@@ -0,0 +1,64 @@
+from django.core.files.storage import default_storage
+from django.db import models, transaction, IntegrityError
+
+from mytravelog.models.stored_blob import StoredBlob
+from mytravelog.utils.derivatives import delete_derivatives
+
+
+__author__ = 'Manas'
+
+# number of tombstones whose files are deleted at a time by the garbage collector
+COLLECT_BATCH_SIZE = 100
+
+
+class MediaTombstoneManager(models.Manager):
+
+    def collect_garbage(self, batch_size=COLLECT_BATCH_SIZE):
+        """
+        Deletes the files recorded in tombstones, along with their derivatives, batch_size tombstones at a time,
+        and then the tombstones themselves. Files that are referenced again by the time they are collected (i.e.
+        the same picture was uploaded again) are kept. Each file is claimed by creating its StoredBlob before it is
+        deleted, in the same transaction, so that the same picture uploaded in the meantime either claims the
+        file first, or waits until the file is deleted and then stores it again.
+        :return: number of deleted files
+        """
+        deleted_count = 0
+        while True:
+            tombstones = list(self.order_by('id')[:batch_size])
+            if len(tombstones) == 0:
+                break
+            names = set(tombstone.name for tombstone in tombstones)
+            referenced_names = set(StoredBlob.objects.filter(name__in=names, reference_count__gt=0)
+                                   .values_list('name', flat=True))
+            for name in names - referenced_names:
+                try:
+                    with transaction.atomic():
+                        StoredBlob.objects.create(name=name, reference_count=0)
+                        delete_derivatives(name)
+                        if default_storage.exists(name):
+                            default_storage.delete(name)
+                            deleted_count += 1
+                        StoredBlob.objects.filter(name=name).delete()
+                except IntegrityError:
+                    # the same picture is being uploaded again
+                    continue
+            self.filter(id__in=[tombstone.id for tombstone in tombstones]).delete()
+        return deleted_count
+
+
+class MediaTombstone(models.Model):
+    """
+    A media file that is no longer used by any picture, to be deleted by the media garbage collector. Files are
+    never deleted along with their pictures, so that deleting many pictures doesn't hold up the request, and so
+    that no file is deleted if the transaction deleting its pictures is rolled back.
+    """
+
+    # Attributes
+    name = models.CharField(max_length=255, null=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # Managers
+    objects = MediaTombstoneManager()
+
+    def __unicode__(self):
+        return self.name
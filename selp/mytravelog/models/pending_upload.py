@@ -0,0 +1,254 @@
+from multiprocessing.pool import ThreadPool
+import os
+import shutil
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.files.base import File
+from django.db import models, connection
+from django.db.models.fields.related import ForeignKey
+from django.utils import timezone
+
+from mytravelog.models.log import Log
+from mytravelog.utils.purge import raw_delete
+
+
+__author__ = 'Manas'
+
+PENDING = 'pending'
+PROCESSING = 'processing'
+FAILED = 'failed'
+STATUS_CHOICES = (
+    (PENDING, 'Pending'),
+    (PROCESSING, 'Processing'),
+    (FAILED, 'Failed')
+)
+
+_processing_pool = None
+_processing_pool_lock = threading.Lock()
+_spool_pool = None
+_spool_pool_lock = threading.Lock()
+
+
+class PendingUploadManager(models.Manager):
+
+    @staticmethod
+    def spool_files(uploaded_files):
+        """
+        Writes the uploaded pictures to new files in the spool directory, in parallel. Files can't be rolled back,
+        so this is called before the transaction staging them with spool_uploads, and the files are deleted with
+        delete_spool_files if the transaction fails.
+        :param uploaded_files: list of uploaded file instances from request.FILES
+        :return: list of spool paths of the files, in the same order
+        """
+        if len(uploaded_files) == 0:
+            return []
+        spool_dir = settings.UPLOAD_SPOOL_DIR
+        if not os.path.exists(spool_dir):
+            try:
+                os.makedirs(spool_dir)
+            except OSError:
+                # created by another worker in the meantime
+                pass
+        spool_paths = [os.path.join(spool_dir, uuid.uuid4().hex) for uploaded_file in uploaded_files]
+        try:
+            write_spool_files(uploaded_files, spool_paths)
+        except Exception:
+            delete_spool_files(spool_paths)
+            raise
+        return spool_paths
+
+    def spool_uploads(self, log, uploaded_files, spool_paths):
+        """
+        Stages the uploaded pictures of the log, written to the spool directory by spool_files, to be turned into
+        LogPictures by the upload processing threads, so that the request doesn't wait for them. The PendingUploads
+        of all of them are inserted with a single query. They are not queued yet, so that this can be called
+        within a transaction: queue_uploads has to be called once it is committed.
+        :param log: log the pictures were uploaded to
+        :param uploaded_files: list of uploaded file instances from request.FILES
+        :param spool_paths: list of spool paths returned by spool_files for the uploaded files
+        :return: list of ids of the new PendingUploads
+        """
+        if len(uploaded_files) == 0:
+            return []
+        self.bulk_create([PendingUpload(log=log, file_name=os.path.basename(uploaded_file.name), spool_path=spool_path)
+                          for uploaded_file, spool_path in zip(uploaded_files, spool_paths)])
+        # bulk_create doesn't set the ids of the new rows, so they are looked up by their unique spool paths
+        return list(self.filter(spool_path__in=spool_paths).order_by('id').values_list('id', flat=True))
+
+    def spool_chunked_uploads(self, log, chunked_uploads):
+        """
+        Stages the finalized chunked uploads as pictures of the log. Their files are already in the spool directory,
+        so the PendingUploads take them over, and the chunked uploads are deleted without deleting their files.
+        Just like spool_uploads, the PendingUploads are inserted with a single query and not queued yet.
+        :param log: log the pictures were uploaded to
+        :param chunked_uploads: list of finalized ChunkedUploads
+        :return: list of ids of the new PendingUploads
+        """
+        # imported inside method to prevent circular dependencies
+        from mytravelog.models.chunked_upload import ChunkedUpload
+
+        if len(chunked_uploads) == 0:
+            return []
+        spool_paths = [chunked_upload.spool_path for chunked_upload in chunked_uploads]
+        self.bulk_create([PendingUpload(log=log, file_name=chunked_upload.file_name,
+                                        spool_path=chunked_upload.spool_path) for chunked_upload in chunked_uploads])
+        raw_delete(ChunkedUpload.objects.filter(id__in=[chunked_upload.id for chunked_upload in chunked_uploads]))
+        return list(self.filter(spool_path__in=spool_paths).order_by('id').values_list('id', flat=True))
+
+    def queue_uploads(self, pending_upload_ids):
+        for pending_upload_id in pending_upload_ids:
+            self.queue_upload(pending_upload_id)
+
+    def queue_upload(self, pending_upload_id):
+        """
+        Queues the upload in the upload processing thread pool. If UPLOAD_PROCESSING_THREADS is set
+        to 0, then the upload is processed right away, in this thread.
+        """
+        global _processing_pool
+        thread_count = getattr(settings, 'UPLOAD_PROCESSING_THREADS', 2)
+        if thread_count == 0:
+            process_pending_upload(pending_upload_id)
+            return
+        with _processing_pool_lock:
+            if _processing_pool is None:
+                _processing_pool = ThreadPool(thread_count)
+        _processing_pool.apply_async(process_pending_upload_in_thread, (pending_upload_id,))
+
+    def get_pending_upload_counts(self, log_ids):
+        """
+        Returns the number of uploads of each of the provided logs that are still being processed, as a dict
+        keyed by log id. Logs without any such uploads are left out.
+        """
+        counts = self.filter(log_id__in=log_ids, status__in=[PENDING, PROCESSING]).values_list('log_id')\
+            .annotate(upload_count=models.Count('id')).order_by()
+        return dict(counts)
+
+    def process_stale_uploads(self, max_age):
+        """
+        Processes the uploads that were staged more than max_age ago but are not done yet, e.g. because the
+        web worker was restarted before its threads got to them. Failed uploads of that age are deleted, since
+        their errors have been reported by then.
+        :param max_age: timedelta
+        :return: number of processed uploads
+        """
+        staged_before = timezone.now() - max_age
+        self.filter(status=FAILED, created_at__lt=staged_before).delete()
+        stale_upload_ids = list(self.filter(status__in=[PENDING, PROCESSING], created_at__lt=staged_before)
+                                .values_list('id', flat=True))
+        self.filter(id__in=stale_upload_ids).update(status=PENDING)
+        for pending_upload_id in stale_upload_ids:
+            process_pending_upload(pending_upload_id)
+        return len(stale_upload_ids)
+
+
+class PendingUpload(models.Model):
+
+    # Relations
+    log = ForeignKey(Log)
+
+    # Attributes
+    # name of the uploaded file, and path of the file staged in the spool directory
+    file_name = models.CharField(max_length=255, null=False)
+    spool_path = models.CharField(max_length=255, null=False)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, null=False, default=PENDING)
+    error = models.CharField(max_length=255, null=False, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # Managers
+    objects = PendingUploadManager()
+
+    def __unicode__(self):
+        return str(self.log_id) + ": " + self.file_name + " (" + self.status + ")"
+
+
+def write_spool_file(uploaded_file, spool_path):
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        # large uploads are already written to a temporary file, which only needs to be moved
+        shutil.move(uploaded_file.temporary_file_path(), spool_path)
+    else:
+        with open(spool_path, 'wb') as spool_file:
+            for chunk in uploaded_file.chunks():
+                spool_file.write(chunk)
+
+
+def write_spool_file_in_thread(args):
+    write_spool_file(*args)
+
+
+def delete_spool_files(spool_paths):
+    for spool_path in spool_paths:
+        try:
+            os.remove(spool_path)
+        except OSError:
+            # never written
+            pass
+
+
+def write_spool_files(uploaded_files, spool_paths):
+    """
+    Writes the uploaded files to their spool paths using the spool thread pool. If UPLOAD_SPOOL_THREADS is set to 0,
+    then the files are written one after the other, in this thread.
+    """
+    global _spool_pool
+    thread_count = getattr(settings, 'UPLOAD_SPOOL_THREADS', 4)
+    if thread_count == 0 or len(uploaded_files) == 1:
+        for uploaded_file, spool_path in zip(uploaded_files, spool_paths):
+            write_spool_file(uploaded_file, spool_path)
+        return
+    with _spool_pool_lock:
+        if _spool_pool is None:
+            _spool_pool = ThreadPool(thread_count)
+    _spool_pool.map(write_spool_file_in_thread, zip(uploaded_files, spool_paths))
+
+
+def process_pending_upload(pending_upload_id):
+    """
+    Turns the staged upload into a picture of its log. The file is saved with the log pictures, which also
+    creates its derivatives, and then the upload is deleted. If the file can't be read, the upload is kept
+    as failed, so that its error can be reported to the user.
+    """
+    # imported inside method to prevent circular dependencies
+    from mytravelog.models.log_picture import LogPicture
+
+    # claim the upload, so that it is never processed twice
+    if PendingUpload.objects.filter(id=pending_upload_id, status=PENDING).update(status=PROCESSING) == 0:
+        return
+    pending_upload = PendingUpload.objects.filter(id=pending_upload_id).first()
+    if pending_upload is None:
+        # the log was deleted in the meantime
+        return
+    try:
+        with open(pending_upload.spool_path, 'rb') as spool_file:
+            log_picture = LogPicture(log_id=pending_upload.log_id)
+            log_picture.picture.save(pending_upload.file_name, File(spool_file), save=False)
+            log_picture.save()
+    except (IOError, OSError):
+        pending_upload.status = FAILED
+        pending_upload.error = "Your picture " + pending_upload.file_name + " could not be saved"
+        pending_upload.save(update_fields=['status', 'error'])
+        return
+    pending_upload.delete()
+    if not Log.objects.filter(id=pending_upload.log_id).exists():
+        log_picture.delete()
+
+
+def process_pending_upload_in_thread(pending_upload_id):
+    try:
+        process_pending_upload(pending_upload_id)
+    finally:
+        # every thread has its own database connection, which is not closed by the request cycle
+        connection.close()
+
+
+# delete the staged file along with the upload, e.g. when it is processed or its log is deleted
+from django.db.models.signals import post_delete
+from django.dispatch.dispatcher import receiver
+
+@receiver(post_delete, sender=PendingUpload)
+def delete_spooled_file(sender, instance, **kwargs):
+    try:
+        os.remove(instance.spool_path)
+    except OSError:
+        pass
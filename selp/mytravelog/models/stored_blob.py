@@ -0,0 +1,72 @@
+from collections import Counter
+from django.db import models, transaction, IntegrityError
+from django.db.models.expressions import F
+
+
+__author__ = 'Manas'
+
+
+class StoredBlobManager(models.Manager):
+
+    def add_reference(self, name):
+        """
+        Counts one more reference to the file with the provided name, e.g. when a picture with the same
+        content as an existing file is uploaded again.
+        """
+        if self.filter(name=name).update(reference_count=F('reference_count') + 1) == 0:
+            try:
+                with transaction.atomic():
+                    self.create(name=name, reference_count=1)
+            except IntegrityError:
+                # created by another request in the meantime
+                self.filter(name=name).update(reference_count=F('reference_count') + 1)
+
+    def release_reference(self, name):
+        """
+        Counts one less reference to the file with the provided name.
+        :return: True if no reference to the file is left, so that it can be deleted, else False. Files
+        without a StoredBlob (e.g. stored before files were shared) only have a single reference.
+        """
+        if self.filter(name=name).update(reference_count=F('reference_count') - 1) == 0:
+            return True
+        unreferenced_blobs = self.filter(name=name, reference_count__lte=0)
+        if unreferenced_blobs.exists():
+            unreferenced_blobs.delete()
+            return True
+        return False
+
+    def release_references(self, names):
+        """
+        Counts one less reference to the file of each of the provided names (names can be repeated). Files
+        released the same number of times are updated together, so the number of queries doesn't grow with
+        the number of names, as long as there are few repeated ones.
+        :return: list of distinct names of the files without any reference left
+        """
+        reference_counts = Counter(names)
+        names_by_reference_count = {}
+        for name, reference_count in reference_counts.items():
+            names_by_reference_count.setdefault(reference_count, []).append(name)
+        for reference_count, released_names in names_by_reference_count.items():
+            self.filter(name__in=released_names).update(reference_count=F('reference_count') - reference_count)
+        blobs = self.filter(name__in=reference_counts.keys())
+        stored_names = set(blobs.values_list('name', flat=True))
+        unreferenced_names = set(blobs.filter(reference_count__lte=0).values_list('name', flat=True))
+        if len(unreferenced_names) > 0:
+            self.filter(name__in=unreferenced_names).delete()
+        return [name for name in reference_counts if name not in stored_names or name in unreferenced_names]
+
+
+class StoredBlob(models.Model):
+    """
+    A file of the content addressed storage, which is shared by every picture with the same content.
+    """
+
+    # Attributes
+    name = models.CharField(max_length=255, null=False, unique=True)
+    reference_count = models.IntegerField(null=False, default=0)
+
+    # Managers
+    objects = StoredBlobManager()
+
+    def __unicode__(self):
+        return self.name + " (" + str(self.reference_count) + ")"
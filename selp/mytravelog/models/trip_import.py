@@ -0,0 +1,437 @@
+from collections import Counter
+import datetime
+from decimal import Decimal
+import itertools
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import os
+import shutil
+import threading
+import uuid
+import zipfile
+import zlib
+
+from django.conf import settings
+from django.core.files.base import File
+from django.db import models, transaction, connection
+from django.db.models.fields.related import ForeignKey
+from django.utils import timezone
+
+from mytravelog.models.album import Album
+from mytravelog.models.city import City
+from mytravelog.models.user_profile import UserProfile
+from mytravelog.utils.derivatives import create_derivatives, MISSING_PICTURE_INFO
+from mytravelog.utils.perceptual_hash import compute_picture_dhash
+from mytravelog.utils.exif import read_photo_metadata
+from mytravelog.utils.geo import get_grid_cell_id
+from mytravelog.utils.purge import raw_delete
+from mytravelog.utils.storage import picture_storage, delete_pictures
+from mytravelog.utils.upload_limits import get_max_file_size, is_archive_name
+
+
+__author__ = 'Manas'
+
+PENDING = 'pending'
+READING = 'reading'
+SAVING = 'saving'
+DONE = 'done'
+FAILED = 'failed'
+STATUS_CHOICES = (
+    (PENDING, 'Pending'),
+    (READING, 'Reading'),
+    (SAVING, 'Saving'),
+    (DONE, 'Done'),
+    (FAILED, 'Failed')
+)
+
+# at most this many photos are imported at once, the others are left out
+MAX_IMPORT_PHOTOS = 1000
+# photos taken in the same city with less than this time between them are grouped into the same log, which holds at
+# most MAX_LOG_PICTURES photos, just like the logs created by users
+MAX_LOG_GAP = datetime.timedelta(hours=6)
+MAX_LOG_PICTURES = 10
+# photos are stored this many at a time, and the progress of the import is updated after each batch
+IMPORT_BATCH_SIZE = 50
+# only JPEG photos carry the EXIF data logs are made from, so other files in archives are not extracted
+PHOTO_EXTENSIONS = ['.jpg', '.jpeg']
+
+_import_pool = None
+_import_pool_lock = threading.Lock()
+_import_process_pool = None
+_import_process_pool_lock = threading.Lock()
+
+
+class TripImportManager(models.Manager):
+
+    def start_import(self, user_profile, album, uploaded_files, chunked_uploads):
+        """
+        Stages the photos of a trip in a spool directory of its own, to be turned into logs in the background by
+        process_trip_import. The uploaded files are written to it, and the files of the finalized chunked uploads
+        (photos, or zip archives of photos) are moved to it, after which the chunked uploads are deleted.
+        The import is not queued yet, queue_import has to be called for it.
+        :param user_profile: user profile importing the photos
+        :param album: album of the logs to be created, or None
+        :param uploaded_files: list of uploaded file instances from request.FILES
+        :param chunked_uploads: list of finalized ChunkedUploads
+        :return: the new TripImport
+        """
+        # imported inside method to prevent circular dependencies
+        from mytravelog.models.chunked_upload import ChunkedUpload
+        from mytravelog.models.pending_upload import write_spool_files
+
+        spool_dir = os.path.join(settings.UPLOAD_SPOOL_DIR, uuid.uuid4().hex)
+        os.makedirs(spool_dir)
+        write_spool_files(uploaded_files, [get_spool_path(spool_dir, uploaded_file.name)
+                                           for uploaded_file in uploaded_files])
+        for chunked_upload in chunked_uploads:
+            os.rename(chunked_upload.spool_path, get_spool_path(spool_dir, chunked_upload.file_name))
+        raw_delete(ChunkedUpload.objects.filter(id__in=[chunked_upload.id for chunked_upload in chunked_uploads]))
+        return self.create(user_profile=user_profile, album=album, spool_dir=spool_dir)
+
+    def queue_import(self, trip_import_id):
+        """
+        Queues the import in the import thread of this web worker, which processes imports one at a time, since
+        each of them keeps the import processes busy. If UPLOAD_PROCESSING_THREADS is set to 0, then the import is
+        processed right away, in this thread.
+        """
+        global _import_pool
+        if getattr(settings, 'UPLOAD_PROCESSING_THREADS', 2) == 0:
+            process_trip_import(trip_import_id)
+            return
+        with _import_pool_lock:
+            if _import_pool is None:
+                _import_pool = ThreadPool(1)
+        _import_pool.apply_async(process_trip_import_in_thread, (trip_import_id,))
+
+    def process_stale_imports(self, max_age):
+        """
+        Processes the imports that made no progress for more than max_age, e.g. because the web worker was
+        restarted in the meantime. They start over from the photos left in their spool directories, so the
+        pictures already stored by the interrupted run are released first, since they are stored again.
+        :param max_age: timedelta
+        :return: number of processed imports
+        """
+        stale_imports = self.filter(status__in=[PENDING, READING, SAVING], updated_at__lt=timezone.now() - max_age)
+        stale_import_ids = []
+        for trip_import_id, stored_names in stale_imports.values_list('id', 'stored_names'):
+            # the import is claimed along with its stored names, so that they are never released twice
+            if stale_imports.filter(id=trip_import_id).update(status=PENDING, stored_names='') == 1:
+                delete_pictures(get_stored_names(stored_names))
+                stale_import_ids.append(trip_import_id)
+        for trip_import_id in stale_import_ids:
+            process_trip_import(trip_import_id)
+        return len(stale_import_ids)
+
+    def update_progress(self, trip_import, **values):
+        self.filter(id=trip_import.id).update(updated_at=timezone.now(), **values)
+        for field_name, value in values.items():
+            setattr(trip_import, field_name, value)
+
+
+class TripImport(models.Model):
+    """
+    A batch of photos (or zip archives of photos) being turned into logs, which are grouped by the cities and
+    times the photos were taken (see process_trip_import). Its counts are updated as the photos are processed,
+    so that the progress of the import can be polled.
+    """
+
+    # Relations
+    user_profile = ForeignKey(UserProfile)
+    album = ForeignKey(Album, null=True, blank=True, on_delete=models.SET_NULL)
+
+    # Attributes
+    # directory the photos are staged in, within the spool directory
+    spool_dir = models.CharField(max_length=255, null=False)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, null=False, default=PENDING)
+    error = models.CharField(max_length=255, null=False, blank=True, default='')
+    # number of photos found, read for their EXIF data, and stored as pictures, number of photos left out since
+    # they were taken in no known city (or have no location or time), and number of logs created
+    photo_count = models.IntegerField(null=False, default=0)
+    read_count = models.IntegerField(null=False, default=0)
+    saved_count = models.IntegerField(null=False, default=0)
+    skipped_count = models.IntegerField(null=False, default=0)
+    log_count = models.IntegerField(null=False, default=0)
+    # names of the pictures stored so far, one per line, which are released if the import fails or is restarted
+    stored_names = models.TextField(null=False, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Managers
+    objects = TripImportManager()
+
+    def __unicode__(self):
+        return str(self.user_profile_id) + ": " + str(self.photo_count) + " photos (" + self.status + ")"
+
+
+def get_spool_path(spool_dir, file_name):
+    # photos are renamed to unique names, keeping their extension, which is also used for their stored pictures
+    return os.path.join(spool_dir, uuid.uuid4().hex + os.path.splitext(os.path.basename(file_name))[1].lower())
+
+
+def get_stored_names(stored_names):
+    return [name for name in stored_names.split('\n') if name]
+
+
+def map_in_import_processes(function, items):
+    """
+    Returns an iterator over the results of the function for each of the items, in order. They are computed by
+    the import process pool, and only a few items at a time are handed to the processes ahead of the results
+    being consumed. If TRIP_IMPORT_PROCESSES is set to 0, then the items are processed in this thread.
+    """
+    global _import_process_pool
+    process_count = getattr(settings, 'TRIP_IMPORT_PROCESSES', 2)
+    if process_count == 0:
+        return itertools.imap(function, items)
+    with _import_process_pool_lock:
+        if _import_process_pool is None:
+            _import_process_pool = multiprocessing.Pool(process_count)
+    return _import_process_pool.imap(function, items, chunksize=8)
+
+
+def create_photo_derivatives(name):
+    # runs in the import processes, which only write files, so that all database updates are made by the import thread
+    # imported inside method to prevent circular dependencies
+    from mytravelog.models.log_picture import LogPicture, get_dhash_fields
+
+    picture_info = create_derivatives(LogPicture(picture=name).picture)
+    if picture_info is not None:
+        picture_info.update(get_dhash_fields(compute_picture_dhash(picture_storage, name)))
+    return name, picture_info
+
+
+def copy_archive_entry(entry_file, path, max_size):
+    """
+    Copies the archive entry to the path, one chunk at a time. Entries can be larger than they claim to be, so
+    the copy is given up on (and the file deleted) as soon as it exceeds max_size bytes.
+    :return: True if the entry was copied
+    """
+    copied_size = 0
+    with open(path, 'wb') as photo_file:
+        chunk = entry_file.read(64 * 1024)
+        while chunk:
+            copied_size += len(chunk)
+            if copied_size > max_size:
+                break
+            photo_file.write(chunk)
+            chunk = entry_file.read(64 * 1024)
+    if copied_size > max_size:
+        os.remove(path)
+        return False
+    return True
+
+
+def extract_photos(spool_dir):
+    """
+    Extracts the photos in the zip archives staged in the spool directory, one at a time, so that archives are
+    never held in memory. Entries that are not photos, are encrypted or are larger than pictures can be are left
+    out, and so are photos beyond MAX_IMPORT_PHOTOS. Archives are deleted once they are extracted.
+    :return: list of paths of all photos in the spool directory, at most MAX_IMPORT_PHOTOS of them
+    """
+    file_names = sorted(os.listdir(spool_dir))
+    photo_count = len([file_name for file_name in file_names if not is_archive_name(file_name)])
+    for file_name in file_names:
+        if not is_archive_name(file_name):
+            continue
+        archive_path = os.path.join(spool_dir, file_name)
+        with zipfile.ZipFile(archive_path) as archive:
+            for entry in archive.infolist():
+                if photo_count >= MAX_IMPORT_PHOTOS:
+                    break
+                is_encrypted = entry.flag_bits & 0x1
+                if is_encrypted or os.path.splitext(entry.filename)[1].lower() not in PHOTO_EXTENSIONS or \
+                        entry.file_size > get_max_file_size():
+                    continue
+                entry_file = archive.open(entry)
+                try:
+                    if copy_archive_entry(entry_file, get_spool_path(spool_dir, entry.filename),
+                                          get_max_file_size()):
+                        photo_count += 1
+                finally:
+                    entry_file.close()
+        os.remove(archive_path)
+    photo_names = sorted(file_name for file_name in os.listdir(spool_dir) if not is_archive_name(file_name))
+    return [os.path.join(spool_dir, file_name) for file_name in photo_names[:MAX_IMPORT_PHOTOS]]
+
+
+def read_photos(trip_import, photo_paths):
+    """
+    Reads the location and time of each photo in the import processes, and finds the city it was taken in.
+    Photos taken in no known city, or without a location or time, are left out.
+    :return: list of (path, city id, latitude, longitude, taken_at) tuples
+    """
+    TripImport.objects.update_progress(trip_import, photo_count=len(photo_paths))
+    photos = []
+    read_count = 0
+    for path, latitude, longitude, taken_at in map_in_import_processes(read_photo_metadata, photo_paths):
+        read_count += 1
+        if latitude is not None and taken_at is not None:
+            city_id = City.objects.get_nearest_city_id(latitude, longitude)
+            if city_id is not None:
+                photos.append((path, city_id, latitude, longitude, taken_at))
+        if read_count % IMPORT_BATCH_SIZE == 0:
+            TripImport.objects.update_progress(trip_import, read_count=read_count)
+    TripImport.objects.update_progress(trip_import, read_count=read_count)
+    return photos
+
+
+def group_photos(photos):
+    """
+    Groups the photos into logs. Photos are ordered by the time they were taken, and each log holds the photos
+    taken in the same city with less than MAX_LOG_GAP between them, up to MAX_LOG_PICTURES of them.
+    :param photos: list of (path, city id, latitude, longitude, taken_at) tuples
+    :return: list of lists of photos, one list per log
+    """
+    groups = []
+    previous_photo = None
+    for photo in sorted(photos, key=lambda photo: (photo[4], photo[0])):
+        path, city_id, latitude, longitude, taken_at = photo
+        if previous_photo is None or city_id != previous_photo[1] or taken_at - previous_photo[4] > MAX_LOG_GAP or \
+                len(groups[-1]) == MAX_LOG_PICTURES:
+            groups.append([])
+        groups[-1].append(photo)
+        previous_photo = photo
+    return groups
+
+
+def store_photos(trip_import, photos, stored_names):
+    """
+    Stores the photos with the pictures, IMPORT_BATCH_SIZE at a time, and creates their derivatives, picture
+    info and perceptual hashes in the import processes. The names of the stored pictures are added to stored_names,
+    and recorded on the import, as soon as each batch is stored, so that they can be released if the import fails
+    or is restarted.
+    :param photos: list of (path, city id, latitude, longitude, taken_at) tuples
+    :return: dict of (picture name, picture info) tuples keyed by photo path
+    """
+    pictures = {}
+    for start in range(0, len(photos), IMPORT_BATCH_SIZE):
+        names = {}
+        for photo in photos[start:start + IMPORT_BATCH_SIZE]:
+            path = photo[0]
+            with open(path, 'rb') as photo_file:
+                names[path] = picture_storage.save(os.path.basename(path), File(photo_file))
+            stored_names.append(names[path])
+        TripImport.objects.update_progress(trip_import, stored_names='\n'.join(stored_names))
+        picture_infos = dict(map_in_import_processes(create_photo_derivatives, list(set(names.values()))))
+        for path, name in names.items():
+            pictures[path] = (name, picture_infos[name] or MISSING_PICTURE_INFO)
+        TripImport.objects.update_progress(trip_import, saved_count=min(start + IMPORT_BATCH_SIZE, len(photos)))
+    return pictures
+
+
+def create_logs(trip_import, groups, pictures):
+    """
+    Inserts the logs of the groups of photos and their pictures at once, and updates the visited cities, countries,
+    grid cell rollups, distance travelled and album stats for all of them together, just like the post_save receivers of Log
+    and LogPicture do for a single log. Each log is placed at the centre of its photos, and is created at the time
+    its first photo was taken. The import is marked as done in the same transaction.
+    """
+    # imported inside method to prevent circular dependencies
+    from mytravelog.models.city_visit import CityVisit
+    from mytravelog.models.country import Country
+    from mytravelog.models.grid_cell_rollup import GridCellRollup
+    from mytravelog.models.log import Log, LOG_GRID_LEVEL, compute_log_score
+    from mytravelog.models.log_picture import LogPicture
+
+    city_names = dict(City.objects.filter(id__in=set(group[0][1] for group in groups)).values_list('id', 'name'))
+    with transaction.atomic():
+        # the album may have been deleted in the meantime
+        album_id = Album.objects.filter(id=trip_import.album_id).values_list('id', flat=True).first()
+        logs = []
+        for group in groups:
+            city_id = group[0][1]
+            latitude = Decimal(sum(photo[2] for photo in group) / len(group)).quantize(Decimal('0.0001'))
+            longitude = Decimal(sum(photo[3] for photo in group) / len(group)).quantize(Decimal('0.0001'))
+            created_at = group[0][4]
+            logs.append(Log(user_profile_id=trip_import.user_profile_id, album_id=album_id, city_id=city_id,
+                            latitude=latitude, longitude=longitude, created_at=created_at,
+                            description="Photos taken in " + city_names[city_id] + " on " +
+                                        created_at.strftime('%d %B %Y'),
+                            score=compute_log_score(created_at, 0),
+                            grid_cell_id=get_grid_cell_id(latitude, longitude, LOG_GRID_LEVEL),
+                            trip_import=trip_import))
+        Log.objects.bulk_create(logs)
+        # bulk_create doesn't set the ids of the logs, which are inserted in order
+        log_ids = list(Log.all_objects.filter(trip_import=trip_import).order_by('id').values_list('id', flat=True))
+        log_pictures = []
+        for log_id, group in zip(log_ids, groups):
+            for photo in group:
+                name, picture_info = pictures[photo[0]]
+                log_pictures.append(LogPicture(log_id=log_id, picture=name, **picture_info))
+        LogPicture.objects.bulk_create(log_pictures)
+
+        for city_id, log_count in Counter(log.city_id for log in logs).items():
+            CityVisit.objects.add_visit(trip_import.user_profile_id, city_id, log_count)
+            Country.objects.add_log(city_id, log_count)
+        GridCellRollup.objects.add_logs([(log_id, log.latitude, log.longitude, log.score)
+                                         for log_id, log in zip(log_ids, logs)])
+        UserProfile.objects.update_distance_travelled([trip_import.user_profile_id])
+        Album.objects.update_stats([album_id])
+        TripImport.objects.update_progress(trip_import, status=DONE, log_count=len(logs), stored_names='')
+
+    Log.objects.invalidate_user_map_info(trip_import.user_profile_id)
+    Log.objects.invalidate_city_top_logs(set(log.city_id for log in logs))
+
+
+def process_trip_import(trip_import_id):
+    """
+    Turns the photos of the import into logs. The locations and times of the photos are read in the import
+    processes, photos taken close together in the same city are grouped into logs, the photos are stored along
+    with their derivatives (also created in the import processes), and finally all logs and their pictures are
+    inserted at once. Only the metadata of the photos is kept in memory, so that memory use stays bounded
+    however many photos are imported. If the photos can't be read, the import is kept as failed, so that its
+    error can be reported to the user. The pictures stored by a failed import are released.
+    """
+    # claim the import, so that it is never processed twice
+    if TripImport.objects.filter(id=trip_import_id, status=PENDING)\
+            .update(status=READING, updated_at=timezone.now()) == 0:
+        return
+    trip_import = TripImport.objects.get(id=trip_import_id)
+    stored_names = []
+    try:
+        try:
+            photos = read_photos(trip_import, extract_photos(trip_import.spool_dir))
+            groups = group_photos(photos)
+            TripImport.objects.update_progress(trip_import, status=SAVING,
+                                               skipped_count=trip_import.photo_count - len(photos))
+            pictures = store_photos(trip_import, photos, stored_names)
+        except (IOError, OSError, zipfile.BadZipfile, zlib.error):
+            fail_trip_import(trip_import, stored_names, "Your photos could not be imported")
+            return
+        if not UserProfile.objects.filter(id=trip_import.user_profile_id).exists():
+            # the account was deleted in the meantime
+            fail_trip_import(trip_import, stored_names, "Your account was deleted")
+            return
+        try:
+            create_logs(trip_import, groups, pictures)
+        except Exception:
+            # the logs were rolled back, so their pictures are only referenced by the import
+            fail_trip_import(trip_import, stored_names, "Your photos could not be imported")
+            raise
+    finally:
+        shutil.rmtree(trip_import.spool_dir, ignore_errors=True)
+
+
+def fail_trip_import(trip_import, stored_names, error):
+    """
+    Releases the pictures stored by the import and keeps it as failed, so that its error can be reported to the
+    user.
+    """
+    delete_pictures(stored_names)
+    TripImport.objects.update_progress(trip_import, status=FAILED, stored_names='', error=error)
+
+
+def process_trip_import_in_thread(trip_import_id):
+    try:
+        process_trip_import(trip_import_id)
+    finally:
+        # every thread has its own database connection, which is not closed by the request cycle
+        connection.close()
+
+
+# delete the staged photos along with the import, e.g. when the account of its user is purged
+from django.db.models.signals import post_delete
+from django.dispatch.dispatcher import receiver
+
+@receiver(post_delete, sender=TripImport)
+def delete_spool_dir(sender, instance, **kwargs):
+    shutil.rmtree(instance.spool_dir, ignore_errors=True)
@@ -1,10 +1,93 @@
-import os
+from django.conf import settings
+from django.db.models.expressions import F
 from django.db.models.query_utils import Q
 
 __author__ = 'Manas'
 
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+import numpy as np
+
+from mytravelog.utils.bitset import bytes_to_bitset, count_common_bits
+from mytravelog.utils.derivatives import create_derivatives, get_picture_info_fields, MISSING_PICTURE_INFO
+from mytravelog.utils.geo import get_path_distances
+from mytravelog.utils.storage import picture_storage, delete_picture
+
+
+class UserProfileManager(models.Manager):
+
+    def get_queryset(self):
+        # hidden user profiles are waiting to be purged, and are left out everywhere in the meantime
+        return super(UserProfileManager, self).get_queryset().filter(is_hidden=False)
+
+    def hide_user_profile(self, user_profile):
+        """
+        Hides the user profile along with all its albums and logs right away, and disables its user, so
+        that the account can't be signed in to anymore (the unusable password also signs out all other
+        sessions of the user). Everything is deleted later on by purge_hidden_objects, in bounded batches.
+        """
+        # imported inside method to prevent circular dependencies
+        from mytravelog.models.album import Album
+        from mytravelog.models.log import Log
+
+        user = user_profile.user
+        with transaction.atomic():
+            self.filter(id=user_profile.id).update(is_hidden=True)
+            Album.objects.filter(user_profile_id=user_profile.id).update(is_hidden=True)
+            Log.objects.hide_logs(Log.objects.filter(user_profile_id=user_profile.id))
+            user.is_active = False
+            user.set_unusable_password()
+            user.save()
+
+    @staticmethod
+    def attach_travel_overlap(user_profiles, current_user_profile):
+        """
+        Attaches the number of cities and countries each user profile has in common with the current user. The
+        visited bitsets are already loaded with each user profile, so no queries are made.
+        :param user_profiles: list of user profiles
+        :param current_user_profile: user profile to compare against, can be None
+        :return: list of user profiles, common_city_count and common_country_count have been attached to each
+        """
+        current_city_bitset = 0
+        current_country_bitset = 0
+        if current_user_profile is not None:
+            current_city_bitset = current_user_profile.get_visited_city_bitset()
+            current_country_bitset = current_user_profile.get_visited_country_bitset()
+        for user_profile in user_profiles:
+            user_profile.common_city_count = count_common_bits(current_city_bitset,
+                                                               user_profile.get_visited_city_bitset())
+            user_profile.common_country_count = count_common_bits(current_country_bitset,
+                                                                  user_profile.get_visited_country_bitset())
+        return user_profiles
+
+    def add_distance_travelled(self, user_profile_id, distance):
+        self.filter(id=user_profile_id).update(distance_travelled=F('distance_travelled') + distance)
+
+    def update_distance_travelled(self, user_profile_ids=None):
+        """
+        Recomputes the distance travelled by the provided users (or by all users if none are provided) from
+        their logs. The coordinates of all logs are loaded as arrays sorted by user and then by creation time,
+        so that the distances of all users are computed in a single vectorized pass.
+        :param user_profile_ids: list of user profile ids, or None to update all user profiles
+        """
+        # imported inside method to prevent circular dependencies
+        from mytravelog.models.log import Log
+
+        user_profiles = self.all()
+        logs = Log.objects.all()
+        if user_profile_ids is not None:
+            user_profiles = user_profiles.filter(id__in=user_profile_ids)
+            logs = logs.filter(user_profile_id__in=user_profile_ids)
+        path = np.array(list(logs.order_by('user_profile_id', 'created_at', 'id')
+                             .values_list('user_profile_id', 'latitude', 'longitude')), dtype=np.float64)
+        path = path.reshape(-1, 3)
+        ids, distances = get_path_distances(path[:, 0], path[:, 1], path[:, 2])
+
+        with transaction.atomic():
+            # users without any logs have not travelled at all
+            user_profiles.update(distance_travelled=0)
+            for user_profile_id, distance in zip(ids.tolist(), distances.tolist()):
+                self.filter(id=user_profile_id).update(distance_travelled=round(distance, 3))
 
 
 class UserProfile(models.Model):
@@ -12,25 +95,59 @@ class UserProfile(models.Model):
     city_count = models.IntegerField(max_length=10, null=False, default=0)
     country_count = models.IntegerField(max_length=10, null=False, default=0)
     rank = models.IntegerField(max_length=10, null=False, default=-1)
-    profile_picture = models.ImageField(upload_to='mytravelog/profile_pictures', blank=True, default='/media/mytravelog/profile_pictures/default_profile_picture.png')
-    cover_picture = models.ImageField(upload_to='mytravelog/cover_pictures', blank=True, default='/media/mytravelog/cover_pictures/default_cover_picture.png')
+    influence = models.FloatField(null=False, default=0)
+    # total distance in km between the user's logs in chronological order, kept up to date whenever logs are posted
+    distance_travelled = models.FloatField(null=False, default=0)
+    # bitsets where bit i is set if the user has logs in the city/country with id i, kept up to date by CityVisit
+    visited_city_bitset = models.BinaryField(null=False, default=b'')
+    visited_country_bitset = models.BinaryField(null=False, default=b'')
+    profile_picture = models.ImageField(upload_to='mytravelog/profile_pictures', storage=picture_storage, blank=True, default='/media/mytravelog/profile_pictures/default_profile_picture.png')
+    cover_picture = models.ImageField(upload_to='mytravelog/cover_pictures', storage=picture_storage, blank=True, default='/media/mytravelog/cover_pictures/default_cover_picture.png')
+    # intrinsic width of the profile picture, set once its derivatives are created
+    profile_picture_width = models.IntegerField(null=False, default=0)
+    # intrinsic size and placeholder of the cover picture (see get_picture_info), set once its derivatives are created
+    cover_picture_width = models.IntegerField(null=False, default=0)
+    cover_picture_height = models.IntegerField(null=False, default=0)
+    cover_picture_placeholder = models.TextField(null=False, blank=True, default='')
+    # set when the account is removed, until it is purged in the background
+    is_hidden = models.BooleanField(null=False, default=False, db_index=True)
+
+    # Managers
+    objects = UserProfileManager()
+    # includes hidden user profiles
+    all_objects = models.Manager()
 
     def __unicode__(self):
         return self.user.username
 
+    def get_visited_city_bitset(self):
+        return bytes_to_bitset(self.visited_city_bitset)
+
+    def get_visited_country_bitset(self):
+        return bytes_to_bitset(self.visited_country_bitset)
+
+    def get_travel_overlap(self, other_user_profile):
+        """
+        Returns the number of cities and countries both users have logs in.
+        """
+        return {
+            'city_count': count_common_bits(self.get_visited_city_bitset(),
+                                            other_user_profile.get_visited_city_bitset()),
+            'country_count': count_common_bits(self.get_visited_country_bitset(),
+                                               other_user_profile.get_visited_country_bitset())
+        }
+
     def update_user_travel_stats(self):
+        # city and country counts are kept up to date by CityVisit whenever a log is created,
+        # edited or deleted, so this is only needed to repair them from the user's logs
         # imported inside method to prevent circular dependencies
-        from mytravelog.models.log import Log
+        from mytravelog.models.city_visit import CityVisit
 
-        city_set = set()
-        country_set = set()
-        all_user_logs = Log.objects.get_user_logs(self)
-        for log in all_user_logs:
-            city_set.add(log.city.id)
-            country_set.add(log.city.country_name)
-        self.city_count = len(city_set)
-        self.country_count = len(country_set)
-        self.save()
+        CityVisit.objects.rebuild_user_visits(self)
+        visited_cities = CityVisit.objects.get_visited_cities(self)
+        self.city_count = visited_cities.count()
+        self.country_count = visited_cities.values('country').distinct().count()
+        self.save(update_fields=['city_count', 'country_count'])
 
     def compute_and_get_user_score(self):
         # imported inside method to prevent circular dependencies
@@ -67,18 +184,39 @@ class UserProfile(models.Model):
         follower_count = Follower.objects.get_follower_count(self)
 
         # finally, compute user score
-        score = sum_city_ranks + 2*log_count + 0.5*comment_count + 0.5*like_count + follower_count
+        # influence is the follower-graph PageRank computed by the update_user_influence script, so that followers
+        # who are themselves followed count for more than followers from accounts nobody follows
+        influence_weight = getattr(settings, 'USER_INFLUENCE_WEIGHT', 0)
+        score = sum_city_ranks + 2*log_count + 0.5*comment_count + 0.5*like_count + follower_count + \
+            influence_weight*self.influence
         return round(score, 5)
 
 
-# auto delete non-default file when imagefield is deleted
-from django.db.models.signals import post_delete
+# auto delete non-default files when imagefields are deleted or changed (unless other pictures share them), and create
+# or delete the resized derivatives of the pictures
+from django.db.models.signals import post_init, post_save, post_delete
 from django.dispatch.dispatcher import receiver
 
 @receiver(post_delete, sender=UserProfile)
 def auto_delete_file(sender, instance, **kwargs):
-    # Pass false so ImageField doesn't save the model.
-    if os.path.basename(instance.profile_picture.name) != 'default_profile_picture.png':
-        instance.profile_picture.delete(False)
-    if os.path.basename(instance.cover_picture.name) != 'default_cover_picture.png':
-        instance.cover_picture.delete(False)
\ No newline at end of file
+    for picture in [instance.profile_picture, instance.cover_picture]:
+        delete_picture(picture)
+
+
+@receiver(post_init, sender=UserProfile)
+def remember_loaded_pictures(sender, instance, **kwargs):
+    instance.loaded_picture_names = (instance.profile_picture.name, instance.cover_picture.name)
+
+
+@receiver(post_save, sender=UserProfile)
+def update_picture_derivatives(sender, instance, **kwargs):
+    for picture, loaded_name in zip([instance.profile_picture, instance.cover_picture], instance.loaded_picture_names):
+        if picture.name != loaded_name:
+            delete_picture(picture, loaded_name)
+            picture_info = create_derivatives(picture) or MISSING_PICTURE_INFO
+            # profile pictures are only shown small, so only cover pictures have placeholders
+            picture_info_fields = get_picture_info_fields(picture.field.name, picture_info)
+            UserProfile.objects.filter(id=instance.id).update(**picture_info_fields)
+            for field_name, value in picture_info_fields.items():
+                setattr(instance, field_name, value)
+    instance.loaded_picture_names = (instance.profile_picture.name, instance.cover_picture.name)
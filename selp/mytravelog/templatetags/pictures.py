@@ -0,0 +1,32 @@
+from django import template
+
+from mytravelog.utils.derivatives import get_derivative_url
+
+
+__author__ = 'Manas'
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def picture_url(context, picture, width):
+    """
+    Returns the url of the smallest derivative of the picture (an ImageField file) that is at least
+    width pixels wide, in WebP if the browser accepts it, e.g. {% picture_url log_picture.picture 800 %}
+    """
+    request = context.get('request', None)
+    accepts_webp = request is not None and 'image/webp' in request.META.get('HTTP_ACCEPT', '')
+    return get_derivative_url(picture, int(width), accepts_webp)
+
+
+@register.simple_tag(takes_context=True)
+def picture_background(context, picture, width, placeholder=''):
+    """
+    Returns the background-image value of the picture (see picture_url), layered on top of its placeholder
+    if it has one, so that the placeholder is shown until the picture is loaded, e.g.
+    style="background-image: {% picture_background log_picture.picture 400 log_picture.placeholder %}"
+    """
+    background = "url('" + picture_url(context, picture, width) + "')"
+    if placeholder:
+        background += ", url('" + placeholder + "')"
+    return background
@@ -1,32 +1,91 @@
+import base64
+import calendar
+import datetime
+from io import BytesIO
 import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
 
+from PIL import Image
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile, File
 from django.core.urlresolvers import resolve
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction, IntegrityError
+from django.db.models import Sum
 from django.http.request import HttpRequest
 from django.http.response import Http404
+from django.template.base import Template
+from django.template.context import Context
 from django.template.loader import render_to_string
 from django.test import TestCase
+from django.test.utils import override_settings, CaptureQueriesContext
+from django.utils import timezone
 
 from mytravelog.models.album import Album
+from mytravelog.models.chunked_upload import ChunkedUpload, UPLOADING, FINALIZED, FAILED
 from mytravelog.models.city import City
+from mytravelog.models.city_visit import CityVisit
 from mytravelog.models.comment import Comment
+from mytravelog.models.country import Country
 from mytravelog.models.follower import Follower
+from mytravelog.models.grid_cell_rollup import GridCellRollup, MIN_CLUSTER_LEVEL, MAX_CLUSTER_LEVEL
+from mytravelog.models.heatmap_tile import HeatmapTile
 from mytravelog.models.like import Like
-from mytravelog.models.log import Log
-from mytravelog.models.log_picture import LogPicture
+from mytravelog.models.log import Log, LOG_GRID_LEVEL, compute_log_score
+from mytravelog.models.log_picture import LogPicture, get_dhash_fields
+from mytravelog.models.media_tombstone import MediaTombstone
+from mytravelog.models.pending_upload import PendingUpload
+from mytravelog.models.stored_blob import StoredBlob
+from mytravelog.models import trip_import
+from mytravelog.models.trip_import import TripImport, MAX_LOG_PICTURES, DONE, FAILED, SAVING, group_photos, \
+    process_trip_import
 from mytravelog.models.user_profile import UserProfile
 from mytravelog.tests import util
-from mytravelog.views.album import show_album, convert_string_to_date, create_album, update_album, delete_album
-from mytravelog.views.city import show_city, get_autocomplete_suggestions
+from mytravelog.utils.bitset import positions_to_bitset, bitset_to_bytes, bytes_to_bitset, count_common_bits
+from mytravelog.utils.exif import read_photo_metadata
+from mytravelog.utils.derivatives import get_derivative_name, get_derivative_url, is_format_supported, \
+    render_derivative, create_derivatives
+from mytravelog.utils.geo import haversine_distance, haversine_distances, get_path_distances, get_grid_cell_id, \
+    get_grid_cell_ranges, to_unit_vector, get_bounding_box
+from mytravelog.utils.heatmap import TILE_SIZE, MAX_HEATMAP_ZOOM, get_tile_path, get_tile_pixels, render_tile, \
+    render_tile_in_pool, read_cached_tile, evict_cached_tiles, get_tiles_drawing_point
+from mytravelog.utils.influence import compute_pagerank
+from mytravelog.utils.kd_tree import KDTree
+from mytravelog.utils.perceptual_hash import compute_dhash, compute_file_dhash, get_hash_bands, \
+    get_hamming_distance, HASH_MASK, MAX_DUPLICATE_DISTANCE
+from mytravelog.utils.media_sweep import find_orphaned_files, reclaim_orphaned_files
+from mytravelog.utils.purge import purge_hidden_objects
+from mytravelog.utils.storage import BLOBS_DIR, get_content_hash, picture_storage
+from mytravelog.utils.upload_limits import UploadLimitHandler, RejectedUpload, get_file_size_error, \
+    get_request_size_error, get_pixel_count_error
+from mytravelog.views.album import show_album, convert_string_to_date, create_album, update_album, delete_album, \
+    get_album_pictures, get_album_logs, ALBUM_PICTURES_PER_PAGE, ALBUM_LOGS_PER_PAGE
+from mytravelog.views.city import show_city, get_autocomplete_suggestions, get_city_logs, CITY_LOGS_PER_PAGE
 from mytravelog.views.comment import create_log_comment, delete_log_comment
 from mytravelog.views.follower import create_follower, delete_follower
+from mytravelog.views.heatmap import show_heatmap_tile, get_tile_points
 from mytravelog.views.home import show_home
 from mytravelog.views.leaderboard import show_leaderboard, get_results
 from mytravelog.views.like import like_log, dislike_log
 from mytravelog.views.live_feed import show_live_feed
-from mytravelog.views.log import create_log, edit_log, delete_log, show_log
+from mytravelog.views.log import create_log, edit_log, delete_log, show_log, get_logs_in_viewport, \
+    get_clusters_in_viewport, get_logs_near_point, NEARBY_RADIUS, NEARBY_LOGS_PER_PAGE, get_upload_status
 from mytravelog.views.search import search_for_cities_and_users, get_search_results
-from mytravelog.views.user import sign_up, sign_in, sign_out, show_user
+from mytravelog.views.trip_import import start_trip_import, get_trip_import_progress
+from mytravelog.views.upload import start_upload, upload_chunk, get_upload_offset, finalize_upload
+from mytravelog.views.user import sign_up, sign_in, sign_out, show_user, delete_account, get_user_logs, get_user_tab, \
+    USER_LOGS_PER_PAGE
+from create_picture_placeholders import create_picture_placeholders
+from update_log_cities import update_log_cities
+from update_user_distances import update_user_distances
+from update_user_influence import update_user_influence
 
 
 class HomeTest(TestCase):
@@ -71,9 +130,65 @@ class CityTest(TestCase):
         expected_html = render_to_string('mytravelog/city.html', {'requested_city': sample_city,
                                                                   'csrf_token': self.client.cookies['csrftoken'].value,
                                                                   'requested_city_logs': [],
-                                                                  'current_user_albums': []})
+                                                                  'current_user_albums': [],
+                                                                  'nearby_radius': NEARBY_RADIUS})
         self.assertEqual(response.content.decode(), expected_html)
 
+    def test_city_logs_are_paginated(self):
+        found = resolve(util.urls['city_base'] + 'Test/logs/')
+        self.assertEqual(found.func, get_city_logs)
+
+        # top logs are cached across tests, and city ids are reused
+        cache.clear()
+        util.add_sample_city(util.city1_sample_data)
+        util.add_sample_user_and_user_profile(util.user1_sample_data)
+        city = City.objects.get(name=util.city1_sample_data['name'])
+        user_profile = util.get_user_and_user_profile(util.user1_sample_data)['user_profile']
+
+        # add more logs than fit in a page, some of which have the same score
+        Log.objects.bulk_create([Log(user_profile=user_profile, city=city, latitude=0, longitude=0, description=str(i),
+                                     score=i / 2) for i in range(CITY_LOGS_PER_PAGE + 4)])
+        log_ids = list(Log.objects.order_by('-score', '-id').values_list('id', flat=True))
+
+        # only the first page is rendered with the city page, highest score first
+        url = util.urls['city_base'] + city.url_name + '/'
+        response = self.client.get(url)
+        self.assertEqual([city_log.id for city_log in response.context['requested_city_logs']],
+                         log_ids[:CITY_LOGS_PER_PAGE])
+        last_log = Log.objects.get(id=log_ids[CITY_LOGS_PER_PAGE - 1])
+        self.assertEqual(response.context['next_logs_cursor'], str(last_log.score) + '_' + str(last_log.id))
+        self.assertContains(response, 'logs-next-page')
+
+        # the next page starts after the cursor, and is the last one
+        response = self.client.get(url + 'logs/', {'before': response.context['next_logs_cursor']},
+                                   HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual([city_log.id for city_log in response.context['requested_user_logs']],
+                         log_ids[CITY_LOGS_PER_PAGE:])
+        self.assertIsNone(response.context['next_logs_cursor'])
+        self.assertNotIn('logs-next-page', response.content)
+
+        # the top logs are cached, until the score of a log changes
+        Log.objects.filter(id=log_ids[-1]).update(score=100)
+        response = self.client.get(url)
+        self.assertEqual(response.context['requested_city_logs'][0].id, log_ids[0])
+        log = Log.objects.get(id=log_ids[-2])
+        log.score = 200
+        log.save()
+        response = self.client.get(url)
+        self.assertEqual([city_log.id for city_log in response.context['requested_city_logs']][:3],
+                         [log_ids[-2], log_ids[-1], log_ids[0]])
+
+        # hidden logs are left out of the top logs
+        Log.objects.hide_log(log)
+        response = self.client.get(url)
+        self.assertEqual(response.context['requested_city_logs'][0].id, log_ids[-1])
+
+        # invalid cursors or non ajax requests raise 404 error
+        for cursor in ['', '1', 'a_1', 'NaN_1', '1_a']:
+            self.assertEqual(self.client.get(url + 'logs/', {'before': cursor},
+                                             HTTP_X_REQUESTED_WITH='XMLHttpRequest').status_code, 404)
+        self.assertEqual(self.client.get(url + 'logs/', {'before': '1_1'}).status_code, 404)
+
     def test_saving_ranking_and_retrieving_cities(self):
         util.add_sample_city(util.city1_sample_data)
         util.add_sample_city(util.city2_sample_data)
@@ -95,6 +210,35 @@ class CityTest(TestCase):
         # city2 gets a lower rank than city1 since its tourist count is greater
         self.assertLess(city2.rank, city1.rank)
 
+    def test_get_nearest_city(self):
+        # no cities with coordinates exist yet
+        self.assertIsNone(City.objects.get_nearest_city(55.95, -3.19))
+
+        util.add_sample_city(util.city1_sample_data)
+        for name, latitude, longitude in [('Edinburgh', 55.9533, -3.1883), ('Glasgow', 55.8642, -4.2518),
+                                          ('Labasa', -16.4167, 179.3833), ('Apia', -13.8506, -171.7513)]:
+            util.add_sample_city({'name': name, 'country_name': name, 'tourist_count': 1, 'tourist_growth': 1,
+                                  'description': name, 'latitude': latitude, 'longitude': longitude})
+
+        # cities are found from coordinates near their centre, even across the antimeridian
+        self.assertEqual(City.objects.get_nearest_city(55.94, -3.21).name, 'Edinburgh')
+        self.assertEqual(City.objects.get_nearest_city(55.87, -4.3).name, 'Glasgow')
+        self.assertEqual(City.objects.get_nearest_city(-16.4, -179.9).name, 'Labasa')
+        # but not beyond the radius
+        self.assertIsNone(City.objects.get_nearest_city(0, 0))
+        self.assertEqual(City.objects.get_nearest_city(0, 0, max_distance=20000).name, 'Glasgow')
+
+        # the k-d tree finds the same city as comparing the distance to every city
+        tree = KDTree([to_unit_vector(latitude, longitude) for latitude, longitude in [(0, 0), (10, 10), (-10, 170)]],
+                      ['a', 'b', 'c'])
+        for latitude in range(-80, 81, 20):
+            for longitude in range(-180, 180, 30):
+                distances = [(haversine_distance(latitude, longitude, 0, 0), 'a'),
+                             (haversine_distance(latitude, longitude, 10, 10), 'b'),
+                             (haversine_distance(latitude, longitude, -10, 170), 'c')]
+                self.assertEqual(tree.get_nearest(to_unit_vector(latitude, longitude))[0], min(distances)[1])
+        self.assertEqual(KDTree([], []).get_nearest((0, 0, 1)), (None, None))
+
     def test_autocomplete_city_name_suggestions(self):
         # non ajax request raises 404 error
         self.assertRaises(Http404, get_autocomplete_suggestions, HttpRequest())
@@ -342,6 +486,9 @@ class AlbumTest(TestCase):
         util.add_sample_album(util.album1_sample_data, util.user1_sample_data)
         self.album = util.get_album(util.album1_sample_data, util.user1_sample_data)
 
+    def tearDown(self):
+        util.delete_all_test_image_files()
+
     def test_album_page_url_resolves_to_correct_function(self):
         found = resolve(util.urls['album_show_base'] + '0/')
         self.assertEqual(found.func, show_album)
@@ -447,13 +594,140 @@ class AlbumTest(TestCase):
         self.assertTrue(is_successful)
 
         # as the user is now authenticated, album should be deleted successfully
-        self.client.post(util.urls['album_update_base'] + str(self.album.id) + '/',
-                         data=util.album2_sample_data,
+        self.client.post(util.urls['album_delete_base'] + str(self.album.id) + '/',
                          HTTP_X_REQUESTED_WITH='XMLHttpRequest')
 
-        # check if album was actually deleted
+        # check if album was actually deleted, it is hidden right away and purged later on
         self.assertEqual(len(Album.objects.filter(name=util.album1_sample_data['name'],
                                                   user_profile__user__username=util.user1_sample_data['username'])), 0)
+        self.assertEqual(len(Album.all_objects.filter(id=self.album.id)), 1)
+
+        # the name of the deleted album can be used again before it is purged
+        response = self.client.post(util.urls['album_create'], data=util.album1_sample_data,
+                                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertNotIn('error', json.loads(response.content))
+        self.assertEqual(Album.objects.get(user_profile__user__username=util.user1_sample_data['username']).name,
+                         util.album1_sample_data['name'])
+        self.assertEqual(Album.all_objects.get(id=self.album.id).name,
+                         util.album1_sample_data['name'] + ' (deleted ' + str(self.album.id) + ')')
+        purge_hidden_objects()
+        self.assertEqual(len(Album.all_objects.filter(id=self.album.id)), 0)
+
+    def test_album_stats_are_kept_up_to_date(self):
+        self.assertEqual(self.album.duration, (self.album.end_date - self.album.start_date).days)
+        self.album.end_date = self.album.start_date + datetime.timedelta(days=3)
+        self.album.save()
+        self.assertEqual(Album.objects.get(id=self.album.id).duration, 3)
+
+        # each sample log has a picture
+        util.add_sample_city(util.city1_sample_data)
+        util.add_sample_city(util.city2_sample_data)
+        util.add_sample_log(util.log1_sample_data, util.album1_sample_data, util.city1_sample_data,
+                            util.user1_sample_data)
+        util.add_sample_log(util.log2_sample_data, util.album1_sample_data, util.city1_sample_data,
+                            util.user1_sample_data)
+        album = Album.objects.get(id=self.album.id)
+        self.assertEqual((album.log_count, album.picture_count, album.city_count), (2, 2, 1))
+
+        # moving a log to another city, and removing a picture, update the stats
+        log = Log.objects.get(description=util.log2_sample_data['description'])
+        log.city = City.objects.get(name=util.city2_sample_data['name'])
+        log.save()
+        LogPicture.objects.delete_log_pictures(log, LogPicture.objects.filter(log=log).values_list('id', flat=True))
+        album = Album.objects.get(id=self.album.id)
+        self.assertEqual((album.log_count, album.picture_count, album.city_count), (2, 1, 2))
+
+        # logs that are moved out of the album or hidden are no longer counted
+        log.album = None
+        log.save()
+        album = Album.objects.get(id=self.album.id)
+        self.assertEqual((album.log_count, album.picture_count, album.city_count), (1, 1, 1))
+        Log.objects.hide_log(Log.objects.get(description=util.log1_sample_data['description']))
+        album = Album.objects.get(id=self.album.id)
+        self.assertEqual((album.log_count, album.picture_count, album.city_count), (0, 0, 0))
+
+    def test_album_pictures_are_paginated(self):
+        found = resolve(util.urls['album_get_pictures_base'] + '0/')
+        self.assertEqual(found.func, get_album_pictures)
+
+        # the pictures share the file of the picture of the sample log, without creating their derivatives again
+        util.add_sample_city(util.city1_sample_data)
+        util.add_sample_log(util.log1_sample_data, util.album1_sample_data, util.city1_sample_data,
+                            util.user1_sample_data)
+        log_picture = LogPicture.objects.get()
+        LogPicture.objects.bulk_create([LogPicture(log=log_picture.log, picture=log_picture.picture.name)
+                                        for i in range(ALBUM_PICTURES_PER_PAGE + 5)])
+        picture_ids = list(LogPicture.objects.order_by('-id').values_list('id', flat=True))
+
+        # only the first page is rendered with the album page
+        response = self.client.get(util.urls['album_show_base'] + str(self.album.id) + '/')
+        self.assertEqual(response.context['album_pictures'], list(LogPicture.objects.filter(
+            id__in=picture_ids[:ALBUM_PICTURES_PER_PAGE]).order_by('-id')))
+        self.assertEqual(response.context['next_cursor'], picture_ids[ALBUM_PICTURES_PER_PAGE - 1])
+        self.assertContains(response, 'album-pictures-more-button')
+
+        # the next page starts after the cursor, and is the last one
+        url = util.urls['album_get_pictures_base'] + str(self.album.id) + '/'
+        response = self.client.get(url, {'before': response.context['next_cursor']},
+                                   HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual([picture.id for picture in response.context['album_pictures']],
+                         picture_ids[ALBUM_PICTURES_PER_PAGE:])
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertEqual(response.content.count('class="album-picture"'), 6)
+        self.assertNotIn('album-pictures-next-page', response.content)
+
+        # pictures of hidden logs are left out, and invalid cursors or non ajax requests raise 404 error
+        Log.objects.hide_log(log_picture.log)
+        response = self.client.get(url, {'before': picture_ids[0] + 1}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(list(response.context['album_pictures']), [])
+        self.assertEqual(self.client.get(url, {'before': 'a'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest').status_code,
+                         404)
+        self.assertEqual(self.client.get(url, {'before': 1}).status_code, 404)
+
+    def test_album_logs_are_paginated(self):
+        found = resolve(util.urls['album_get_logs_base'] + '0/')
+        self.assertEqual(found.func, get_album_logs)
+
+        # add more logs than fit in a page, some of which are posted at the same time
+        util.add_sample_city(util.city1_sample_data)
+        util.add_sample_log(util.log1_sample_data, util.album1_sample_data, util.city1_sample_data,
+                            util.user1_sample_data)
+        log = Log.objects.get()
+        created_at = log.created_at - datetime.timedelta(days=1)
+        Log.objects.bulk_create([Log(user_profile=log.user_profile, album=self.album, city=log.city,
+                                     latitude=log.latitude, longitude=log.longitude, description=str(i), score=0,
+                                     created_at=created_at - datetime.timedelta(hours=i / 2))
+                                 for i in range(ALBUM_LOGS_PER_PAGE + 4)])
+        log_ids = list(Log.objects.filter(album=self.album).order_by('-created_at', '-id').values_list('id', flat=True))
+
+        # only the first page is rendered with the album page
+        response = self.client.get(util.urls['album_show_base'] + str(self.album.id) + '/')
+        self.assertEqual([album_log.id for album_log in response.context['requested_album_logs']],
+                         log_ids[:ALBUM_LOGS_PER_PAGE])
+        self.assertEqual(response.context['next_logs_cursor'], log_ids[ALBUM_LOGS_PER_PAGE - 1])
+        self.assertContains(response, 'logs-next-page')
+        self.assertEqual(len(response.context['requested_album_logs'][0].pictures), 1)
+
+        # the next page starts after the cursor, and is the last one
+        url = util.urls['album_get_logs_base'] + str(self.album.id) + '/'
+        response = self.client.get(url, {'before': response.context['next_logs_cursor']},
+                                   HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual([album_log.id for album_log in response.context['requested_user_logs']],
+                         log_ids[ALBUM_LOGS_PER_PAGE:])
+        self.assertIsNone(response.context['next_logs_cursor'])
+        self.assertNotIn('logs-next-page', response.content)
+
+        # the page after a hidden log is still found, and invalid cursors or non ajax requests raise 404 error
+        Log.objects.hide_log(Log.objects.get(id=log_ids[ALBUM_LOGS_PER_PAGE - 1]))
+        response = self.client.get(url, {'before': log_ids[ALBUM_LOGS_PER_PAGE - 1]},
+                                   HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual([album_log.id for album_log in response.context['requested_user_logs']],
+                         log_ids[ALBUM_LOGS_PER_PAGE:])
+        self.assertEqual(self.client.get(url, {'before': 'a'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest').status_code,
+                         404)
+        self.assertEqual(self.client.get(url, {'before': log_ids[0] + 1000},
+                                         HTTP_X_REQUESTED_WITH='XMLHttpRequest').status_code, 404)
+        self.assertEqual(self.client.get(url, {'before': log_ids[0]}).status_code, 404)
 
     def test_album_form_validation(self):
         # first delete album created in setUp
@@ -521,6 +795,10 @@ class AlbumTest(TestCase):
 class LogTest(TestCase):
 
     def setUp(self):
+        # uploads are processed within the request, since the test database can't be shared with other threads
+        self.spool_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(UPLOAD_SPOOL_DIR=self.spool_dir, UPLOAD_PROCESSING_THREADS=0)
+        self.settings_override.enable()
         # log data to be used for log creation
         self.log_sample_data = util.log1_sample_data
         self.log_sample_data['log_picture_1'] = util.get_small_image()
@@ -528,6 +806,8 @@ class LogTest(TestCase):
         self.log_sample_data['album_name'] = util.album1_sample_data['name']
 
     def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.spool_dir)
         util.delete_all_test_image_files()
 
     def test_create_log_url_resolves_to_correct_function(self):
@@ -657,6 +937,71 @@ class LogTest(TestCase):
         self.assertEqual(updated_log.description, log_sample_data['description'])
         self.assertEqual(updated_log.user_profile.user.username, util.user1_sample_data['username'])
 
+    def test_edit_log_deletes_and_adds_pictures_in_bulk(self):
+        util.add_sample_city(util.city1_sample_data)
+        util.add_sample_user_and_user_profile(util.user1_sample_data)
+        util.add_sample_album(util.album1_sample_data, util.user1_sample_data)
+        util.add_sample_log(util.log1_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        util.add_sample_log(util.log2_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        log = Log.objects.get(description=util.log1_sample_data['description'])
+        other_log = Log.objects.get(description=util.log2_sample_data['description'])
+        for i in range(2):
+            LogPicture.objects.create(log=log, picture=ContentFile(util.get_jpeg_data(10, 10, (100 * i, 0, 0)), 'other.jpg'))
+        log_picture_ids = list(LogPicture.objects.filter(log=log).order_by('id').values_list('id', flat=True))
+        other_log_picture = LogPicture.objects.get(log=other_log)
+
+        # only the pictures of the edited log are deleted, even if pictures of other logs are requested
+        self.client.login(username=util.user1_sample_data['username'], password=util.user1_sample_data['password'])
+        images_to_delete = ', '.join(str(picture_id) for picture_id in log_picture_ids[1:] + [other_log_picture.id])
+        response = self.client.post(util.urls['log_update_base'] + str(log.id) + '/',
+                                    data={'description': 'desc', 'album_name': 'None',
+                                          'images_to_delete': images_to_delete + ', ',
+                                          'log_picture_1': util.get_small_image()},
+                                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertNotIn('error', json.loads(response.content))
+        self.assertEqual(len(LogPicture.objects.filter(log=log)), 2)
+        self.assertEqual(len(LogPicture.objects.filter(id=log_picture_ids[0])), 1)
+        self.assertEqual(len(LogPicture.objects.filter(id=other_log_picture.id)), 1)
+        self.assertEqual(len(MediaTombstone.objects.all()), 2)
+
+        # the number of queries doesn't depend on the number of deleted and added pictures
+        query_counts = []
+        for picture_count in [1, 3]:
+            for i in range(picture_count):
+                LogPicture.objects.create(log=other_log,
+                                          picture=ContentFile(util.get_jpeg_data(10, 10, (0, 100 * i, 0)), 'other.jpg'))
+            delete_picture_ids = LogPicture.objects.filter(log=other_log).exclude(id=other_log_picture.id)\
+                .values_list('id', flat=True)
+            uploaded_files = [SimpleUploadedFile('picture.jpg', util.get_jpeg_data(10, 10, (0, 0, 100 * i)))
+                              for i in range(picture_count)]
+            spool_paths = PendingUpload.objects.spool_files(uploaded_files)
+            with CaptureQueriesContext(connection) as captured_queries:
+                with transaction.atomic():
+                    self.assertEqual(LogPicture.objects.delete_log_pictures(other_log, list(delete_picture_ids)),
+                                     picture_count)
+                    pending_upload_ids = PendingUpload.objects.spool_uploads(other_log, uploaded_files, spool_paths)
+            self.assertEqual(len(pending_upload_ids), picture_count)
+            query_counts.append(len(captured_queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+        MediaTombstone.objects.collect_garbage()
+
+    def test_update_log_view_deletes_spooled_pictures_on_failure(self):
+        util.add_sample_city(util.city1_sample_data)
+        util.add_sample_user_and_user_profile(util.user1_sample_data)
+        util.add_sample_album(util.album1_sample_data, util.user1_sample_data)
+        util.add_sample_log(util.log2_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        log = Log.objects.all()[0]
+        self.client.login(username=util.user1_sample_data['username'], password=util.user1_sample_data['password'])
+
+        # the transaction fails after the picture was written to the spool directory
+        with self.assertRaises(Album.DoesNotExist):
+            self.client.post(util.urls['log_update_base'] + str(log.id) + '/',
+                             data={'album_name': 'missing', 'description': 'desc', 'images_to_delete': '',
+                                   'log_picture_1': util.get_small_image()},
+                             HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(os.listdir(self.spool_dir), [])
+        self.assertEqual(len(PendingUpload.objects.all()), 0)
+
     def test_delete_log_view(self):
         # first we need to create a log since update_log view needs a log id
         util.add_sample_city(util.city1_sample_data)
@@ -687,9 +1032,17 @@ class LogTest(TestCase):
                          data=self.log_sample_data,
                          HTTP_X_REQUESTED_WITH='XMLHttpRequest')
 
+        # the log is hidden right away, and purged along with its picture later on
         self.assertEqual(len(Log.objects.all()), 0)
+        self.assertEqual(len(Log.all_objects.all()), 1)
+        purge_hidden_objects()
+        self.assertEqual(len(Log.all_objects.all()), 0)
+        self.assertEqual(len(LogPicture.objects.all()), 0)
 
     def test_get_log_info_for_map_view(self):
+        # map info is cached across tests, and user profile ids are reused
+        cache.clear()
+
         # first we need to create a log since get_log_info_for_map returns all logs for a particular user
         util.add_sample_city(util.city1_sample_data)
         util.add_sample_user_and_user_profile(util.user1_sample_data)
@@ -707,12 +1060,362 @@ class LogTest(TestCase):
         response = self.client.get(util.urls['log_get_info_for_map_base'] + user.username + '/',
                                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
         log = Log.objects.all()[0]
-        response_dict = json.loads(response.content)['user_logs_info'][str(log.id)]
-        self.assertEqual(response_dict['city'], log.city.name)
-        self.assertEqual(response_dict['date_and_time'], str(log.created_at))
-        self.assertEqual(response_dict['latitude'], str(log.latitude))
-        self.assertEqual(response_dict['longitude'], str(log.longitude))
-        self.assertEqual(response_dict['url'], '/mytravelog/log/' + str(log.id) + '/')
+        response_dict = json.loads(response.content)['user_logs_info']
+        self.assertEqual(response_dict['ids'], [log.id])
+        self.assertEqual(response_dict['latitudes'], [float(log.latitude)])
+        self.assertEqual(response_dict['longitudes'], [float(log.longitude)])
+        self.assertEqual(response_dict['timestamps'], [calendar.timegm(log.created_at.utctimetuple())])
+        self.assertEqual(response_dict['cities'][response_dict['city_indices'][0]], log.city.name)
+
+        # the same response is not sent again if the logs have not changed
+        etag = response['ETag']
+        response = self.client.get(util.urls['log_get_info_for_map_base'] + user.username + '/',
+                                   HTTP_X_REQUESTED_WITH='XMLHttpRequest', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # a new log invalidates the cached info, and logs in the same city share their city name
+        util.add_sample_log(util.log2_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        response = self.client.get(util.urls['log_get_info_for_map_base'] + user.username + '/',
+                                   HTTP_X_REQUESTED_WITH='XMLHttpRequest', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        response_dict = json.loads(response.content)['user_logs_info']
+        self.assertEqual(len(response_dict['ids']), 2)
+        self.assertEqual(response_dict['cities'], [log.city.name])
+        self.assertEqual(response_dict['city_indices'], [0, 0])
+
+        # deleting a log invalidates the cached info as well
+        log.delete()
+        response = self.client.get(util.urls['log_get_info_for_map_base'] + user.username + '/',
+                                   HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertNotIn(log.id, json.loads(response.content)['user_logs_info']['ids'])
+
+    def test_get_logs_in_bbox(self):
+        util.add_sample_city(util.city1_sample_data)
+        util.add_sample_user_and_user_profile(util.user1_sample_data)
+        util.add_sample_album(util.album1_sample_data, util.user1_sample_data)
+        for latitude, longitude in [(0, 0), (26, 54), (-10, 179.5), (-10, -179.5), (89.9, 0)]:
+            log_data = {'latitude': latitude, 'longitude': longitude, 'description': 'desc'}
+            util.add_sample_log(log_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+
+        # each log is indexed by the grid cell containing it
+        log = Log.objects.get(latitude=26, longitude=54)
+        self.assertEqual(log.grid_cell_id, get_grid_cell_id(26, 54, LOG_GRID_LEVEL))
+        self.assertEqual(get_grid_cell_ranges(-1, -1, 1, 1, 1), [(0, 1), (2, 3)])
+        self.assertEqual(get_grid_cell_ranges(-1, 170, 1, -170, 1), [(1, 1), (0, 0), (3, 3), (2, 2)])
+
+        def get_coordinates(logs):
+            return sorted((float(log.latitude), float(log.longitude)) for log in logs)
+
+        # small bounding box
+        self.assertEqual(get_coordinates(Log.objects.get_logs_in_bbox(25, 53, 27, 55)), [(26, 54)])
+        self.assertEqual(len(Log.objects.get_logs_in_bbox(25, 53, 25.9, 55)), 0)
+        # bounding box crossing the antimeridian
+        self.assertEqual(get_coordinates(Log.objects.get_logs_in_bbox(-11, 179, -9, -179)),
+                         [(-10, -179.5), (-10, 179.5)])
+        # bounding box spanning more rows of grid cells than MAX_GRID_CELL_RANGES
+        self.assertEqual(get_coordinates(Log.objects.get_logs_in_bbox(-90, -1, 90, 1)), [(0, 0), (89.9, 0)])
+        self.assertEqual(len(Log.objects.get_logs_in_bbox(-90, -180, 90, 180)), 5)
+
+        # moving a log updates its grid cell
+        log.latitude = -26
+        log.save()
+        self.assertEqual(len(Log.objects.get_logs_in_bbox(25, 53, 27, 55)), 0)
+        self.assertEqual(len(Log.objects.get_logs_in_bbox(-27, 53, -25, 55)), 1)
+
+    def test_get_logs_in_viewport_view(self):
+        found = resolve(util.urls['log_get_logs_in_viewport'])
+        self.assertEqual(found.func, get_logs_in_viewport)
+
+        util.add_sample_city(util.city1_sample_data)
+        util.add_sample_user_and_user_profile(util.user1_sample_data)
+        util.add_sample_album(util.album1_sample_data, util.user1_sample_data)
+        util.add_sample_log(util.log1_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        util.add_sample_log(util.log2_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        Log.objects.filter(latitude=util.log1_sample_data['latitude']).update(score=10)
+        bbox = {'min_latitude': -30, 'min_longitude': -60, 'max_latitude': 30, 'max_longitude': 60}
+
+        # non ajax request raises 404 error
+        response = self.client.get(util.urls['log_get_logs_in_viewport'], bbox)
+        self.assertEqual(response.status_code, 404)
+
+        # logs are ordered by decreasing score
+        response = self.client.get(util.urls['log_get_logs_in_viewport'], bbox, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        logs_info = json.loads(response.content)['logs_info']
+        self.assertEqual([log_info['latitude'] for log_info in logs_info],
+                         [util.log1_sample_data['latitude'], util.log2_sample_data['latitude']])
+        self.assertEqual(logs_info[0]['city'], util.city1_sample_data['name'])
+
+        # missing or invalid coordinates raise 404 error
+        for key, value in [('min_latitude', ''), ('max_latitude', -40), ('max_longitude', 200)]:
+            invalid_bbox = dict(bbox)
+            invalid_bbox[key] = value
+            response = self.client.get(util.urls['log_get_logs_in_viewport'], invalid_bbox,
+                                       HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            self.assertEqual(response.status_code, 404)
+
+    def test_grid_cell_rollups(self):
+        util.add_sample_city(util.city1_sample_data)
+        util.add_sample_user_and_user_profile(util.user1_sample_data)
+        util.add_sample_album(util.album1_sample_data, util.user1_sample_data)
+        for latitude, longitude in [(10, 10), (12, 12), (-40, -100)]:
+            log_data = {'latitude': latitude, 'longitude': longitude, 'description': 'desc'}
+            util.add_sample_log(log_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        log_1 = Log.objects.get(latitude=10)
+        log_2 = Log.objects.get(latitude=12)
+
+        def get_clusters(level):
+            return sorted((rollup.log_count, rollup.get_centroid(), rollup.top_log_id)
+                          for rollup in GridCellRollup.objects.get_clusters_in_bbox(-90, -180, 90, 180, level))
+
+        # each log is rolled up at every level, but both nearby logs share their cells at levels 2 and 3
+        level_count = MAX_CLUSTER_LEVEL - MIN_CLUSTER_LEVEL + 1
+        self.assertEqual(len(GridCellRollup.objects.all()), 3 * level_count - 2)
+        clusters = get_clusters(MIN_CLUSTER_LEVEL)
+        self.assertEqual(clusters[1][0], 2)
+        self.assertEqual(clusters[1][1], (11, 11))
+        self.assertEqual(len(get_clusters(MAX_CLUSTER_LEVEL)), 3)
+
+        # a higher score makes a log the top log of its cells
+        log_1.score = 10
+        log_1.save()
+        self.assertEqual(get_clusters(MIN_CLUSTER_LEVEL)[1][2], log_1.id)
+        log_2.score = 20
+        log_2.save()
+        self.assertEqual(get_clusters(MIN_CLUSTER_LEVEL)[1][2], log_2.id)
+
+        # moving a log moves it to other cells
+        log_1.latitude = 50
+        log_1.save()
+        self.assertEqual([cluster[0] for cluster in get_clusters(MIN_CLUSTER_LEVEL)], [1, 1, 1])
+
+        # deleting the top log picks the next highest scored log in the cell, and empty cells are deleted
+        log_1.latitude = 10
+        log_1.save()
+        log_2.delete()
+        self.assertEqual(get_clusters(MIN_CLUSTER_LEVEL), [(1, (-40, -100), Log.objects.get(latitude=-40).id),
+                                                           (1, (10, 10), log_1.id)])
+        self.assertEqual(len(get_clusters(MAX_CLUSTER_LEVEL)), 2)
+
+        # rebuilding the rollups gives the same clusters
+        clusters = [get_clusters(level) for level in range(MIN_CLUSTER_LEVEL, MAX_CLUSTER_LEVEL + 1)]
+        GridCellRollup.objects.rebuild_rollups()
+        self.assertEqual([get_clusters(level) for level in range(MIN_CLUSTER_LEVEL, MAX_CLUSTER_LEVEL + 1)], clusters)
+
+    def test_get_clusters_in_viewport_view(self):
+        found = resolve(util.urls['log_get_clusters_in_viewport'])
+        self.assertEqual(found.func, get_clusters_in_viewport)
+
+        util.add_sample_city(util.city1_sample_data)
+        util.add_sample_user_and_user_profile(util.user1_sample_data)
+        util.add_sample_album(util.album1_sample_data, util.user1_sample_data)
+        util.add_sample_log(util.log1_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        util.add_sample_log(util.log1_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        util.add_sample_log(util.log2_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        get_data = {'min_latitude': -60, 'min_longitude': -120, 'max_latitude': 60, 'max_longitude': 120, 'zoom': 1}
+
+        # non ajax request raises 404 error
+        response = self.client.get(util.urls['log_get_clusters_in_viewport'], get_data)
+        self.assertEqual(response.status_code, 404)
+
+        # at a low zoom level, logs in the same cell are returned as a single cluster
+        response = self.client.get(util.urls['log_get_clusters_in_viewport'], get_data,
+                                   HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        clusters = json.loads(response.content)['clusters']
+        self.assertEqual([cluster['count'] for cluster in clusters], [2, 1])
+        self.assertEqual((clusters[0]['latitude'], clusters[0]['longitude']),
+                         (util.log1_sample_data['latitude'], util.log1_sample_data['longitude']))
+
+        # at a high zoom level, each log is returned on its own
+        get_data['zoom'] = 15
+        response = self.client.get(util.urls['log_get_clusters_in_viewport'], get_data,
+                                   HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        clusters = json.loads(response.content)['clusters']
+        self.assertEqual([cluster['count'] for cluster in clusters], [1, 1, 1])
+
+        # missing or invalid zoom level raises 404 error
+        for zoom in ['', -1]:
+            get_data['zoom'] = zoom
+            response = self.client.get(util.urls['log_get_clusters_in_viewport'], get_data,
+                                       HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            self.assertEqual(response.status_code, 404)
+
+    def test_get_logs_near(self):
+        util.add_sample_city(util.city1_sample_data)
+        util.add_sample_user_and_user_profile(util.user1_sample_data)
+        util.add_sample_album(util.album1_sample_data, util.user1_sample_data)
+        for latitude, longitude in [(60, 10.08), (60, 10), (60.03, 10), (60, 10.2), (-10, 179.99), (-10, -179.99)]:
+            log_data = {'latitude': latitude, 'longitude': longitude, 'description': 'desc'}
+            util.add_sample_log(log_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+
+        # the bounding box of the circle is wider than radius/cos(latitude) at high latitudes and wraps around
+        min_latitude, min_longitude, max_latitude, max_longitude = get_bounding_box(60, 10, 5)
+        self.assertAlmostEqual(haversine_distance(60, 10, max_latitude, 10), 5, 5)
+        self.assertGreater(max_longitude - 10, 5 / 111.195 / 0.5)
+        self.assertGreater(get_bounding_box(0, 179.99, 5)[1], get_bounding_box(0, 179.99, 5)[3])
+        self.assertEqual(get_bounding_box(89.99, 0, 5)[1::2], (-180, 180))
+
+        # logs within the radius are ordered by distance, and (60, 10.2) is about 11 km away
+        logs, total_count = Log.objects.get_logs_near(60, 10, 5)
+        self.assertEqual(total_count, 3)
+        self.assertEqual([(float(log.latitude), float(log.longitude)) for log in logs],
+                         [(60, 10), (60.03, 10), (60, 10.08)])
+        self.assertEqual(logs[0].distance, 0)
+        self.assertAlmostEqual(logs[2].distance, haversine_distance(60, 10, 60, 10.08))
+        self.assertEqual(Log.objects.get_logs_near(60, 10, 12)[1], 4)
+
+        # results are paginated by distance
+        logs, total_count = Log.objects.get_logs_near(60, 10, 5, 1, 1)
+        self.assertEqual(total_count, 3)
+        self.assertEqual([float(log.latitude) for log in logs], [60.03])
+        self.assertEqual(len(Log.objects.get_logs_near(60, 10, 5, 3, 1)[0]), 0)
+
+        # the circle crosses the antimeridian
+        logs, total_count = Log.objects.get_logs_near(-10, 180, 5)
+        self.assertEqual(total_count, 2)
+        self.assertEqual(len(Log.objects.get_logs_near(0, 0, 5)[0]), 0)
+
+    def test_get_logs_near_point_view(self):
+        found = resolve(util.urls['log_get_logs_near_point'])
+        self.assertEqual(found.func, get_logs_near_point)
+
+        util.add_sample_city(util.city1_sample_data)
+        util.add_sample_user_and_user_profile(util.user1_sample_data)
+        util.add_sample_album(util.album1_sample_data, util.user1_sample_data)
+        for i in range(NEARBY_LOGS_PER_PAGE + 1):
+            log_data = {'latitude': 0, 'longitude': i * 0.001, 'description': 'desc' + str(i)}
+            util.add_sample_log(log_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        get_data = {'latitude': 0, 'longitude': 0}
+
+        # non ajax request raises 404 error
+        response = self.client.get(util.urls['log_get_logs_near_point'], get_data)
+        self.assertEqual(response.status_code, 404)
+
+        # the first page holds the nearest logs along with their pictures
+        response = self.client.get(util.urls['log_get_logs_near_point'], get_data,
+                                   HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        response_data = json.loads(response.content)
+        self.assertEqual(response_data['total_count'], NEARBY_LOGS_PER_PAGE + 1)
+        self.assertTrue(response_data['has_next'])
+        logs_info = response_data['logs_info']
+        self.assertEqual([log_info['description'] for log_info in logs_info],
+                         ['desc' + str(i) for i in range(NEARBY_LOGS_PER_PAGE)])
+        self.assertEqual(logs_info[0]['distance'], 0)
+        self.assertEqual(logs_info[0]['picture_url'],
+                         get_derivative_url(LogPicture.objects.get(log_id=logs_info[0]['id']).picture, 200))
+        self.assertEqual(logs_info[0]['username'], util.user1_sample_data['username'])
+
+        # the second page holds the remaining log
+        get_data['page'] = 2
+        response = self.client.get(util.urls['log_get_logs_near_point'], get_data,
+                                   HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        response_data = json.loads(response.content)
+        self.assertFalse(response_data['has_next'])
+        self.assertEqual([log_info['description'] for log_info in response_data['logs_info']],
+                         ['desc' + str(NEARBY_LOGS_PER_PAGE)])
+
+        # missing or invalid values raise 404 error
+        for key, value in [('latitude', ''), ('longitude', 200), ('radius', 1000), ('radius', 0), ('page', 0)]:
+            invalid_get_data = dict(get_data)
+            invalid_get_data[key] = value
+            response = self.client.get(util.urls['log_get_logs_near_point'], invalid_get_data,
+                                       HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            self.assertEqual(response.status_code, 404)
+
+    def test_uploads_are_processed_in_background(self):
+        found = resolve(util.urls['log_get_upload_status_base'] + '0/')
+        self.assertEqual(found.func, get_upload_status)
+
+        util.add_sample_user_and_user_profile(util.user1_sample_data)
+        self.client.login(username=util.user1_sample_data['username'], password=util.user1_sample_data['password'])
+        util.add_sample_city(util.city1_sample_data)
+        util.add_sample_album(util.album1_sample_data, util.user1_sample_data)
+
+        # uploads are staged and then turned into log pictures, which leaves nothing in the spool directory
+        self.client.post(util.urls['log_create'], data=self.log_sample_data, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        log = Log.objects.get()
+        self.assertEqual(len(LogPicture.objects.filter(log=log)), 1)
+        self.assertEqual(len(PendingUpload.objects.all()), 0)
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+        # an upload that hasn't been processed yet is shown as a placeholder
+        spool_path = os.path.join(self.spool_dir, 'staged')
+        shutil.copy(util.small_image_path, spool_path)
+        PendingUpload.objects.create(log=log, file_name='small_image.jpg', spool_path=spool_path)
+        response = self.client.get(util.urls['user_base'] + util.user1_sample_data['username'] + '/')
+        self.assertIn('Processing 1 picture...', response.content)
+        status_url = util.urls['log_get_upload_status_base'] + str(log.id) + '/'
+        response = self.client.get(status_url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(json.loads(response.content)['pending_count'], 1)
+
+        # only the user of the log can follow its uploads, whose errors hold the names of the uploaded files
+        util.add_sample_user_and_user_profile(util.user2_sample_data)
+        self.client.login(username=util.user2_sample_data['username'], password=util.user2_sample_data['password'])
+        response = self.client.get(util.urls['user_base'] + util.user1_sample_data['username'] + '/')
+        self.assertNotIn('Processing 1 picture...', response.content)
+        response = self.client.get(status_url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(json.loads(response.content), {'error': "This log does not belong to you"})
+        self.client.logout()
+        response = self.client.get(status_url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(json.loads(response.content), {'redirect_to': "/mytravelog/sign_in/"})
+        self.client.login(username=util.user1_sample_data['username'], password=util.user1_sample_data['password'])
+
+        # pending uploads count towards the maximum number of pictures of a log
+        log_data_dict = {'description': 'desc', 'album_name': 'None', 'images_to_delete': ''}
+        for i in range(9):
+            log_data_dict['log_picture_' + str(i)] = util.get_small_image()
+        response = self.client.post(util.urls['log_update_base'] + str(log.id) + '/', data=log_data_dict,
+                                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(json.loads(response.content)['error'], "At most 10 images are allowed")
+
+        # stale uploads are processed by the pending uploads script, and uploads that can't be read fail
+        PendingUpload.objects.create(log=log, file_name='missing.jpg', spool_path=os.path.join(self.spool_dir, 'missing'))
+        self.assertEqual(PendingUpload.objects.process_stale_uploads(datetime.timedelta(0)), 2)
+        response = self.client.get(status_url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        response_data = json.loads(response.content)
+        self.assertEqual(response_data['pending_count'], 0)
+        self.assertEqual(response_data['errors'], ["Your picture missing.jpg could not be saved"])
+        self.assertEqual(len(response_data['picture_urls']), 2)
+        self.assertFalse(os.path.exists(spool_path))
+
+        # staged files are deleted along with their log
+        shutil.copy(util.small_image_path, spool_path)
+        PendingUpload.objects.create(log=log, file_name='small_image.jpg', spool_path=spool_path)
+        log.delete()
+        self.assertFalse(os.path.exists(spool_path))
+        self.assertEqual(len(PendingUpload.objects.all()), 0)
+
+    def test_create_log_finds_city_from_coordinates(self):
+        util.add_sample_user_and_user_profile(util.user1_sample_data)
+        self.client.login(username=util.user1_sample_data['username'], password=util.user1_sample_data['password'])
+        util.add_sample_album(util.album1_sample_data, util.user1_sample_data)
+        city_data = dict(util.city1_sample_data, latitude=55.9533, longitude=-3.1883)
+        util.add_sample_city(city_data)
+        util.add_sample_city(util.city2_sample_data)
+
+        # the location name provided by the client is ignored if the coordinates are near a city
+        log_data_dict = {'location': 'Edinburgh, UK', 'latitude': 55.94, 'longitude': -3.2, 'description': 'desc',
+                         'album_name': util.album1_sample_data['name'], 'log_picture_1': util.get_small_image()}
+        response = self.client.post(util.urls['log_create'], data=log_data_dict, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(len(json.loads(response.content)), 0)
+        self.assertEqual(Log.objects.get().city.name, city_data['name'])
+
+        # else the city is found by its name
+        log_data_dict['location'] = util.city2_sample_data['name']
+        log_data_dict['latitude'] = 0
+        log_data_dict['log_picture_1'] = util.get_small_image()
+        response = self.client.post(util.urls['log_create'], data=log_data_dict, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        # the same picture was posted in the first log, which only adds a warning
+        self.assertNotIn('error', json.loads(response.content))
+        log = Log.objects.get(latitude=0)
+        self.assertEqual(log.city.name, util.city2_sample_data['name'])
+
+        # existing logs are moved to their nearest city in bulk
+        Log.objects.filter(id=log.id).update(latitude=55.96)
+        self.assertEqual(update_log_cities(), 1)
+        self.assertEqual(Log.objects.get(id=log.id).city.name, city_data['name'])
+        self.assertEqual(UserProfile.objects.get(user__username=util.user1_sample_data['username']).city_count, 1)
+        self.assertEqual(update_log_cities(), 0)
 
     def test_log_form_validation(self):
         # create and sign in a new user
@@ -901,6 +1604,21 @@ class LikeTest(TestCase):
         self.assertEqual(len(Like.objects.filter(log=log_to_dislike)), 0)
         self.assertEqual(response.status_code, 200)
 
+    def test_update_scores_only_counts_likes_of_other_users(self):
+        log_to_score = Log.objects.all()[0]
+        util.add_sample_user_and_user_profile(util.user2_sample_data)
+        author_user_profile = util.get_user_and_user_profile(util.user1_sample_data)['user_profile']
+        other_user_profile = util.get_user_and_user_profile(util.user2_sample_data)['user_profile']
+        Like.objects.create(log=log_to_score, liker_user_profile=author_user_profile)
+        Like.objects.create(log=log_to_score, liker_user_profile=other_user_profile)
+        Comment.objects.create(log=log_to_score, commenter_user_profile=other_user_profile, body='Nice')
+
+        # the like of the author is left out, and only the changed score is written
+        self.assertEqual(Log.objects.update_scores(), 1)
+        log_to_score = Log.objects.get(id=log_to_score.id)
+        self.assertEqual(float(log_to_score.score), compute_log_score(log_to_score.created_at, 2))
+        self.assertEqual(Log.objects.update_scores(), 0)
+
 
 class CommentTest(TestCase):
 
@@ -1089,6 +1807,1018 @@ class FollowerTest(TestCase):
                                                      following_user_profile=self.following_user_profile)), 0)
 
 
+class HeatmapTest(TestCase):
+
+    def setUp(self):
+        self.tile_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(HEATMAP_TILE_DIR=self.tile_dir, HEATMAP_RENDER_PROCESSES=0)
+        self.settings_override.enable()
+        util.add_sample_city(util.city1_sample_data)
+        util.add_sample_user_and_user_profile(util.user1_sample_data)
+        util.add_sample_album(util.album1_sample_data, util.user1_sample_data)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.tile_dir)
+        util.delete_all_test_image_files()
+
+    def get_tile(self, zoom, x, y):
+        response = self.client.get(util.urls['heatmap_base'] + '%d/%d/%d.png' % (zoom, x, y))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        return Image.open(BytesIO(response.content))
+
+    def test_heatmap_tile_url_resolves_to_correct_function(self):
+        found = resolve(util.urls['heatmap_base'] + '1/0/1.png')
+        self.assertEqual(found.func, show_heatmap_tile)
+
+    def test_heatmap_tiles_are_rendered_from_logs(self):
+        util.add_sample_log(util.log1_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+
+        # the log at (0, 0) is drawn in the centre of the whole world tile, and nowhere else
+        tile = self.get_tile(0, 0, 0)
+        self.assertEqual(tile.size, (TILE_SIZE, TILE_SIZE))
+        self.assertGreater(tile.getpixel((128, 128))[3], 0)
+        self.assertEqual(tile.getpixel((10, 10))[3], 0)
+
+        # at zoom level 1, it is on the corner of all 4 tiles
+        for x, y, corner in [(0, 0, (255, 255)), (1, 0, (0, 255)), (0, 1, (255, 0)), (1, 1, (0, 0))]:
+            self.assertGreater(self.get_tile(1, x, y).getpixel(corner)[3], 0)
+
+        # logs across the antimeridian are drawn on both sides of it
+        log_data = {'latitude': 0, 'longitude': 179.9, 'description': 'desc'}
+        util.add_sample_log(log_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        self.assertGreater(self.get_tile(2, 0, 1).getpixel((0, 255))[3], 0)
+        self.assertGreater(self.get_tile(2, 3, 1).getpixel((255, 255))[3], 0)
+
+        # tiles outside the map do not exist
+        response = self.client.get(util.urls['heatmap_base'] + '1/2/0.png')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(util.urls['heatmap_base'] + '%d/0/0.png' % (MAX_HEATMAP_ZOOM + 1))
+        self.assertEqual(response.status_code, 404)
+
+    def test_heatmap_tiles_are_drawn_from_rollups(self):
+        util.add_sample_log(util.log1_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        log_data = {'latitude': 0.001, 'longitude': 0.001, 'description': 'desc'}
+        util.add_sample_log(log_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+
+        # both logs are in the same grid cell, and are drawn as one point with a count of 2
+        pixel_xs, pixel_ys, log_counts = get_tile_points(0, 0, 0)
+        self.assertEqual(list(log_counts), [2])
+        self.assertAlmostEqual(pixel_xs[0], 128, places=3)
+
+        # tiles beyond the deepest rollup level draw the logs one by one
+        pixel_xs, pixel_ys, log_counts = get_tile_points(MAX_HEATMAP_ZOOM, 2 ** (MAX_HEATMAP_ZOOM - 1),
+                                                         2 ** (MAX_HEATMAP_ZOOM - 1))
+        self.assertEqual(list(log_counts), [1, 1])
+
+        # without rollups, low zoom tiles are empty
+        GridCellRollup.objects.all().delete()
+        self.assertEqual(len(get_tile_points(0, 0, 0)[2]), 0)
+
+    def test_heatmap_tiles_are_cached_until_their_logs_change(self):
+        util.add_sample_log(util.log1_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        self.get_tile(0, 0, 0)
+        self.get_tile(2, 0, 0)
+        self.assertTrue(os.path.exists(get_tile_path(0, 0, 0)))
+        self.assertTrue(os.path.exists(get_tile_path(2, 0, 0)))
+
+        # a cached tile is returned without rendering it again, as long as no logs drawn on it have changed
+        HeatmapTile.objects.all().delete()
+        for tile_path in [get_tile_path(0, 0, 0), get_tile_path(2, 0, 0)]:
+            with open(tile_path, 'wb') as tile_file:
+                tile_file.write(b'cached')
+        response = self.client.get(util.urls['heatmap_base'] + '0/0/0.png')
+        self.assertEqual(response.content, b'cached')
+
+        # a new log only marks the tiles it is drawn on as changed, which are rendered again
+        self.assertIn((0, 0, 0), get_tiles_drawing_point(util.log2_sample_data['latitude'],
+                                                         util.log2_sample_data['longitude']))
+        self.assertNotIn((2, 0, 0), get_tiles_drawing_point(util.log2_sample_data['latitude'],
+                                                            util.log2_sample_data['longitude']))
+        self.assertEqual(len(get_tiles_drawing_point(0, 0)), 1 + 4 * MAX_HEATMAP_ZOOM)
+        util.add_sample_log(util.log2_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        self.assertTrue(HeatmapTile.objects.has_changed_since(0, 0, 0, os.path.getmtime(get_tile_path(0, 0, 0))))
+        self.assertEqual(self.get_tile(0, 0, 0).size, (TILE_SIZE, TILE_SIZE))
+        response = self.client.get(util.urls['heatmap_base'] + '2/0/0.png')
+        self.assertEqual(response.content, b'cached')
+
+        # tiles used the longest time ago are evicted once the cache is full, along with the rows of changed tiles
+        # that every remaining tile was rendered after
+        self.get_tile(1, 0, 0)
+        os.utime(get_tile_path(2, 0, 0), (0, 0))
+        cache_size = sum(os.path.getsize(get_tile_path(*tile)) for tile in [(0, 0, 0), (1, 0, 0), (2, 0, 0)])
+        HeatmapTile.objects.create(zoom=1, x=1, y=1, changed_at=0)
+        self.assertEqual(evict_cached_tiles(cache_size - 1), 1)
+        self.assertFalse(os.path.exists(get_tile_path(2, 0, 0)))
+        self.assertTrue(os.path.exists(get_tile_path(0, 0, 0)))
+        self.assertTrue(os.path.exists(get_tile_path(1, 0, 0)))
+        self.assertFalse(HeatmapTile.objects.filter(changed_at=0).exists())
+        self.assertTrue(HeatmapTile.objects.filter(zoom=0, x=0, y=0).exists())
+
+        # tiles are also evicted as they are written, once the cache is full
+        with self.settings(HEATMAP_TILE_CACHE_SIZE=cache_size):
+            self.get_tile(2, 1, 1)
+        self.assertFalse(os.path.exists(get_tile_path(0, 0, 0)))
+        self.assertTrue(os.path.exists(get_tile_path(2, 1, 1)))
+
+    def test_heatmap_tiles_are_rendered_in_process_pool(self):
+        pixel_xs, pixel_ys = get_tile_pixels([0, 10, 10], [0, 20, 20.1], 1, 1, 0)
+        with self.settings(HEATMAP_RENDER_PROCESSES=1):
+            data = render_tile_in_pool(1, 1, 0, pixel_xs, pixel_ys, [1, 2, 1], 1000, 30)
+        self.assertEqual(data, render_tile(pixel_xs, pixel_ys, [1, 2, 1]))
+        # the rendered tile is cached by the pool as well, with the time its points were read
+        self.assertEqual(read_cached_tile(1, 1, 0), (data, 1000))
+
+
+class PictureDerivativesTest(TestCase):
+
+    def setUp(self):
+        util.add_sample_city(util.city1_sample_data)
+        util.add_sample_user_and_user_profile(util.user1_sample_data)
+        util.add_sample_album(util.album1_sample_data, util.user1_sample_data)
+        util.add_sample_log(util.log1_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        self.log_picture = LogPicture.objects.get()
+
+    def tearDown(self):
+        util.delete_all_test_image_files()
+
+    def get_derivative_size(self, picture, size_name, extension):
+        derivative_file = picture.storage.open(get_derivative_name(picture.name, size_name, extension), 'rb')
+        try:
+            return Image.open(derivative_file).size
+        finally:
+            derivative_file.close()
+
+    def test_derivatives_are_created_and_deleted_with_pictures(self):
+        # the small image is 720x480, and derivatives are only scaled down to fit their size
+        picture = self.log_picture.picture
+        self.assertEqual(self.get_derivative_size(picture, 'thumb', 'jpg'), (200, 133))
+        self.assertEqual(self.get_derivative_size(picture, 'feed', 'jpg'), (720, 480))
+        self.assertEqual(self.get_derivative_size(picture, 'full', 'jpg'), (720, 480))
+        webp_name = get_derivative_name(picture.name, 'thumb', 'webp')
+        self.assertEqual(picture.storage.exists(webp_name), is_format_supported('WEBP'))
+
+        # derivatives are deleted along with their picture, by the media garbage collector
+        thumb_name = get_derivative_name(picture.name, 'thumb', 'jpg')
+        self.log_picture.delete()
+        self.assertTrue(picture.storage.exists(thumb_name))
+        MediaTombstone.objects.collect_garbage()
+        self.assertFalse(picture.storage.exists(thumb_name))
+
+        # derivatives of a new cover picture replace the ones of the previous picture
+        user_profile = UserProfile.objects.get(user__username=util.user1_sample_data['username'])
+        user_profile.cover_picture = File(util.get_small_image())
+        user_profile.save()
+        first_cover_picture_name = user_profile.cover_picture.name
+        self.assertEqual(self.get_derivative_size(user_profile.cover_picture, 'thumb', 'jpg'), (200, 133))
+        user_profile = UserProfile.objects.get(id=user_profile.id)
+        user_profile.cover_picture = ContentFile(util.get_jpeg_data(400, 400), 'other_image.jpg')
+        user_profile.save()
+        MediaTombstone.objects.collect_garbage()
+        self.assertFalse(picture.storage.exists(first_cover_picture_name))
+        self.assertFalse(picture.storage.exists(get_derivative_name(first_cover_picture_name, 'thumb', 'jpg')))
+        self.assertEqual(self.get_derivative_size(user_profile.cover_picture, 'thumb', 'jpg'), (200, 200))
+        other_cover_picture_name = user_profile.cover_picture.name
+        user_profile.delete()
+        MediaTombstone.objects.collect_garbage()
+        self.assertFalse(picture.storage.exists(other_cover_picture_name))
+
+        # transparent pixels are made white in JPEG derivatives
+        image = Image.new('RGBA', (400, 100), (0, 0, 0, 0))
+        derivative = Image.open(BytesIO(render_derivative(image, 200, 'JPEG')))
+        self.assertEqual(derivative.size, (200, 50))
+        self.assertEqual(derivative.getpixel((0, 0)), (255, 255, 255))
+
+    def test_picture_url_picks_smallest_adequate_derivative(self):
+        picture = self.log_picture.picture
+        self.assertEqual(get_derivative_url(picture, 100), picture.storage.url(
+            get_derivative_name(picture.name, 'thumb', 'jpg')))
+        self.assertEqual(get_derivative_url(picture, 201), picture.storage.url(
+            get_derivative_name(picture.name, 'feed', 'jpg')))
+        self.assertEqual(get_derivative_url(picture, 5000), picture.storage.url(
+            get_derivative_name(picture.name, 'full', 'jpg')))
+        # WebP derivatives are only used if they were created
+        webp_url = get_derivative_url(picture, 100, True)
+        self.assertEqual(webp_url.endswith('.webp'), is_format_supported('WEBP'))
+
+        # pictures without derivatives, such as the default profile picture, are served as they are
+        user_profile = UserProfile.objects.get(user__username=util.user1_sample_data['username'])
+        self.assertEqual(get_derivative_url(user_profile.profile_picture, 100), user_profile.profile_picture.url)
+        user_profile.profile_picture = File(util.get_small_image())
+        user_profile.save()
+        self.assertEqual(UserProfile.objects.get(id=user_profile.id).profile_picture_width, 720)
+        self.assertEqual(get_derivative_url(user_profile.profile_picture, 100), picture.storage.url(
+            get_derivative_name(user_profile.profile_picture.name, 'thumb', 'jpg')))
+
+        # derivatives are never looked up in the storage, pictures have them once their width is stored
+        LogPicture.objects.filter(id=self.log_picture.id).update(width=0)
+        self.assertEqual(get_derivative_url(LogPicture.objects.get(id=self.log_picture.id).picture, 100), picture.url)
+
+        # the template tag returns the same url
+        template = Template('{% load pictures %}{% picture_url picture 100 %}')
+        self.assertEqual(template.render(Context({'picture': picture})), get_derivative_url(picture, 100))
+
+    def test_placeholders_are_stored_with_pictures(self):
+        # the small image is 720x480, and its placeholder is a tiny PNG inlined as a data uri
+        log_picture = LogPicture.objects.get(id=self.log_picture.id)
+        self.assertEqual((log_picture.width, log_picture.height), (720, 480))
+        self.assertTrue(log_picture.placeholder.startswith('data:image/png;base64,'))
+        self.assertLess(len(log_picture.placeholder), 400)
+        placeholder = Image.open(BytesIO(base64.b64decode(log_picture.placeholder.split(',')[1])))
+        self.assertEqual(placeholder.size, (8, 5))
+
+        # cover pictures have placeholders as well, and default pictures have none
+        album = util.get_album(util.album1_sample_data, util.user1_sample_data)
+        self.assertEqual(album.cover_picture_placeholder, '')
+        album.cover_picture = File(util.get_small_image())
+        album.save()
+        album = Album.objects.get(id=album.id)
+        self.assertEqual((album.cover_picture_width, album.cover_picture_height), (720, 480))
+        self.assertEqual(album.cover_picture_placeholder, log_picture.placeholder)
+
+        # the template tag layers the picture on top of its placeholder
+        template = Template('{% load pictures %}{% picture_background picture 100 placeholder %}')
+        background = template.render(Context({'picture': log_picture.picture, 'placeholder': log_picture.placeholder}))
+        self.assertEqual(background, "url('" + get_derivative_url(log_picture.picture, 100) + "'), url('" +
+                         log_picture.placeholder + "')")
+        background = template.render(Context({'picture': log_picture.picture, 'placeholder': ''}))
+        self.assertEqual(background, "url('" + get_derivative_url(log_picture.picture, 100) + "')")
+
+        # placeholders of pictures uploaded before placeholders existed are created by the backfill script, and the
+        # pictures sharing a file are all updated at once
+        LogPicture.objects.update(width=0, height=0, placeholder='')
+        Album.objects.update(cover_picture_width=0, cover_picture_height=0, cover_picture_placeholder='')
+        self.assertEqual(create_picture_placeholders(2), 1)
+        self.assertEqual(LogPicture.objects.get(id=log_picture.id).placeholder, log_picture.placeholder)
+        self.assertEqual(Album.objects.get(id=album.id).cover_picture_width, 720)
+
+    def test_identical_pictures_share_a_file(self):
+        # files are named after their content, in directories sharded by the leading characters of its hash
+        picture = self.log_picture.picture
+        with open(util.small_image_path, 'rb') as image_file:
+            content_hash = get_content_hash(File(image_file))
+        self.assertEqual(picture.name, BLOBS_DIR + '/' + content_hash[0:2] + '/' + content_hash[2:4] + '/' +
+                         content_hash + '.jpg')
+
+        # uploading the same picture again only counts another reference to the same file
+        second_log_picture = LogPicture.objects.create(log=self.log_picture.log,
+                                                       picture=File(util.get_small_image()))
+        album = Album.objects.get()
+        album.cover_picture = File(util.get_small_image())
+        album.save()
+        self.assertEqual(second_log_picture.picture.name, picture.name)
+        self.assertEqual(album.cover_picture.name, picture.name)
+        self.assertEqual(StoredBlob.objects.get(name=picture.name).reference_count, 3)
+
+        # the file and its derivatives are only deleted along with the last picture sharing it
+        thumb_name = get_derivative_name(picture.name, 'thumb', 'jpg')
+        self.log_picture.delete()
+        second_log_picture.delete()
+        self.assertEqual(len(MediaTombstone.objects.all()), 0)
+        album.cover_picture = ContentFile(util.get_jpeg_data(100, 100), 'other_image.jpg')
+        album.save()
+        self.assertEqual(len(StoredBlob.objects.filter(name=picture.name)), 0)
+        MediaTombstone.objects.collect_garbage()
+        self.assertFalse(picture.storage.exists(picture.name))
+        self.assertFalse(picture.storage.exists(thumb_name))
+        other_cover_picture_name = album.cover_picture.name
+        album.delete()
+        MediaTombstone.objects.collect_garbage()
+        self.assertFalse(picture.storage.exists(other_cover_picture_name))
+
+    def test_concurrent_saves_of_a_picture_share_its_file(self):
+        picture = self.log_picture.picture
+        with open(picture.path, 'rb') as picture_file:
+            data = picture_file.read()
+
+        # another request saves the same picture between the existence check and the rename of this request
+        picture.storage.exists = lambda name: False
+        try:
+            name = picture.storage.save('again.jpg', File(util.get_small_image()))
+        finally:
+            del picture.storage.exists
+        self.assertEqual(name, picture.name)
+        self.assertEqual(StoredBlob.objects.get(name=picture.name).reference_count, 2)
+        with open(picture.path, 'rb') as picture_file:
+            self.assertEqual(picture_file.read(), data)
+        # the temporary file is gone
+        self.assertEqual([file_name for file_name in os.listdir(os.path.dirname(picture.path))
+                          if file_name.endswith('.tmp')], [])
+
+    def test_unused_files_are_collected_in_batches(self):
+        picture = self.log_picture.picture
+        picture_name = picture.name
+        other_log_picture = LogPicture.objects.create(log=self.log_picture.log,
+                                                      picture=ContentFile(util.get_jpeg_data(100, 100), 'other.jpg'))
+        other_picture_name = other_log_picture.picture.name
+
+        # deleting pictures only records their files, which are kept if the transaction is rolled back
+        log_id = self.log_picture.log_id
+        try:
+            with transaction.atomic():
+                Log.objects.get(id=log_id).delete()
+                self.assertEqual(set(MediaTombstone.objects.values_list('name', flat=True)),
+                                 {picture_name, other_picture_name})
+                raise IntegrityError
+        except IntegrityError:
+            pass
+        self.assertEqual(len(MediaTombstone.objects.all()), 0)
+        Log.objects.get(id=log_id).delete()
+        self.assertTrue(picture.storage.exists(picture_name))
+
+        # files used again by the time they are collected are kept, the others are deleted a batch at a time
+        util.add_sample_log(util.log2_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        self.assertEqual(MediaTombstone.objects.collect_garbage(batch_size=1), 1)
+        self.assertTrue(picture.storage.exists(picture_name))
+        self.assertTrue(picture.storage.exists(get_derivative_name(picture_name, 'thumb', 'jpg')))
+        self.assertFalse(picture.storage.exists(other_picture_name))
+        self.assertFalse(picture.storage.exists(get_derivative_name(other_picture_name, 'thumb', 'jpg')))
+        self.assertEqual(len(MediaTombstone.objects.all()), 0)
+
+        # files of pictures being uploaded again, whose blob exists but doesn't count the reference yet, are kept
+        Log.objects.all()[0].delete()
+        StoredBlob.objects.create(name=picture_name, reference_count=0)
+        self.assertEqual(MediaTombstone.objects.collect_garbage(), 0)
+        self.assertTrue(picture.storage.exists(picture_name))
+
+    def test_orphaned_files_are_found_and_reclaimed(self):
+        picture = self.log_picture.picture
+        orphan_name = picture.storage.save('orphan.jpg', ContentFile(util.get_jpeg_data(10, 10)))
+        # the file is no longer referenced, as if the request saving its picture died before saving the picture
+        StoredBlob.objects.filter(name=orphan_name).delete()
+
+        orphaned_names = [name for name, size in find_orphaned_files(0)]
+        self.assertIn(orphan_name, orphaned_names)
+        self.assertNotIn(picture.name, orphaned_names)
+        self.assertNotIn(get_derivative_name(picture.name, 'thumb', 'jpg'), orphaned_names)
+        # default pictures are referenced by their url, and are kept even when no row uses them
+        self.assertNotIn('mytravelog/cover_pictures/default_cover_picture.png', orphaned_names)
+        UserProfile.objects.update(profile_picture=picture.name, cover_picture=picture.name)
+        Album.objects.update(cover_picture=picture.name)
+        orphaned_names = [name for name, size in find_orphaned_files(0)]
+        self.assertNotIn('mytravelog/cover_pictures/default_cover_picture.png', orphaned_names)
+        self.assertNotIn('mytravelog/profile_pictures/default_profile_picture.png', orphaned_names)
+        # recently modified files may not be referenced yet
+        self.assertNotIn(orphan_name, [name for name, size in find_orphaned_files(60 * 60)])
+
+        orphan_size = picture.storage.size(orphan_name)
+        self.assertEqual(reclaim_orphaned_files([orphan_name]), orphan_size)
+        self.assertFalse(picture.storage.exists(orphan_name))
+        # the empty directories of the file are deleted as well
+        self.assertFalse(os.path.exists(os.path.dirname(picture.storage.path(orphan_name))))
+
+
+class UploadLimitTest(TestCase):
+
+    def setUp(self):
+        util.add_sample_user_and_user_profile(util.user1_sample_data)
+        self.client.login(username=util.user1_sample_data['username'], password=util.user1_sample_data['password'])
+        util.add_sample_city(util.city1_sample_data)
+        self.album_data_dict = {'name': 'album', 'start_date': '2014-01-01', 'end_date': '2014-01-02'}
+
+    def tearDown(self):
+        util.delete_all_test_image_files()
+
+    def receive_file(self, path, chunk_size=64 * 1024):
+        # feeds the file to the handler the way the multipart parser does, and returns the chunks passed on
+        handler = UploadLimitHandler()
+        handler.new_file('picture', os.path.basename(path), 'image/jpeg', None)
+        passed_on_chunks = []
+        with open(path, 'rb') as image_file:
+            start = 0
+            chunk = image_file.read(chunk_size)
+            while chunk:
+                passed_on_chunks.append(handler.receive_data_chunk(chunk, start))
+                start += len(chunk)
+                chunk = image_file.read(chunk_size)
+        return passed_on_chunks, handler.file_complete(start)
+
+    def test_files_exceeding_limits_are_rejected_while_received(self):
+        # files within the limits are passed on to the other handlers as they are
+        passed_on_chunks, uploaded_file = self.receive_file(util.small_image_path)
+        self.assertIsNone(uploaded_file)
+        self.assertNotIn(None, passed_on_chunks)
+
+        # no chunk beyond the size limit is passed on, and the file is replaced by its error
+        passed_on_chunks, uploaded_file = self.receive_file(util.large_image_path)
+        self.assertIsInstance(uploaded_file, RejectedUpload)
+        self.assertEqual(uploaded_file.upload_error, get_file_size_error())
+        self.assertEqual(uploaded_file.size, os.path.getsize(util.large_image_path))
+        self.assertEqual(sum(len(chunk) for chunk in passed_on_chunks if chunk is not None), 2048 * 1024)
+
+        # too many pixels are found from the header, so nothing after its chunk is passed on
+        with self.settings(MAX_UPLOAD_PIXELS=1000 * 1000):
+            passed_on_chunks, uploaded_file = self.receive_file(util.large_image_path)
+            self.assertEqual(uploaded_file.upload_error, get_pixel_count_error())
+        self.assertEqual(passed_on_chunks[0], None)
+        self.assertEqual(set(passed_on_chunks), {None})
+
+    def test_upload_errors_are_reported_by_validation(self):
+        # the large image is 4877x3515, so it is rejected for its pixels before its size is exceeded
+        with self.settings(MAX_UPLOAD_PIXELS=1000 * 1000):
+            self.album_data_dict['cover_picture'] = util.get_large_image()
+            response = self.client.post(util.urls['album_create'], data=self.album_data_dict,
+                                        HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            self.assertEqual(json.loads(response.content)['error'], "Max image resolution allowed is 1 megapixels")
+
+            # pictures with too many pixels are never decoded for derivatives either
+            log_picture = LogPicture()
+            log_picture.picture.save('large_image.jpg', File(util.get_large_image()), save=False)
+            self.assertFalse(create_derivatives(log_picture.picture))
+            log_picture.picture.delete(save=False)
+
+        self.album_data_dict['cover_picture'] = util.get_small_image()
+        response = self.client.post(util.urls['album_create'], data=self.album_data_dict,
+                                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(len(json.loads(response.content)), 0)
+        self.assertEqual(len(Album.objects.all()), 1)
+
+    def test_requests_exceeding_size_limit_are_rejected(self):
+        with self.settings(MAX_UPLOAD_REQUEST_SIZE=1024 * 1024):
+            # ajax requests get the error the same way as validation errors
+            self.album_data_dict['cover_picture'] = util.get_large_image()
+            response = self.client.post(util.urls['album_create'], data=self.album_data_dict,
+                                        HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            self.assertEqual(json.loads(response.content)['error'], get_request_size_error())
+            self.assertEqual(len(Album.objects.all()), 0)
+
+            response = self.client.post(util.urls['sign_up'], data={'profile_picture': util.get_large_image()})
+            self.assertEqual(response.status_code, 413)
+
+            # requests within the limit are untouched
+            self.album_data_dict['cover_picture'] = util.get_small_image()
+            response = self.client.post(util.urls['album_create'], data=self.album_data_dict,
+                                        HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            self.assertEqual(len(json.loads(response.content)), 0)
+
+
+class ChunkedUploadTest(TestCase):
+
+    def setUp(self):
+        # uploads are processed within the request, since the test database can't be shared with other threads
+        self.spool_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(UPLOAD_SPOOL_DIR=self.spool_dir, UPLOAD_PROCESSING_THREADS=0)
+        self.settings_override.enable()
+        util.add_sample_city(util.city1_sample_data)
+        util.add_sample_user_and_user_profile(util.user1_sample_data)
+        self.client.login(username=util.user1_sample_data['username'], password=util.user1_sample_data['password'])
+        with open(util.small_image_path, 'rb') as image_file:
+            self.image_data = image_file.read()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.spool_dir)
+        util.delete_all_test_image_files()
+
+    def start(self, size):
+        response = self.client.post(util.urls['upload_start'], data={'file_name': 'small_image.jpg', 'size': size},
+                                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        return json.loads(response.content)
+
+    def send_chunk(self, upload_id, offset, chunk):
+        response = self.client.post(util.urls['upload_chunk_base'] + str(upload_id) + '/?offset=' + str(offset),
+                                    data=chunk, content_type='application/octet-stream',
+                                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        return json.loads(response.content)
+
+    def finalize(self, upload_id):
+        response = self.client.post(util.urls['upload_finalize_base'] + str(upload_id) + '/',
+                                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        return json.loads(response.content)
+
+    def upload(self, chunk_size=1024):
+        upload_id = self.start(len(self.image_data))['upload_id']
+        for offset in range(0, len(self.image_data), chunk_size):
+            self.send_chunk(upload_id, offset, self.image_data[offset:offset + chunk_size])
+        self.assertEqual(self.finalize(upload_id), {})
+        return upload_id
+
+    def test_upload_urls_resolve_to_correct_functions(self):
+        self.assertEqual(resolve(util.urls['upload_start']).func, start_upload)
+        self.assertEqual(resolve(util.urls['upload_chunk_base'] + '1/').func, upload_chunk)
+        self.assertEqual(resolve(util.urls['upload_offset_base'] + '1/').func, get_upload_offset)
+        self.assertEqual(resolve(util.urls['upload_finalize_base'] + '1/').func, finalize_upload)
+
+    def test_chunks_are_written_at_their_offsets_and_uploads_can_be_resumed(self):
+        response_data = self.start(len(self.image_data))
+        upload_id = response_data['upload_id']
+        self.assertEqual(response_data['offset'], 0)
+
+        # chunks at other offsets than the number of received bytes are not written, e.g. when sent again
+        self.assertEqual(self.send_chunk(upload_id, 0, self.image_data[:1024]), {'offset': 1024})
+        response_data = self.send_chunk(upload_id, 0, self.image_data[:1024])
+        self.assertEqual(response_data['offset'], 1024)
+        self.assertIn('error', response_data)
+        self.assertIn('error', self.finalize(upload_id))
+
+        # the upload is resumed from the offset of the upload
+        response = self.client.get(util.urls['upload_offset_base'] + str(upload_id) + '/',
+                                   HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(json.loads(response.content), {'offset': 1024, 'status': UPLOADING})
+        self.send_chunk(upload_id, 1024, self.image_data[1024:])
+        self.assertEqual(self.finalize(upload_id), {})
+        chunked_upload = ChunkedUpload.objects.get(id=upload_id)
+        self.assertEqual(chunked_upload.status, FINALIZED)
+        with open(chunked_upload.spool_path, 'rb') as spool_file:
+            self.assertEqual(spool_file.read(), self.image_data)
+
+        # uploads of other users can't be found
+        util.add_sample_user_and_user_profile(util.user2_sample_data)
+        self.client.login(username=util.user2_sample_data['username'], password=util.user2_sample_data['password'])
+        self.assertIn('error', self.send_chunk(upload_id, len(self.image_data), 'data'))
+
+    def test_uploads_exceeding_limits_fail_while_received(self):
+        with self.settings(MAX_UPLOAD_FILE_SIZE=1024):
+            self.assertIn('error', self.start(len(self.image_data)))
+        self.assertEqual(len(ChunkedUpload.objects.all()), 0)
+
+        # the header of the small image is parsed once its first 4096 bytes are received, and the upload fails
+        # right then since it shows too many pixels, so its next chunks are not written
+        with self.settings(MAX_UPLOAD_PIXELS=10):
+            upload_id = self.start(len(self.image_data))['upload_id']
+            self.assertEqual(self.send_chunk(upload_id, 0, self.image_data[:1024]), {'offset': 1024})
+            self.assertFalse(ChunkedUpload.objects.get(id=upload_id).is_header_checked)
+            response_data = self.send_chunk(upload_id, 1024, self.image_data[1024:4096])
+            self.assertEqual(response_data['error'], get_pixel_count_error())
+            self.assertEqual(ChunkedUpload.objects.get(id=upload_id).status, FAILED)
+            self.assertIn('error', self.send_chunk(upload_id, 4096, self.image_data[4096:8192]))
+            self.assertEqual(self.finalize(upload_id)['error'], get_pixel_count_error())
+
+        # chunks can't exceed the announced size
+        upload_id = self.start(10)['upload_id']
+        self.assertIn('error', self.send_chunk(upload_id, 0, self.image_data[:11]))
+
+    def test_logs_are_created_and_edited_with_finalized_uploads(self):
+        upload_ids = [self.upload(), self.upload(chunk_size=4096)]
+        spool_paths = list(ChunkedUpload.objects.values_list('spool_path', flat=True))
+        log_data = {'location': util.city1_sample_data['name'], 'latitude': '1', 'longitude': '2',
+                    'description': 'desc', 'album_name': 'None'}
+
+        # unknown uploads are reported
+        log_data['upload_ids'] = str(upload_ids[0]) + ', ' + str(upload_ids[1] + 1)
+        response = self.client.post(util.urls['log_create'], data=log_data, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertIn('error', json.loads(response.content))
+        self.assertEqual(len(Log.objects.all()), 0)
+
+        log_data['upload_ids'] = str(upload_ids[0])
+        response = self.client.post(util.urls['log_create'], data=log_data, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(json.loads(response.content), {})
+        log = Log.objects.get(description='desc')
+        self.assertEqual(len(LogPicture.objects.filter(log=log)), 1)
+        self.assertEqual(len(ChunkedUpload.objects.all()), 1)
+
+        # the same upload can't be attached twice
+        response = self.client.post(util.urls['log_create'], data=log_data, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertIn('error', json.loads(response.content))
+
+        response = self.client.post(util.urls['log_update_base'] + str(log.id) + '/',
+                                    data={'description': 'desc', 'album_name': 'None', 'images_to_delete': '',
+                                          'upload_ids': str(upload_ids[1]) + ', '},
+                                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(json.loads(response.content), {})
+        self.assertEqual(len(LogPicture.objects.filter(log=log)), 2)
+        self.assertEqual(len(ChunkedUpload.objects.all()), 0)
+        for spool_path in spool_paths:
+            self.assertFalse(os.path.exists(spool_path))
+
+    def test_stale_uploads_are_deleted_with_their_files(self):
+        upload_id = self.start(len(self.image_data))['upload_id']
+        spool_path = ChunkedUpload.objects.get(id=upload_id).spool_path
+        self.assertEqual(ChunkedUpload.objects.delete_stale_uploads(datetime.timedelta(days=1)), 0)
+        ChunkedUpload.objects.filter(id=upload_id)\
+            .update(updated_at=ChunkedUpload.objects.get(id=upload_id).updated_at - datetime.timedelta(days=2))
+        self.assertEqual(ChunkedUpload.objects.delete_stale_uploads(datetime.timedelta(days=1)), 1)
+        self.assertFalse(os.path.exists(spool_path))
+
+
+class TripImportTest(TestCase):
+
+    def setUp(self):
+        # imports are processed within the request, since the test database can't be shared with other threads
+        self.spool_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(UPLOAD_SPOOL_DIR=self.spool_dir, UPLOAD_PROCESSING_THREADS=0,
+                                                   TRIP_IMPORT_PROCESSES=0)
+        self.settings_override.enable()
+        util.add_sample_city(dict(util.city1_sample_data, latitude=55.9533, longitude=-3.1883))
+        util.add_sample_city(dict(util.city2_sample_data, latitude=55.8642, longitude=-4.2518))
+        util.add_sample_user_and_user_profile(util.user1_sample_data)
+        util.add_sample_album(util.album1_sample_data, util.user1_sample_data)
+        self.user_profile = util.get_user_and_user_profile(util.user1_sample_data)['user_profile']
+        self.client.login(username=util.user1_sample_data['username'], password=util.user1_sample_data['password'])
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.spool_dir)
+        util.delete_all_test_image_files()
+
+    def get_progress(self, trip_import_id):
+        response = self.client.get(util.urls['trip_import_progress_base'] + str(trip_import_id) + '/',
+                                   HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        return json.loads(response.content)
+
+    def upload_archive(self, entries):
+        output = BytesIO()
+        with zipfile.ZipFile(output, 'w') as archive:
+            for entry_name, data in entries:
+                archive.writestr(entry_name, data)
+        data = output.getvalue()
+        chunked_upload, error = ChunkedUpload.objects.start_upload(self.user_profile, 'trip.zip', len(data))
+        ChunkedUpload.objects.receive_chunk(chunked_upload, 0, data)
+        ChunkedUpload.objects.finalize_upload(chunked_upload)
+        return chunked_upload.id
+
+    def test_trip_import_urls_resolve_to_correct_functions(self):
+        self.assertEqual(resolve(util.urls['trip_import_start']).func, start_trip_import)
+        self.assertEqual(resolve(util.urls['trip_import_progress_base'] + '1/').func, get_trip_import_progress)
+
+    def test_photo_metadata_is_read_from_exif(self):
+        photo_path = os.path.join(self.spool_dir, 'photo.jpg')
+        with open(photo_path, 'wb') as photo_file:
+            photo_file.write(util.get_photo_data(-33.8688, 151.2093, datetime.datetime(2014, 7, 12, 10, 30)))
+        path, latitude, longitude, taken_at = read_photo_metadata(photo_path)
+        self.assertAlmostEqual(latitude, -33.8688)
+        self.assertAlmostEqual(longitude, 151.2093)
+        self.assertEqual(calendar.timegm(taken_at.utctimetuple()),
+                         calendar.timegm(datetime.datetime(2014, 7, 12, 10, 30).utctimetuple()))
+
+        # photos without EXIF data, and files that are not photos, have no location or time
+        with open(photo_path, 'wb') as photo_file:
+            photo_file.write(util.get_jpeg_data(16, 16))
+        self.assertEqual(read_photo_metadata(photo_path), (photo_path, None, None, None))
+        with open(photo_path, 'wb') as photo_file:
+            photo_file.write(b'not a photo')
+        self.assertEqual(read_photo_metadata(photo_path), (photo_path, None, None, None))
+
+    def test_photos_are_grouped_by_city_and_time(self):
+        start = datetime.datetime(2014, 7, 12, 10, 0)
+        photos = [('a', 1, 0, 0, start + datetime.timedelta(hours=2)), ('b', 1, 0, 0, start),
+                  ('c', 1, 0, 0, start + datetime.timedelta(hours=9)), ('d', 2, 0, 0, start + datetime.timedelta(hours=10))]
+        groups = group_photos(photos)
+        self.assertEqual([[photo[0] for photo in group] for group in groups], [['b', 'a'], ['c'], ['d']])
+
+        # logs hold at most as many pictures as users can post with a log
+        photos = [(str(i), 1, 0, 0, start + datetime.timedelta(minutes=i)) for i in range(MAX_LOG_PICTURES + 1)]
+        self.assertEqual([len(group) for group in group_photos(photos)], [MAX_LOG_PICTURES, 1])
+
+    def test_trip_is_imported_from_photos_and_archives(self):
+        day = datetime.datetime(2014, 7, 12)
+        edinburgh, glasgow = (55.9533, -3.1883), (55.8642, -4.2518)
+        import_data = {'album_name': util.album1_sample_data['name']}
+        for i, hour in enumerate([10, 11, 12, 34]):
+            import_data['photo_' + str(i)] = SimpleUploadedFile('photo.jpg', util.get_photo_data(
+                edinburgh[0], edinburgh[1], day + datetime.timedelta(hours=hour), (50 * i, 0, 0)))
+        # photos without a location are left out
+        import_data['photo_4'] = SimpleUploadedFile('photo.jpg', util.get_jpeg_data(16, 16))
+        import_data['upload_ids'] = str(self.upload_archive([
+            ('trip/glasgow_1.jpg', util.get_photo_data(glasgow[0], glasgow[1], day + datetime.timedelta(hours=40),
+                                                       (0, 100, 0))),
+            ('trip/glasgow_2.JPG', util.get_photo_data(glasgow[0], glasgow[1], day + datetime.timedelta(hours=41),
+                                                       (0, 200, 0))),
+            ('trip/notes.txt', b'not a photo')]))
+        response = self.client.post(util.urls['trip_import_start'], data=import_data,
+                                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        trip_import_id = json.loads(response.content)['trip_import_id']
+        self.assertEqual(self.get_progress(trip_import_id), {'status': DONE, 'photo_count': 7, 'read_count': 7,
+                                                             'saved_count': 6, 'skipped_count': 1, 'log_count': 3})
+        self.assertEqual(len(ChunkedUpload.objects.all()), 0)
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+        # the logs are created at the time of their first photo, in the album
+        logs = list(Log.objects.filter(trip_import_id=trip_import_id).order_by('created_at'))
+        self.assertEqual([log.city.name for log in logs], [util.city1_sample_data['name']] * 2 +
+                         [util.city2_sample_data['name']])
+        self.assertEqual([len(LogPicture.objects.filter(log=log)) for log in logs], [3, 1, 2])
+        self.assertEqual(logs[0].created_at, timezone.make_aware(day + datetime.timedelta(hours=10), timezone.utc))
+        self.assertEqual(float(logs[0].score), compute_log_score(logs[0].created_at, 0))
+        self.assertEqual(logs[0].album.name, util.album1_sample_data['name'])
+        self.assertEqual((float(logs[2].latitude), float(logs[2].longitude)), glasgow)
+        self.assertEqual(set(LogPicture.objects.values_list('width', 'height')), {(16, 16)})
+        self.assertNotIn('', LogPicture.objects.values_list('placeholder', flat=True))
+
+        # the travel stats are updated for all logs together
+        user_profile = UserProfile.objects.get(id=self.user_profile.id)
+        self.assertEqual(user_profile.city_count, 2)
+        self.assertEqual(dict(CityVisit.objects.filter(user_profile=user_profile).values_list('city__name', 'log_count')),
+                         {util.city1_sample_data['name']: 2, util.city2_sample_data['name']: 1})
+        self.assertGreater(user_profile.distance_travelled, 0)
+        self.assertEqual(sum(GridCellRollup.objects.filter(level=MAX_CLUSTER_LEVEL).values_list('log_count', flat=True)),
+                         3)
+
+        for log in logs:
+            Log.objects.hide_log(log)
+        purge_hidden_objects()
+        MediaTombstone.objects.collect_garbage()
+        self.assertEqual(len(StoredBlob.objects.all()), 0)
+
+    def test_failed_and_foreign_imports_are_reported(self):
+        response = self.client.post(util.urls['trip_import_start'], data={'upload_ids': '1'},
+                                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertIn('error', json.loads(response.content))
+
+        # archives can't be attached to logs, and imports whose archive can't be read fail without creating any logs
+        chunked_upload, error = ChunkedUpload.objects.start_upload(self.user_profile, 'trip.zip', 10)
+        ChunkedUpload.objects.receive_chunk(chunked_upload, 0, b'not a zip!')
+        ChunkedUpload.objects.finalize_upload(chunked_upload)
+        self.assertEqual(ChunkedUpload.objects.get_finalized_uploads(self.user_profile, [chunked_upload.id]), [])
+        response = self.client.post(util.urls['trip_import_start'], data={'upload_ids': str(chunked_upload.id)},
+                                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        trip_import_id = json.loads(response.content)['trip_import_id']
+        self.assertIn('error', self.get_progress(trip_import_id))
+        self.assertEqual(len(Log.objects.all()), 0)
+
+        # imports of other users can't be found
+        util.add_sample_user_and_user_profile(util.user2_sample_data)
+        self.client.login(username=util.user2_sample_data['username'], password=util.user2_sample_data['password'])
+        self.assertEqual(self.get_progress(trip_import_id), {'error': "Your import could not be found"})
+
+    def test_stale_and_failed_imports_release_their_pictures(self):
+        photo_data = util.get_photo_data(55.9533, -3.1883, datetime.datetime(2014, 7, 12, 10))
+
+        def add_trip_import(**values):
+            spool_dir = tempfile.mkdtemp(dir=self.spool_dir)
+            with open(os.path.join(spool_dir, 'photo.jpg'), 'wb') as photo_file:
+                photo_file.write(photo_data)
+            return TripImport.objects.create(user_profile=self.user_profile, spool_dir=spool_dir, **values)
+
+        # the photo was stored by an interrupted run, which is released when the import is restarted
+        stored_name = picture_storage.save('photo.jpg', ContentFile(photo_data))
+        stale_import = add_trip_import(status=SAVING, stored_names=stored_name)
+        TripImport.objects.filter(id=stale_import.id).update(updated_at=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(TripImport.objects.process_stale_imports(datetime.timedelta(minutes=10)), 1)
+        self.assertEqual(TripImport.objects.get(id=stale_import.id).status, DONE)
+        self.assertEqual(TripImport.objects.get(id=stale_import.id).stored_names, '')
+        self.assertEqual(StoredBlob.objects.get(name=stored_name).reference_count, 1)
+
+        # imports whose logs can't be created release their pictures and are kept as failed
+        failed_import = add_trip_import()
+        create_logs = trip_import.create_logs
+        trip_import.create_logs = lambda *args: 1 / 0
+        try:
+            self.assertRaises(ZeroDivisionError, process_trip_import, failed_import.id)
+        finally:
+            trip_import.create_logs = create_logs
+        failed_import = TripImport.objects.get(id=failed_import.id)
+        self.assertEqual((failed_import.status, failed_import.stored_names), (FAILED, ''))
+        self.assertFalse(os.path.exists(failed_import.spool_dir))
+        self.assertEqual(StoredBlob.objects.get(name=stored_name).reference_count, 1)
+
+        for log in Log.objects.filter(trip_import=stale_import):
+            Log.objects.hide_log(log)
+        purge_hidden_objects()
+        MediaTombstone.objects.collect_garbage()
+        self.assertEqual(len(StoredBlob.objects.all()), 0)
+
+
+class DuplicatePictureTest(TestCase):
+
+    def setUp(self):
+        # uploads are processed within the request, since the test database can't be shared with other threads
+        self.spool_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(UPLOAD_SPOOL_DIR=self.spool_dir, UPLOAD_PROCESSING_THREADS=0)
+        self.settings_override.enable()
+        util.add_sample_city(util.city1_sample_data)
+        util.add_sample_user_and_user_profile(util.user1_sample_data)
+        util.add_sample_user_and_user_profile(util.user2_sample_data)
+        util.add_sample_album(util.album1_sample_data, util.user1_sample_data)
+        util.add_sample_log(util.log1_sample_data, util.album1_sample_data, util.city1_sample_data,
+                            util.user1_sample_data)
+        self.log_picture = LogPicture.objects.get()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.spool_dir)
+        util.delete_all_test_image_files([ContentFile(self.get_gradient_data(True))])
+
+    def get_gradient_data(self, is_reversed):
+        # the brightness of a gradient only decreases (or increases) from left to right, so all bits of its hash are set
+        # (or cleared)
+        image = Image.new('L', (90, 80))
+        image.putdata([255 - x if is_reversed else x for y in range(80) for x in range(90)])
+        output = BytesIO()
+        image.convert('RGB').save(output, 'JPEG')
+        return output.getvalue()
+
+    def create_log(self, picture_file):
+        log_data = {'location': util.city1_sample_data['name'], 'latitude': util.log1_sample_data['latitude'],
+                    'longitude': util.log1_sample_data['longitude'], 'description': 'desc', 'album_name': 'None',
+                    'log_picture_1': picture_file}
+        response = self.client.post(util.urls['log_create'], data=log_data, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        return json.loads(response.content)
+
+    def test_hashes_of_similar_pictures_are_close(self):
+        image = Image.open(util.small_image_path)
+        dhash = compute_dhash(image)
+        self.assertEqual(compute_dhash(image.copy()), dhash)
+        # resized and recompressed copies are near-duplicates
+        output = BytesIO()
+        image.resize((360, 240), Image.ANTIALIAS).save(output, 'JPEG', quality=50)
+        self.assertLessEqual(get_hamming_distance(compute_file_dhash(output), dhash), MAX_DUPLICATE_DISTANCE)
+        self.assertEqual(output.tell(), 0)
+
+        # hashes are signed 64 bit integers, split into bands from their highest bits to their lowest ones
+        decreasing_dhash = compute_file_dhash(BytesIO(self.get_gradient_data(True)))
+        increasing_dhash = compute_file_dhash(BytesIO(self.get_gradient_data(False)))
+        self.assertEqual(decreasing_dhash, -1)
+        self.assertEqual(increasing_dhash, 0)
+        self.assertEqual(get_hamming_distance(decreasing_dhash, increasing_dhash), 64)
+        self.assertEqual(get_hash_bands(decreasing_dhash), [0xFFFF] * 4)
+        self.assertEqual(get_hash_bands(0x0001000200030004), [1, 2, 3, 4])
+        self.assertEqual(get_dhash_fields(None)['dhash_band_0'], None)
+        self.assertIsNone(compute_file_dhash(BytesIO(b'not a picture')))
+
+    def test_near_duplicates_are_found_through_band_indexes(self):
+        # pictures are hashed along with their derivatives
+        self.assertEqual(self.log_picture.dhash, compute_file_dhash(util.get_small_image()))
+        self.assertEqual(self.log_picture.dhash_band_0, get_hash_bands(self.log_picture.dhash)[0])
+        self.assertEqual(LogPicture.objects.get_near_duplicates(self.log_picture.dhash), [self.log_picture])
+
+        # a picture whose hash differs in one bit of every band shares no band, and is only found when each band
+        # is allowed to differ
+        dhash = self.log_picture.dhash ^ 0x0001000100010001
+        self.assertEqual(LogPicture.objects.get_near_duplicates(dhash), [])
+        changed_dhash = self.log_picture.dhash ^ 0x0001000100000000
+        self.assertEqual(LogPicture.objects.get_near_duplicates(changed_dhash), [self.log_picture])
+        self.assertEqual(LogPicture.objects.get_near_duplicates(changed_dhash, max_distance=1), [])
+
+        # only the pictures sharing a band with the hash are read
+        LogPicture.objects.filter(id=self.log_picture.id).update(**get_dhash_fields(dhash ^ HASH_MASK))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(LogPicture.objects.get_near_duplicates(self.log_picture.dhash), [])
+        self.assertEqual(len(queries), 1)
+        self.assertIn('dhash_band_0', queries[0]['sql'])
+
+    def test_create_log_warns_about_duplicate_pictures(self):
+        self.client.login(username=util.user1_sample_data['username'], password=util.user1_sample_data['password'])
+        response_data = self.create_log(util.get_small_image())
+        self.assertEqual(response_data['duplicate_log_ids'], [self.log_picture.log_id])
+        self.assertIn('warning', response_data)
+        # the log is created anyway, and its picture is hashed
+        self.assertEqual(Log.objects.count(), 2)
+        self.assertEqual(LogPicture.objects.filter(dhash=self.log_picture.dhash).count(), 2)
+
+        # different pictures, and pictures of other users, are not duplicates
+        self.assertNotIn('warning', self.create_log(SimpleUploadedFile('gradient.jpg', self.get_gradient_data(True))))
+        self.client.login(username=util.user2_sample_data['username'], password=util.user2_sample_data['password'])
+        self.assertNotIn('warning', self.create_log(util.get_small_image()))
+
+    def test_duplicate_groups_are_reported(self):
+        log = self.log_picture.log
+        gradient_dhash = compute_file_dhash(BytesIO(self.get_gradient_data(True)))
+        for dhash in [self.log_picture.dhash, self.log_picture.dhash ^ 1, gradient_dhash, gradient_dhash ^ 0xFF]:
+            log_picture = LogPicture(log=log, picture=self.log_picture.picture.name)
+            log_picture.save()
+            LogPicture.objects.filter(id=log_picture.id).update(**get_dhash_fields(dhash))
+
+        # the gradient copy differs in 8 bits, so only the copies of the small image are grouped
+        groups = LogPicture.objects.get_duplicate_groups()
+        self.assertEqual(len(groups), 1)
+        self.assertEqual([log_picture_id for log_picture_id, log_id, name in groups[0]],
+                         list(LogPicture.objects.filter(dhash__in=[self.log_picture.dhash, self.log_picture.dhash ^ 1])
+                              .order_by('id').values_list('id', flat=True)))
+        self.assertEqual(len(groups[0]), 3)
+
+        # the hashes of oversized band buckets are not compared, but identical hashes are still grouped
+        groups = LogPicture.objects.get_duplicate_groups(max_bucket_hashes=1)
+        self.assertEqual([[log_picture_id for log_picture_id, log_id, name in group] for group in groups],
+                         [list(LogPicture.objects.filter(dhash=self.log_picture.dhash).order_by('id')
+                               .values_list('id', flat=True))])
+
+
+class PurgeTest(TestCase):
+
+    def setUp(self):
+        util.add_sample_city(util.city1_sample_data)
+        util.add_sample_city(util.city2_sample_data)
+        util.add_sample_user_and_user_profile(util.user1_sample_data)
+        util.add_sample_user_and_user_profile(util.user2_sample_data)
+        util.add_sample_album(util.album1_sample_data, util.user1_sample_data)
+        util.add_sample_album(util.album2_sample_data, util.user2_sample_data)
+        self.user_profile_1 = util.get_user_and_user_profile(util.user1_sample_data)['user_profile']
+        self.user_profile_2 = util.get_user_and_user_profile(util.user2_sample_data)['user_profile']
+
+    def tearDown(self):
+        util.delete_all_test_image_files()
+
+    def test_delete_account_url_resolves_to_correct_function(self):
+        found = resolve(util.urls['account_delete'])
+        self.assertEqual(found.func, delete_account)
+
+    def test_hidden_album_is_purged_in_batches(self):
+        util.add_sample_log(util.log1_sample_data, util.album1_sample_data, util.city1_sample_data,
+                            util.user1_sample_data)
+        util.add_sample_log(util.log1_sample_data, util.album1_sample_data, util.city1_sample_data,
+                            util.user1_sample_data)
+        util.add_sample_log(util.log2_sample_data, util.album1_sample_data, util.city2_sample_data,
+                            util.user1_sample_data)
+        log = Log.objects.all()[0]
+        Like.objects.create(log=log, liker_user_profile=self.user_profile_2)
+        Comment.objects.create(log=log, commenter_user_profile=self.user_profile_2,
+                               body=util.comment_sample_bodies['short_comment'])
+        picture_name = LogPicture.objects.all()[0].picture.name
+        album = util.get_album(util.album1_sample_data, util.user1_sample_data)
+
+        # the album and its logs are hidden right away, but nothing is deleted yet
+        Album.objects.hide_album(album)
+        self.assertEqual(len(Album.objects.filter(id=album.id)), 0)
+        self.assertEqual(len(Log.objects.get_user_logs(self.user_profile_1)), 0)
+        self.assertEqual(len(Log.all_objects.all()), 3)
+        self.assertEqual(len(LogPicture.objects.all()), 3)
+
+        # the bookkeeping of the log post_delete receivers is done right away for all hidden logs
+        user_profile = UserProfile.objects.get(id=self.user_profile_1.id)
+        self.assertEqual(user_profile.city_count, 0)
+        self.assertEqual(user_profile.country_count, 0)
+        self.assertEqual(user_profile.distance_travelled, 0)
+        self.assertEqual(len(CityVisit.objects.filter(user_profile=user_profile)), 0)
+        self.assertEqual(Country.objects.get(name=util.city1_sample_data['country_name']).log_count, 0)
+        self.assertEqual(len(GridCellRollup.objects.all()), 0)
+
+        # logs, their children and the album are deleted two rows at a time, without counting the logs out twice
+        self.assertEqual(purge_hidden_objects(batch_size=2), (3, 1, 0))
+        self.assertEqual(len(Log.all_objects.all()), 0)
+        self.assertEqual(len(Album.all_objects.filter(id=album.id)), 0)
+        self.assertEqual(len(LogPicture.objects.all()), 0)
+        self.assertEqual(len(Like.objects.all()), 0)
+        self.assertEqual(len(Comment.objects.all()), 0)
+        self.assertEqual(Country.objects.get(name=util.city1_sample_data['country_name']).log_count, 0)
+        self.assertEqual(len(CityVisit.objects.filter(user_profile=user_profile)), 0)
+
+        # the picture shared by the three logs is released once, and left to the media garbage collector
+        self.assertEqual(len(StoredBlob.objects.filter(name=picture_name)), 0)
+        self.assertEqual(len(MediaTombstone.objects.filter(name=picture_name)), 1)
+
+    def test_hidden_log_is_left_out_of_stats_right_away(self):
+        util.add_sample_log(util.log1_sample_data, util.album1_sample_data, util.city1_sample_data,
+                            util.user1_sample_data)
+        util.add_sample_log(util.log2_sample_data, util.album1_sample_data, util.city2_sample_data,
+                            util.user1_sample_data)
+        first_log, second_log = Log.objects.order_by('id')
+        Log.objects.filter(id=second_log.id).update(score=10)
+        GridCellRollup.objects.rebuild_rollups()
+        self.assertGreater(UserProfile.objects.get(id=self.user_profile_1.id).distance_travelled, 0)
+
+        # the city, country, distance and rollups of the hidden log are updated before it is purged
+        Log.objects.hide_log(second_log)
+        user_profile = UserProfile.objects.get(id=self.user_profile_1.id)
+        self.assertEqual((user_profile.city_count, user_profile.distance_travelled), (1, 0))
+        self.assertEqual(Country.objects.get(name=util.city2_sample_data['country_name']).log_count, 0)
+        self.assertEqual(len(GridCellRollup.objects.filter(top_log_id=second_log.id)), 0)
+        self.assertEqual(GridCellRollup.objects.filter(level=MIN_CLUSTER_LEVEL).aggregate(Sum('log_count')),
+                         {'log_count__sum': 1})
+
+        # hiding the log again, or purging it, doesn't count it out twice
+        Log.objects.hide_log(second_log)
+        self.assertEqual(purge_hidden_objects(), (1, 0, 0))
+        user_profile = UserProfile.objects.get(id=self.user_profile_1.id)
+        self.assertEqual(user_profile.city_count, 1)
+        self.assertEqual(len(CityVisit.objects.filter(user_profile=user_profile)), 1)
+        self.assertEqual(GridCellRollup.objects.filter(level=MIN_CLUSTER_LEVEL).aggregate(Sum('log_count')),
+                         {'log_count__sum': 1})
+
+    def test_delete_account_view(self):
+        util.add_sample_log(util.log1_sample_data, util.album1_sample_data, util.city1_sample_data,
+                            util.user1_sample_data)
+        util.add_sample_log(util.log2_sample_data, util.album2_sample_data, util.city2_sample_data,
+                            util.user2_sample_data)
+        other_log = Log.objects.get(user_profile=self.user_profile_2)
+        Like.objects.create(log=other_log, liker_user_profile=self.user_profile_1)
+        Follower.objects.create(follower_user_profile=self.user_profile_1, following_user_profile=self.user_profile_2)
+        Follower.objects.create(follower_user_profile=self.user_profile_2, following_user_profile=self.user_profile_1)
+
+        # non ajax request raises 404 error
+        response = self.client.post(util.urls['account_delete'])
+        self.assertEqual(response.status_code, 404)
+
+        # anon user gets redirected to sign in page
+        response = self.client.post(util.urls['account_delete'], HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(json.loads(response.content)['redirect_to'], util.urls['sign_in'])
+
+        # sign in user
+        is_successful = self.client.login(username=util.user1_sample_data['username'],
+                                          password=util.user1_sample_data['password'])
+        self.assertTrue(is_successful)
+
+        # the account is hidden and the user is signed out
+        response = self.client.post(util.urls['account_delete'], HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(json.loads(response.content)['redirect_to'], util.urls['home'])
+        self.assertFalse(User.objects.get(username=util.user1_sample_data['username']).is_active)
+        self.assertEqual(len(UserProfile.objects.filter(id=self.user_profile_1.id)), 0)
+        self.assertEqual(len(Log.objects.all()), 1)
+        response = self.client.get(util.urls['user_base'] + util.user1_sample_data['username'] + '/')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(self.client.login(username=util.user1_sample_data['username'],
+                                           password=util.user1_sample_data['password']))
+
+        # everything of the user is purged, the other user keeps their log
+        self.assertEqual(purge_hidden_objects(), (1, 1, 1))
+        self.assertEqual(len(User.objects.filter(username=util.user1_sample_data['username'])), 0)
+        self.assertEqual(len(UserProfile.all_objects.filter(id=self.user_profile_1.id)), 0)
+        self.assertEqual(len(Like.objects.all()), 0)
+        self.assertEqual(len(Follower.objects.all()), 0)
+        self.assertEqual(len(Log.all_objects.all()), 1)
+
+
 class LeaderBoardTest(TestCase):
 
     def tearDown(self):
@@ -1110,6 +2840,20 @@ class LeaderBoardTest(TestCase):
         self.assertIn(util.user2_sample_data['first_name'], response.content)
         self.assertIn(util.user2_sample_data['last_name'], response.content)
         self.assertIn(util.user2_sample_data['username'], response.content)
+        self.assertNotIn('In Common', response.content)
+
+        # signed in users also see how many countries and cities they have in common with everyone
+        util.add_sample_city(util.city1_sample_data)
+        util.add_sample_album(util.album1_sample_data, util.user1_sample_data)
+        util.add_sample_album(util.album1_sample_data, util.user2_sample_data)
+        util.add_sample_log(util.log1_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        util.add_sample_log(util.log2_sample_data, util.album1_sample_data, util.city1_sample_data, util.user2_sample_data)
+        self.client.login(username=util.user1_sample_data['username'], password=util.user1_sample_data['password'])
+        response = self.client.get(util.urls['leaderboard_show_base'] + 'users/')
+        self.assertIn('In Common', response.content)
+        for user_profile in response.context['requested_page_items']:
+            self.assertEqual(user_profile.common_city_count, 1)
+            self.assertEqual(user_profile.common_country_count, 1)
 
     def test_cities_appear_in_leaderboard_table(self):
         util.add_sample_city(util.city1_sample_data)
@@ -1208,6 +2952,49 @@ class LeaderBoardTest(TestCase):
         self.assertEqual(results[1], user_profile_1)
         self.assertEqual(len(results), 2)
 
+    def test_countries_appear_in_leaderboard_table(self):
+        util.add_sample_city(util.city1_sample_data)
+        util.add_sample_city(util.city2_sample_data)
+
+        response = self.client.get(util.urls['leaderboard_show_base'] + 'countries/')
+
+        self.assertIn(util.city1_sample_data['country_name'], response.content)
+        self.assertIn(util.city2_sample_data['country_name'], response.content)
+
+    def test_leaderboard_countries_search_and_rollups(self):
+        util.add_sample_city(util.city1_sample_data)
+        util.add_sample_city(util.city2_sample_data)
+        country1 = Country.objects.get(name=util.city1_sample_data['country_name'])
+        country2 = Country.objects.get(name=util.city2_sample_data['country_name'])
+
+        # countries are ranked by their total tourist count
+        self.assertEqual(country1.tourist_count, util.city1_sample_data['tourist_count'])
+        self.assertLess(country2.rank, country1.rank)
+        results = get_results('', 'countries', 'rank', 'asc')
+        self.assertEqual(list(results), [country2, country1])
+        results = get_results(util.city1_sample_data['country_name'], 'countries', 'rank', 'asc')
+        self.assertEqual(list(results), [country1])
+
+        # log and visitor counts are updated as soon as logs are created and deleted
+        util.add_sample_user_and_user_profile(util.user1_sample_data)
+        util.add_sample_album(util.album1_sample_data, util.user1_sample_data)
+        util.add_sample_log(util.log1_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        util.add_sample_log(util.log2_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        country1 = Country.objects.get(id=country1.id)
+        self.assertEqual(country1.log_count, 2)
+        self.assertEqual(country1.visitor_count, 1)
+        results = get_results('', 'countries', 'log_count', 'desc')
+        self.assertEqual(results[0], country1)
+
+        Log.objects.all()[0].delete()
+        country1 = Country.objects.get(id=country1.id)
+        self.assertEqual(country1.log_count, 1)
+        self.assertEqual(country1.visitor_count, 1)
+        Log.objects.all()[0].delete()
+        country1 = Country.objects.get(id=country1.id)
+        self.assertEqual(country1.log_count, 0)
+        self.assertEqual(country1.visitor_count, 0)
+
 
 class UserTest(TestCase):
 
@@ -1240,6 +3027,83 @@ class UserTest(TestCase):
         found = resolve(util.urls['user_base'] + 'username/')
         self.assertEqual(found.func, show_user)
 
+    def test_user_logs_are_paginated(self):
+        found = resolve(util.urls['user_get_logs_base'] + 'username/logs/')
+        self.assertEqual(found.func, get_user_logs)
+
+        # add more logs than fit in a page, some of which are posted at the same time
+        log = Log.objects.get()
+        created_at = log.created_at - datetime.timedelta(days=1)
+        Log.objects.bulk_create([Log(user_profile=self.user_profile_1, city=log.city, latitude=log.latitude,
+                                     longitude=log.longitude, description=str(i), score=0,
+                                     created_at=created_at - datetime.timedelta(hours=i / 2))
+                                 for i in range(USER_LOGS_PER_PAGE + 4)])
+        log_ids = list(Log.objects.filter(user_profile=self.user_profile_1).order_by('-created_at', '-id')
+                       .values_list('id', flat=True))
+
+        # only the first page is rendered with the user page, while the counts cover all logs
+        url = util.urls['user_base'] + util.user1_sample_data['username'] + '/'
+        response = self.client.get(url)
+        self.assertEqual([user_log.id for user_log in response.context['requested_user_logs']],
+                         log_ids[:USER_LOGS_PER_PAGE])
+        self.assertEqual(response.context['next_logs_cursor'], log_ids[USER_LOGS_PER_PAGE - 1])
+        self.assertEqual(response.context['requested_user_log_count'], len(log_ids))
+        self.assertEqual(response.context['requested_user_following_count'], 1)
+        self.assertContains(response, 'logs-next-page')
+        # the pictures, likes and comments of the page logs are attached to them
+        self.assertEqual(len(response.context['requested_user_logs'][0].pictures), 1)
+        self.assertEqual(len(response.context['requested_user_logs'][0].likes), 1)
+
+        # the next page starts after the cursor, and is the last one
+        response = self.client.get(url + 'logs/', {'before': response.context['next_logs_cursor']},
+                                   HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual([user_log.id for user_log in response.context['requested_user_logs']],
+                         log_ids[USER_LOGS_PER_PAGE:])
+        self.assertIsNone(response.context['next_logs_cursor'])
+        self.assertNotIn('logs-next-page', response.content)
+
+        # the page after a hidden log is still found, and invalid cursors or non ajax requests raise 404 error
+        Log.objects.hide_log(Log.objects.get(id=log_ids[USER_LOGS_PER_PAGE - 1]))
+        response = self.client.get(url + 'logs/', {'before': log_ids[USER_LOGS_PER_PAGE - 1]},
+                                   HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual([user_log.id for user_log in response.context['requested_user_logs']],
+                         log_ids[USER_LOGS_PER_PAGE:])
+        self.assertEqual(self.client.get(url + 'logs/', {'before': 'a'},
+                                         HTTP_X_REQUESTED_WITH='XMLHttpRequest').status_code, 404)
+        self.assertEqual(self.client.get(url + 'logs/', {'before': log_ids[0] + 1000},
+                                         HTTP_X_REQUESTED_WITH='XMLHttpRequest').status_code, 404)
+        self.assertEqual(self.client.get(url + 'logs/', {'before': log_ids[0]}).status_code, 404)
+
+    def test_user_tabs_are_loaded_lazily(self):
+        found = resolve(util.urls['user_base'] + 'username/albums/')
+        self.assertEqual(found.func, get_user_tab)
+
+        # the albums, followers and following are left out of the user page, apart from their counts
+        url = util.urls['user_base'] + util.user1_sample_data['username'] + '/'
+        response = self.client.get(url)
+        self.assertNotIn('class="album"', response.content)
+        self.assertEqual(response.context['requested_user_album_count'], 1)
+        self.assertEqual(response.context['requested_user_follower_count'], 0)
+
+        # each tab is rendered on its own
+        response = self.client.get(url + 'albums/', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertItemsEqual(response.context['requested_user_albums'], Album.objects.all())
+        self.assertIn('class="album"', response.content)
+        self.assertNotIn('album-dropdown-item-edit', response.content)
+        response = self.client.get(url + 'following/', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertContains(response, '@' + util.user2_sample_data['username'])
+        url = util.urls['user_base'] + util.user2_sample_data['username'] + '/'
+        response = self.client.get(url + 'followers/', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertContains(response, '@' + util.user1_sample_data['username'])
+
+        # albums can only be edited by their owner, and unknown tabs or non ajax requests raise 404 error
+        self.client.login(username=util.user1_sample_data['username'], password=util.user1_sample_data['password'])
+        url = util.urls['user_base'] + util.user1_sample_data['username'] + '/'
+        response = self.client.get(url + 'albums/', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertIn('album-dropdown-item-edit', response.content)
+        self.assertEqual(self.client.get(url + 'likes/', HTTP_X_REQUESTED_WITH='XMLHttpRequest').status_code, 404)
+        self.assertEqual(self.client.get(url + 'albums/').status_code, 404)
+
     def test_get_requested_user_albums(self):
         # get user1 albums
         # should return 1 album
@@ -1306,6 +3170,172 @@ class UserTest(TestCase):
         self.assertEqual(self.user_profile_2.city_count, 0)
         self.assertEqual(self.user_profile_2.country_count, 0)
 
+    def test_travel_stats_follow_log_changes(self):
+        # the log added in setUp has already been counted, without calling update_user_travel_stats
+        user_profile_1 = UserProfile.objects.get(id=self.user_profile_1.id)
+        self.assertEqual(user_profile_1.city_count, 1)
+        self.assertEqual(user_profile_1.country_count, 1)
+
+        # a second log in the same city only increments the visit's log count
+        util.add_sample_log(util.log2_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        user_profile_1 = UserProfile.objects.get(id=self.user_profile_1.id)
+        self.assertEqual(user_profile_1.city_count, 1)
+        self.assertEqual(CityVisit.objects.get(user_profile=user_profile_1).log_count, 2)
+
+        # moving a log to another city adds the city and its country
+        util.add_sample_city(util.city2_sample_data)
+        log = Log.objects.all()[0]
+        log.city = City.objects.get(name=util.city2_sample_data['name'])
+        log.save()
+        user_profile_1 = UserProfile.objects.get(id=self.user_profile_1.id)
+        self.assertEqual(user_profile_1.city_count, 2)
+        self.assertEqual(user_profile_1.country_count, 2)
+
+        # deleting the only log in a city removes the city and its country again
+        log.delete()
+        user_profile_1 = UserProfile.objects.get(id=self.user_profile_1.id)
+        self.assertEqual(user_profile_1.city_count, 1)
+        self.assertEqual(user_profile_1.country_count, 1)
+        self.assertEqual(CityVisit.objects.get(user_profile=user_profile_1).log_count, 1)
+
+    def test_get_visited_and_common_cities(self):
+        city1 = City.objects.get(name=util.city1_sample_data['name'])
+        self.assertItemsEqual(CityVisit.objects.get_visited_cities(self.user_profile_1), [city1])
+        self.assertEqual(len(CityVisit.objects.get_visited_cities(self.user_profile_2)), 0)
+        self.assertEqual(len(CityVisit.objects.get_common_cities(self.user_profile_1, self.user_profile_2)), 0)
+
+        # once user_profile_2 logs in the same city, it becomes a common city
+        util.add_sample_album(util.album1_sample_data, util.user2_sample_data)
+        util.add_sample_log(util.log2_sample_data, util.album1_sample_data, util.city1_sample_data, util.user2_sample_data)
+        self.assertItemsEqual(CityVisit.objects.get_common_cities(self.user_profile_1, self.user_profile_2), [city1])
+
+    def test_visited_bitsets_and_travel_overlap(self):
+        # bitsets round trip through their byte representation
+        bitset = positions_to_bitset([1, 3, 200])
+        self.assertEqual(bytes_to_bitset(bitset_to_bytes(bitset)), bitset)
+        self.assertEqual(bytes_to_bitset(bitset_to_bytes(0)), 0)
+        self.assertEqual(count_common_bits(bitset, positions_to_bitset([3, 200, 5])), 2)
+
+        # the log added in setUp sets the bits of city1 and its country for user_profile_1
+        city1 = City.objects.get(name=util.city1_sample_data['name'])
+        user_profile_1 = UserProfile.objects.get(id=self.user_profile_1.id)
+        self.assertEqual(user_profile_1.get_visited_city_bitset(), positions_to_bitset([city1.id]))
+        self.assertEqual(user_profile_1.get_visited_country_bitset(), positions_to_bitset([city1.country_id]))
+        user_profile_2 = UserProfile.objects.get(id=self.user_profile_2.id)
+        self.assertEqual(user_profile_1.get_travel_overlap(user_profile_2), {'city_count': 0, 'country_count': 0})
+
+        # once user_profile_2 logs in the same city, the users have 1 city and 1 country in common
+        util.add_sample_album(util.album1_sample_data, util.user2_sample_data)
+        util.add_sample_log(util.log2_sample_data, util.album1_sample_data, util.city1_sample_data, util.user2_sample_data)
+        user_profile_2 = UserProfile.objects.get(id=self.user_profile_2.id)
+        self.assertEqual(user_profile_1.get_travel_overlap(user_profile_2), {'city_count': 1, 'country_count': 1})
+
+        # overlap is attached to a list of user profiles in one pass
+        user_profiles = list(UserProfile.objects.all())
+        UserProfile.objects.attach_travel_overlap(user_profiles, user_profile_2)
+        for user_profile in user_profiles:
+            self.assertEqual(user_profile.common_city_count, 1)
+            self.assertEqual(user_profile.common_country_count, 1)
+
+        # deleting the log clears the bits again
+        Log.objects.get(user_profile=user_profile_2).delete()
+        user_profile_2 = UserProfile.objects.get(id=self.user_profile_2.id)
+        self.assertEqual(user_profile_2.get_visited_city_bitset(), 0)
+        self.assertEqual(user_profile_1.get_travel_overlap(user_profile_2), {'city_count': 0, 'country_count': 0})
+
+    def test_haversine_distances(self):
+        # a quarter of the equator, and the same distance along a meridian
+        self.assertAlmostEqual(haversine_distance(0, 0, 0, 90), 10007.543, places=3)
+        self.assertAlmostEqual(haversine_distance(0, 0, 90, 0), haversine_distance(0, 0, 0, 90))
+        self.assertEqual(haversine_distance(10, 20, 10, 20), 0)
+        distances = haversine_distances([0, 0], [0, 0], [0, 90], [90, 0])
+        self.assertAlmostEqual(distances[0], 10007.543, places=3)
+        self.assertAlmostEqual(distances[1], 10007.543, places=3)
+
+        # paths of different groups are never joined
+        ids, totals = get_path_distances([1, 1, 1, 2, 2, 3], [0, 0, 0, 90, 90, 0], [0, 90, 180, 0, 0, 0])
+        self.assertEqual(ids.tolist(), [1, 2, 3])
+        self.assertAlmostEqual(totals[0], 2 * haversine_distance(0, 0, 0, 90))
+        self.assertEqual(totals[1], 0)
+        self.assertEqual(totals[2], 0)
+
+    def test_distance_travelled_follows_log_changes(self):
+        log1_to_log2 = haversine_distance(util.log1_sample_data['latitude'], util.log1_sample_data['longitude'],
+                                          util.log2_sample_data['latitude'], util.log2_sample_data['longitude'])
+
+        # a single log does not cover any distance
+        self.assertEqual(UserProfile.objects.get(id=self.user_profile_1.id).distance_travelled, 0)
+
+        # appending logs extends the path with one segment each
+        util.add_sample_log(util.log2_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        util.add_sample_log(util.log1_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        self.assertAlmostEqual(UserProfile.objects.get(id=self.user_profile_1.id).distance_travelled,
+                               2 * log1_to_log2, places=3)
+
+        # deleting the latest log removes its segment
+        logs = list(Log.objects.filter(user_profile=self.user_profile_1).order_by('created_at', 'id'))
+        logs[2].delete()
+        self.assertAlmostEqual(UserProfile.objects.get(id=self.user_profile_1.id).distance_travelled,
+                               log1_to_log2, places=3)
+
+        # deleting a past log recomputes the path
+        util.add_sample_log(util.log1_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        logs[1].delete()
+        self.assertAlmostEqual(UserProfile.objects.get(id=self.user_profile_1.id).distance_travelled, 0, places=3)
+
+        # the batch job computes the same distances as the incremental updates
+        util.add_sample_log(util.log2_sample_data, util.album1_sample_data, util.city1_sample_data, util.user1_sample_data)
+        UserProfile.objects.filter(id=self.user_profile_1.id).update(distance_travelled=-1)
+        update_user_distances()
+        self.assertAlmostEqual(UserProfile.objects.get(id=self.user_profile_1.id).distance_travelled,
+                               log1_to_log2, places=3)
+        self.assertEqual(UserProfile.objects.get(id=self.user_profile_2.id).distance_travelled, 0)
+
+
+class UserInfluenceTest(TestCase):
+
+    def test_pagerank_favours_users_followed_by_influential_users(self):
+        # nodes 0 and 1 follow 2, 2 follows 3, and 4 is followed by nobody but follows 5
+        sources = [0, 1, 2, 4]
+        targets = [2, 2, 3, 5]
+        ranks = compute_pagerank(sources, targets, 6)
+        self.assertAlmostEqual(ranks.sum(), 1.0)
+
+        # 3 has a single follower, but that follower is followed by 2 users, so 3 beats 5
+        self.assertGreater(ranks[3], ranks[5])
+        self.assertGreater(ranks[2], ranks[0])
+
+        # warm-starting from the previous vector converges to the same ranks
+        warm_ranks = compute_pagerank(sources, targets, 6, initial_ranks=ranks * 6)
+        for rank, warm_rank in zip(ranks, warm_ranks):
+            self.assertAlmostEqual(rank, warm_rank)
+
+    def test_pagerank_without_edges_is_uniform(self):
+        ranks = compute_pagerank([], [], 4)
+        for rank in ranks:
+            self.assertAlmostEqual(rank, 0.25)
+
+    def test_update_user_influence_stores_influence_on_user_profiles(self):
+        util.add_sample_user_and_user_profile(util.user1_sample_data)
+        util.add_sample_user_and_user_profile(util.user2_sample_data)
+        user_profile_1 = util.get_user_and_user_profile(util.user1_sample_data)['user_profile']
+        user_profile_2 = util.get_user_and_user_profile(util.user2_sample_data)['user_profile']
+        Follower.objects.create(following_user_profile=user_profile_2, follower_user_profile=user_profile_1)
+
+        update_user_influence()
+
+        # influence is relative to an average user, so it sums up to the number of users
+        user_profile_1 = UserProfile.objects.get(id=user_profile_1.id)
+        user_profile_2 = UserProfile.objects.get(id=user_profile_2.id)
+        self.assertGreater(user_profile_2.influence, user_profile_1.influence)
+        self.assertAlmostEqual(user_profile_1.influence + user_profile_2.influence, 2.0, places=5)
+
+        # influence only contributes to the user score when it has a weight
+        score_without_influence = user_profile_2.compute_and_get_user_score()
+        with self.settings(USER_INFLUENCE_WEIGHT=10):
+            score_with_influence = user_profile_2.compute_and_get_user_score()
+        self.assertAlmostEqual(score_with_influence - score_without_influence, 10*user_profile_2.influence, places=4)
+
 
 class FollowerManagerTest(TestCase):
 
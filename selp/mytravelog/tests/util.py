@@ -1,13 +1,20 @@
+from io import BytesIO
 import os
+import shutil
+import struct
+
+from PIL import Image
 
 from django.contrib.auth.models import User
-from django.core.files.base import File
+from django.core.files.base import ContentFile, File
 
 from mytravelog.models.album import Album
 from mytravelog.models.city import City
 from mytravelog.models.log import Log
 from mytravelog.models.log_picture import LogPicture
 from mytravelog.models.user_profile import UserProfile
+from mytravelog.utils.derivatives import get_derivative_name
+from mytravelog.utils.storage import get_blob_name, get_content_hash
 
 
 __author__ = 'Manas'
@@ -17,7 +24,9 @@ urls = {
     'sign_up': '/mytravelog/sign_up/',
     'sign_in': '/mytravelog/sign_in/',
     'sign_out': '/mytravelog/sign_out/',
+    'account_delete': '/mytravelog/account/delete/',
     'user_base': '/mytravelog/user/',
+    'user_get_logs_base': '/mytravelog/user/',
     'city_base': '/mytravelog/city/',
     'city_autocomplete': '/mytravelog/city/autocomplete/',
     'search_base': '/mytravelog/search/',
@@ -25,11 +34,23 @@ urls = {
     'album_update_base': '/mytravelog/album/update/',
     'album_delete_base': '/mytravelog/album/delete/',
     'album_show_base': '/mytravelog/album/',
+    'album_get_pictures_base': '/mytravelog/album/pictures/',
+    'album_get_logs_base': '/mytravelog/album/logs/',
     'log_create': '/mytravelog/log/create/',
     'log_update_base': '/mytravelog/log/edit/',
     'log_delete_base': '/mytravelog/log/delete/',
     'log_show_base': '/mytravelog/log/',
     'log_get_info_for_map_base': '/mytravelog/log/get_info_for_map/',
+    'log_get_logs_in_viewport': '/mytravelog/log/get_logs_in_viewport/',
+    'log_get_clusters_in_viewport': '/mytravelog/log/get_clusters_in_viewport/',
+    'log_get_logs_near_point': '/mytravelog/log/get_logs_near_point/',
+    'log_get_upload_status_base': '/mytravelog/log/get_upload_status/',
+    'upload_start': '/mytravelog/upload/start/',
+    'upload_chunk_base': '/mytravelog/upload/chunk/',
+    'upload_offset_base': '/mytravelog/upload/offset/',
+    'upload_finalize_base': '/mytravelog/upload/finalize/',
+    'trip_import_start': '/mytravelog/trip_import/start/',
+    'trip_import_progress_base': '/mytravelog/trip_import/progress/',
     'log_show_live_feed_base': '/mytravelog/live_feed/',
     'like_create_base': '/mytravelog/like/create/',
     'like_delete_base': '/mytravelog/like/delete/',
@@ -37,7 +58,8 @@ urls = {
     'comment_delete_base': '/mytravelog/comment/delete/',
     'follower_create_base': '/mytravelog/follower/create/',
     'follower_delete_base': '/mytravelog/follower/delete/',
-    'leaderboard_show_base': '/mytravelog/leaderboard/'
+    'leaderboard_show_base': '/mytravelog/leaderboard/',
+    'heatmap_base': '/mytravelog/heatmap/'
 }
 
 city1_sample_data = {
@@ -110,7 +132,9 @@ def add_sample_city(city_sample_data):
                       country_name=city_sample_data['country_name'],
                       tourist_count=city_sample_data['tourist_count'],
                       tourist_growth=city_sample_data['tourist_growth'],
-                      description=city_sample_data['description'])
+                      description=city_sample_data['description'],
+                      latitude=city_sample_data.get('latitude'),
+                      longitude=city_sample_data.get('longitude'))
 
 
 def add_sample_user_and_user_profile(user_sample_data):
@@ -135,6 +159,52 @@ def get_small_image():
     return open(small_image_path, 'rb')
 
 
+def get_jpeg_data(width, height, color=(0, 128, 255)):
+    output = BytesIO()
+    Image.new('RGB', (width, height), color).save(output, 'JPEG')
+    return output.getvalue()
+
+
+def get_exif_data(latitude, longitude, taken_at):
+    """
+    Returns the EXIF data of a photo taken at the provided location and (naive) time, to be passed as the exif
+    argument of Image.save. It holds a little-endian TIFF structure with the pointers to the EXIF and GPS IFDs,
+    followed by the EXIF IFD with the DateTimeOriginal tag and the GPS IFD with the coordinates, in degrees.
+    """
+    def ifd(entries, offset):
+        # entries are (tag, type, count, value or data) tuples, data longer than 4 bytes follows the IFD
+        data_offset = offset + 2 + 12 * len(entries) + 4
+        header, data = struct.pack('<H', len(entries)), b''
+        for tag, field_type, count, value in entries:
+            if isinstance(value, bytes) and len(value) > 4:
+                header += struct.pack('<HHII', tag, field_type, count, data_offset + len(data))
+                data += value
+            elif isinstance(value, bytes):
+                header += struct.pack('<HHI', tag, field_type, count) + value.ljust(4, b'\x00')
+            else:
+                header += struct.pack('<HHII', tag, field_type, count, value)
+        return header + struct.pack('<I', 0) + data
+
+    def degrees(value):
+        return struct.pack('<IIIIII', int(round(abs(value) * 10000)), 10000, 0, 1, 0, 1)
+
+    date_time = taken_at.strftime('%Y:%m:%d %H:%M:%S').encode('ascii') + b'\x00'
+    exif_offset = 8 + 2 + 2 * 12 + 4
+    gps_offset = exif_offset + 2 + 12 + 4 + len(date_time)
+    tiff = b'II' + struct.pack('<HI', 42, 8)
+    tiff += ifd([(0x8769, 4, 1, exif_offset), (0x8825, 4, 1, gps_offset)], 8)
+    tiff += ifd([(0x9003, 2, len(date_time), date_time)], exif_offset)
+    gps_data = ifd([(1, 2, 2, b'N\x00' if latitude >= 0 else b'S\x00'), (2, 5, 3, degrees(latitude)),
+                    (3, 2, 2, b'E\x00' if longitude >= 0 else b'W\x00'), (4, 5, 3, degrees(longitude))], gps_offset)
+    return b'Exif\x00\x00' + tiff + gps_data
+
+
+def get_photo_data(latitude, longitude, taken_at, color=(0, 128, 255)):
+    output = BytesIO()
+    Image.new('RGB', (16, 16), color).save(output, 'JPEG', exif=get_exif_data(latitude, longitude, taken_at))
+    return output.getvalue()
+
+
 def get_user_and_user_profile(user_sample_data):
     sample_user = User.objects.get(username=user_sample_data['username'])
     sample_user_profile = UserProfile.objects.get(user=sample_user)
@@ -157,7 +227,6 @@ def add_sample_album(album_sample_data, user_sample_data):
 def get_album(album_sample_data, user_sample_data):
     album = Album.objects.get(name=album_sample_data['name'],
                               user_profile__user__username=user_sample_data['username'])
-    album.duration = (album.end_date - album.start_date).days
     return album
 
 
@@ -178,17 +247,23 @@ def add_sample_log(log_sample_data, album_sample_data, city_sample_data, user_sa
     log_picture.save()
 
 
-def delete_all_test_image_files():
-    log_pictures_dir = os.path.join(os.path.join(os.path.join(os.path.join(os.path.dirname(
-        os.path.dirname(os.path.dirname(__file__))), 'selp'), 'media'), 'mytravelog'), 'log_pictures')
-    cover_pictures_dir = os.path.join(os.path.dirname(log_pictures_dir), 'cover_pictures')
-    profile_pictures_dir = os.path.join(os.path.dirname(log_pictures_dir), 'profile_pictures')
-
-    dirs = [log_pictures_dir, cover_pictures_dir, profile_pictures_dir]
-
-    for d in dirs:
-        for f in os.listdir(d):
-            if 'small_image' in f:
-                path = os.path.join(d, f)
-                if os.path.isfile(path):
-                    os.remove(path)
\ No newline at end of file
+def delete_all_test_image_files(generated_files=()):
+    media_dir = os.path.join(os.path.join(os.path.dirname(
+        os.path.dirname(os.path.dirname(__file__))), 'selp'), 'media')
+
+    # pictures are stored under the hash of their content, so the test images are found from their content. Test
+    # images that are uploaded again from the same file object are empty, since the file was already read. Pictures
+    # generated by a test are passed in generated_files
+    test_files = [File(open(small_image_path, 'rb')), File(open(large_image_path, 'rb')), ContentFile(b'')]
+    test_files.extend(generated_files)
+    for test_file in test_files:
+        blob_name = get_blob_name(get_content_hash(test_file), 'image.jpg')
+        test_file.close()
+        path = os.path.join(media_dir, blob_name)
+        if os.path.isfile(path):
+            os.remove(path)
+
+        # derivatives of each test image are stored in a directory named after it
+        derivatives_path = os.path.dirname(os.path.join(media_dir, get_derivative_name(blob_name, 'thumb', 'jpg')))
+        if os.path.isdir(derivatives_path):
+            shutil.rmtree(derivatives_path)
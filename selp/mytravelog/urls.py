@@ -1,5 +1,5 @@
 from django.conf.urls import patterns, url
-from mytravelog.views import search, album, log, like, comment, follower, leaderboard
+from mytravelog.views import search, album, log, like, comment, follower, leaderboard, heatmap, upload, trip_import
 from mytravelog.views.live_feed import show_live_feed
 from views import home, user, city
 
@@ -11,19 +11,35 @@ urlpatterns = patterns(
     url(r'^sign_up/$', user.sign_up),
     url(r'^sign_in/$', user.sign_in),
     url(r'^sign_out/$', user.sign_out),
+    url(r'^account/delete/$', user.delete_account),
     url(r'^city/autocomplete/$', city.get_autocomplete_suggestions),
     url(r'^city/(?P<city_url_name>\w+)/$', city.show_city),
+    url(r'^city/(?P<city_url_name>\w+)/logs/$', city.get_city_logs),
     url(r'^search/$', search.search_for_cities_and_users),
     url(r'^user/(?P<username>\w+)/$', user.show_user),
+    url(r'^user/(?P<username>\w+)/logs/$', user.get_user_logs),
+    url(r'^user/(?P<username>\w+)/(?P<tab>albums|followers|following)/$', user.get_user_tab),
     url(r'^album/create/$', album.create_album),
     url(r'^album/update/(?P<album_id>\w+)/$', album.update_album),
     url(r'^album/delete/(?P<album_id>\w+)/$', album.delete_album),
+    url(r'^album/pictures/(?P<album_id>\d+)/$', album.get_album_pictures),
+    url(r'^album/logs/(?P<album_id>\d+)/$', album.get_album_logs),
     url(r'^album/(?P<album_id>\w+)/$', album.show_album),
     url(r'^log/create/$', log.create_log),
     url(r'^log/delete/(?P<log_id>\w+)/$', log.delete_log),
     url(r'^log/edit/(?P<log_id>\w+)/$', log.edit_log),
+    url(r'^log/get_logs_in_viewport/$', log.get_logs_in_viewport),
+    url(r'^log/get_clusters_in_viewport/$', log.get_clusters_in_viewport),
+    url(r'^log/get_logs_near_point/$', log.get_logs_near_point),
+    url(r'^log/get_upload_status/(?P<log_id>\w+)/$', log.get_upload_status),
     url(r'^log/(?P<log_id>\w+)/$', log.show_log),
     url(r'^log/get_info_for_map/(?P<username>\w+)/$', log.get_log_info_for_map),
+    url(r'^upload/start/$', upload.start_upload),
+    url(r'^upload/chunk/(?P<upload_id>\d+)/$', upload.upload_chunk),
+    url(r'^upload/offset/(?P<upload_id>\d+)/$', upload.get_upload_offset),
+    url(r'^upload/finalize/(?P<upload_id>\d+)/$', upload.finalize_upload),
+    url(r'^trip_import/start/$', trip_import.start_trip_import),
+    url(r'^trip_import/progress/(?P<trip_import_id>\d+)/$', trip_import.get_trip_import_progress),
     url(r'^like/create/(?P<log_id>\w+)/$', like.like_log),
     url(r'^like/delete/(?P<log_id>\w+)/$', like.dislike_log),
     url(r'^comment/create/(?P<log_id>\w+)/$', comment.create_log_comment),
@@ -31,5 +47,6 @@ urlpatterns = patterns(
     url(r'^follower/create/(?P<following_user_profile_id>\w+)/$', follower.create_follower),
     url(r'^follower/delete/(?P<following_user_profile_id>\w+)/$', follower.delete_follower),
     url(r'^live_feed/(?P<feed_filter>\w+)/$', show_live_feed),
-    url(r'^leaderboard/(?P<model>\w+)/$', leaderboard.show_leaderboard)
+    url(r'^leaderboard/(?P<model>\w+)/$', leaderboard.show_leaderboard),
+    url(r'^heatmap/(?P<zoom>\d+)/(?P<x>\d+)/(?P<y>\d+)\.png$', heatmap.show_heatmap_tile)
 )
@@ -0,0 +1,42 @@
+import binascii
+
+__author__ = 'Manas'
+
+
+def positions_to_bitset(positions):
+    """
+    Converts a list of bit positions (such as city or country ids) into a bitset.
+    :param positions: list of non-negative integers
+    :return: bitset as a (long) integer, where every provided position is set
+    """
+    bitset = 0
+    for position in positions:
+        bitset |= 1 << position
+    return bitset
+
+
+def bitset_to_bytes(bitset):
+    """
+    Serializes a bitset into big-endian bytes, so that it can be stored in a BinaryField.
+    """
+    hex_string = '%x' % bitset if bitset > 0 else ''
+    if len(hex_string) % 2 == 1:
+        hex_string = '0' + hex_string
+    return binascii.unhexlify(hex_string)
+
+
+def bytes_to_bitset(value):
+    """
+    Deserializes a bitset previously serialized using bitset_to_bytes.
+    """
+    if value is None:
+        return 0
+    hex_string = binascii.hexlify(bytes(value))
+    return int(hex_string, 16) if len(hex_string) > 0 else 0
+
+
+def count_common_bits(bitset_1, bitset_2):
+    """
+    Returns the number of positions set in both bitsets, i.e. the popcount of their AND.
+    """
+    return bin(bitset_1 & bitset_2).count('1')
@@ -103,6 +103,25 @@ def deserialize(file_name):
         infile.close()
 
 
+# reads the centroid coordinates of cities from a file named filename, within the same directory, where each line
+# holds a city name, latitude and longitude separated by '|', and returns a dict mapping city names to coordinates
+def read_city_coordinates(file_name):
+    infile = None
+    try:
+        coordinates_path = os.path.join(os.path.dirname(__file__), file_name)
+        infile = open(coordinates_path, 'rb')
+        city_coordinates = {}
+        for line in infile:
+            if len(line.strip()) > 0:
+                name, latitude, longitude = line.strip().split('|')
+                city_coordinates[name] = (float(latitude), float(longitude))
+        return city_coordinates
+    except Exception as e:
+        print repr(e)
+    finally:
+        infile.close()
+
+
 # (only used for testing)
 # write city name, url_name and info in a readable form, to a file named filename, within the same directory
 def write_to_file_readable(cities, file_name):
@@ -125,6 +144,7 @@ wikipedia = "info_dump_wikipedia.txt"
 wikipedia_readable = "info_dump_wikipedia_readable.txt"
 wikitravel = "info_dump_wikitravel.txt"
 wikitravel_readable = "info_dump_wikitravel_readable.txt"
+coordinates = "city_coordinates.txt"
 base_link_wikipedia = "http://en.wikipedia.org/wiki/"
 base_link_wikitravel = "http://wikitravel.org/en/"
 
@@ -0,0 +1,187 @@
+import base64
+from io import BytesIO
+import os
+from PIL import Image
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from mytravelog.utils.upload_limits import is_too_many_pixels
+
+__author__ = 'Manas'
+
+# derivatives are resized to fit in a square of this many pixels, from smallest to largest
+DERIVATIVE_SIZES = [
+    ('thumb', 200),
+    ('feed', 800),
+    ('full', 1600)
+]
+# derivatives are saved in each of these formats, as (file extension, Pillow format name) pairs
+DERIVATIVE_FORMATS = [
+    ('jpg', 'JPEG'),
+    ('webp', 'WEBP')
+]
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+# all derivatives are stored under this directory of the default storage, named after their picture
+DERIVATIVES_DIR = 'mytravelog/derivatives'
+# placeholders are resized to fit in a square of this many pixels, which takes a PNG of about 200 bytes
+PLACEHOLDER_SIZE = 8
+# stored for pictures without derivatives, e.g. default pictures
+MISSING_PICTURE_INFO = {
+    'width': 0,
+    'height': 0,
+    'placeholder': ''
+}
+
+
+def is_format_supported(image_format):
+    # WebP support is optional in Pillow, as it depends on libwebp being available when Pillow is built
+    Image.init()
+    return image_format in Image.SAVE
+
+
+def get_derivative_name(name, size_name, extension):
+    """
+    Returns the name of the derivative of the picture with the provided name (relative to its storage). The
+    name only depends on the name of the picture, so derivatives can be found without being looked up, e.g.
+    mytravelog/log_pictures/picture.jpg -> mytravelog/derivatives/mytravelog/log_pictures/picture/thumb.webp
+    """
+    return DERIVATIVES_DIR + '/' + os.path.splitext(name.lstrip('/'))[0] + '/' + size_name + '.' + extension
+
+
+def render_derivative(image, max_size, image_format):
+    """
+    Returns the image scaled down to fit in a square of max_size pixels (images are never scaled up),
+    encoded in the provided format.
+    """
+    derivative = image.copy()
+    derivative.thumbnail((max_size, max_size), Image.ANTIALIAS)
+    if image_format == 'JPEG' and derivative.mode != 'RGB':
+        # JPEG has no alpha channel, so transparent pixels are made white
+        background = Image.new('RGB', derivative.size, (255, 255, 255))
+        background.paste(derivative, mask=derivative.split()[3])
+        derivative = background
+    output = BytesIO()
+    if image_format == 'JPEG':
+        derivative.save(output, image_format, quality=JPEG_QUALITY, optimize=True, progressive=True)
+    else:
+        derivative.save(output, image_format, quality=WEBP_QUALITY)
+    return output.getvalue()
+
+
+def render_placeholder(image):
+    """
+    Returns the image scaled down to fit in a square of PLACEHOLDER_SIZE pixels, as a data uri of a PNG. Pages
+    inline it below the picture, where browsers scale it up into a blurred preview until the picture is loaded.
+    """
+    placeholder = image.copy()
+    placeholder.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.ANTIALIAS)
+    output = BytesIO()
+    placeholder.save(output, 'PNG', optimize=True)
+    return 'data:image/png;base64,' + base64.b64encode(output.getvalue())
+
+
+def open_picture(storage, name):
+    """
+    Opens and decodes the picture with the provided name, converted to RGB (or RGBA if it has transparent pixels).
+    :return: the image, or None if the picture could not be read or has too many pixels
+    """
+    try:
+        picture_file = storage.open(name, 'rb')
+        try:
+            image = Image.open(picture_file)
+            # opening the picture only reads its header, so that decompression bombs are never decoded
+            if is_too_many_pixels(image.size):
+                return None
+            image.load()
+        finally:
+            picture_file.close()
+    except (IOError, OSError, ValueError):
+        return None
+    if image.mode in ['RGBA', 'LA'] or (image.mode == 'P' and 'transparency' in image.info):
+        return image.convert('RGBA')
+    elif image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+
+def get_picture_info(image):
+    """
+    Returns the intrinsic width and height of the picture and its placeholder, which are stored along with it.
+    """
+    return {
+        'width': image.size[0],
+        'height': image.size[1],
+        'placeholder': render_placeholder(image)
+    }
+
+
+def get_picture_info_field_name(field_name, key):
+    # the picture info of an ImageField is stored in fields named after it (e.g. cover_picture_width), except for the
+    # picture of LogPicture (e.g. width)
+    return key if field_name == 'picture' else field_name + '_' + key
+
+
+def get_picture_info_fields(field_name, picture_info):
+    """
+    Returns the values of the fields storing the picture info of the ImageField with the provided name. Profile
+    pictures are only shown small, so only their width is stored.
+    """
+    keys = ['width'] if field_name == 'profile_picture' else picture_info.keys()
+    return dict((get_picture_info_field_name(field_name, key), picture_info[key]) for key in keys)
+
+
+def has_derivatives(field_file):
+    """
+    Tells if the picture in the provided ImageField file has derivatives, from the width stored along with it once
+    they are created, so that the storage is never looked up while a page is rendered.
+    """
+    return getattr(field_file.instance, get_picture_info_field_name(field_file.field.name, 'width'), 0) > 0
+
+
+def create_derivatives(field_file):
+    """
+    Creates every derivative of the picture in the provided ImageField file, in every supported
+    format, replacing any existing derivatives of it.
+    :return: the picture info (see get_picture_info), or None if the picture could not be read or
+    has too many pixels
+    """
+    image = open_picture(field_file.storage, field_file.name)
+    if image is None:
+        return None
+
+    for size_name, max_size in DERIVATIVE_SIZES:
+        for extension, image_format in DERIVATIVE_FORMATS:
+            if is_format_supported(image_format):
+                name = get_derivative_name(field_file.name, size_name, extension)
+                # storages pick another name if the file exists, but derivatives must keep their name
+                if default_storage.exists(name):
+                    default_storage.delete(name)
+                default_storage.save(name, ContentFile(render_derivative(image, max_size, image_format)))
+    return get_picture_info(image)
+
+
+def delete_derivatives(name):
+    for size_name, max_size in DERIVATIVE_SIZES:
+        for extension, image_format in DERIVATIVE_FORMATS:
+            derivative_name = get_derivative_name(name, size_name, extension)
+            if default_storage.exists(derivative_name):
+                default_storage.delete(derivative_name)
+
+
+def get_derivative_url(field_file, width, accepts_webp=False):
+    """
+    Returns the url of the smallest derivative of the picture that is at least width pixels wide (or the
+    largest one), preferring WebP if the browser accepts it. If the picture has no derivatives (e.g. the
+    default pictures, or pictures uploaded before derivatives were created), then the url of the picture
+    itself is returned. Derivatives are created in every supported format, so WebP derivatives exist as
+    long as WebP is supported.
+    """
+    if not has_derivatives(field_file):
+        return field_file.url
+    size_name = DERIVATIVE_SIZES[-1][0]
+    for name, max_size in DERIVATIVE_SIZES:
+        if max_size >= width:
+            size_name = name
+            break
+    extension = 'webp' if accepts_webp and is_format_supported('WEBP') else 'jpg'
+    return default_storage.url(get_derivative_name(field_file.name, size_name, extension))
@@ -0,0 +1,98 @@
+import datetime
+from PIL import Image
+from django.utils import timezone
+from mytravelog.utils.upload_limits import is_too_many_pixels
+
+__author__ = 'Manas'
+
+# EXIF tags of the time the photo was taken (in the local time of the camera), and of its GPS info
+DATE_TIME_ORIGINAL_TAG = 36867
+DATE_TIME_TAG = 306
+GPS_INFO_TAG = 34853
+# GPS tags, the GPS date and time stamps are in UTC
+GPS_LATITUDE_REF_TAG = 1
+GPS_LATITUDE_TAG = 2
+GPS_LONGITUDE_REF_TAG = 3
+GPS_LONGITUDE_TAG = 4
+GPS_TIME_STAMP_TAG = 7
+GPS_DATE_STAMP_TAG = 29
+EXIF_DATE_FORMAT = '%Y:%m:%d'
+EXIF_DATE_TIME_FORMAT = '%Y:%m:%d %H:%M:%S'
+
+
+def rational_to_float(rational):
+    # rationals are read as (numerator, denominator) tuples
+    numerator, denominator = rational
+    return float(numerator) / denominator
+
+
+def get_coordinate(degrees_minutes_seconds, ref):
+    degrees, minutes, seconds = [rational_to_float(rational) for rational in degrees_minutes_seconds]
+    coordinate = degrees + minutes / 60 + seconds / 3600
+    if ref in ['S', 'W']:
+        return -coordinate
+    return coordinate
+
+
+def get_photo_location(gps_info):
+    """
+    Returns the location in the GPS info of a photo as a (latitude, longitude) tuple, or None if it has no
+    valid location.
+    """
+    try:
+        latitude = get_coordinate(gps_info[GPS_LATITUDE_TAG], gps_info.get(GPS_LATITUDE_REF_TAG, 'N'))
+        longitude = get_coordinate(gps_info[GPS_LONGITUDE_TAG], gps_info.get(GPS_LONGITUDE_REF_TAG, 'E'))
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return None
+    if not (-90 <= latitude <= 90) or not (-180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
+
+def get_photo_time(exif, gps_info):
+    """
+    Returns the time the photo was taken, from the GPS date and time stamps if it has them, since they are in
+    UTC, else from the time set in the camera, which is taken as UTC as well.
+    :return: an aware datetime, or None if the photo has no valid time
+    """
+    try:
+        taken_at = datetime.datetime.strptime(gps_info[GPS_DATE_STAMP_TAG], EXIF_DATE_FORMAT)
+        hours, minutes, seconds = [rational_to_float(rational) for rational in gps_info[GPS_TIME_STAMP_TAG]]
+        taken_at += datetime.timedelta(hours=hours, minutes=minutes, seconds=int(seconds))
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        taken_at = None
+        for tag in [DATE_TIME_ORIGINAL_TAG, DATE_TIME_TAG]:
+            try:
+                taken_at = datetime.datetime.strptime(exif[tag].strip('\x00 '), EXIF_DATE_TIME_FORMAT)
+                break
+            except (KeyError, AttributeError, ValueError):
+                continue
+    if taken_at is None:
+        return None
+    return timezone.make_aware(taken_at, timezone.utc)
+
+
+def read_photo_metadata(path):
+    """
+    Reads the location and time the photo was taken from its EXIF data. Only the header of the photo is
+    read, so that photos are never decoded here, and photos with too many pixels are left out.
+    :return: tuple of (path, latitude, longitude, taken_at), where the location and time are None if the photo
+    doesn't have them or is not a valid image
+    """
+    try:
+        with open(path, 'rb') as photo_file:
+            image = Image.open(photo_file)
+            if is_too_many_pixels(image.size) or not hasattr(image, '_getexif'):
+                return path, None, None, None
+            exif = image._getexif() or {}
+    except Exception:
+        # Pillow raises all kinds of errors for invalid images and EXIF data
+        return path, None, None, None
+    gps_info = exif.get(GPS_INFO_TAG)
+    if not isinstance(gps_info, dict):
+        gps_info = {}
+    location = get_photo_location(gps_info)
+    taken_at = get_photo_time(exif, gps_info)
+    if location is None:
+        return path, None, None, taken_at
+    return path, location[0], location[1], taken_at
@@ -0,0 +1,155 @@
+import math
+import numpy as np
+
+__author__ = 'Manas'
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_distance(latitude_1, longitude_1, latitude_2, longitude_2):
+    """
+    Returns the great-circle distance in kilometres between two points given in degrees.
+    """
+    latitude_1, longitude_1, latitude_2, longitude_2 = map(math.radians, map(float, [latitude_1, longitude_1,
+                                                                                     latitude_2, longitude_2]))
+    a = math.sin((latitude_2 - latitude_1) / 2) ** 2 + \
+        math.cos(latitude_1) * math.cos(latitude_2) * math.sin((longitude_2 - longitude_1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def to_unit_vector(latitude, longitude):
+    """
+    Returns the point given in degrees as an (x, y, z) point on the unit sphere, so that points can be compared
+    by their euclidean (chord) distance, which grows with the great-circle distance between them.
+    """
+    latitude = math.radians(float(latitude))
+    longitude = math.radians(float(longitude))
+    return math.cos(latitude) * math.cos(longitude), math.cos(latitude) * math.sin(longitude), math.sin(latitude)
+
+
+def get_chord_length(distance):
+    """
+    Returns the length of the chord between two points on the unit sphere that are distance kilometres apart.
+    """
+    return 2 * math.sin(min(float(distance) / EARTH_RADIUS_KM, math.pi) / 2)
+
+
+def haversine_distances(latitudes_1, longitudes_1, latitudes_2, longitudes_2):
+    """
+    Vectorized version of haversine_distance, returns a numpy array where the i-th distance
+    is the distance in kilometres between the i-th points of both sets of coordinates.
+    """
+    latitudes_1, longitudes_1, latitudes_2, longitudes_2 = [np.radians(np.asarray(values, dtype=np.float64))
+                                                            for values in [latitudes_1, longitudes_1,
+                                                                           latitudes_2, longitudes_2]]
+    a = np.sin((latitudes_2 - latitudes_1) / 2) ** 2 + \
+        np.cos(latitudes_1) * np.cos(latitudes_2) * np.sin((longitudes_2 - longitudes_1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def get_path_distances(group_ids, latitudes, longitudes):
+    """
+    Sums up the distance travelled along several paths at once. The points of all paths are
+    provided as parallel arrays, sorted by path and then chronologically within each path.
+    :param group_ids: numpy array of the path (e.g. user profile id) each point belongs to
+    :param latitudes: numpy array of latitudes in degrees
+    :param longitudes: numpy array of longitudes in degrees
+    :return: tuple of (unique group ids, total distance in kilometres travelled along each of their paths)
+    """
+    group_ids = np.asarray(group_ids, dtype=np.int64)
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    unique_group_ids, group_positions = np.unique(group_ids, return_inverse=True)
+    if len(group_ids) < 2:
+        return unique_group_ids, np.zeros(len(unique_group_ids))
+
+    # distance between every two consecutive points, only kept if both points belong to the same path
+    segments = haversine_distances(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:])
+    segments[group_positions[:-1] != group_positions[1:]] = 0
+    totals = np.bincount(group_positions[1:], weights=segments, minlength=len(unique_group_ids))
+    return unique_group_ids, totals
+
+
+def get_grid_size(level):
+    # the world is split into 2^level rows of latitude and 2^level columns of longitude
+    return 2 ** level
+
+
+def get_grid_row_and_column(latitude, longitude, level):
+    grid_size = get_grid_size(level)
+    row = int(math.floor((float(latitude) + 90) / 180 * grid_size))
+    column = int(math.floor((float(longitude) + 180) / 360 * grid_size))
+    # points on the north pole or the antimeridian belong to the last row/column
+    return min(max(row, 0), grid_size - 1), min(max(column, 0), grid_size - 1)
+
+
+def get_grid_cell_id(latitude, longitude, level):
+    """
+    Returns the id of the grid cell containing the point at the provided level. Cells are
+    numbered row by row from the south-west corner, so the cells of a row have consecutive ids.
+    """
+    row, column = get_grid_row_and_column(latitude, longitude, level)
+    return row * get_grid_size(level) + column
+
+
+def get_grid_cell_ranges(min_latitude, min_longitude, max_latitude, max_longitude, level, max_ranges=None):
+    """
+    Returns the ranges of grid cell ids covering the bounding box. Since the cells of a row
+    have consecutive ids, there is one range per row, or two if the box crosses the antimeridian
+    (i.e. min_longitude > max_longitude).
+    :param max_ranges: if more ranges are needed, a single range covering all rows of the bounding box is returned
+    :return: list of (first cell id, last cell id) tuples, both inclusive
+    """
+    grid_size = get_grid_size(level)
+    min_row, min_column = get_grid_row_and_column(min_latitude, min_longitude, level)
+    max_row, max_column = get_grid_row_and_column(max_latitude, max_longitude, level)
+    if float(min_longitude) <= float(max_longitude):
+        column_ranges = [(min_column, max_column)]
+    else:
+        column_ranges = [(min_column, grid_size - 1), (0, max_column)]
+    if max_ranges is not None and (max_row - min_row + 1) * len(column_ranges) > max_ranges:
+        return [(min_row * grid_size, (max_row + 1) * grid_size - 1)]
+    ranges = []
+    for row in range(min_row, max_row + 1):
+        for first_column, last_column in column_ranges:
+            ranges.append((row * grid_size + first_column, row * grid_size + last_column))
+    return ranges
+
+
+def get_bounding_box(latitude, longitude, radius):
+    """
+    Returns the smallest bounding box containing all points within radius kilometres of the point given in degrees,
+    as a (min_latitude, min_longitude, max_latitude, max_longitude) tuple. The box crosses the antimeridian
+    (i.e. min_longitude > max_longitude) if the circle does, and spans all longitudes if it contains a pole.
+    """
+    latitude = float(latitude)
+    longitude = float(longitude)
+    angular_radius = float(radius) / EARTH_RADIUS_KM
+    min_latitude = latitude - math.degrees(angular_radius)
+    max_latitude = latitude + math.degrees(angular_radius)
+    if min_latitude <= -90 or max_latitude >= 90:
+        return max(min_latitude, -90), -180, min(max_latitude, 90), 180
+    # the circle is widest closer to the pole than the point itself, so this is more than radius / cos(latitude)
+    longitude_radius = math.degrees(math.asin(min(math.sin(angular_radius) / math.cos(math.radians(latitude)), 1.0)))
+    min_longitude = longitude - longitude_radius
+    max_longitude = longitude + longitude_radius
+    if min_longitude < -180:
+        min_longitude += 360
+    if max_longitude > 180:
+        max_longitude -= 360
+    return min_latitude, min_longitude, max_latitude, max_longitude
+
+
+def get_child_cell_ranges(cell_id, level, child_level):
+    """
+    Returns the ranges of ids of all grid cells at child_level (which must not be lower than level) that
+    are contained in the grid cell at level, in the same format as get_grid_cell_ranges.
+    """
+    scale = get_grid_size(child_level - level)
+    child_grid_size = get_grid_size(child_level)
+    row, column = divmod(cell_id, get_grid_size(level))
+    ranges = []
+    for child_row in range(row * scale, (row + 1) * scale):
+        first_child_cell_id = child_row * child_grid_size + column * scale
+        ranges.append((first_child_cell_id, first_child_cell_id + scale - 1))
+    return ranges
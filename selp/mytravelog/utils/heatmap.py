@@ -0,0 +1,310 @@
+from functools import partial
+from io import BytesIO
+import math
+import multiprocessing
+import os
+import threading
+import time
+from PIL import Image
+from django.conf import settings
+import numpy as np
+
+from mytravelog.utils.geo import get_grid_row_and_column
+
+__author__ = 'Manas'
+
+TILE_SIZE = 256
+# tiles are only rendered up to this zoom level, beyond it the heatmap would show single logs anyway
+MAX_HEATMAP_ZOOM = 12
+# every log is spread over the pixels within this radius, so tiles also need the logs just outside of them
+BLUR_RADIUS = 12
+# number of logs per pixel (after blurring) at which the heatmap reaches its hottest colour
+SATURATION_COUNT = 0.05
+# latitude limit of the web mercator projection used by slippy maps
+MAX_MERCATOR_LATITUDE = 85.0511
+# tiles are drawn from the grid cell rollups at zoom + 5, whose cells are 8 pixels wide on the tile and are hidden
+# by the blur, tiles of deeper zoom levels only cover a few logs, which are drawn one by one
+ROLLUP_LEVEL_OFFSET = 5
+# a web worker evicts tiles from the cache once it has written this fraction of HEATMAP_TILE_CACHE_SIZE since its
+# last eviction, instead of walking the whole cache after every write
+EVICTION_WRITE_FRACTION = 0.05
+# rows of changed tiles are kept at least this many seconds, for the tiles that are still being rendered
+CHANGED_TILE_MIN_AGE = 10 * 60
+
+# colour ramp from cold to hot, as (intensity, red, green, blue, alpha) stops
+COLOUR_STOPS = np.array([
+    [0.0, 0, 0, 255, 0],
+    [0.25, 0, 128, 255, 120],
+    [0.5, 0, 255, 128, 170],
+    [0.75, 255, 255, 0, 200],
+    [1.0, 255, 0, 0, 230]
+], dtype=np.float64)
+
+_render_pool = None
+# results of the tiles being rendered in the pool by this web worker, by (zoom, x, y)
+_rendering_tiles = {}
+_rendering_tiles_lock = threading.Lock()
+# number of bytes of tiles written by this web worker since its last eviction
+_written_size = 0
+_written_size_lock = threading.Lock()
+
+
+def get_world_pixel(latitude, longitude, zoom):
+    """
+    Returns the position of the point on the whole web mercator map at the zoom level, in pixels.
+    """
+    latitude = math.radians(min(max(float(latitude), -MAX_MERCATOR_LATITUDE), MAX_MERCATOR_LATITUDE))
+    world_size = TILE_SIZE * 2 ** zoom
+    pixel_x = (float(longitude) + 180) / 360 * world_size
+    pixel_y = (1 - math.log(math.tan(latitude) + 1 / math.cos(latitude)) / math.pi) / 2 * world_size
+    return pixel_x, pixel_y
+
+
+def get_world_pixels(latitudes, longitudes, zoom):
+    """
+    Vectorized version of get_world_pixel, returns numpy arrays of x and y pixel positions.
+    """
+    latitudes = np.radians(np.clip(np.asarray(latitudes, dtype=np.float64),
+                                   -MAX_MERCATOR_LATITUDE, MAX_MERCATOR_LATITUDE))
+    world_size = TILE_SIZE * 2 ** zoom
+    pixel_xs = (np.asarray(longitudes, dtype=np.float64) + 180) / 360 * world_size
+    pixel_ys = (1 - np.log(np.tan(latitudes) + 1 / np.cos(latitudes)) / np.pi) / 2 * world_size
+    return pixel_xs, pixel_ys
+
+
+def get_coordinates(pixel_x, pixel_y, zoom):
+    """
+    Inverse of get_world_pixel, returns the (latitude, longitude) of the pixel position at the zoom level.
+    """
+    world_size = float(TILE_SIZE * 2 ** zoom)
+    longitude = pixel_x / world_size * 360 - 180
+    latitude = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * pixel_y / world_size))))
+    return latitude, longitude
+
+
+def get_tile_bbox(zoom, x, y):
+    """
+    Returns the bounding box of all logs that can show up on the tile, i.e. the tile extended by the
+    blur radius, as a (min_latitude, min_longitude, max_latitude, max_longitude) tuple.
+    """
+    world_size = TILE_SIZE * 2 ** zoom
+    min_pixel_y = max(y * TILE_SIZE - BLUR_RADIUS, 0)
+    max_pixel_y = min((y + 1) * TILE_SIZE + BLUR_RADIUS, world_size)
+    max_latitude = get_coordinates(0, min_pixel_y, zoom)[0]
+    min_latitude = get_coordinates(0, max_pixel_y, zoom)[0]
+    # logs at the poles are drawn on the edge of the map
+    if min_pixel_y == 0:
+        max_latitude = 90
+    if max_pixel_y == world_size:
+        min_latitude = -90
+    if TILE_SIZE + 2 * BLUR_RADIUS >= world_size:
+        return min_latitude, -180, max_latitude, 180
+    # longitudes are wrapped around, so the bounding box may cross the antimeridian
+    min_longitude = (x * TILE_SIZE - BLUR_RADIUS) * 360.0 / world_size - 180
+    max_longitude = ((x + 1) * TILE_SIZE + BLUR_RADIUS) * 360.0 / world_size - 180
+    if min_longitude < -180:
+        min_longitude += 360
+    if max_longitude > 180:
+        max_longitude -= 360
+    return min_latitude, min_longitude, max_latitude, max_longitude
+
+
+def get_tile_pixels(latitudes, longitudes, zoom, x, y):
+    """
+    Returns the positions of the points relative to the top left corner of the tile, in pixels. Points
+    on the other side of the antimeridian are moved next to the tile.
+    """
+    world_size = TILE_SIZE * 2 ** zoom
+    pixel_xs, pixel_ys = get_world_pixels(latitudes, longitudes, zoom)
+    pixel_xs -= x * TILE_SIZE
+    pixel_ys -= y * TILE_SIZE
+    # distance from the centre of the tile along the x axis is at most half of the world
+    pixel_xs[pixel_xs - TILE_SIZE / 2.0 < -world_size / 2.0] += world_size
+    pixel_xs[pixel_xs - TILE_SIZE / 2.0 > world_size / 2.0] -= world_size
+    return pixel_xs, pixel_ys
+
+
+def get_tiles_drawing_point(latitude, longitude):
+    """
+    Returns the (zoom, x, y) tuples of the tiles at every zoom level that a log at the point is drawn on. Logs are
+    drawn at the centroid of their grid cell at zoom + ROLLUP_LEVEL_OFFSET (or at the point itself, which is inside
+    that cell), so these are the tiles within the blur radius of that cell.
+    """
+    tiles = []
+    for zoom in range(0, MAX_HEATMAP_ZOOM + 1):
+        tile_count = 2 ** zoom
+        level = zoom + ROLLUP_LEVEL_OFFSET
+        row, column = get_grid_row_and_column(latitude, longitude, level)
+        cell_height = 180.0 / 2 ** level
+        cell_width = 360.0 / 2 ** level
+        min_pixel_x, min_pixel_y = get_world_pixel((row + 1) * cell_height - 90, column * cell_width - 180, zoom)
+        max_pixel_x, max_pixel_y = get_world_pixel(row * cell_height - 90, (column + 1) * cell_width - 180, zoom)
+        first_x = int(math.floor((min_pixel_x - BLUR_RADIUS) / TILE_SIZE))
+        last_x = int(math.floor((max_pixel_x + BLUR_RADIUS) / TILE_SIZE))
+        first_y = max(int(math.floor((min_pixel_y - BLUR_RADIUS) / TILE_SIZE)), 0)
+        last_y = min(int(math.floor((max_pixel_y + BLUR_RADIUS) / TILE_SIZE)), tile_count - 1)
+        # tiles are wrapped around the antimeridian
+        tile_xs = set(x % tile_count for x in range(first_x, last_x + 1))
+        tiles.extend((zoom, x, y) for x in tile_xs for y in range(first_y, last_y + 1))
+    return tiles
+
+
+def render_tile(pixel_xs, pixel_ys, log_counts):
+    """
+    Renders a heatmap tile from the positions of points relative to the tile, and the number of logs at each
+    of them. Logs are counted per pixel, spread over the blur radius and mapped onto the colour ramp, and the
+    tile is returned as PNG data. This function doesn't touch the database, so it can run in a separate process.
+    """
+    padded_size = TILE_SIZE + 2 * BLUR_RADIUS
+    counts = np.histogram2d(np.asarray(pixel_ys, dtype=np.float64), np.asarray(pixel_xs, dtype=np.float64),
+                            bins=padded_size, range=[[-BLUR_RADIUS, TILE_SIZE + BLUR_RADIUS]] * 2,
+                            weights=np.asarray(log_counts, dtype=np.float64))[0]
+
+    # separable box blur, using cumulative sums along each axis
+    window = 2 * BLUR_RADIUS + 1
+    density = counts
+    for axis in [0, 1]:
+        cumulative = np.cumsum(np.insert(density, 0, 0, axis=axis), axis=axis)
+        density = (np.take(cumulative, range(window, padded_size + 1), axis=axis) -
+                   np.take(cumulative, range(0, padded_size + 1 - window), axis=axis))
+    density /= window * window
+
+    intensity = np.clip(np.log1p(density / SATURATION_COUNT * (math.e - 1)), 0, 1)
+    pixels = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+    for channel in range(4):
+        pixels[:, :, channel] = np.interp(intensity, COLOUR_STOPS[:, 0], COLOUR_STOPS[:, channel + 1])
+    pixels[density == 0] = 0
+
+    output = BytesIO()
+    Image.fromarray(pixels, 'RGBA').save(output, 'PNG')
+    return output.getvalue()
+
+
+def render_tile_in_pool(zoom, x, y, pixel_xs, pixel_ys, log_counts, points_read_at, timeout):
+    """
+    Renders the tile in the render process pool, where it is cached on disk once it is rendered, so that
+    a burst of tile requests can't keep all web workers busy. A tile that is already being rendered is not
+    rendered again. If HEATMAP_RENDER_PROCESSES is set to 0, then the tile is rendered in this process.
+    :param points_read_at: time (in seconds since the epoch) at which the points were read from the database
+    :param timeout: number of seconds to wait for the tile
+    :return: PNG data of the tile, or None if it is still being rendered after the timeout
+    """
+    global _render_pool
+    process_count = getattr(settings, 'HEATMAP_RENDER_PROCESSES', 2)
+    if process_count == 0:
+        data = render_tile(pixel_xs, pixel_ys, log_counts)
+        write_cached_tile(zoom, x, y, data, points_read_at)
+        return data
+    with _rendering_tiles_lock:
+        if _render_pool is None:
+            _render_pool = multiprocessing.Pool(process_count)
+        result = _rendering_tiles.get((zoom, x, y))
+        # results are only ready after their callback, so a ready result is left over from a failed render
+        if result is None or result.ready():
+            result = _render_pool.apply_async(render_tile, (pixel_xs, pixel_ys, log_counts),
+                                              callback=partial(write_rendered_tile, zoom, x, y, points_read_at))
+            _rendering_tiles[(zoom, x, y)] = result
+    try:
+        return result.get(timeout)
+    except multiprocessing.TimeoutError:
+        return None
+
+
+def write_rendered_tile(zoom, x, y, points_read_at, data):
+    # called in the result handler thread of the pool, once the tile has been rendered
+    write_cached_tile(zoom, x, y, data, points_read_at)
+    with _rendering_tiles_lock:
+        del _rendering_tiles[(zoom, x, y)]
+
+
+def get_tile_path(zoom, x, y):
+    return os.path.join(settings.HEATMAP_TILE_DIR, str(zoom), str(x), str(y) + '.png')
+
+
+def read_cached_tile(zoom, x, y):
+    """
+    Returns the PNG data of the tile if it is cached on disk, along with the time at which its logs were read
+    to render it (its modification time), else None. The access time of the tile is set to now, so that the
+    tiles used the longest time ago are evicted first.
+    """
+    path = get_tile_path(zoom, x, y)
+    try:
+        with open(path, 'rb') as tile_file:
+            rendered_at = os.fstat(tile_file.fileno()).st_mtime
+            data = tile_file.read()
+        os.utime(path, (time.time(), rendered_at))
+    except (IOError, OSError):
+        return None
+    return data, rendered_at
+
+
+def write_cached_tile(zoom, x, y, data, points_read_at):
+    """
+    Caches the PNG data of the tile on disk, with the time at which its points were read as its modification
+    time, so that logs added while it was rendered mark it as changed (see HeatmapTile). Once this web worker
+    has written EVICTION_WRITE_FRACTION of HEATMAP_TILE_CACHE_SIZE bytes, the cache is evicted down to that size.
+    """
+    global _written_size
+    path = get_tile_path(zoom, x, y)
+    if not os.path.exists(os.path.dirname(path)):
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            # created by another worker in the meantime
+            pass
+    # write to a temporary file first, so that other workers never read a partially written tile
+    temporary_path = path + '.' + str(os.getpid()) + '.' + str(threading.current_thread().ident) + '.tmp'
+    with open(temporary_path, 'wb') as tile_file:
+        tile_file.write(data)
+    os.utime(temporary_path, (time.time(), points_read_at))
+    os.rename(temporary_path, path)
+
+    max_size = getattr(settings, 'HEATMAP_TILE_CACHE_SIZE', 100 * 1024 * 1024)
+    with _written_size_lock:
+        _written_size += len(data)
+        should_evict = _written_size > max_size * EVICTION_WRITE_FRACTION
+        if should_evict:
+            _written_size = 0
+    if should_evict:
+        evict_cached_tiles(max_size)
+
+
+def evict_cached_tiles(max_size):
+    """
+    Deletes the tiles used the longest time ago until the cache fits in max_size bytes. The rows of changed
+    tiles (see HeatmapTile) are deleted as well once every cached tile has been rendered since they changed.
+    :return: number of deleted tiles
+    """
+    # imported inside method to prevent circular dependencies
+    from mytravelog.models.heatmap_tile import HeatmapTile
+
+    tiles = []
+    total_size = 0
+    for directory, directory_names, file_names in os.walk(settings.HEATMAP_TILE_DIR):
+        for file_name in file_names:
+            # temporary files are renamed to tiles as soon as they are written
+            if file_name.endswith('.tmp'):
+                continue
+            path = os.path.join(directory, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            tiles.append((stat.st_atime, stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+    tiles.sort()
+    deleted_count = 0
+    oldest_rendered_at = time.time() - CHANGED_TILE_MIN_AGE
+    for used_at, rendered_at, size, path in tiles:
+        if total_size <= max_size:
+            oldest_rendered_at = min(oldest_rendered_at, rendered_at)
+            continue
+        try:
+            os.remove(path)
+            deleted_count += 1
+        except OSError:
+            pass
+        total_size -= size
+    HeatmapTile.objects.filter(changed_at__lt=oldest_rendered_at).delete()
+    return deleted_count
+
@@ -0,0 +1,54 @@
+import numpy as np
+
+__author__ = 'Manas'
+
+
+def compute_pagerank(sources, targets, node_count, initial_ranks=None, damping=0.85, tolerance=1.0e-8,
+                     max_iterations=100):
+    """
+    Computes a PageRank vector over a directed graph using sparse power iteration.
+    The graph is described by two parallel integer arrays, where the i-th edge goes
+    from sources[i] to targets[i], and every node is a position in [0, node_count).
+    Each iteration is a single scatter-add over the edge arrays, so a graph with 1M
+    edges converges in a fraction of a second per iteration.
+    :param sources: numpy array of node positions where each edge starts (the follower)
+    :param targets: numpy array of node positions where each edge ends (the user being followed)
+    :param node_count: total number of nodes in the graph, including nodes without any edges
+    :param initial_ranks: optional previous rank vector used to warm-start the iteration
+    :param damping: probability of following an edge instead of jumping to a random node
+    :param tolerance: iteration stops once the L1 change between two iterations falls below this value
+    :param max_iterations: upper bound on the number of iterations
+    :return: numpy array of ranks that sums up to 1
+    """
+    if node_count == 0:
+        return np.zeros(0)
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+
+    # every node spreads its rank evenly across all of its outgoing edges
+    out_degrees = np.bincount(sources, minlength=node_count).astype(np.float64)
+    edge_weights = 1.0 / out_degrees[sources] if len(sources) > 0 else np.zeros(0)
+    dangling_nodes = out_degrees == 0
+
+    # start from the previous vector if one is provided, else from a uniform vector
+    ranks = None
+    if initial_ranks is not None:
+        ranks = np.asarray(initial_ranks, dtype=np.float64).clip(min=0)
+        if len(ranks) != node_count or ranks.sum() == 0:
+            ranks = None
+        else:
+            ranks = ranks / ranks.sum()
+    if ranks is None:
+        ranks = np.ones(node_count) / node_count
+
+    teleport = (1.0 - damping) / node_count
+    for iteration in range(max_iterations):
+        spread = np.bincount(targets, weights=ranks[sources] * edge_weights, minlength=node_count)
+        # rank held by nodes without outgoing edges is spread evenly across all nodes
+        dangling_rank = ranks[dangling_nodes].sum() / node_count
+        new_ranks = damping * (spread + dangling_rank) + teleport
+        change = np.abs(new_ranks - ranks).sum()
+        ranks = new_ranks
+        if change < tolerance:
+            break
+    return ranks / ranks.sum()
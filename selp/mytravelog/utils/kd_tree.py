@@ -0,0 +1,48 @@
+__author__ = 'Manas'
+
+
+class KDTree(object):
+    """
+    A static k-d tree for nearest neighbour lookups. Points are tuples of equal length, and each
+    point carries a value (e.g. the id of the object at that point), which is returned by lookups.
+    """
+
+    def __init__(self, points, values):
+        self.root = self._build(list(zip(points, values)), 0)
+
+    def _build(self, items, depth):
+        if len(items) == 0:
+            return None
+        axis = depth % len(items[0][0])
+        items.sort(key=lambda item: item[0][axis])
+        median = len(items) // 2
+        # nodes are (point, value, axis, left subtree, right subtree) tuples
+        return (items[median][0], items[median][1], axis,
+                self._build(items[:median], depth + 1),
+                self._build(items[median + 1:], depth + 1))
+
+    def get_nearest(self, point):
+        """
+        Returns the value of the point nearest to the provided point, along with the squared
+        euclidean distance between both, or (None, None) if the tree is empty.
+        """
+        best = [None, float('inf')]
+        self._search(self.root, point, best)
+        if best[0] is None:
+            return None, None
+        return best[0], best[1]
+
+    def _search(self, node, point, best):
+        if node is None:
+            return
+        node_point, value, axis, left, right = node
+        squared_distance = sum((a - b) ** 2 for a, b in zip(node_point, point))
+        if squared_distance < best[1]:
+            best[0] = value
+            best[1] = squared_distance
+        difference = point[axis] - node_point[axis]
+        near, far = (left, right) if difference < 0 else (right, left)
+        self._search(near, point, best)
+        # the other side can only hold a nearer point if the splitting plane is nearer than the best point
+        if difference ** 2 < best[1]:
+            self._search(far, point, best)
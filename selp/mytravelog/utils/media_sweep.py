@@ -0,0 +1,94 @@
+from itertools import chain
+import os
+import time
+from django.conf import settings
+from mytravelog.utils.derivatives import DERIVATIVES_DIR, DERIVATIVE_SIZES, DERIVATIVE_FORMATS, get_derivative_name
+from mytravelog.utils.storage import BLOBS_DIR
+
+__author__ = 'Manas'
+
+# directories of the media root holding uploaded pictures and their derivatives
+SWEPT_DIRS = [BLOBS_DIR, DERIVATIVES_DIR, 'mytravelog/log_pictures', 'mytravelog/cover_pictures',
+              'mytravelog/profile_pictures']
+
+
+def get_referenced_names():
+    """
+    Marks every media file in use: the pictures of all models and their derivatives, and the default pictures of
+    the picture fields, even when no row uses them anymore. Default pictures have absolute urls as their names,
+    which are turned into names relative to the media root.
+    :return: set of names relative to the media root
+    """
+    # imported inside method to prevent circular dependencies
+    from mytravelog.models.album import Album
+    from mytravelog.models.log_picture import LogPicture
+    from mytravelog.models.user_profile import UserProfile
+
+    picture_fields = [(LogPicture, 'picture'), (Album, 'cover_picture'), (UserProfile, 'profile_picture'),
+                      (UserProfile, 'cover_picture')]
+    referenced_names = set()
+    for model, field_name in picture_fields:
+        names = model.objects.values_list(field_name, flat=True).iterator()
+        field = model._meta.get_field(field_name)
+        if field.has_default():
+            names = chain([field.get_default()], names)
+        for name in names:
+            if name.startswith(settings.MEDIA_URL):
+                name = name[len(settings.MEDIA_URL):]
+            referenced_names.add(name)
+            for size_name, max_size in DERIVATIVE_SIZES:
+                for extension, image_format in DERIVATIVE_FORMATS:
+                    referenced_names.add(get_derivative_name(name, size_name, extension))
+    return referenced_names
+
+
+def find_orphaned_files(min_age):
+    """
+    Sweeps the media directories for files that are not in use. Files modified less than min_age seconds ago
+    are skipped, since the pictures using them may not be saved yet.
+    :return: list of (name relative to the media root, size in bytes) tuples
+    """
+    referenced_names = get_referenced_names()
+    modified_before = time.time() - min_age
+    orphaned_files = []
+    for swept_dir in SWEPT_DIRS:
+        for directory, directory_names, file_names in os.walk(os.path.join(settings.MEDIA_ROOT, swept_dir)):
+            for file_name in file_names:
+                path = os.path.join(directory, file_name)
+                name = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+                if name in referenced_names:
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if stat.st_mtime < modified_before:
+                    orphaned_files.append((name, stat.st_size))
+    return orphaned_files
+
+
+def reclaim_orphaned_files(names):
+    """
+    Deletes the files with the provided names (relative to the media root), along with the directories
+    left empty, up to the media directory they are in.
+    :return: number of bytes reclaimed
+    """
+    reclaimed_size = 0
+    media_root = os.path.abspath(settings.MEDIA_ROOT)
+    swept_dirs = set(os.path.join(media_root, swept_dir) for swept_dir in SWEPT_DIRS)
+    for name in names:
+        path = os.path.join(media_root, name)
+        try:
+            reclaimed_size += os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            continue
+        directory = os.path.dirname(path)
+        while directory not in swept_dirs and directory.startswith(media_root + os.sep):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                # the directory is not empty
+                break
+            directory = os.path.dirname(directory)
+    return reclaimed_size
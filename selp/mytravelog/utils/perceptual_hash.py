@@ -0,0 +1,88 @@
+from PIL import Image
+from mytravelog.utils.upload_limits import is_too_many_pixels
+
+__author__ = 'Manas'
+
+# the dHash compares each pixel of a HASH_SIZE x HASH_SIZE grayscale thumbnail to its right neighbour, which gives a
+# 64 bit hash that barely changes when a picture is resized, recompressed or slightly edited
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+HASH_MASK = (1 << HASH_BITS) - 1
+# hashes are split into HASH_BANDS bands of BAND_BITS bits, each of which is stored in an indexed column. Two hashes
+# that differ in at most HASH_BANDS - 1 bits have at least one identical band, so near-duplicates are found by
+# looking up the bands of a hash in the indexes instead of comparing it to every stored hash
+HASH_BANDS = 4
+BAND_BITS = HASH_BITS / HASH_BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+# pictures whose hashes differ in at most this many bits are taken as near-duplicates
+MAX_DUPLICATE_DISTANCE = HASH_BANDS - 1
+# pictures are decoded at a reduced scale (if their format supports it) that is still at least this large
+DRAFT_SIZE = 64
+
+
+def to_signed(value):
+    # hashes are stored in signed 64 bit columns
+    if value >= 1 << (HASH_BITS - 1):
+        return value - (1 << HASH_BITS)
+    return value
+
+
+def compute_dhash(image):
+    """
+    Returns the 64 bit difference hash of the image, as a signed integer.
+    """
+    thumbnail = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.ANTIALIAS)
+    pixels = list(thumbnail.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        for column in range(HASH_SIZE):
+            offset = row * (HASH_SIZE + 1) + column
+            value = (value << 1) | (1 if pixels[offset] > pixels[offset + 1] else 0)
+    return to_signed(value)
+
+
+def compute_file_dhash(picture_file):
+    """
+    Returns the difference hash of the picture in the provided file, or None if it could not be read or has too
+    many pixels. Since the hash only needs a tiny thumbnail, JPEGs are decoded at 1/8 of their size (see
+    Image.draft), which makes this cheap enough to be done while handling a request.
+    """
+    try:
+        picture_file.seek(0)
+        image = Image.open(picture_file)
+        if is_too_many_pixels(image.size):
+            return None
+        image.draft('L', (DRAFT_SIZE, DRAFT_SIZE))
+        return compute_dhash(image)
+    except (IOError, OSError, ValueError):
+        return None
+    finally:
+        picture_file.seek(0)
+
+
+def compute_picture_dhash(storage, name):
+    """
+    Returns the difference hash of the picture with the provided name (see compute_file_dhash). Stored pictures are
+    hashed the same way as uploaded files, so that their hashes can be compared.
+    """
+    try:
+        picture_file = storage.open(name, 'rb')
+    except (IOError, OSError, ValueError):
+        return None
+    try:
+        return compute_file_dhash(picture_file)
+    finally:
+        picture_file.close()
+
+
+def get_hash_bands(dhash):
+    """
+    Returns the HASH_BANDS bands of the hash, from its highest bits to its lowest ones.
+    """
+    value = dhash & HASH_MASK
+    return [(value >> (BAND_BITS * (HASH_BANDS - 1 - index))) & BAND_MASK for index in range(HASH_BANDS)]
+
+
+def get_hamming_distance(dhash, other_dhash):
+    # number of bits that differ between the two hashes
+    return bin((dhash ^ other_dhash) & HASH_MASK).count('1')
@@ -0,0 +1,178 @@
+import os
+from django.db import transaction
+from mytravelog.utils.storage import delete_pictures
+
+__author__ = 'Manas'
+
+# number of rows deleted by each query (and in each transaction) while purging hidden objects
+PURGE_BATCH_SIZE = 100
+
+
+def raw_delete(queryset):
+    """
+    Deletes the rows of the queryset with a single query, without loading them into memory, cascading the
+    deletion or sending any signals. The children of the rows and the work of the post_delete receivers are
+    taken care of by the purge functions below.
+    """
+    queryset._raw_delete(queryset.db)
+
+
+def delete_in_batches(queryset, batch_size):
+    """
+    Deletes the rows of the queryset batch_size rows at a time, for rows that need no cleaning up.
+    """
+    while True:
+        ids = list(queryset.order_by('id').values_list('id', flat=True)[:batch_size])
+        if len(ids) == 0:
+            break
+        raw_delete(queryset.model._base_manager.filter(id__in=ids))
+
+
+def delete_log_pictures_in_batches(log_ids, batch_size):
+    # imported inside method to prevent circular dependencies
+    from mytravelog.models.log_picture import LogPicture
+
+    while True:
+        with transaction.atomic():
+            rows = list(LogPicture.objects.filter(log_id__in=log_ids).order_by('id')
+                        .values_list('id', 'picture')[:batch_size])
+            if len(rows) == 0:
+                break
+            log_picture_ids, names = zip(*rows)
+            raw_delete(LogPicture.objects.filter(id__in=log_picture_ids))
+            delete_pictures(names)
+
+
+def delete_pending_uploads_in_batches(log_ids, batch_size):
+    # imported inside method to prevent circular dependencies
+    from mytravelog.models.pending_upload import PendingUpload
+
+    while True:
+        rows = list(PendingUpload.objects.filter(log_id__in=log_ids).order_by('id')
+                    .values_list('id', 'spool_path')[:batch_size])
+        if len(rows) == 0:
+            break
+        pending_upload_ids, spool_paths = zip(*rows)
+        raw_delete(PendingUpload.objects.filter(id__in=pending_upload_ids))
+        for spool_path in spool_paths:
+            try:
+                os.remove(spool_path)
+            except OSError:
+                pass
+
+
+def purge_logs(log_ids, batch_size=PURGE_BATCH_SIZE):
+    """
+    Deletes the hidden logs with the provided ids, after their likes, comments, pictures and pending uploads have
+    been deleted in batches. The logs themselves are deleted at once. Their visited cities, distance travelled,
+    grid cell rollups and cached map info were already updated when they were hidden (see LogManager.hide_logs).
+    """
+    # imported inside method to prevent circular dependencies
+    from mytravelog.models.comment import Comment
+    from mytravelog.models.like import Like
+    from mytravelog.models.log import Log
+
+    delete_in_batches(Like.objects.filter(log_id__in=log_ids), batch_size)
+    delete_in_batches(Comment.objects.filter(log_id__in=log_ids), batch_size)
+    delete_log_pictures_in_batches(log_ids, batch_size)
+    delete_pending_uploads_in_batches(log_ids, batch_size)
+
+    raw_delete(Log.all_objects.filter(id__in=log_ids, is_hidden=True))
+
+
+def purge_hidden_logs(batch_size=PURGE_BATCH_SIZE):
+    """
+    Deletes all hidden logs, batch_size logs at a time.
+    :return: number of purged logs
+    """
+    # imported inside method to prevent circular dependencies
+    from mytravelog.models.log import Log
+
+    purged_count = 0
+    while True:
+        log_ids = list(Log.all_objects.filter(is_hidden=True).order_by('id').values_list('id', flat=True)[:batch_size])
+        if len(log_ids) == 0:
+            break
+        purge_logs(log_ids, batch_size)
+        purged_count += len(log_ids)
+    return purged_count
+
+
+def purge_hidden_albums(batch_size=PURGE_BATCH_SIZE):
+    """
+    Deletes all hidden albums whose logs have been purged, batch_size albums at a time, along with their
+    cover pictures.
+    :return: number of purged albums
+    """
+    # imported inside method to prevent circular dependencies
+    from mytravelog.models.album import Album
+    from mytravelog.models.trip_import import TripImport
+
+    purged_count = 0
+    while True:
+        with transaction.atomic():
+            rows = list(Album.all_objects.filter(is_hidden=True, log__isnull=True).order_by('id')
+                        .values_list('id', 'cover_picture')[:batch_size])
+            if len(rows) == 0:
+                break
+            album_ids, names = zip(*rows)
+            TripImport.objects.filter(album_id__in=album_ids).update(album=None)
+            raw_delete(Album.all_objects.filter(id__in=album_ids))
+            delete_pictures(names)
+        purged_count += len(album_ids)
+    return purged_count
+
+
+def purge_hidden_user_profiles(batch_size=PURGE_BATCH_SIZE):
+    """
+    Deletes all hidden user profiles whose logs and albums have been purged, along with their users, pictures,
+    likes, comments, followers and followings. The scores of the logs they liked or commented on are updated
+    the next time those logs are scored.
+    :return: number of purged user profiles
+    """
+    # imported inside method to prevent circular dependencies
+    from django.contrib.auth.models import User
+    from mytravelog.models.chunked_upload import ChunkedUpload
+    from mytravelog.models.city_visit import CityVisit
+    from mytravelog.models.comment import Comment
+    from mytravelog.models.follower import Follower
+    from mytravelog.models.like import Like
+    from mytravelog.models.trip_import import TripImport
+    from mytravelog.models.user_profile import UserProfile
+
+    purged_count = 0
+    while True:
+        rows = list(UserProfile.all_objects.filter(is_hidden=True, log__isnull=True, album__isnull=True)
+                    .order_by('id').values_list('id', 'user_id', 'profile_picture', 'cover_picture')[:batch_size])
+        if len(rows) == 0:
+            break
+        user_profile_ids, user_ids, profile_pictures, cover_pictures = zip(*rows)
+        delete_in_batches(Like.objects.filter(liker_user_profile_id__in=user_profile_ids), batch_size)
+        delete_in_batches(Comment.objects.filter(commenter_user_profile_id__in=user_profile_ids), batch_size)
+        delete_in_batches(Follower.objects.filter(follower_user_profile_id__in=user_profile_ids), batch_size)
+        delete_in_batches(Follower.objects.filter(following_user_profile_id__in=user_profile_ids), batch_size)
+        # uploads that were never attached to a log and imports are few, and their files are deleted by their receivers
+        ChunkedUpload.objects.filter(user_profile_id__in=user_profile_ids).delete()
+        TripImport.objects.filter(user_profile_id__in=user_profile_ids).delete()
+        with transaction.atomic():
+            # visits are deleted along with the last logs in their cities, so this only cleans up inconsistent ones
+            raw_delete(CityVisit.objects.filter(user_profile_id__in=user_profile_ids))
+            raw_delete(UserProfile.all_objects.filter(id__in=user_profile_ids))
+            # the few rows of the users (e.g. their permissions) are deleted by the usual cascade
+            User.objects.filter(id__in=user_ids).delete()
+            delete_pictures(profile_pictures + cover_pictures)
+        purged_count += len(user_profile_ids)
+    return purged_count
+
+
+def purge_hidden_objects(batch_size=PURGE_BATCH_SIZE):
+    """
+    Deletes all hidden logs, albums and user profiles (in that order, since hiding an album or user profile also
+    hides their logs). Every query deletes at most batch_size rows, so that no transaction grows with the number
+    of objects that belong to the hidden ones.
+    :return: tuple of (number of purged logs, number of purged albums, number of purged user profiles)
+    """
+    log_count = purge_hidden_logs(batch_size)
+    album_count = purge_hidden_albums(batch_size)
+    user_profile_count = purge_hidden_user_profiles(batch_size)
+    return log_count, album_count, user_profile_count
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import threading
+from django.core.files.storage import FileSystemStorage
+
+__author__ = 'Manas'
+
+# all pictures are stored under this directory, whichever model they belong to
+BLOBS_DIR = 'mytravelog/pictures'
+# number of nested directories named after the leading characters of the hash (two per directory)
+SHARD_DEPTH = 2
+# longer file extensions are cut, so that names fit in the database
+MAX_EXTENSION_LENGTH = 5
+
+
+def get_content_hash(content):
+    sha = hashlib.sha256()
+    for chunk in content.chunks():
+        sha.update(chunk)
+    return sha.hexdigest()
+
+
+def get_blob_name(content_hash, name):
+    """
+    Returns the name of the file with the provided content hash, keeping the extension of its original name, e.g.
+    picture.JPG -> mytravelog/pictures/3a/7b/3a7b...e9.jpg
+    """
+    shards = [content_hash[2 * i:2 * i + 2] for i in range(SHARD_DEPTH)]
+    extension = os.path.splitext(name)[1].lower()[:MAX_EXTENSION_LENGTH]
+    return '/'.join([BLOBS_DIR] + shards + [content_hash + extension])
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every file under the hash of its content, in directories sharded by the leading characters
+    of the hash, so that no directory grows too large. Files with the same content are only stored once,
+    and every save of such a file counts as a reference to it (see StoredBlob). Deleting a file releases
+    one reference, and the file is only deleted along with its last reference.
+    """
+
+    def get_available_name(self, name):
+        # files are named after their content, so an existing file with the same name is the same file
+        return name
+
+    def _save(self, name, content):
+        # imported inside method to prevent circular dependencies
+        from mytravelog.models.stored_blob import StoredBlob
+
+        name = get_blob_name(get_content_hash(content), name)
+        # the reference is counted first, so that the file can't be deleted while it is saved
+        StoredBlob.objects.add_reference(name)
+        if not self.exists(name):
+            self.write_blob(name, content)
+        return name
+
+    def write_blob(self, name, content):
+        """
+        Writes the content to a temporary file in the directory of the blob, which is then renamed to the blob,
+        so that the blob only ever exists once it is completely written. If the same content is saved by another
+        request at the same time, whichever rename comes last keeps the same content.
+        """
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # created by another request in the meantime
+                if not os.path.isdir(directory):
+                    raise
+        temporary_path = path + '.' + str(os.getpid()) + '.' + str(threading.current_thread().ident) + '.tmp'
+        try:
+            with open(temporary_path, 'wb') as temporary_file:
+                for chunk in content.chunks():
+                    temporary_file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temporary_path, self.file_permissions_mode)
+            try:
+                os.rename(temporary_path, path)
+            except OSError:
+                # renaming onto an existing file fails on Windows, where the blob was saved by another request
+                if not os.path.exists(path):
+                    raise
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    def delete(self, name):
+        # imported inside method to prevent circular dependencies
+        from mytravelog.models.stored_blob import StoredBlob
+
+        if StoredBlob.objects.release_reference(name):
+            super(ContentAddressedStorage, self).delete(name)
+
+
+picture_storage = ContentAddressedStorage()
+
+
+def delete_picture(field_file, name=None):
+    """
+    Releases the reference of the ImageField file to its picture (or to the picture with the provided
+    name, e.g. the picture it had before it was changed). Once no other file shares the picture, it is
+    recorded in a MediaTombstone, and the picture and its derivatives are deleted later on by the media
+    garbage collector. Default pictures are shared by all users and have absolute names, so they are
+    never deleted.
+    """
+    if name is None:
+        name = field_file.name
+    delete_pictures([name])
+
+
+def delete_pictures(names):
+    """
+    Releases one reference to the picture of each of the provided names at once, and records the pictures that
+    are no longer shared by any other file in MediaTombstones, just like delete_picture.
+    """
+    # imported inside method to prevent circular dependencies
+    from mytravelog.models.media_tombstone import MediaTombstone
+    from mytravelog.models.stored_blob import StoredBlob
+
+    names = [name for name in names if name and not name.startswith('/')]
+    if len(names) == 0:
+        return
+    unreferenced_names = StoredBlob.objects.release_references(names)
+    MediaTombstone.objects.bulk_create([MediaTombstone(name=name) for name in unreferenced_names])
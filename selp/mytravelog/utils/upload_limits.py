@@ -0,0 +1,170 @@
+from io import BytesIO
+import json
+from PIL import Image
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.http import HttpResponse
+
+__author__ = 'Manas'
+
+# image headers are looked for in at most this many bytes at the start of each uploaded file
+MAX_HEADER_SIZE = 256 * 1024
+
+
+def get_max_file_size():
+    return getattr(settings, 'MAX_UPLOAD_FILE_SIZE', 2048 * 1024)
+
+
+def get_max_archive_size():
+    return getattr(settings, 'MAX_UPLOAD_ARCHIVE_SIZE', 500 * 1024 * 1024)
+
+
+def get_max_request_size():
+    return getattr(settings, 'MAX_UPLOAD_REQUEST_SIZE', 21 * 1024 * 1024)
+
+
+def get_max_pixels():
+    return getattr(settings, 'MAX_UPLOAD_PIXELS', 40 * 1000 * 1000)
+
+
+def get_file_size_error():
+    return "Max image size allowed is " + str(get_max_file_size() // (1024 * 1024)) + " mb"
+
+
+def get_archive_size_error():
+    return "Max archive size allowed is " + str(get_max_archive_size() // (1024 * 1024)) + " mb"
+
+
+def get_request_size_error():
+    return "Max total size of all images is " + str(get_max_request_size() // (1024 * 1024)) + " mb"
+
+
+def get_pixel_count_error():
+    return "Max image resolution allowed is " + str(get_max_pixels() // (1000 * 1000)) + " megapixels"
+
+
+def is_archive_name(file_name):
+    # archives of photos can only be imported as trips, see TripImport
+    return file_name.lower().endswith('.zip')
+
+
+def is_too_many_pixels(size):
+    width, height = size
+    return width * height > get_max_pixels()
+
+
+def check_image_header(header, is_complete):
+    """
+    Checks the image size in the header data received so far, which only needs to be parsed by Pillow, so
+    that pictures with too many pixels to be decoded safely are rejected before the rest of them is received.
+    Files that are not images are rejected later, when their derivatives can't be created.
+    :param header: data received from the start of the file, up to MAX_HEADER_SIZE bytes
+    :param is_complete: True if no more header data will be received
+    :return: tuple of (error message or None, True if the header was parsed or can't be parsed anymore)
+    """
+    try:
+        image = Image.open(BytesIO(header))
+    except (IOError, SyntaxError, ValueError):
+        # the header is incomplete, or the file is not an image
+        return None, is_complete
+    if is_too_many_pixels(image.size):
+        return get_pixel_count_error(), True
+    return None, True
+
+
+def get_upload_error(uploaded_file):
+    """
+    Returns an error message if the uploaded picture exceeds the upload limits, else None. Pictures rejected
+    while the request was read carry their own error, the others are only checked for their size.
+    :param uploaded_file: uploaded file instance from request.FILES
+    """
+    upload_error = getattr(uploaded_file, 'upload_error', None)
+    if upload_error is not None:
+        return upload_error
+    if uploaded_file.size > get_max_file_size():
+        return get_file_size_error()
+    return None
+
+
+class RejectedUpload(UploadedFile):
+    """
+    Takes the place of an uploaded file that was rejected by the UploadLimitHandler. It has no content,
+    only the error to report, and the number of bytes received before the file was rejected as its size.
+    """
+
+    def __init__(self, name, content_type, size, charset, upload_error):
+        super(RejectedUpload, self).__init__(BytesIO(), name, content_type, size, charset)
+        self.upload_error = upload_error
+
+
+class UploadLimitHandler(FileUploadHandler):
+    """
+    Enforces the upload limits while the request is being read, so that pictures exceeding them are never
+    held in memory or written to disk. It must come before the handlers storing the uploaded files: chunks
+    of a rejected file are dropped instead of being passed on, and the file is replaced by a RejectedUpload,
+    so that its error is reported by the form validation like any other. The header of every file is parsed
+    by Pillow as soon as it is received, which only reads the image size, so that pictures with too many
+    pixels to be decoded safely are rejected before the rest of them is received.
+    """
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super(UploadLimitHandler, self).new_file(field_name, file_name, content_type, content_length, charset,
+                                                 content_type_extra)
+        self.received_size = 0
+        self.header = b''
+        self.upload_error = None
+        if content_length is not None and content_length > get_max_file_size():
+            self.upload_error = get_file_size_error()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received_size += len(raw_data)
+        if self.upload_error is None and self.received_size > get_max_file_size():
+            self.upload_error = get_file_size_error()
+        if self.upload_error is None and self.header is not None:
+            self.header += raw_data
+            self.check_header(len(self.header) >= MAX_HEADER_SIZE)
+        if self.upload_error is not None:
+            # the handlers after this one never receive the chunk
+            return None
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.upload_error is None and self.header is not None:
+            self.check_header(True)
+        if self.upload_error is None:
+            # the file is returned by the handlers storing it
+            return None
+        return RejectedUpload(self.file_name, self.content_type, self.received_size, self.charset,
+                              self.upload_error)
+
+    def check_header(self, is_complete):
+        """
+        Rejects the file if its image header shows too many pixels. Once the header is parsed, or if it can't
+        be parsed from the complete header data, the file is let through and its header is no longer kept.
+        """
+        self.upload_error, is_checked = check_image_header(self.header, is_complete)
+        if is_checked:
+            self.header = None
+
+
+class UploadLimitMiddleware(object):
+    """
+    Rejects requests with a body larger than MAX_UPLOAD_REQUEST_SIZE before any of it is read. Django never
+    reads past the Content-Length of the request, so this bounds the data received for all uploads at once.
+    Ajax requests receive the error in the same format as the errors of the views they are sent to.
+    """
+
+    def process_request(self, request):
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        if content_length <= get_max_request_size():
+            return None
+        error = get_request_size_error()
+        if request.is_ajax():
+            return_data = json.dumps({'error': error})
+            mimetype = "application/json"
+            return HttpResponse(return_data, mimetype)
+        return HttpResponse(error, status=413)
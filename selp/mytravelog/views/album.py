@@ -8,11 +8,18 @@ from django.shortcuts import get_object_or_404, render
 from mytravelog.models.album import Album
 from mytravelog.models.follower import Follower
 from mytravelog.models.log import Log
+from mytravelog.models.log_picture import LogPicture
 from mytravelog.models.user_profile import UserProfile
+from mytravelog.utils.upload_limits import get_upload_error
 
 
 __author__ = 'Manas'
 
+# number of pictures in each page of the album gallery, a multiple of the 4 pictures in each row
+ALBUM_PICTURES_PER_PAGE = 24
+# number of logs in each page of the album logs
+ALBUM_LOGS_PER_PAGE = 10
+
 
 def create_album(request):
     """
@@ -54,9 +61,10 @@ def delete_album(request, album_id):
     Deletes an album with the provided album_id. It first
     checks if the album actually belongs to the user
     who sent the request. If this is not the case, then
-    an error is sent back. Else, the album is successfully
-    deleted. Also note that this view only accepts ajax
-    requests, else a 404 error is raised.
+    an error is sent back. Else, the album and its logs are
+    hidden right away, and they are deleted by
+    purge_hidden_objects later on. Also note that this view
+    only accepts ajax requests, else a 404 error is raised.
     """
     user = request.user
     return_data = {}
@@ -65,8 +73,8 @@ def delete_album(request, album_id):
             album_to_delete = Album.objects.get(id=album_id)
             # check if album belongs to current user
             if album_to_delete.user_profile.user.username == user.username:
-                # delete album
-                album_to_delete.delete()
+                # hide album and its logs
+                Album.objects.hide_album(album_to_delete)
             else:
                 return_data['error'] = "This album does not belong to you"
         else:
@@ -82,12 +90,12 @@ def delete_album(request, album_id):
 def show_album(request, album_id):
     """
     Renders user_album template using the the data of the
-    album with the provided album_id.
+    album with the provided album_id. Only the first page of
+    the album pictures is rendered, the next pages are fetched
+    from get_album_pictures.
     """
-    # get requested user album and attach duration to it
+    # get requested user album, its duration and counts are stored along with it
     requested_album = get_object_or_404(Album, id=album_id)
-    duration = (requested_album.end_date - requested_album.start_date).days
-    requested_album.duration = duration
 
     # get current user and user profile
     current_user = request.user
@@ -99,13 +107,9 @@ def show_album(request, album_id):
     requested_user_profile = requested_album.user_profile
     requested_user = requested_user_profile.user
 
-    # get all album logs and pictures
-    requested_album_logs = Log.objects.attach_additional_info_to_logs(Log.objects.get_album_logs(requested_album),
-                                                          current_user_profile)
-    album_pictures = []
-    for log in requested_album_logs:
-        album_pictures += log.pictures
-    requested_album.pictures = album_pictures
+    # get the first pages of album logs and album pictures, the next pages are fetched as the user scrolls
+    requested_album_logs, next_logs_cursor = get_album_logs_page(requested_album, None, current_user_profile)
+    album_pictures, next_cursor = get_album_pictures_page(requested_album, None)
 
     # get all requested albums in order to populate the Albums drop-down list while editing a log (EditLogModal)
     requested_user_albums = Album.objects.get_user_albums_with_duration(requested_user_profile)
@@ -130,6 +134,9 @@ def show_album(request, album_id):
         'requested_user_albums': requested_user_albums,
         'requested_album': requested_album,
         'requested_album_logs': requested_album_logs,
+        'next_logs_cursor': next_logs_cursor,
+        'album_pictures': album_pictures,
+        'next_cursor': next_cursor,
         'can_follow': can_follow,
         'is_followed': is_followed,
         'can_edit_profile': can_edit_profile
@@ -137,7 +144,99 @@ def show_album(request, album_id):
     return render(request, 'mytravelog/user_album.html', data_dict)
 
 
+def get_album_pictures(request, album_id):
+    """
+    Renders the next page of the pictures of the album with the provided
+    album_id, i.e. the pictures before the one whose id is provided in the
+    'before' GET data (see show_album). The rendered page holds the cursor
+    of the page after it, if there is one. Also note that this view only
+    accepts ajax requests, else a 404 error is raised.
+    """
+    if request.is_ajax():
+        requested_album = get_object_or_404(Album, id=album_id)
+        before = request.GET.get('before', '')
+        if not before.isdigit():
+            raise Http404
+        album_pictures, next_cursor = get_album_pictures_page(requested_album, int(before))
+        data_dict = {
+            'requested_album': requested_album,
+            'album_pictures': album_pictures,
+            'next_cursor': next_cursor
+        }
+        return render(request, 'mytravelog/album_pictures.html', data_dict)
+    else:
+        raise Http404
+
+
+def get_album_logs(request, album_id):
+    """
+    Renders the next page of the logs of the album with the provided
+    album_id, i.e. the logs posted before the one whose id is provided
+    in the 'before' GET data (see show_album). The rendered page holds
+    the cursor of the page after it, if there is one. Also note that
+    this view only accepts ajax requests, else a 404 error is raised.
+    """
+    if request.is_ajax():
+        # get current user and user profile
+        current_user = request.user
+        current_user_profile = None
+        if current_user.is_authenticated():
+            current_user_profile = UserProfile.objects.get(user=current_user)
+
+        requested_album = get_object_or_404(Album, id=album_id)
+        before = request.GET.get('before', '')
+        if not before.isdigit():
+            raise Http404
+        # the log of the cursor may have been deleted since the previous page was rendered
+        before_log = Log.all_objects.filter(id=int(before), album=requested_album).first()
+        if before_log is None:
+            raise Http404
+        requested_album_logs, next_logs_cursor = get_album_logs_page(requested_album, before_log,
+                                                                     current_user_profile)
+        data_dict = {
+            'current_user_profile': current_user_profile,
+            'requested_user_logs': requested_album_logs,
+            'next_logs_cursor': next_logs_cursor
+        }
+        return render(request, 'mytravelog/log_list.html', data_dict)
+    else:
+        raise Http404
+
+
 # -------------------HELPER FUNCTIONS--------------------
+def get_album_pictures_page(album, before_id):
+    """
+    Returns a page of the pictures of the album (see LogPictureManager.get_album_pictures).
+    :param album: Album instance
+    :param before_id: cursor of the page, i.e. id of the last picture of the previous page, or None for the first page
+    :return: tuple of (list of LogPictures, cursor of the next page or None if this is the last page)
+    """
+    # one more picture is fetched to find out if there is a next page
+    album_pictures = list(LogPicture.objects.get_album_pictures(album, before_id)[:ALBUM_PICTURES_PER_PAGE + 1])
+    if len(album_pictures) > ALBUM_PICTURES_PER_PAGE:
+        album_pictures = album_pictures[:ALBUM_PICTURES_PER_PAGE]
+        return album_pictures, album_pictures[-1].id
+    return album_pictures, None
+
+
+def get_album_logs_page(album, before_log, current_user_profile):
+    """
+    Returns a page of the logs of the album (see LogManager.get_album_logs), along with their pictures, likes and
+    comments.
+    :param album: Album instance
+    :param before_log: cursor of the page, i.e. last log of the previous page, or None for the first page
+    :param current_user_profile: UserProfile instance of the current user, or None if the user is signed out
+    :return: tuple of (list of Logs, cursor of the next page or None if this is the last page)
+    """
+    # one more log is fetched to find out if there is a next page
+    album_logs = list(Log.objects.get_album_logs(album, before_log)[:ALBUM_LOGS_PER_PAGE + 1])
+    next_cursor = None
+    if len(album_logs) > ALBUM_LOGS_PER_PAGE:
+        album_logs = album_logs[:ALBUM_LOGS_PER_PAGE]
+        next_cursor = album_logs[-1].id
+    return Log.objects.attach_additional_info_to_logs(album_logs, current_user_profile), next_cursor
+
+
 def create_or_update_album(request, operation, album_id):
     """
     Creates or updates an album based on the provided operation.
@@ -237,8 +336,9 @@ def validate_album_form(operation, user_profile, name, start_date, end_date, alb
     if len(end_date) == 0:
         return "End date is required"
     if cover_picture is not None:
-        if cover_picture._size > 2048*1024:
-            return "Max image size allowed is 2 mb"
+        upload_error = get_upload_error(cover_picture)
+        if upload_error is not None:
+            return upload_error
     return None
 
 
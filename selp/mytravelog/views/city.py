@@ -1,3 +1,4 @@
+from decimal import Decimal, InvalidOperation
 import json
 
 from django.db.models.query_utils import Q
@@ -6,18 +7,23 @@ from django.shortcuts import get_object_or_404, render
 
 from mytravelog.models.album import Album
 from mytravelog.models.city import City
-from mytravelog.models.log import Log
+from mytravelog.models.log import Log, CITY_TOP_LOG_COUNT
 from mytravelog.models.user_profile import UserProfile
+from mytravelog.views.log import NEARBY_RADIUS
 
 
 __author__ = 'Manas'
 
+# number of logs in each page of the city page, the first of which is cached (see LogManager.get_city_top_logs)
+CITY_LOGS_PER_PAGE = CITY_TOP_LOG_COUNT - 1
+
 
 def show_city(request, city_url_name):
     """
     Renders city template using the data of the city with
     the url_name provided. If no city matches this name,
-    404 error is raised.
+    404 error is raised. Only the first page of the city logs
+    is rendered, the next pages are fetched from get_city_logs.
     """
     # get city using the url name provided
     # else, show 404 error
@@ -33,19 +39,50 @@ def show_city(request, city_url_name):
     # editing a log (EditLogModal)
     current_user_albums = Album.objects.get_user_albums_with_duration(current_user_profile)
 
-    # get all city logs
-    requested_city_logs = Log.objects.attach_additional_info_to_logs(Log.objects.get_city_logs(requested_city),
-                                                                     current_user_profile)
+    # get the first page of city logs, i.e. the logs with the highest scores
+    requested_city_logs, next_logs_cursor = get_city_logs_page(requested_city, None, current_user_profile)
 
     data_dict = {
         'requested_city': requested_city,
         'current_user_profile': current_user_profile,
         'requested_city_logs': requested_city_logs,
-        'current_user_albums': current_user_albums
+        'next_logs_cursor': next_logs_cursor,
+        'current_user_albums': current_user_albums,
+        'nearby_radius': NEARBY_RADIUS
     }
     return render(request, 'mytravelog/city.html', data_dict)
 
 
+def get_city_logs(request, city_url_name):
+    """
+    Renders the next page of the logs of the city with the provided
+    url_name, i.e. the logs ranked after the cursor provided in the
+    'before' GET data (see show_city). The rendered page holds the
+    cursor of the page after it, if there is one. Also note that this
+    view only accepts ajax requests, else a 404 error is raised.
+    """
+    if request.is_ajax():
+        # get current user and user profile
+        current_user = request.user
+        current_user_profile = None
+        if current_user.is_authenticated():
+            current_user_profile = UserProfile.objects.get(user=current_user)
+
+        requested_city = get_object_or_404(City, url_name=city_url_name)
+        before = parse_city_logs_cursor(request.GET.get('before', ''))
+        if before is None:
+            raise Http404
+        requested_city_logs, next_logs_cursor = get_city_logs_page(requested_city, before, current_user_profile)
+        data_dict = {
+            'current_user_profile': current_user_profile,
+            'requested_user_logs': requested_city_logs,
+            'next_logs_cursor': next_logs_cursor
+        }
+        return render(request, 'mytravelog/log_list.html', data_dict)
+    else:
+        raise Http404
+
+
 def get_autocomplete_suggestions(request):
     """
     Returns a dict of all city names with their corresponding country
@@ -65,3 +102,44 @@ def get_autocomplete_suggestions(request):
             mimetype = "application/json"
             return HttpResponse(return_data, mimetype)
     raise Http404
+
+
+# ----------------------Helper functions------------------------
+
+def get_city_logs_page(city, before, current_user_profile):
+    """
+    Returns a page of the logs of the city (see LogManager.get_city_logs), along with their pictures, likes and
+    comments. The first page is made of the cached top logs of the city.
+    :param city: City instance
+    :param before: (score, id) of the last log of the previous page, or None for the first page
+    :param current_user_profile: UserProfile instance of the current user, or None if the user is signed out
+    :return: tuple of (list of Logs, cursor of the next page or None if this is the last page)
+    """
+    if before is None:
+        city_logs = Log.objects.get_city_top_logs(city.id)
+    else:
+        # one more log is fetched to find out if there is a next page
+        city_logs = list(Log.objects.get_city_logs(city, before).select_related('city', 'user_profile__user')
+                         [:CITY_LOGS_PER_PAGE + 1])
+    next_cursor = None
+    if len(city_logs) > CITY_LOGS_PER_PAGE:
+        city_logs = city_logs[:CITY_LOGS_PER_PAGE]
+        # the score is part of the cursor, since scores change while the city logs are being paged through
+        next_cursor = str(city_logs[-1].score) + '_' + str(city_logs[-1].id)
+    return Log.objects.attach_additional_info_to_logs(city_logs, current_user_profile), next_cursor
+
+
+def parse_city_logs_cursor(cursor):
+    """
+    Returns the (score, id) tuple of the provided cursor (see get_city_logs_page), or None if it is invalid.
+    """
+    score, _, log_id = cursor.rpartition('_')
+    if not log_id.isdigit():
+        return None
+    try:
+        score = Decimal(score)
+    except InvalidOperation:
+        return None
+    if not score.is_finite():
+        return None
+    return score, int(log_id)
@@ -0,0 +1,74 @@
+import time
+from django.conf import settings
+from django.http.response import Http404, HttpResponse
+import numpy as np
+
+from mytravelog.models.grid_cell_rollup import GridCellRollup, MAX_CLUSTER_LEVEL
+from mytravelog.models.heatmap_tile import HeatmapTile
+from mytravelog.models.log import Log
+from mytravelog.utils.heatmap import MAX_HEATMAP_ZOOM, ROLLUP_LEVEL_OFFSET, get_tile_bbox, get_tile_pixels, \
+    read_cached_tile, render_tile, render_tile_in_pool
+
+
+__author__ = 'Manas'
+
+
+def show_heatmap_tile(request, zoom, x, y):
+    """
+    Returns a PNG tile of the heatmap of all logs, for slippy maps such as Google Maps.
+    Tiles are cached on disk, and are only rendered again once logs drawn on them have been added or removed
+    (see HeatmapTile). Rendering happens in a separate process pool: changed tiles are served while they are
+    rendered again, and new tiles are waited for at most HEATMAP_RENDER_TIMEOUT seconds, after which an empty
+    tile is returned. Raises a 404 error if the tile doesn't exist.
+    """
+    zoom = int(zoom)
+    x = int(x)
+    y = int(y)
+    if zoom > MAX_HEATMAP_ZOOM or x >= 2 ** zoom or y >= 2 ** zoom:
+        raise Http404
+
+    cached_tile = read_cached_tile(zoom, x, y)
+    if cached_tile is not None and not HeatmapTile.objects.has_changed_since(zoom, x, y, cached_tile[1]):
+        data = cached_tile[0]
+    else:
+        points_read_at = time.time()
+        pixel_xs, pixel_ys, log_counts = get_tile_points(zoom, x, y)
+        timeout = 0 if cached_tile is not None else getattr(settings, 'HEATMAP_RENDER_TIMEOUT', 2)
+        data = render_tile_in_pool(zoom, x, y, pixel_xs, pixel_ys, log_counts, points_read_at, timeout)
+        if data is None and cached_tile is not None:
+            data = cached_tile[0]
+        elif data is None:
+            # the tile is still being rendered, so browsers ask for it again instead of keeping the empty one
+            response = HttpResponse(render_tile([], [], []), "image/png")
+            response['Cache-Control'] = 'no-cache'
+            return response
+
+    response = HttpResponse(data, "image/png")
+    # tiles change whenever logs are posted, so browsers only keep them for a few minutes
+    response['Cache-Control'] = 'public, max-age=300'
+    return response
+
+
+def get_tile_points(zoom, x, y):
+    """
+    Returns the positions of the points drawn on the tile, relative to it in pixels, along with the number of
+    logs at each point. The points are the centroids of the grid cell rollups at the level matching the zoom,
+    so that a tile never reads more rows than there are cells, or the logs themselves beyond the deepest level.
+    """
+    bbox = get_tile_bbox(zoom, x, y)
+    level = zoom + ROLLUP_LEVEL_OFFSET
+    if level <= MAX_CLUSTER_LEVEL:
+        rollups = np.array(list(GridCellRollup.objects.get_clusters_in_bbox(*bbox, level=level)
+                                .values_list('log_count', 'latitude_sum', 'longitude_sum')),
+                           dtype=np.float64).reshape(-1, 3)
+        log_counts = rollups[:, 0]
+        latitudes = rollups[:, 1] / log_counts
+        longitudes = rollups[:, 2] / log_counts
+    else:
+        coordinates = np.array(list(Log.objects.get_logs_in_bbox(*bbox).values_list('latitude', 'longitude')),
+                               dtype=np.float64).reshape(-1, 2)
+        latitudes = coordinates[:, 0]
+        longitudes = coordinates[:, 1]
+        log_counts = np.ones(len(coordinates))
+    pixel_xs, pixel_ys = get_tile_pixels(latitudes, longitudes, zoom, x, y)
+    return pixel_xs, pixel_ys, log_counts
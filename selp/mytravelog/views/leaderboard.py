@@ -4,6 +4,7 @@ from django.db.models.query_utils import Q
 from django.http.response import Http404
 from django.shortcuts import render
 from mytravelog.models.city import City
+from mytravelog.models.country import Country
 from mytravelog.models.follower import Follower
 from mytravelog.models.log import Log
 from mytravelog.models.user_profile import UserProfile
@@ -16,8 +17,8 @@ def show_leaderboard(request, model):
     """
     Renders the leaderboard template using the results based
     on the model provided. The results are obtained using the
-    helper function: get_results. Model can only take two values:
-    'users' or 'cities'. The results are first paginated,
+    helper function: get_results. Model can only take three values:
+    'users', 'cities' or 'countries'. The results are first paginated,
     and then only those results belonging to the requested page
     number are used while rendering the template.
     """
@@ -38,6 +39,10 @@ def show_leaderboard(request, model):
     elif model == 'cities':
         # get all cities and sort them by increasing order of rank
         items = get_results(query, model, order_by, order)
+    elif model == 'countries':
+        # get all countries and sort them by increasing order of rank, their log and visitor counts are
+        # precomputed rollups, so no logs need to be counted here
+        items = get_results(query, model, order_by, order)
     else:
         raise Http404
     # paginate leaderboard items
@@ -51,10 +56,17 @@ def show_leaderboard(request, model):
         # If page is out of range (e.g. 9999), deliver last page of results.
         items = paginator.page(paginator.num_pages)
 
+    # attach number of cities and countries in common with the current user, only for the requested page
+    current_user_profile = None
+    if model == 'users' and request.user.is_authenticated():
+        current_user_profile = UserProfile.objects.get(user=request.user)
+        UserProfile.objects.attach_travel_overlap(items, current_user_profile)
+
     data_dict = {
         'requested_page_items': items,
         'model': model,
-        'query': query
+        'query': query,
+        'current_user_profile': current_user_profile
     }
     return render(request, 'mytravelog/leaderboard.html', data_dict)
 
@@ -65,10 +77,11 @@ def get_results(query, model, order_by, order):
     """
     Returns filtered results based on the parameters provided.
     :param query: the search term
-    :param model: tells the function which model to query on. Can only take two values: 'users' or 'cities'
+    :param model: tells the function which model to query on. Can only take three values: 'users', 'cities' or
+    'countries'
     :param order_by: the field name by which the results should be sorted
     :param order: the order in which the results should be sorted. Can only take two values: 'asc' or 'desc'
-    :return: List of cities or user profiles (depends on the model provided)
+    :return: List of cities, countries or user profiles (depends on the model provided)
     """
     if model == 'users':
         results = UserProfile.objects.filter(
@@ -86,9 +99,12 @@ def get_results(query, model, order_by, order):
             else:
                 results = sorted(attach_log_and_follower_count(results), key=attrgetter(order_by), reverse=True)
     else:
-        results = City.objects.filter(
-            Q(name__startswith=query) |
-            Q(country_name__startswith=query))
+        if model == 'countries':
+            results = Country.objects.filter(name__startswith=query)
+        else:
+            results = City.objects.filter(
+                Q(name__startswith=query) |
+                Q(country_name__startswith=query))
         if order == 'asc':
             results = results.order_by(order_by)
         else:
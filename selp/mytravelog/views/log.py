@@ -1,28 +1,46 @@
 import json
 
-from django.contrib.auth.models import User
-from django.http.response import Http404, HttpResponse
+from django.db import transaction
+from django.http.response import Http404, HttpResponse, HttpResponseNotModified
 from django.shortcuts import get_object_or_404, render
 
 from mytravelog.models.album import Album
+from mytravelog.models.chunked_upload import ChunkedUpload
 from mytravelog.models.city import City
 from mytravelog.models.follower import Follower
+from mytravelog.models.grid_cell_rollup import GridCellRollup, MIN_CLUSTER_LEVEL, MAX_CLUSTER_LEVEL
 from mytravelog.models.log import Log
 from mytravelog.models.log_picture import LogPicture
+from mytravelog.models.pending_upload import PendingUpload, FAILED, delete_spool_files
 from mytravelog.models.user_profile import UserProfile
+from mytravelog.utils.derivatives import get_derivative_url
+from mytravelog.utils.perceptual_hash import compute_file_dhash
+from mytravelog.utils.upload_limits import get_upload_error
 
 
 __author__ = 'Manas'
 
+# maximum number of logs returned by get_logs_in_viewport, and clusters returned by get_clusters_in_viewport
+MAX_VIEWPORT_LOGS = 100
+MAX_VIEWPORT_CLUSTERS = 500
+# default and maximum radius in kilometres of get_logs_near_point, and the number of logs it returns per page
+NEARBY_RADIUS = 5
+MAX_NEARBY_RADIUS = 50
+NEARBY_LOGS_PER_PAGE = 10
+
 
 def create_log(request):
     """
     Creates a new log using the provided POST data. First, the
     provided POST data is validated, if no errors are returned,
-    then a log is created successfully. Also, new LogPicture is
-    created for each of the pictures in the POST data. Also note
-    that this view only accepts ajax requests, else a 404 error
-    is raised.
+    then a log is created successfully. Also, each of the pictures
+    in the POST data is staged as a PendingUpload, which becomes a
+    LogPicture once processed in the background, just like the pictures
+    uploaded in chunks whose ids are in upload_ids. If any of the
+    pictures looks like a picture of another log of the user, the log
+    is still created, and a warning is returned along with the ids of
+    those logs. Also note that this view only accepts ajax requests,
+    else a 404 error is raised.
     """
     if request.is_ajax():
         user = request.user
@@ -38,12 +56,19 @@ def create_log(request):
             album_name = post_data.get('album_name', '')
             description = post_data.get('description', '')
 
+            # find the city of the log from its coordinates, or from the location name if no city is near enough
+            city = get_log_city(location, latitude, longitude)
+
+            # get pictures that were uploaded in chunks beforehand
+            user_profile = UserProfile.objects.get(user=user)
+            chunked_upload_ids = get_chunked_upload_ids(post_data)
+            chunked_uploads = ChunkedUpload.objects.get_finalized_uploads(user_profile, chunked_upload_ids)
+
             # validate log data
-            error = validate_add_log_form(location, latitude, longitude, description, file_data)
+            error = validate_add_log_form(location, latitude, longitude, description, file_data, city,
+                                          chunked_upload_ids, chunked_uploads)
             if error is None:
-                # get user_profile, album and city associated with this log
-                user_profile = UserProfile.objects.get(user=user)
-                city = City.objects.get(name=location)
+                # get album associated with this log
                 if album_name != "None":
                     album = Album.objects.get(name=album_name, user_profile=user_profile)
                 else:
@@ -64,15 +89,18 @@ def create_log(request):
                 new_log.score = new_log.get_log_score()
                 new_log.save()
 
-                # create new log picture for every image submitted by user
-                for key, image_file in file_data.iteritems():
-                    new_log_picture = LogPicture()
-                    new_log_picture.log = new_log
-                    new_log_picture.picture = image_file
-                    new_log_picture.save()
+                # warn about pictures that were already posted, the new log has no pictures yet so it is never found
+                dhashes = get_upload_dhashes(file_data.values(), chunked_uploads)
+                duplicate_log_ids = LogPicture.objects.get_duplicate_log_ids(user_profile, dhashes)
+                if len(duplicate_log_ids) > 0:
+                    return_data['warning'] = "Some of your pictures look like pictures you have already posted"
+                    return_data['duplicate_log_ids'] = duplicate_log_ids
 
-                # finally, update user travel stats
-                user_profile.update_user_travel_stats()
+                # stage every image submitted by user, they are saved as log pictures in the background
+                spool_paths = PendingUpload.objects.spool_files(file_data.values())
+                pending_upload_ids = PendingUpload.objects.spool_uploads(new_log, file_data.values(), spool_paths) + \
+                    PendingUpload.objects.spool_chunked_uploads(new_log, chunked_uploads)
+                PendingUpload.objects.queue_uploads(pending_upload_ids)
 
             else:
                 return_data['error'] = error
@@ -92,8 +120,10 @@ def delete_log(request, log_id):
     Deletes the log with the provided log_id. It first
     checks if the log actually belongs to the current user.
     If this is not the case, then an error message is returned.
-    Else, the log is successfully deleted. Also note that this
-    view only accepts ajax requests, else a 404 error is raised.
+    Else, the log is hidden right away, and it is deleted along with
+    its pictures, likes and comments by purge_hidden_objects later on.
+    Also note that this view only accepts ajax requests, else a 404
+    error is raised.
     """
     user = request.user
     return_data = {}
@@ -102,9 +132,8 @@ def delete_log(request, log_id):
             log_to_delete = Log.objects.get_log_by_id(log_id)
             # check if log belongs to current user
             if log_to_delete.user_profile.user == user:
-                # delete log and update user travel stats
-                log_to_delete.delete()
-                UserProfile.objects.get(user=user).update_user_travel_stats()
+                # hide log, user travel stats are updated once it is purged
+                Log.objects.hide_log(log_to_delete)
             else:
                 return_data['error'] = "This log does not belong to you"
         else:
@@ -122,9 +151,12 @@ def edit_log(request, log_id):
     Updates the log with the provided id, using the POST data provided.
     It also checks if the log actually belongs to the current user. If
     this is not the case, then an error message is returned. Else, the
-    log is updated successfully. Also, the LogPicture instances are deleted
-    based on the on the delete_picture_ids list in POST data. Also note that
-    this view only accepts ajax requests, else a 404 error is raised.
+    log is updated successfully. Also, the LogPicture instances of the log
+    are deleted based on the delete_picture_ids list in POST data, and the
+    new pictures (including the ones uploaded in chunks whose ids are in
+    upload_ids) are staged all at once, within the same transaction (their
+    files are written beforehand, and deleted if the transaction fails). Also
+    note that this view only accepts ajax requests, else a 404 error is raised.
     """
     if request.is_ajax():
         user = request.user
@@ -141,30 +173,49 @@ def edit_log(request, log_id):
             # get log that has to be edited along with all the pictures associated with it
             log_to_edit = Log.objects.get_log_by_id(log_id)
             if log_to_edit.user_profile.user == user:
-                log_pictures = LogPicture.objects.filter(log=log_to_edit)
+                # only pictures of this log can be deleted
+                log_picture_ids = set(LogPicture.objects.filter(log=log_to_edit).values_list('id', flat=True))
+                # ids are separated by ', ' by the edit log modal
+                delete_picture_ids = [int(picture_id.strip()) for picture_id in delete_picture_ids
+                                      if picture_id.strip().isdigit() and int(picture_id) in log_picture_ids]
+                # pictures that are still being processed count as well
+                pending_upload_count = PendingUpload.objects.get_pending_upload_counts([log_to_edit.id])\
+                    .get(log_to_edit.id, 0)
+                # get pictures that were uploaded in chunks beforehand
+                user_profile = log_to_edit.user_profile
+                chunked_upload_ids = get_chunked_upload_ids(post_data)
+                chunked_uploads = ChunkedUpload.objects.get_finalized_uploads(user_profile, chunked_upload_ids)
 
                 # validate log data
-                error = validate_edit_log_form(description, len(delete_picture_ids), file_data, len(log_pictures))
+                error = validate_edit_log_form(description, len(delete_picture_ids), file_data,
+                                               len(log_picture_ids) + pending_upload_count,
+                                               chunked_upload_ids, chunked_uploads)
                 if error is None:
-                    # update existing log
-                    user_profile = UserProfile.objects.get(user=user)
-                    if album_name != "None":
-                        log_to_edit.album = Album.objects.get(name=album_name, user_profile=user_profile)
-                    else:
-                        log_to_edit.album = None
-                    log_to_edit.description = description
-                    log_to_edit.save()
-
-                    # remove log pictures requested by user
-                    for picture_id in delete_picture_ids:
-                        LogPicture.objects.get(id=picture_id).delete()
-
-                    # create new log picture for every image submitted by user
-                    for key, image_file in file_data.iteritems():
-                        new_log_picture = LogPicture()
-                        new_log_picture.log = log_to_edit
-                        new_log_picture.picture = image_file
-                        new_log_picture.save()
+                    # images are written to the spool directory before the transaction, and deleted if it fails
+                    spool_paths = PendingUpload.objects.spool_files(file_data.values())
+                    try:
+                        with transaction.atomic():
+                            # update existing log
+                            if album_name != "None":
+                                log_to_edit.album = Album.objects.get(name=album_name, user_profile=user_profile)
+                            else:
+                                log_to_edit.album = None
+                            log_to_edit.description = description
+                            log_to_edit.save()
+
+                            # remove log pictures requested by user, their files are deleted in the background
+                            LogPicture.objects.delete_log_pictures(log_to_edit, delete_picture_ids)
+
+                            # stage every image submitted by user, they are saved as log pictures in the background
+                            pending_upload_ids = \
+                                PendingUpload.objects.spool_uploads(log_to_edit, file_data.values(), spool_paths) + \
+                                PendingUpload.objects.spool_chunked_uploads(log_to_edit, chunked_uploads)
+                    except Exception:
+                        delete_spool_files(spool_paths)
+                        raise
+
+                    # only queued once committed, so that the upload processing threads can see them
+                    PendingUpload.objects.queue_uploads(pending_upload_ids)
 
                 else:
                     return_data['error'] = error
@@ -181,6 +232,43 @@ def edit_log(request, log_id):
         raise Http404
 
 
+def get_upload_status(request, log_id):
+    """
+    Returns the number of pictures of the log with the provided log_id that are still
+    being processed, the errors of the pictures that failed and the urls of all processed
+    pictures. The log page of its user polls this view until all pictures are processed.
+    It first checks if the log actually belongs to the current user, since the errors
+    hold the names of the uploaded files. If this is not the case, then an error message
+    is returned. Also note that this view only accepts ajax requests, else a 404 error
+    is raised.
+    """
+    user = request.user
+    return_data = {}
+    if request.is_ajax():
+        if user.is_authenticated():
+            log = get_object_or_404(Log, id=log_id)
+            # check if log belongs to current user
+            if log.user_profile.user == user:
+                failed_uploads = PendingUpload.objects.filter(log=log, status=FAILED)
+                accepts_webp = 'image/webp' in request.META.get('HTTP_ACCEPT', '')
+                return_data = {
+                    'pending_count': PendingUpload.objects.get_pending_upload_counts([log.id]).get(log.id, 0),
+                    'errors': [failed_upload.error for failed_upload in failed_uploads],
+                    'picture_urls': [get_derivative_url(log_picture.picture, 200, accepts_webp)
+                                     for log_picture in LogPicture.objects.filter(log=log).order_by('id')]
+                }
+            else:
+                return_data['error'] = "This log does not belong to you"
+        else:
+            return_data['redirect_to'] = "/mytravelog/sign_in/"
+
+        return_data = json.dumps(return_data)
+        mimetype = "application/json"
+        return HttpResponse(return_data, mimetype)
+    else:
+        raise Http404
+
+
 def show_log(request, log_id):
     """
     Renders the user_log template using the data of the log with the
@@ -233,25 +321,143 @@ def show_log(request, log_id):
 
 def get_log_info_for_map(request, username):
     """
-    Returns a dict where each log id is mapped to their info. The log info
-    that is returned in filtered using the username provided. Also note that
-    this view only accepts ajax requests, else a 404 error is raised.
+    Returns the info of all logs posted by the user with the provided username,
+    as parallel arrays of ids, coordinates, timestamps and city indices, along
+    with a table of city names. The response is cached per user and carries an
+    ETag, so a 304 response is returned if the logs have not changed since the
+    client last requested them. Also note that this view only accepts ajax requests,
+    else a 404 error is raised.
     """
-    return_data = {}
     if request.is_ajax():
-        all_user_logs = Log.objects.filter(user_profile__user=get_object_or_404(User, username=username))
-        user_logs_info = {}
-        for log in all_user_logs:
-            user_logs_info[log.id] = {
+        requested_user_profile = get_object_or_404(UserProfile, user__username=username)
+        map_info = Log.objects.get_user_map_info(requested_user_profile.id)
+        if request.META.get('HTTP_IF_NONE_MATCH') == map_info['etag']:
+            response = HttpResponseNotModified()
+        else:
+            mimetype = "application/json"
+            response = HttpResponse(map_info['content'], mimetype)
+        response['ETag'] = map_info['etag']
+        # the browser has to revalidate the cached response every time, since logs may have changed
+        response['Cache-Control'] = 'no-cache'
+        return response
+    else:
+        raise Http404
+
+
+def get_logs_in_viewport(request):
+    """
+    Returns the info of the logs inside the bounding box provided in the GET
+    request (min_latitude, min_longitude, max_latitude and max_longitude). At most
+    MAX_VIEWPORT_LOGS logs are returned, in decreasing order of score. Also note
+    that this view only accepts ajax requests, else a 404 error is raised.
+    """
+    if request.is_ajax():
+        bbox = get_bbox(request.GET)
+        logs = Log.objects.get_logs_in_bbox(*bbox).order_by('-score', '-id')\
+            .values_list('id', 'latitude', 'longitude', 'city__name')[:MAX_VIEWPORT_LOGS]
+        logs_info = []
+        for log_id, latitude, longitude, city_name in logs:
+            logs_info.append({
+                'id': log_id,
+                'city': city_name,
+                'latitude': float(latitude),
+                'longitude': float(longitude),
+                'url': '/mytravelog/log/' + str(log_id) + '/'
+            })
+        return_data = json.dumps({'logs_info': logs_info})
+        mimetype = "application/json"
+        return HttpResponse(return_data, mimetype)
+    else:
+        raise Http404
+
+
+def get_clusters_in_viewport(request):
+    """
+    Returns clusters of the logs inside the bounding box provided in the GET request
+    (min_latitude, min_longitude, max_latitude and max_longitude), for a map at the
+    provided zoom level. Each cluster holds the number of logs in a grid cell, their
+    centroid and the id of the highest scored log. The grid gets finer as the map is
+    zoomed in, until each log is returned on its own. Also note that this view only
+    accepts ajax requests, else a 404 error is raised.
+    """
+    if request.is_ajax():
+        bbox = get_bbox(request.GET)
+        try:
+            zoom = int(request.GET['zoom'])
+        except (KeyError, ValueError):
+            raise Http404
+        if zoom < 0:
+            raise Http404
+
+        # a map at zoom level z is 2^z tiles wide, so every tile is split into 4 by 4 grid cells
+        level = max(zoom + 2, MIN_CLUSTER_LEVEL)
+        clusters = []
+        if level <= MAX_CLUSTER_LEVEL:
+            rollups = GridCellRollup.objects.get_clusters_in_bbox(*bbox, level=level)\
+                .order_by('-log_count')[:MAX_VIEWPORT_CLUSTERS]
+            for rollup in rollups:
+                latitude, longitude = rollup.get_centroid()
+                clusters.append({
+                    'count': rollup.log_count,
+                    'latitude': round(latitude, 4),
+                    'longitude': round(longitude, 4),
+                    'top_log_id': rollup.top_log_id
+                })
+        else:
+            # the map is zoomed in far enough to show each log on its own
+            logs = Log.objects.get_logs_in_bbox(*bbox).order_by('-score', '-id')\
+                .values_list('id', 'latitude', 'longitude')[:MAX_VIEWPORT_LOGS]
+            for log_id, latitude, longitude in logs:
+                clusters.append({
+                    'count': 1,
+                    'latitude': float(latitude),
+                    'longitude': float(longitude),
+                    'top_log_id': log_id
+                })
+        return_data = json.dumps({'clusters': clusters})
+        mimetype = "application/json"
+        return HttpResponse(return_data, mimetype)
+    else:
+        raise Http404
+
+
+def get_logs_near_point(request):
+    """
+    Returns the info of the logs within the radius (in kilometres, NEARBY_RADIUS by
+    default) around the point provided in the GET request (latitude and longitude),
+    nearest first. Logs are returned NEARBY_LOGS_PER_PAGE at a time, and the requested
+    page number can be provided as page in the GET request. Also note that this view
+    only accepts ajax requests, else a 404 error is raised.
+    """
+    if request.is_ajax():
+        latitude, longitude, radius, page = get_nearby_query(request.GET)
+        logs, total_count = Log.objects.get_logs_near(latitude, longitude, radius,
+                                                      (page - 1) * NEARBY_LOGS_PER_PAGE, NEARBY_LOGS_PER_PAGE)
+        logs = Log.objects.attach_additional_info_to_logs(logs, None)
+        accepts_webp = 'image/webp' in request.META.get('HTTP_ACCEPT', '')
+        logs_info = []
+        for log in logs:
+            logs_info.append({
+                'id': log.id,
                 'city': log.city.name,
-                'date_and_time': str(log.created_at),
-                'latitude': str(log.latitude),
-                'longitude': str(log.longitude),
+                'country': log.city.country_name,
+                'latitude': float(log.latitude),
+                'longitude': float(log.longitude),
+                'distance': round(log.distance, 2),
+                'description': log.description,
+                'username': log.user_profile.user.username,
+                'full_name': log.user_profile.user.get_full_name(),
+                'picture_url': get_derivative_url(log.pictures[0].picture, 200, accepts_webp)
+                if len(log.pictures) > 0 else None,
+                'like_count': len(log.likes),
+                'comment_count': len(log.comments),
                 'url': '/mytravelog/log/' + str(log.id) + '/'
-            }
-        return_data['user_logs_info'] = user_logs_info
-
-        return_data = json.dumps(return_data)
+            })
+        return_data = json.dumps({
+            'logs_info': logs_info,
+            'total_count': total_count,
+            'has_next': page * NEARBY_LOGS_PER_PAGE < total_count
+        })
         mimetype = "application/json"
         return HttpResponse(return_data, mimetype)
     else:
@@ -260,7 +466,8 @@ def get_log_info_for_map(request, username):
 
 # ---------------Helper functions----------------
 
-def validate_add_log_form(location, latitude, longitude, description, file_data):
+def validate_add_log_form(location, latitude, longitude, description, file_data, city, chunked_upload_ids=(),
+                          chunked_uploads=()):
     """
     Validates the provided log data and returns an error message, if any error occurs, else, None is returned.
     :param location: name of the city where the log is created
@@ -268,50 +475,142 @@ def validate_add_log_form(location, latitude, longitude, description, file_data)
     :param longitude: longitude of the location
     :param description: description of the log
     :param file_data: dict of all files in POST data, i.e. request.FILES
+    :param city: city of the log found by get_log_city, or None if no city was found
+    :param chunked_upload_ids: ids of the chunked uploads in POST data
+    :param chunked_uploads: finalized chunked uploads of the user with these ids
     :return: an error message if any error occurs, else, None is returned.
     """
-    if len(location) == 0 or len(latitude) == 0 or len(longitude) == 0:
+    if len(latitude) == 0 or len(longitude) == 0 or (len(location) == 0 and city is None):
         return "Your location could not be verified"
     if len(description) == 0:
         return "Description is required"
     if len(description) > 1000:
         return "Description length cannot exceed 1000 characters"
-    if len(file_data) == 0:
+    if len(chunked_uploads) < len(set(chunked_upload_ids)):
+        return "Your picture could not be found, please upload it again"
+    number_of_pictures = len(file_data) + len(chunked_uploads)
+    if number_of_pictures == 0:
         return "At least one image is required"
-    if len(file_data) > 10:
+    if number_of_pictures > 10:
         return "At most 10 images are allowed"
     for key, image_file in file_data.iteritems():
-        if (image_file._size > 2048*1024):
-            return "Max image size allowed is 2 mb"
-    if City.objects.filter(name=location).count() == 0:
+        upload_error = get_upload_error(image_file)
+        if upload_error is not None:
+            return upload_error
+    if city is None:
         return "No city named '" + location + "' in the database"
     return None
 
 
-def validate_edit_log_form(description, number_of_pictures_to_delete, file_data, total_number_of_pictures):
+def get_log_city(location, latitude, longitude):
+    """
+    Returns the city nearest to the provided coordinates. If the coordinates are invalid or no
+    city is near enough, then the city is looked up by the provided location name instead.
+    :param location: name of the city where the log is created, as provided by the client
+    :param latitude: latitude of the location
+    :param longitude: longitude of the location
+    :return: the city of the log, or None if no city matches
+    """
+    try:
+        latitude = float(latitude)
+        longitude = float(longitude)
+    except ValueError:
+        pass
+    else:
+        if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+            city = City.objects.get_nearest_city(latitude, longitude)
+            if city is not None:
+                return city
+    return City.objects.filter(name=location).first()
+
+
+def get_chunked_upload_ids(post_data):
+    """
+    Returns the ids of the chunked uploads in the upload_ids POST data, which are separated by commas.
+    """
+    return [int(upload_id.strip()) for upload_id in post_data.get('upload_ids', '').split(',')
+            if upload_id.strip().isdigit()]
+
+
+def get_upload_dhashes(uploaded_files, chunked_uploads):
+    """
+    Returns the perceptual hashes of the uploaded pictures and of the pictures uploaded in chunks (None for the
+    pictures that could not be read), which are compared to the hashes of the pictures already posted.
+    """
+    dhashes = [compute_file_dhash(uploaded_file) for uploaded_file in uploaded_files]
+    for chunked_upload in chunked_uploads:
+        try:
+            with open(chunked_upload.spool_path, 'rb') as spool_file:
+                dhashes.append(compute_file_dhash(spool_file))
+        except (IOError, OSError):
+            dhashes.append(None)
+    return dhashes
+
+
+def validate_edit_log_form(description, number_of_pictures_to_delete, file_data, total_number_of_pictures,
+                           chunked_upload_ids=(), chunked_uploads=()):
     """
     Validates the log data provided.
     :param description: description of the log
     :param number_of_pictures_to_delete: total number of picture to be deleted
     :param file_data: dict of all files in POST data, i.e. request.FILES
     :param total_number_of_pictures: total number of existing log pictures
+    :param chunked_upload_ids: ids of the chunked uploads in POST data
+    :param chunked_uploads: finalized chunked uploads of the user with these ids
     :return: an error message if any error occurs, else, None is returned
     """
     if len(description) == 0:
         return "Description is required"
     if len(description) > 1000:
         return "Description length cannot exceed 1000 characters"
-    number_of_pictures_to_add = len(file_data)
+    if len(chunked_uploads) < len(set(chunked_upload_ids)):
+        return "Your picture could not be found, please upload it again"
+    number_of_pictures_to_add = len(file_data) + len(chunked_uploads)
     remaining_pictures = total_number_of_pictures - number_of_pictures_to_delete + number_of_pictures_to_add
     if remaining_pictures == 0:
         return "At least one image is required"
     if remaining_pictures > 10:
         return "At most 10 images are allowed"
     for key, image_file in file_data.iteritems():
-        if (image_file._size > 2048*1024):
-            return "Max image size allowed is 2 mb"
+        upload_error = get_upload_error(image_file)
+        if upload_error is not None:
+            return upload_error
     return None
 
 
+def get_bbox(get_data):
+    """
+    Returns the bounding box provided in the GET data as a (min_latitude, min_longitude, max_latitude,
+    max_longitude) tuple of floats. min_longitude may be greater than max_longitude, if the bounding
+    box crosses the antimeridian. A 404 error is raised if any of the coordinates is missing or invalid.
+    :param get_data: request.GET
+    """
+    try:
+        bbox = tuple(float(get_data[key]) for key in ['min_latitude', 'min_longitude', 'max_latitude', 'max_longitude'])
+    except (KeyError, ValueError):
+        raise Http404
+    min_latitude, min_longitude, max_latitude, max_longitude = bbox
+    if not (-90 <= min_latitude <= max_latitude <= 90) or \
+            not (-180 <= min_longitude <= 180) or not (-180 <= max_longitude <= 180):
+        raise Http404
+    return bbox
 
 
+def get_nearby_query(get_data):
+    """
+    Returns the point, radius and page number provided in the GET data as a (latitude, longitude, radius, page)
+    tuple. The radius defaults to NEARBY_RADIUS and the page to 1. A 404 error is raised if the point is missing,
+    or if any of the values is invalid or the radius exceeds MAX_NEARBY_RADIUS.
+    :param get_data: request.GET
+    """
+    try:
+        latitude = float(get_data['latitude'])
+        longitude = float(get_data['longitude'])
+        radius = float(get_data.get('radius', NEARBY_RADIUS))
+        page = int(get_data.get('page', 1))
+    except (KeyError, ValueError):
+        raise Http404
+    if not (-90 <= latitude <= 90) or not (-180 <= longitude <= 180) or not (0 < radius <= MAX_NEARBY_RADIUS) or \
+            page < 1:
+        raise Http404
+    return latitude, longitude, radius, page
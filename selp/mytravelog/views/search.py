@@ -15,7 +15,8 @@ def search_for_cities_and_users(request):
     Renders the search template using the results based on the query provided
     in the GET request (using the helper function get_search_results). If exactly
     1 city matches the query, the the user is redirected to its city page.
-    Else, the search results are shown.
+    Else, the search results are shown. If the user is signed in, then users are
+    sorted by the number of countries and cities they have in common with them.
     """
     search_query = request.GET.get('query', None)
     if search_query is not None:
@@ -37,6 +38,11 @@ def search_for_cities_and_users(request):
                 for user_profile in user_profiles:
                     user_profile.is_followed = Follower.objects.is_requested_user_followed_by_current_user(user_profile,
                                                                                                            current_user_profile)
+                # show users who have been to the most places in common with current user first
+                UserProfile.objects.attach_travel_overlap(user_profiles, current_user_profile)
+                user_profiles = sorted(user_profiles,
+                                       key=lambda x: (x.common_country_count, x.common_city_count),
+                                       reverse=True)
 
             results_count = len(cities) + len(user_profiles)
             data_dict = {'cities': cities,
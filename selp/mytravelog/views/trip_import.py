@@ -0,0 +1,115 @@
+import json
+
+from django.http.response import Http404, HttpResponse
+
+from mytravelog.models.album import Album
+from mytravelog.models.chunked_upload import ChunkedUpload
+from mytravelog.models.trip_import import TripImport, MAX_IMPORT_PHOTOS, FAILED
+from mytravelog.models.user_profile import UserProfile
+from mytravelog.utils.upload_limits import get_upload_error
+from mytravelog.views.log import get_chunked_upload_ids
+
+
+__author__ = 'Manas'
+
+
+def start_trip_import(request):
+    """
+    Starts importing a trip from the photos in the POST data, and from the photos or zip archives of photos
+    uploaded in chunks whose ids are in upload_ids. The photos are turned into logs in the background, grouped
+    by the cities and times they were taken, and the id of the import is returned so that its progress can be
+    polled. Also note that this view only accepts ajax requests, else a 404 error is raised.
+    """
+    if request.is_ajax():
+        user = request.user
+        return_data = {}
+        if user.is_authenticated():
+            post_data = request.POST
+            file_data = request.FILES
+            album_name = post_data.get('album_name', 'None')
+            user_profile = UserProfile.objects.get(user=user)
+            chunked_upload_ids = get_chunked_upload_ids(post_data)
+            chunked_uploads = ChunkedUpload.objects.get_finalized_uploads(user_profile, chunked_upload_ids,
+                                                                          include_archives=True)
+            if album_name != "None":
+                album = Album.objects.filter(name=album_name, user_profile=user_profile).first()
+            else:
+                album = None
+
+            # validate import data
+            error = validate_trip_import_form(file_data, chunked_upload_ids, chunked_uploads)
+            if error is None and album_name != "None" and album is None:
+                error = "Album could not be found"
+            if error is None:
+                trip_import = TripImport.objects.start_import(user_profile, album, file_data.values(),
+                                                              chunked_uploads)
+                TripImport.objects.queue_import(trip_import.id)
+                return_data['trip_import_id'] = trip_import.id
+            else:
+                return_data['error'] = error
+        else:
+            return_data['redirect_to'] = '/mytravelog/sign_in/'
+
+        return_data = json.dumps(return_data)
+        mimetype = "application/json"
+        return HttpResponse(return_data, mimetype)
+
+    else:
+        raise Http404
+
+
+def get_trip_import_progress(request, trip_import_id):
+    """
+    Returns the progress of the import with the provided trip_import_id: its status, the number of photos
+    found, read and stored so far, the number of photos left out since they were not taken in any known city,
+    and the number of logs created once it is done. Also note that this view only accepts ajax requests,
+    else a 404 error is raised.
+    """
+    if request.is_ajax():
+        user = request.user
+        return_data = {}
+        if user.is_authenticated():
+            trip_import = TripImport.objects.filter(id=trip_import_id, user_profile__user=user).first()
+            if trip_import is None:
+                return_data['error'] = "Your import could not be found"
+            else:
+                return_data['status'] = trip_import.status
+                return_data['photo_count'] = trip_import.photo_count
+                return_data['read_count'] = trip_import.read_count
+                return_data['saved_count'] = trip_import.saved_count
+                return_data['skipped_count'] = trip_import.skipped_count
+                return_data['log_count'] = trip_import.log_count
+                if trip_import.status == FAILED:
+                    return_data['error'] = trip_import.error
+        else:
+            return_data['redirect_to'] = '/mytravelog/sign_in/'
+
+        return_data = json.dumps(return_data)
+        mimetype = "application/json"
+        return HttpResponse(return_data, mimetype)
+
+    else:
+        raise Http404
+
+
+# ----------------------Helper functions------------------------
+
+def validate_trip_import_form(file_data, chunked_upload_ids, chunked_uploads):
+    """
+    Validates the provided import data.
+    :param file_data: dict of all files in POST data, i.e. request.FILES
+    :param chunked_upload_ids: ids of the chunked uploads in POST data
+    :param chunked_uploads: finalized chunked uploads (photos or archives) of the user with these ids
+    :return: an error message if any error occurs, else, None is returned
+    """
+    if len(chunked_uploads) < len(set(chunked_upload_ids)):
+        return "Your photos could not be found, please upload them again"
+    if len(file_data) == 0 and len(chunked_uploads) == 0:
+        return "At least one photo is required"
+    if len(file_data) + len([upload for upload in chunked_uploads if not upload.is_archive]) > MAX_IMPORT_PHOTOS:
+        return "At most " + str(MAX_IMPORT_PHOTOS) + " photos can be imported at once"
+    for key, image_file in file_data.iteritems():
+        upload_error = get_upload_error(image_file)
+        if upload_error is not None:
+            return upload_error
+    return None
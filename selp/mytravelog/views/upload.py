@@ -0,0 +1,145 @@
+import json
+
+from django.http.response import Http404, HttpResponse
+
+from mytravelog.models.chunked_upload import ChunkedUpload
+from mytravelog.models.user_profile import UserProfile
+
+
+__author__ = 'Manas'
+
+
+def start_upload(request):
+    """
+    Starts a chunked upload of a picture, using the file_name and size (in bytes) provided in
+    the POST data. The id of the upload is returned, along with the offset of the first chunk.
+    Also note that this view only accepts ajax requests, else a 404 error is raised.
+    """
+    if request.is_ajax():
+        user = request.user
+        return_data = {}
+        if user.is_authenticated():
+            post_data = request.POST
+            file_name = post_data.get('file_name', '')
+            size = post_data.get('size', '')
+            if len(file_name) == 0 or not size.isdigit() or int(size) == 0:
+                return_data['error'] = "Your picture could not be uploaded"
+            else:
+                user_profile = UserProfile.objects.get(user=user)
+                chunked_upload, error = ChunkedUpload.objects.start_upload(user_profile, file_name, int(size))
+                if error is None:
+                    return_data['upload_id'] = chunked_upload.id
+                    return_data['offset'] = chunked_upload.received_size
+                else:
+                    return_data['error'] = error
+        else:
+            return_data['redirect_to'] = '/mytravelog/sign_in/'
+
+        return_data = json.dumps(return_data)
+        mimetype = "application/json"
+        return HttpResponse(return_data, mimetype)
+
+    else:
+        raise Http404
+
+
+def upload_chunk(request, upload_id):
+    """
+    Writes the body of the request as the chunk of the upload with the provided upload_id
+    starting at the offset provided in the GET data. The offset of the next chunk is always
+    returned, so that the client can resume the upload from there, e.g. after an error or a
+    dropped connection. Also note that this view only accepts ajax requests, else a 404 error
+    is raised.
+    """
+    if request.is_ajax():
+        user = request.user
+        return_data = {}
+        if user.is_authenticated():
+            chunked_upload = get_user_chunked_upload(user, upload_id)
+            offset = request.GET.get('offset', '')
+            if chunked_upload is None:
+                return_data['error'] = "Your picture could not be found, please upload it again"
+            elif not offset.isdigit():
+                return_data['error'] = "This part of the picture was not expected"
+                return_data['offset'] = chunked_upload.received_size
+            else:
+                error = ChunkedUpload.objects.receive_chunk(chunked_upload, int(offset), request.body)
+                if error is not None:
+                    return_data['error'] = error
+                    # the upload may have been changed by another request in the meantime
+                    chunked_upload = get_user_chunked_upload(user, upload_id)
+                return_data['offset'] = chunked_upload.received_size
+        else:
+            return_data['redirect_to'] = '/mytravelog/sign_in/'
+
+        return_data = json.dumps(return_data)
+        mimetype = "application/json"
+        return HttpResponse(return_data, mimetype)
+
+    else:
+        raise Http404
+
+
+def get_upload_offset(request, upload_id):
+    """
+    Returns the offset from which the upload with the provided upload_id has to be resumed,
+    i.e. the number of bytes received so far. Also note that this view only accepts ajax
+    requests, else a 404 error is raised.
+    """
+    if request.is_ajax():
+        user = request.user
+        return_data = {}
+        if user.is_authenticated():
+            chunked_upload = get_user_chunked_upload(user, upload_id)
+            if chunked_upload is None:
+                return_data['error'] = "Your picture could not be found, please upload it again"
+            else:
+                return_data['offset'] = chunked_upload.received_size
+                return_data['status'] = chunked_upload.status
+        else:
+            return_data['redirect_to'] = '/mytravelog/sign_in/'
+
+        return_data = json.dumps(return_data)
+        mimetype = "application/json"
+        return HttpResponse(return_data, mimetype)
+
+    else:
+        raise Http404
+
+
+def finalize_upload(request, upload_id):
+    """
+    Completes the upload with the provided upload_id once all its chunks are received. The id
+    can then be sent to create_log or edit_log in the upload_ids POST data, instead of the
+    picture itself. Also note that this view only accepts ajax requests, else a 404 error is
+    raised.
+    """
+    if request.is_ajax():
+        user = request.user
+        return_data = {}
+        if user.is_authenticated():
+            chunked_upload = get_user_chunked_upload(user, upload_id)
+            if chunked_upload is None:
+                return_data['error'] = "Your picture could not be found, please upload it again"
+            else:
+                error = ChunkedUpload.objects.finalize_upload(chunked_upload)
+                if error is not None:
+                    return_data['error'] = error
+        else:
+            return_data['redirect_to'] = '/mytravelog/sign_in/'
+
+        return_data = json.dumps(return_data)
+        mimetype = "application/json"
+        return HttpResponse(return_data, mimetype)
+
+    else:
+        raise Http404
+
+
+# ----------------------Helper functions------------------------
+
+def get_user_chunked_upload(user, upload_id):
+    """
+    Returns the chunked upload with the provided id if it belongs to the user, else None.
+    """
+    return ChunkedUpload.objects.filter(id=upload_id, user_profile__user=user).first()
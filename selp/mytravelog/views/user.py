@@ -1,16 +1,22 @@
+import json
+
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
-from django.http.response import HttpResponseRedirect
+from django.http.response import HttpResponseRedirect, HttpResponse, Http404
 from django.shortcuts import render, get_object_or_404
 
 from mytravelog.models.album import Album
 from mytravelog.models.follower import Follower
 from mytravelog.models.log import Log
 from mytravelog.models.user_profile import UserProfile
+from mytravelog.utils.upload_limits import get_upload_error
 
 
 __author__ = 'Manas'
 
+# number of logs in each page of the timeline of a user
+USER_LOGS_PER_PAGE = 10
+
 
 def sign_up(request):
     """
@@ -121,10 +127,38 @@ def sign_out(request):
         return HttpResponseRedirect('/mytravelog/sign_in')
 
 
+def delete_account(request):
+    """
+    Removes the account of the current user. The user profile, along
+    with all its albums and logs, is hidden right away and the user
+    is signed out and disabled. Everything is deleted by
+    purge_hidden_objects later on. Also note that this view only
+    accepts ajax requests, else a 404 error is raised.
+    """
+    user = request.user
+    return_data = {}
+    if request.is_ajax():
+        if user.is_authenticated():
+            user_profile = UserProfile.objects.get(user=user)
+            UserProfile.objects.hide_user_profile(user_profile)
+            logout(request)
+            return_data['redirect_to'] = "/mytravelog/"
+        else:
+            return_data['redirect_to'] = "/mytravelog/sign_in/"
+
+        return_data = json.dumps(return_data)
+        mimetype = "application/json"
+        return HttpResponse(return_data, mimetype)
+    else:
+        raise Http404
+
+
 def show_user(request, username):
     """
     Renders the user_main template using the data of the user with the
-    provided username.
+    provided username. Only the first page of the user logs is rendered,
+    the next pages are fetched from get_user_logs, and the albums, followers
+    and following tabs are fetched from get_user_tab when they are first shown.
     """
     # get current user and user profile
     current_user = request.user
@@ -134,20 +168,22 @@ def show_user(request, username):
 
     # get requested user and user profile
     requested_user = get_object_or_404(User, username=username)
-    requested_user_profile = UserProfile.objects.get(user=requested_user)
+    # removed accounts are hidden until they are purged
+    requested_user_profile = get_object_or_404(UserProfile, user=requested_user)
 
-    # get user albums and attach duration to each album
-    requested_user_albums = Album.objects.get_user_albums_with_duration(requested_user_profile)
+    # check if current user can edit profile
+    can_edit_profile = False
+    if current_user == requested_user:
+        can_edit_profile = True
 
-    # get user logs along with pictures, likes and comments for each log
-    requested_user_logs = Log.objects.attach_additional_info_to_logs(Log.objects.get_user_logs(requested_user_profile),
-                                                                     current_user_profile)
+    # get user albums in order to populate the Albums drop-down lists while adding or editing a log, which can only
+    # be done by the user
+    requested_user_albums = []
+    if can_edit_profile:
+        requested_user_albums = Album.objects.get_user_albums_with_duration(requested_user_profile)
 
-    # get user followers and following
-    requested_user_followers = Follower.objects.get_requested_user_followers(requested_user_profile,
-                                                                             current_user_profile)
-    requested_user_following = Follower.objects.get_requested_user_following(requested_user_profile,
-                                                                             current_user_profile)
+    # get the first page of user logs along with pictures, likes and comments for each log
+    requested_user_logs, next_logs_cursor = get_user_logs_page(requested_user_profile, None, current_user_profile)
 
     # check if requested user can be followed by current user
     # if yes, then check if requested user is being followed by current user
@@ -158,19 +194,23 @@ def show_user(request, username):
         is_followed = Follower.objects.is_requested_user_followed_by_current_user(requested_user_profile,
                                                                                   current_user_profile)
 
-    # check if current user can edit profile
-    can_edit_profile = False
-    if current_user == requested_user:
-        can_edit_profile = True
+    # get number of cities and countries both the current and requested user have been to
+    travel_overlap = None
+    if current_user != requested_user and current_user_profile is not None:
+        travel_overlap = requested_user_profile.get_travel_overlap(current_user_profile)
 
     data_dict = {
         'requested_user': requested_user,
         'requested_user_profile': requested_user_profile,
         'current_user_profile': current_user_profile,
+        'travel_overlap': travel_overlap,
         'requested_user_albums': requested_user_albums,
         'requested_user_logs': requested_user_logs,
-        'requested_user_followers': requested_user_followers,
-        'requested_user_following': requested_user_following,
+        'next_logs_cursor': next_logs_cursor,
+        'requested_user_log_count': Log.objects.get_user_logs(requested_user_profile).count(),
+        'requested_user_album_count': Album.objects.filter(user_profile=requested_user_profile).count(),
+        'requested_user_follower_count': Follower.objects.get_follower_count(requested_user_profile),
+        'requested_user_following_count': Follower.objects.get_following_count(requested_user_profile),
         'can_follow': can_follow,
         'is_followed': is_followed,
         'can_edit_profile': can_edit_profile
@@ -178,8 +218,93 @@ def show_user(request, username):
     return render(request, 'mytravelog/user_main.html', data_dict)
 
 
+def get_user_logs(request, username):
+    """
+    Renders the next page of the logs of the user with the provided
+    username, i.e. the logs posted before the one whose id is provided
+    in the 'before' GET data (see show_user). The rendered page holds
+    the cursor of the page after it, if there is one. Also note that
+    this view only accepts ajax requests, else a 404 error is raised.
+    """
+    if request.is_ajax():
+        # get current user and user profile
+        current_user = request.user
+        current_user_profile = None
+        if current_user.is_authenticated():
+            current_user_profile = UserProfile.objects.get(user=current_user)
+
+        requested_user_profile = get_object_or_404(UserProfile, user__username=username)
+        before = request.GET.get('before', '')
+        if not before.isdigit():
+            raise Http404
+        # the log of the cursor may have been deleted since the previous page was rendered
+        before_log = Log.all_objects.filter(id=int(before), user_profile=requested_user_profile).first()
+        if before_log is None:
+            raise Http404
+        requested_user_logs, next_logs_cursor = get_user_logs_page(requested_user_profile, before_log,
+                                                                   current_user_profile)
+        data_dict = {
+            'current_user_profile': current_user_profile,
+            'requested_user_logs': requested_user_logs,
+            'next_logs_cursor': next_logs_cursor
+        }
+        return render(request, 'mytravelog/log_list.html', data_dict)
+    else:
+        raise Http404
+
+
+def get_user_tab(request, username, tab):
+    """
+    Renders the albums, followers or following tab (based on the provided
+    tab) of the user page of the user with the provided username. These
+    tabs are fetched by the user page when they are first shown. Also note
+    that this view only accepts ajax requests, else a 404 error is raised.
+    """
+    if request.is_ajax():
+        # get current user and user profile
+        current_user = request.user
+        current_user_profile = None
+        if current_user.is_authenticated():
+            current_user_profile = UserProfile.objects.get(user=current_user)
+
+        requested_user_profile = get_object_or_404(UserProfile, user__username=username)
+        data_dict = {
+            'current_user_profile': current_user_profile,
+            'can_edit_profile': current_user == requested_user_profile.user
+        }
+        if tab == 'albums':
+            data_dict['requested_user_albums'] = Album.objects.get_user_albums_with_duration(requested_user_profile)
+        elif tab == 'followers':
+            data_dict['requested_user_followers'] = Follower.objects.get_requested_user_followers(
+                requested_user_profile, current_user_profile)
+        else:
+            data_dict['requested_user_following'] = Follower.objects.get_requested_user_following(
+                requested_user_profile, current_user_profile)
+        return render(request, 'mytravelog/user_' + tab + '.html', data_dict)
+    else:
+        raise Http404
+
+
 # ----------------------Helper functions------------------------
 
+def get_user_logs_page(user_profile, before_log, current_user_profile):
+    """
+    Returns a page of the logs of the user (see LogManager.get_user_logs), along with their pictures, likes
+    and comments.
+    :param user_profile: UserProfile instance of the user whose logs are requested
+    :param before_log: cursor of the page, i.e. last log of the previous page, or None for the first page
+    :param current_user_profile: UserProfile instance of the current user, or None if the user is signed out
+    :return: tuple of (list of Logs, cursor of the next page or None if this is the last page)
+    """
+    # one more log is fetched to find out if there is a next page
+    user_logs = list(Log.objects.get_user_logs(user_profile, before_log)[:USER_LOGS_PER_PAGE + 1])
+    next_cursor = None
+    if len(user_logs) > USER_LOGS_PER_PAGE:
+        user_logs = user_logs[:USER_LOGS_PER_PAGE]
+        next_cursor = user_logs[-1].id
+    return Log.objects.attach_additional_info_to_logs(user_logs, current_user_profile), next_cursor
+
+
 def validate_sign_up_form(first_name, last_name, email, username, password, profile_picture, cover_picture):
     """
     Validates the user data provided.
@@ -212,12 +337,11 @@ def validate_sign_up_form(first_name, last_name, email, username, password, prof
         return "Password must be at least 6 characters long"
     if len(User.objects.filter(username=username)) > 0:
         return "That username is not available"
-    if profile_picture is not None:
-        if profile_picture._size > 2048*1024:
-            return "Max image size allowed is 2 mb"
-    if cover_picture is not None:
-        if cover_picture._size > 2048*1024:
-            return "Max image size allowed is 2 mb"
+    for picture in [profile_picture, cover_picture]:
+        if picture is not None:
+            upload_error = get_upload_error(picture)
+            if upload_error is not None:
+                return upload_error
     return None
 
 
@@ -0,0 +1,30 @@
+import datetime
+import os
+import django
+
+__author__ = 'Manas'
+
+
+def process_pending_uploads():
+    # setup django environment
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "selp.settings")
+    from mytravelog.models.chunked_upload import ChunkedUpload
+    from mytravelog.models.pending_upload import PendingUpload
+    from mytravelog.models.trip_import import TripImport
+    django.setup()
+
+    # uploads are normally processed within seconds by the threads of the web worker that received them
+    processed_count = PendingUpload.objects.process_stale_uploads(datetime.timedelta(minutes=10))
+    # chunked uploads that were not resumed for a day are given up on by their users
+    deleted_count = ChunkedUpload.objects.delete_stale_uploads(datetime.timedelta(days=1))
+    # trip imports update their progress every few seconds while they are processed
+    import_count = TripImport.objects.process_stale_imports(datetime.timedelta(minutes=10))
+    return processed_count, deleted_count, import_count
+
+if __name__ == "__main__":
+
+    processed_count, deleted_count, import_count = process_pending_uploads()
+    print str(processed_count) + " stale uploads were processed."
+    print str(deleted_count) + " abandoned chunked uploads were deleted."
+    print str(import_count) + " stale trip imports were processed."
+    print "End of pending uploads script."
@@ -0,0 +1,22 @@
+import os
+import django
+
+__author__ = 'Manas'
+
+
+def purge_hidden_objects():
+    # setup django environment
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "selp.settings")
+    from mytravelog.utils import purge
+    django.setup()
+
+    # deleted logs, albums and accounts are only hidden by their requests, and deleted here in bounded batches
+    return purge.purge_hidden_objects()
+
+if __name__ == "__main__":
+
+    log_count, album_count, user_profile_count = purge_hidden_objects()
+    print str(log_count) + " logs, " + str(album_count) + " albums and " + str(user_profile_count) + \
+        " accounts were purged."
+    print "Run collect_media_garbage.py to delete the files of their pictures."
+    print "End of hidden object purging script."
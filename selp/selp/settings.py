@@ -10,6 +10,7 @@ https://docs.djangoproject.com/en/1.7/ref/settings/
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 import os
+from django.conf import global_settings
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 PROJECT_DIR = os.path.dirname(__file__)
 
@@ -41,6 +42,7 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'mytravelog.utils.upload_limits.UploadLimitMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -65,6 +67,22 @@ DATABASES = {
     }
 }
 
+# Cache
+# the cache is shared by all web workers and scripts, so that invalidating an entry reaches every one of them
+# (the table is created by a migration, see mytravelog/migrations/0039_create_cache_table.py)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'mytravelog_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    }
+}
+# entries are invalidated when they change, the timeouts only bound how long a missed invalidation can last
+USER_MAP_INFO_CACHE_TIMEOUT = 24 * 60 * 60
+CITY_TOP_LOGS_CACHE_TIMEOUT = 60 * 60
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.7/topics/i18n/
 
@@ -92,7 +110,47 @@ TEMPLATE_DIR = os.path.join(PROJECT_DIR, 'templates')
 TEMPLATE_DIRS = (
     TEMPLATE_DIR,
 )
+# the request is needed by the picture_url template tag, to serve WebP pictures to browsers accepting them
+TEMPLATE_CONTEXT_PROCESSORS = global_settings.TEMPLATE_CONTEXT_PROCESSORS + (
+    'django.core.context_processors.request',
+)
 
 # development static media server
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(PROJECT_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(PROJECT_DIR, 'media')
+
+# user ranking
+# weight of the follower-graph influence score (see update_user_influence.py) in the user score
+USER_INFLUENCE_WEIGHT = 0
+
+# heatmap tiles
+# rendered tiles are cached in this directory until logs drawn on them change, and the tiles used the longest time
+# ago are deleted beyond the size limit as tiles are written (or by evict_heatmap_tiles.py)
+HEATMAP_TILE_DIR = os.path.join(BASE_DIR, 'heatmap_tiles')
+HEATMAP_TILE_CACHE_SIZE = 100 * 1024 * 1024
+# number of processes rendering tiles, 0 renders tiles in the web worker itself
+HEATMAP_RENDER_PROCESSES = 2
+# number of seconds a request waits for a tile that isn't cached yet, before an empty tile is returned
+HEATMAP_RENDER_TIMEOUT = 2
+
+# picture uploads
+# uploaded pictures are staged in this directory, until they are saved as log pictures by the upload processing threads
+UPLOAD_SPOOL_DIR = os.path.join(BASE_DIR, 'upload_spool')
+# number of threads per web worker processing staged uploads, 0 processes uploads within the request itself
+UPLOAD_PROCESSING_THREADS = 2
+# number of threads per web worker writing the uploads of a request to the spool directory, 0 writes them one by one
+UPLOAD_SPOOL_THREADS = 4
+# limits enforced while uploads are received, by the upload limit handler and middleware
+FILE_UPLOAD_HANDLERS = ('mytravelog.utils.upload_limits.UploadLimitHandler',) + global_settings.FILE_UPLOAD_HANDLERS
+MAX_UPLOAD_FILE_SIZE = 2048 * 1024
+# at most 10 pictures per log, plus the rest of the form data
+MAX_UPLOAD_REQUEST_SIZE = 10 * MAX_UPLOAD_FILE_SIZE + 1024 * 1024
+# pictures with more pixels are rejected from their header, before they are ever decoded
+MAX_UPLOAD_PIXELS = 40 * 1000 * 1000
+# zip archives of photos uploaded in chunks to be imported as trips
+MAX_UPLOAD_ARCHIVE_SIZE = 500 * 1024 * 1024
+
+# trip imports
+# number of processes reading the EXIF data of imported photos and rendering their derivatives, 0 does it in the
+# import thread of the web worker itself
+TRIP_IMPORT_PROCESSES = 2
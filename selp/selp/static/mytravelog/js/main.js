@@ -10,7 +10,8 @@
  * and using it to generate a class name for the active tab. The appropriate tab is selected
  * using this class name, and active tab class is added to it. To deselect all the other tabs,
  * active tab class is removed from all the sibling tabs of the active tab. The hash is also used
- * to show the contents of the right div under the tabs.
+ * to show the contents of the right div under the tabs. The contents of the albums, followers
+ * and following tabs are only fetched from the server when these tabs are first shown.
  */
 var UserTabNavigationHandler = (function () {
 
@@ -31,6 +32,9 @@ var UserTabNavigationHandler = (function () {
         var activeContent = $('.' + hash.substr(1) + '-content');
         activeContent.show();
         activeContent.siblings('div[class$=content]').hide();
+        if (hash != '#logs' && activeContent.attr('data-url') != null) {
+            _loadTabContent(activeContent);
+        }
         if (hash == '#logs') {
             _config.addNewAlbumButton.hide();
             _config.addNewLogButton.show();
@@ -45,6 +49,20 @@ var UserTabNavigationHandler = (function () {
         }
     }
 
+    function _loadTabContent(tabContent) {
+        var url = tabContent.attr('data-url');
+        // the tab is only fetched once
+        tabContent.removeAttr('data-url');
+        $.ajax({
+            url: url,
+            type: 'GET',
+            dataType: 'html',
+            success: function (response) {
+                tabContent.html(response);
+            }
+        });
+    }
+
     function init() {
         // navigate to logs if no hash found
         if (window.location.hash == '') {
@@ -94,7 +112,8 @@ var WorldMapModal = (function () {
 
     /**
      * Uses the log info response from the server and user's first name
-     * to mark all location on the map
+     * to mark all location on the map. The log info is made up of parallel
+     * arrays, where the i-th entry of each array belongs to the same log
      * @param userLogsInfo
      * @param firstName
      * @private
@@ -114,38 +133,39 @@ var WorldMapModal = (function () {
 
         var map = new google.maps.Map(_config.mapContainer[0], options);
 
-        for (var key in userLogsInfo) {
-            if (userLogsInfo.hasOwnProperty(key)) {
-                var latlng = new google.maps.LatLng(userLogsInfo[key]['latitude'], userLogsInfo[key]['longitude']);
-
-                var infoWindow = new google.maps.InfoWindow({
-                    content: [
-                        firstName + " was in <strong>" + userLogsInfo[key]['city'] + "</strong> <br>",
-                        " on " + new Date(userLogsInfo[key]['date_and_time']).toDateString() + "<br>",
-                        " at " + new Date(userLogsInfo[key]['date_and_time']).toLocaleTimeString() + "<br>",
-                        "<a href=" + userLogsInfo[key]['url'] +">Go to log</a>"
-                    ].join('\n')
-                });
+        for (var i = 0; i < userLogsInfo['ids'].length; i++) {
+            var latlng = new google.maps.LatLng(userLogsInfo['latitudes'][i], userLogsInfo['longitudes'][i]);
+            var city = userLogsInfo['cities'][userLogsInfo['city_indices'][i]];
+            // timestamps are in seconds since epoch
+            var dateAndTime = new Date(userLogsInfo['timestamps'][i] * 1000);
+
+            var infoWindow = new google.maps.InfoWindow({
+                content: [
+                    firstName + " was in <strong>" + city + "</strong> <br>",
+                    " on " + dateAndTime.toDateString() + "<br>",
+                    " at " + dateAndTime.toLocaleTimeString() + "<br>",
+                    "<a href=/mytravelog/log/" + userLogsInfo['ids'][i] + "/>Go to log</a>"
+                ].join('\n')
+            });
 
 
-                var markerIcon = new google.maps.MarkerImage(
-                    "http://www.google.com/mapfiles/marker" + userLogsInfo[key]['city'].substring(0, 1) + ".png"
-                );
+            var markerIcon = new google.maps.MarkerImage(
+                "http://www.google.com/mapfiles/marker" + city.substring(0, 1) + ".png"
+            );
+
+            var marker = new google.maps.Marker({
+                position: latlng,
+                map: map,
+                icon: markerIcon
+            });
+            marker.setMap(map);
 
-                var marker = new google.maps.Marker({
-                    position: latlng,
-                    map: map,
-                    icon: markerIcon
+            // open infoWindow when marker is clicked
+            (function(infoWindow, marker) {
+                google.maps.event.addListener(marker, 'click', function() {
+                    infoWindow.open(map, marker);
                 });
-                marker.setMap(map);
-
-                // open infoWindow when marker is clicked
-                (function(infoWindow, marker) {
-                    google.maps.event.addListener(marker, 'click', function() {
-                        infoWindow.open(map, marker);
-                    });
-                }(infoWindow, marker))
-            }
+            }(infoWindow, marker))
         }
     }
 
@@ -179,13 +199,15 @@ var WorldMapModal = (function () {
  */
 function handleAlbums() {
     // go to album page when user clicks on an album
-    $('.album').click(function () {
+    // albums are delegated, since the albums tab on user page is fetched when it is first shown
+    $(document).on('click', '.album', function () {
         var albumId = $(this).attr('data-id');
         window.location.href = '/mytravelog/album/' + albumId + '/';
     });
 
     AddOrEditAlbumModal.init();
     DeleteAlbumModal.init();
+    AlbumPicturesHandler.init();
 }
 
 /**
@@ -208,7 +230,7 @@ var AddOrEditAlbumModal = (function() {
         inputEndDate: $('#add-or-edit-album-modal-end-date-input'),
         submitButton: $('#add-or-edit-album-modal-submit-button'),
         modal: $('#add-or-edit-album-modal'),
-        dropdownItemEdit: $('.album-dropdown-item-edit'),
+        dropdownItemEditClass: '.album-dropdown-item-edit',
         editAlbumButton: $('#edit-album-button'),
         addNewAlbumButton: $('#add-new-album-button'),
         submitUrl: '',
@@ -223,7 +245,7 @@ var AddOrEditAlbumModal = (function() {
             _showModal('Add new album', '', '', '', 'Add');
             _config.submitUrl = '/mytravelog/album/create/';
         });
-        _config.dropdownItemEdit.click(function (event) {
+        $(document).on('click', _config.dropdownItemEditClass, function (event) {
             event.stopPropagation();
 
             //get all data about the selected album
@@ -288,13 +310,13 @@ var DeleteAlbumModal = (function () {
         submitButton: $('#delete-album-modal-submit-button'),
         errorContainer: $('#delete-album-modal-error-container'),
         modal: $('#delete-album-modal'),
-        dropdownItemDelete: $('.album-dropdown-item-delete'),
+        dropdownItemDeleteClass: '.album-dropdown-item-delete',
         deleteAlbumButton: $('#delete-album-button'),
         submitUrl: ''
     };
 
     function _bindUIActions() {
-        _config.dropdownItemDelete.click(function (event) {
+        $(document).on('click', _config.dropdownItemDeleteClass, function (event) {
             event.stopPropagation();
 
             //get required data about the selected album
@@ -371,6 +393,53 @@ var DeleteAlbumModal = (function () {
     };
 }());
 
+/**
+ * Handles the show more button below the pictures on the album page. Only
+ * the first page of pictures is rendered with the page, and each click
+ * fetches the next page, which is rendered by the server and appended to
+ * the pictures. Every page holds the cursor of the page after it, and the
+ * button is hidden once the last page is shown.
+ */
+var AlbumPicturesHandler = (function () {
+
+    var _config = {
+        picturesContainer: $('.album-pictures-container'),
+        moreButton: $('.album-pictures-more-button'),
+        nextPageClass: '.album-pictures-next-page',
+        baseUrl: '/mytravelog/album/pictures/'
+    };
+
+    function init() {
+        _config.moreButton.click(function () {
+            _loadNextPage();
+        });
+    }
+
+    function _loadNextPage() {
+        var nextPage = _config.picturesContainer.find(_config.nextPageClass);
+        _config.moreButton.hide();
+        $.ajax({
+            url: _config.baseUrl + _config.moreButton.attr('data-id') + '/',
+            type: 'GET',
+            dataType: 'html',
+            data: {
+                before: nextPage.attr('data-before')
+            },
+            success: function (response) {
+                nextPage.remove();
+                _config.picturesContainer.append(response);
+                if (_config.picturesContainer.find(_config.nextPageClass).length > 0) {
+                    _config.moreButton.show();
+                }
+            }
+        });
+    }
+
+    return {
+        init: init
+    };
+}());
+
 //-----Logs-----
 
 /**
@@ -378,7 +447,8 @@ var DeleteAlbumModal = (function () {
  */
 function handleLogs() {
     // go to log page when user clicks on an dropdown item: view
-    $('.log-dropdown-item-view').click(function () {
+    // log handlers are delegated, since the next pages of logs are appended to the user page
+    $(document).on('click', '.log-dropdown-item-view', function () {
         var log = $(this).closest('.log');
         var logId = log.attr('data-id');
         window.location.href = '/mytravelog/log/' + logId + '/';
@@ -391,6 +461,8 @@ function handleLogs() {
     LikeHandler.init();
     CommentHandler.init();
     ShareLogModal.init();
+    PendingUploadsHandler.init();
+    TripImportModal.init();
 }
 
 /**
@@ -401,7 +473,8 @@ function handleLogs() {
 * If user clicks on 'Add another image' button, a new file field
 * with an incremented name (eg: if log_picture_1 already exists,
 * then log_picture_2 is added) is added. When the user clicks on
-* Add, the form is submitted to the server as a POST request.
+* Add, the pictures are uploaded in chunks, and the form is submitted
+* to the server as a POST request along with the ids of the uploads.
 * On success, the page is reloaded, else, an error message is
 * displayed.
 */
@@ -440,7 +513,7 @@ var AddLogModal = (function () {
         });
         _config.form.submit(function (event) {
             event.preventDefault();
-            submitForm($(this), _config.errorContainer, '/mytravelog/log/create/');
+            submitLogForm($(this), _config.errorContainer, '/mytravelog/log/create/', _config.submitButton);
         });
     }
 
@@ -577,8 +650,9 @@ var AddLogModal = (function () {
 var LogPicturesViewer = (function () {
 
     var _config = {
-        logPicture: $('.log-picture'),
-        albumPicture: $('.album-picture'),
+        logPictureClass: '.log-picture',
+        logPicture: null,
+        albumPicture: null,
         modal: $('#log-picture-modal'),
         modalPictureContainer: $('#log-picture-modal-picture'),
         modalPreviousButton: $('#log-picture-modal-previous-button'),
@@ -587,7 +661,8 @@ var LogPicturesViewer = (function () {
         modalIndex: $('#log-picture-modal-index'),
         currentIndex: 0,
         totalPictures: 0,
-        urls: []
+        urls: [],
+        placeholders: []
     };
 
     function init() {
@@ -595,12 +670,13 @@ var LogPicturesViewer = (function () {
     }
 
     function _bindUIActions() {
-        _config.logPicture.click(function () {
+        $(document).on('click', _config.logPictureClass, function () {
             _config.logPicture = $(this);
             _getCurrentIndexAndUrlsLog();
             _config.modal.modal();
         });
-        _config.albumPicture.click(function () {
+        // album pictures are delegated, since the next pages of pictures are appended to the album page
+        $(document).on('click', '.album-picture', function () {
             _config.albumPicture = $(this);
             _getCurrentIndexAndUrlsAlbum();
             _config.modal.modal();
@@ -625,7 +701,12 @@ var LogPicturesViewer = (function () {
     }
 
     function _showCurrentPicture() {
-        var img = '<div id="log-picture-modal-picture" style="background-image: url(\'' + _config.urls[_config.currentIndex] +'\')"/>';
+        // the placeholder of the picture is shown until the picture is loaded
+        var background = 'url(\'' + _config.urls[_config.currentIndex] + '\')';
+        if (_config.placeholders[_config.currentIndex]) {
+            background += ', url(\'' + _config.placeholders[_config.currentIndex] + '\')';
+        }
+        var img = '<div id="log-picture-modal-picture" style="background-image: ' + background + '"/>';
         _config.modalPictureContainer.html(img);
 
         //set modal index
@@ -649,10 +730,12 @@ var LogPicturesViewer = (function () {
     // called when user clicks on a picture within a log
     function _getCurrentIndexAndUrlsLog() {
         _config.urls = [];
+        _config.placeholders = [];
         var logPicturesContainer = _config.logPicture.closest('.log-pictures-container');
         var logPictures = logPicturesContainer.find('.log-picture');
         logPictures.each(function () {
             _config.urls.push($(this).attr('data-url'));
+            _config.placeholders.push($(this).attr('data-placeholder'));
         });
         _config.totalPictures = logPictures.length;
 
@@ -668,16 +751,17 @@ var LogPicturesViewer = (function () {
     // called when user clicks on a picture on the album page photos section
     function _getCurrentIndexAndUrlsAlbum() {
         _config.urls = [];
+        _config.placeholders = [];
         var albumPicturesContainer = _config.albumPicture.closest('.album-pictures-container');
         var albumPictures = albumPicturesContainer.find('.album-picture');
         albumPictures.each(function () {
-            var pictureUrl = $(this).css('background-image').replace('url(', '').replace(')', '');
-            _config.urls.push(pictureUrl);
+            _config.urls.push($(this).attr('data-url'));
+            _config.placeholders.push($(this).attr('data-placeholder'));
         });
         _config.totalPictures = albumPictures.length;
 
         //get index of selected picture
-        var currentUrl = _config.albumPicture.css('background-image').replace('url(', '').replace(')', '');
+        var currentUrl = _config.albumPicture.attr('data-url');
         for (var i=0; i<_config.totalPictures; i++) {
             if (_config.urls[i] == currentUrl) {
                 _config.currentIndex = i;
@@ -704,7 +788,7 @@ var DeleteLogModal = (function () {
         logCreatedAt: $('#delete-log-modal-created-at'),
         submitButton: $('#delete-log-modal-submit-button'),
         errorContainer: $('#delete-log-modal-error-container'),
-        dropdownItemDelete: $('.log-dropdown-item-delete'),
+        dropdownItemDeleteClass: '.log-dropdown-item-delete',
         deleteLogButton: $('#delete-log-button'),
         modal: $('#delete-log-modal'),
         submitUrl: ''
@@ -715,7 +799,7 @@ var DeleteLogModal = (function () {
     }
 
     function _bindUIActions() {
-        _config.dropdownItemDelete.add(_config.deleteLogButton).click(function () {
+        $(document).on('click', _config.dropdownItemDeleteClass + ', #delete-log-button', function () {
             // if dropdown delete item is clicked, then log would be its closest parent
             // but, if delete button is clicked (on log page), then there would be only one log in the body of the page
             var log = $(this).closest('.log');
@@ -791,7 +875,8 @@ var DeleteLogModal = (function () {
  * already exists, then log_picture_2 is added) is added. Previously
  * saved log images are also displayed. Whenever the user clicks on any of these
  * images, their id is appended to a hidden input field. When the user clicks on
- * Save, the form is submitted to the server as a POST request.
+ * Save, the new pictures are uploaded in chunks, and the form is submitted to the
+ * server as a POST request along with the ids of the uploads.
  * On success, the page is reloaded, else, an error message is displayed.
  */
 var EditLogModal = (function () {
@@ -807,7 +892,7 @@ var EditLogModal = (function () {
         submitButton: $('#edit-log-modal-submit-button'),
         moreImagesButton: $('#edit-log-modal-more-images-button'),
         modal: $('#edit-log-modal'),
-        dropdownItemEdit: $('.log-dropdown-item-edit'),
+        dropdownItemEditClass: '.log-dropdown-item-edit',
         editLogButton: $('#edit-log-button'),
         additionalImageCounter: 0,
         previousImagesContainer: $('#edit-log-modal-previous-images-container'),
@@ -820,7 +905,7 @@ var EditLogModal = (function () {
     }
 
     function _bindUIActions() {
-        _config.dropdownItemEdit.add(_config.editLogButton).click(function () {
+        $(document).on('click', _config.dropdownItemEditClass + ', #edit-log-button', function () {
             // if dropdown edit item is clicked, then log would be its closest parent
             // but, if edit button is clicked (on log page), then there would be only one log in the body of the page
             var log = $(this).closest('.log');
@@ -855,7 +940,7 @@ var EditLogModal = (function () {
         });
         _config.form.submit(function (event) {
             event.preventDefault();
-            submitForm($(this), _config.errorContainer, _config.submitUrl);
+            submitLogForm($(this), _config.errorContainer, _config.submitUrl, _config.submitButton);
         });
         _config.previousImagesContainer.on('click', '.edit-log-modal-previous-image', function () {
             // append picture id for every image clicked by user
@@ -959,7 +1044,6 @@ var EditLogModal = (function () {
 var LikeHandler = (function () {
 
     var _config = {
-        likeButton: $('.like-log-button'),
         likeButtonInActiveClass: 'like-log-button',
         likeButtonActiveClass: 'like-log-button-active',
         dataLogIdAttr: 'data-log-id',
@@ -980,7 +1064,7 @@ var LikeHandler = (function () {
     }
 
     function _bindUIActions() {
-        _config.likeButton.click(function () {
+        $(document).on('click', '.' + _config.likeButtonInActiveClass, function () {
             var logId = $(this).attr(_config.dataLogIdAttr);
             var className = $(this).attr('class');
             if (className == _config.likeButtonInActiveClass) {
@@ -1075,7 +1159,7 @@ var LikeHandler = (function () {
 var CommentHandler = (function () {
 
     var _config = {
-        inputComment: $('.comment-log-input'),
+        inputCommentClass: '.comment-log-input',
         createCommentBaseUrl: '/mytravelog/comment/create/',
         deleteCommentBaseUrl: '/mytravelog/comment/delete/',
         dataLogIdAttr: 'data-log-id',
@@ -1096,7 +1180,7 @@ var CommentHandler = (function () {
     }
 
     function _bindUIActions() {
-        _config.inputComment.keypress(function (event) {
+        $(document).on('keypress', _config.inputCommentClass, function (event) {
             //detect enter keypress
             if (event.which == 13) {
                 var logId = $(this).attr(_config.dataLogIdAttr);
@@ -1104,7 +1188,7 @@ var CommentHandler = (function () {
                 _sendPostRequest(logId, body, _config.createCommentOperation, $(this));
             }
         });
-        $(_config.commentContainerClass).on('click', _config.commentDeleteButtonClass, function () {
+        $(document).on('click', _config.commentContainerClass + ' ' + _config.commentDeleteButtonClass, function () {
             var commentId = $(this).attr(_config.dataCommentIdAttr);
             _sendPostRequest(commentId, null, _config.deleteCommentOperation, $(this));
         });
@@ -1214,7 +1298,7 @@ var ShareLogModal = (function () {
         facebookBaseUrl: 'https://www.facebook.com/sharer/sharer.php?u=',
         twitterBaseUrl: 'https://twitter.com/home?status=',
         gplusBaseUrl: 'https://plus.google.com/share?url=',
-        dropdownItemShare: $('.log-dropdown-item-share'),
+        dropdownItemShareClass: '.log-dropdown-item-share',
         logBaseUrl: window.location.host + '/mytravelog/log/',
         modal: $('#share-log-modal'),
         iconsContainer: $('#share-log-modal-icons-container'),
@@ -1227,7 +1311,7 @@ var ShareLogModal = (function () {
     }
 
     function _bindUIActions() {
-        _config.dropdownItemShare.click(function () {
+        $(document).on('click', _config.dropdownItemShareClass, function () {
             var log = $(this).closest('.log');
             var location = log.attr('data-location');
             var createdAt = log.attr('data-created-at');
@@ -1278,7 +1362,6 @@ var ShareLogModal = (function () {
 var FollowerHandler = (function () {
 
     var _config = {
-        followButton: $('.follow-button'),
         followButtonActiveClass: 'follow-button-active',
         followButtonInactiveClass: 'follow-button',
         followingUserProfileIdAttr: 'data-following-user-profile-id',
@@ -1289,7 +1372,9 @@ var FollowerHandler = (function () {
     };
 
     function _bindUIActions() {
-        _config.followButton.click(function () {
+        // follow buttons are delegated, since the followers and following tabs on user page are fetched when
+        // they are first shown
+        $(document).on('click', '.' + _config.followButtonInactiveClass, function () {
             var followingUserProfileId = $(this).attr(_config.followingUserProfileIdAttr);
             if ($(this).attr('class').indexOf(_config.followButtonActiveClass) == -1) {
                 _sendPostRequest(followingUserProfileId, _config.createFollowerOperation, $(this), _postSuccessCallback);
@@ -1353,16 +1438,426 @@ var FollowerHandler = (function () {
 
 }());
 
+/**
+ * Handles the placeholders of logs whose pictures are still being processed after
+ * being uploaded. The upload status of each such log is polled every few seconds,
+ * and the page is reloaded to show the pictures once all of them are processed. If
+ * any of the pictures could not be saved, the errors are shown in the placeholder.
+ * The placeholders of logs appended to the page later on are watched as well.
+ */
+var PendingUploadsHandler = (function () {
+
+    var _config = {
+        placeholder: $('.log-pictures-placeholder'),
+        placeholderClass: '.log-pictures-placeholder',
+        baseUrl: '/mytravelog/log/get_upload_status/',
+        pollInterval: 2000
+    };
+
+    function init() {
+        _config.placeholder.each(function () {
+            _pollUploadStatus($(this));
+        });
+    }
+
+    function watch(logs) {
+        logs.find(_config.placeholderClass).each(function () {
+            _pollUploadStatus($(this));
+        });
+    }
+
+    function _pollUploadStatus(placeholder) {
+        setTimeout(function () {
+            $.ajax({
+                url: _config.baseUrl + placeholder.attr('data-log-id') + '/',
+                type: 'GET',
+                dataType: 'json',
+                success: function (response) {
+                    if (response.error || response.redirect_to) {
+                        // only the user of the log can follow its uploads, e.g. until the session expires
+                        return;
+                    }
+                    if (response.pending_count > 0) {
+                        _pollUploadStatus(placeholder);
+                    }
+                    else if (response.errors.length > 0) {
+                        placeholder.find('.placeholder-text').text(response.errors.join('. '));
+                    }
+                    else {
+                        window.location.reload();
+                    }
+                }
+            });
+        }, _config.pollInterval);
+    }
+
+    return {
+        init: init,
+        watch: watch
+    };
+}());
+
+/**
+ * Handles a modal which allows the user to import a trip from its photos. When the user
+ * clicks on Import, the photos (or zip archives of photos) are uploaded in chunks, and the
+ * import is started with the ids of the uploads. The progress of the import is then polled
+ * every few seconds and shown in the modal, and the page is reloaded to show the new logs
+ * once it is done. If the import fails, the error is displayed instead.
+ */
+var TripImportModal = (function () {
+
+    var _config = {
+        form: $('#import-trip-modal-form'),
+        errorContainer: $('#import-trip-modal-error-container'),
+        inputAlbum: $('#import-trip-modal-album-input'),
+        inputPhotos: $('#import-trip-modal-photos-input'),
+        progressText: $('#import-trip-modal-progress-text'),
+        submitButton: $('#import-trip-modal-submit-button'),
+        modal: $('#import-trip-modal'),
+        importTripButton: $('#import-trip-button'),
+        startUrl: '/mytravelog/trip_import/start/',
+        progressBaseUrl: '/mytravelog/trip_import/progress/',
+        pollInterval: 2000
+    };
+
+    function init() {
+        _bindUIActions();
+    }
+
+    function _bindUIActions() {
+        _config.importTripButton.click(function () {
+            _showModal();
+        });
+        _config.form.submit(function (event) {
+            event.preventDefault();
+            _startImport();
+        });
+    }
+
+    function _showModal() {
+        _config.errorContainer.hide();
+        _config.errorContainer.empty();
+        _config.inputAlbum.find('option[value="None"]').attr('selected', true);
+        _config.inputPhotos.val('');
+        _config.progressText.text('');
+        _config.submitButton.prop('disabled', false);
+        _config.modal.modal();
+    }
+
+    function _showError(error) {
+        _config.progressText.text('');
+        _config.errorContainer.append('<strong>Error! </strong>' + error);
+        _config.errorContainer.show();
+        _config.submitButton.prop('disabled', false);
+    }
+
+    function _startImport() {
+        _config.errorContainer.empty();
+        _config.errorContainer.hide();
+        _config.submitButton.prop('disabled', true);
+
+        var files = $.makeArray(_config.inputPhotos[0].files);
+        ChunkedUploadHandler.uploadAll(files, function (file, offset) {
+            _config.progressText.text('Uploading ' + file.name + ' (' + Math.round(100 * offset / file.size) + '%)');
+        }).done(function (uploadIds) {
+            _config.progressText.text('Starting your import...');
+            $.ajax({
+                url: _config.startUrl,
+                type: 'POST',
+                dataType: 'json',
+                data: {
+                    album_name: _config.inputAlbum.val(),
+                    upload_ids: uploadIds.join(','),
+                    csrfmiddlewaretoken: csrf_token
+                },
+                success: function (response) {
+                    if (response['redirect_to'] != null) {
+                        window.location.href = response['redirect_to'];
+                    }
+                    else if (response['error'] != null) {
+                        _showError(response['error']);
+                    }
+                    else {
+                        _pollProgress(response['trip_import_id']);
+                    }
+                },
+                error: function () {
+                    _showError('Your import could not be started');
+                }
+            });
+        }).fail(_showError);
+    }
+
+    function _pollProgress(tripImportId) {
+        setTimeout(function () {
+            $.ajax({
+                url: _config.progressBaseUrl + tripImportId + '/',
+                type: 'GET',
+                dataType: 'json',
+                success: function (response) {
+                    if (response['error'] != null) {
+                        _showError(response['error']);
+                    }
+                    else if (response['status'] == 'done') {
+                        window.location.reload();
+                    }
+                    else {
+                        _config.progressText.text('Read ' + response['read_count'] + ' of ' + response['photo_count'] +
+                            ' photos, ' + response['saved_count'] + ' saved and ' + response['skipped_count'] +
+                            ' left out since they were not taken in a known city');
+                        _pollProgress(tripImportId);
+                    }
+                },
+                error: function () {
+                    // the import goes on in the background, so polling is only retried
+                    _pollProgress(tripImportId);
+                }
+            });
+        }, _config.pollInterval);
+    }
+
+    return {
+        init: init
+    };
+}());
+
+/**
+ * Handles the infinite scroll of the logs on user, city and album pages. Only the
+ * first page of logs is rendered with the page, and the next page is fetched from
+ * the data-url of the element around the logs whenever the user scrolls close to
+ * the bottom of the logs, as long as they are shown. Pages are rendered by the
+ * server and appended to the logs, and every page holds the cursor of the page
+ * after it.
+ */
+var LogPagesHandler = (function () {
+
+    var _config = {
+        logsContainer: $('.logs-container'),
+        nextPageClass: '.logs-next-page',
+        // distance from the bottom of the logs at which the next page is fetched
+        scrollMargin: 800
+    };
+
+    var _isLoading = false;
+
+    function init() {
+        $(window).scroll(function () {
+            _loadNextPageIfNeeded();
+        });
+    }
+
+    function _loadNextPageIfNeeded() {
+        var nextPage = _config.logsContainer.find(_config.nextPageClass);
+        // the logs are hidden while another tab is shown on user and city pages
+        if (_isLoading || nextPage.length == 0 || !_config.logsContainer.is(':visible')) {
+            return;
+        }
+        var logsBottom = _config.logsContainer.offset().top + _config.logsContainer.height();
+        if ($(window).scrollTop() + $(window).height() + _config.scrollMargin < logsBottom) {
+            return;
+        }
+
+        _isLoading = true;
+        $.ajax({
+            url: _config.logsContainer.closest('[data-url]').attr('data-url'),
+            type: 'GET',
+            dataType: 'html',
+            data: {
+                before: nextPage.attr('data-before')
+            },
+            success: function (response) {
+                nextPage.remove();
+                var logs = $($.parseHTML(response));
+                _config.logsContainer.append(logs);
+                PendingUploadsHandler.watch(logs);
+            },
+            complete: function () {
+                _isLoading = false;
+            }
+        });
+    }
+
+    return {
+        init: init
+    };
+}());
+
+/**
+ * Uploads pictures in chunks, so that a dropped connection only costs the chunk that
+ * was being sent. An upload is started with the name and size of the file, and its
+ * chunks are sent one after the other from the offset returned by the server. After
+ * a dropped connection, the upload is resumed from the offset received by the server.
+ * Once all chunks are received, the upload is finalized, and the id of the upload is
+ * sent along with the form instead of the file.
+ */
+var ChunkedUploadHandler = (function () {
+
+    var _config = {
+        startUrl: '/mytravelog/upload/start/',
+        chunkBaseUrl: '/mytravelog/upload/chunk/',
+        offsetBaseUrl: '/mytravelog/upload/offset/',
+        finalizeBaseUrl: '/mytravelog/upload/finalize/',
+        chunkSize: 256 * 1024,
+        // number of times in a row the upload is resumed after a dropped connection, and the delay before resuming
+        maxRetries: 5,
+        retryDelay: 2000
+    };
+
+    // uploads the files one after the other, the promise is resolved with the ids of the uploads
+    function uploadAll(files, onProgress) {
+        var deferred = $.Deferred();
+        var uploadIds = [];
+
+        function uploadNext() {
+            if (uploadIds.length == files.length) {
+                deferred.resolve(uploadIds);
+                return;
+            }
+            upload(files[uploadIds.length], onProgress).done(function (uploadId) {
+                uploadIds.push(uploadId);
+                uploadNext();
+            }).fail(deferred.reject);
+        }
+
+        uploadNext();
+        return deferred.promise();
+    }
+
+    // the promise is resolved with the id of the upload, or rejected with an error message
+    function upload(file, onProgress) {
+        var deferred = $.Deferred();
+        $.ajax({
+            url: _config.startUrl,
+            type: 'POST',
+            dataType: 'json',
+            data: {
+                file_name: file.name,
+                size: file.size,
+                csrfmiddlewaretoken: csrf_token
+            },
+            success: function (response) {
+                if (response['redirect_to'] != null) {
+                    window.location.href = response['redirect_to'];
+                }
+                else if (response['error'] != null) {
+                    deferred.reject(response['error']);
+                }
+                else {
+                    _sendChunk(file, response['upload_id'], response['offset'], 0, deferred, onProgress);
+                }
+            },
+            error: function () {
+                deferred.reject('Your picture ' + file.name + ' could not be uploaded');
+            }
+        });
+        return deferred.promise();
+    }
+
+    function _sendChunk(file, uploadId, offset, retryCount, deferred, onProgress) {
+        if (onProgress != null) {
+            onProgress(file, offset);
+        }
+        if (offset >= file.size) {
+            _finalize(file, uploadId, deferred);
+            return;
+        }
+        $.ajax({
+            url: _config.chunkBaseUrl + uploadId + '/?offset=' + offset,
+            type: 'POST',
+            dataType: 'json',
+            data: file.slice(offset, offset + _config.chunkSize),
+            // the chunk is sent as the raw body of the request, so the token is sent in a header
+            headers: {'X-CSRFToken': csrf_token},
+            contentType: 'application/octet-stream',
+            processData: false,
+            success: function (response) {
+                // the upload is resumed from the offset of the server, unless it can't go any further
+                if (response['offset'] == null || (response['error'] != null && response['offset'] == offset)) {
+                    deferred.reject(response['error']);
+                }
+                else {
+                    _sendChunk(file, uploadId, response['offset'], 0, deferred, onProgress);
+                }
+            },
+            error: function () {
+                if (retryCount >= _config.maxRetries) {
+                    deferred.reject('Your picture ' + file.name + ' could not be uploaded');
+                    return;
+                }
+                setTimeout(function () {
+                    _resume(file, uploadId, offset, retryCount + 1, deferred, onProgress);
+                }, _config.retryDelay);
+            }
+        });
+    }
+
+    function _resume(file, uploadId, offset, retryCount, deferred, onProgress) {
+        $.ajax({
+            url: _config.offsetBaseUrl + uploadId + '/',
+            type: 'GET',
+            dataType: 'json',
+            cache: false,
+            success: function (response) {
+                if (response['error'] != null) {
+                    deferred.reject(response['error']);
+                }
+                else {
+                    _sendChunk(file, uploadId, response['offset'], retryCount, deferred, onProgress);
+                }
+            },
+            error: function () {
+                // the connection is still down, so the chunk is sent again from the same offset
+                _sendChunk(file, uploadId, offset, retryCount, deferred, onProgress);
+            }
+        });
+    }
+
+    function _finalize(file, uploadId, deferred) {
+        $.ajax({
+            url: _config.finalizeBaseUrl + uploadId + '/',
+            type: 'POST',
+            dataType: 'json',
+            data: {
+                csrfmiddlewaretoken: csrf_token
+            },
+            success: function (response) {
+                if (response['error'] != null) {
+                    deferred.reject(response['error']);
+                }
+                else {
+                    deferred.resolve(uploadId);
+                }
+            },
+            error: function () {
+                deferred.reject('Your picture ' + file.name + ' could not be uploaded');
+            }
+        });
+    }
+
+    return {
+        upload: upload,
+        uploadAll: uploadAll
+    };
+}());
+
 //-----Helper functions go here-----
 
-function submitForm(form, errorContainer, url) {
+function submitForm(form, errorContainer, url, uploadIds) {
     //clear and hide existing errors
     errorContainer.empty();
     errorContainer.hide();
 
-    //get form data
+    //get form data, leaving out the files that were uploaded in chunks beforehand (disabled inputs are left out)
+    var fileInputs = form.find('input[type="file"]');
+    if (uploadIds != null) {
+        fileInputs.prop('disabled', true);
+    }
     var formData = new FormData(form[0]);                  //get reference of the form DOM element
+    fileInputs.prop('disabled', false);
     formData.append('csrfmiddlewaretoken', csrf_token);    //token declared in user base template
+    if (uploadIds != null) {
+        formData.append('upload_ids', uploadIds.join(','));
+    }
 
     $.ajax({
         url: url,
@@ -1372,6 +1867,7 @@ function submitForm(form, errorContainer, url) {
         success: function (response) {
             var redirect_to = response['redirect_to'];
             var error_message = response['error'];
+            var warning_message = response['warning'];
             if (redirect_to != null) {
                 window.location.href = redirect_to;
             }
@@ -1380,6 +1876,10 @@ function submitForm(form, errorContainer, url) {
                 errorContainer.show();
             }
             else {
+                //the form was submitted, so warnings are only shown before the page is reloaded
+                if (warning_message != null) {
+                    alert(warning_message);
+                }
                 window.location.reload();
             }
         },
@@ -1390,6 +1890,36 @@ function submitForm(form, errorContainer, url) {
     });
 }
 
+/**
+ * Uploads the pictures picked in the file inputs of the log form in chunks, and then
+ * submits the rest of the form along with the ids of the uploads. The submit button
+ * shows the progress of the uploads, and is disabled until they are done.
+ */
+function submitLogForm(form, errorContainer, url, submitButton) {
+    errorContainer.empty();
+    errorContainer.hide();
+
+    var files = [];
+    form.find('input[type="file"]').each(function () {
+        if (this.files.length > 0) {
+            files.push(this.files[0]);
+        }
+    });
+    var buttonText = submitButton.text();
+    submitButton.prop('disabled', true);
+    ChunkedUploadHandler.uploadAll(files, function (file, offset) {
+        submitButton.text('Uploading ' + file.name + ' (' + Math.round(100 * offset / file.size) + '%)');
+    }).done(function (uploadIds) {
+        submitForm(form, errorContainer, url, uploadIds);
+    }).fail(function (error) {
+        errorContainer.append('<strong>Error! </strong>' + error);
+        errorContainer.show();
+    }).always(function () {
+        submitButton.text(buttonText);
+        submitButton.prop('disabled', false);
+    });
+}
+
 //--------------------City page modules/functions go here------------------------
 
 /**
@@ -1562,6 +2092,93 @@ var CityWeatherForecastHandler = (function () {
     };
 }());
 
+/**
+ * Handles the list of logs near the city centre on the nearby tab of the city page.
+ * The logs are only requested once the tab is opened, and then one page at a time
+ * whenever the show more button is clicked. Logs are returned nearest first, so each
+ * page is simply appended to the list.
+ */
+var CityNearbyLogsHandler = (function () {
+
+    var _config = {
+        nearbyContent: $('.nearby-content'),
+        nearbyLogsContainer: $('.nearby-logs-container'),
+        nothingFoundContainer: $('.nearby-nothing-found-container'),
+        moreButton: $('.nearby-more-button'),
+        baseUrl: '/mytravelog/log/get_logs_near_point/'
+    };
+
+    var _nextPage = 1;
+
+    function init() {
+        if (_config.nearbyContent.length == 0) {
+            return;
+        }
+        _loadFirstPageIfNearbyTab();
+        $(window).on('hashchange', function () {
+            _loadFirstPageIfNearbyTab();
+        });
+        _config.moreButton.click(function () {
+            _loadNextPage();
+        });
+    }
+
+    function _loadFirstPageIfNearbyTab() {
+        if (window.location.hash == '#nearby' && _nextPage == 1) {
+            _loadNextPage();
+        }
+    }
+
+    function _loadNextPage() {
+        _config.moreButton.hide();
+        $.ajax({
+            url: _config.baseUrl,
+            type: 'GET',
+            dataType: 'json',
+            data: {
+                latitude: _config.nearbyContent.data('latitude'),
+                longitude: _config.nearbyContent.data('longitude'),
+                page: _nextPage
+            },
+            success: function (response) {
+                _showLogs(response.logs_info);
+                if (response.total_count == 0) {
+                    _config.nothingFoundContainer.show();
+                }
+                if (response.has_next) {
+                    _config.moreButton.show();
+                }
+                _nextPage++;
+            }
+        });
+    }
+
+    function _showLogs(logsInfo) {
+        for (var i=0; i<logsInfo.length; i++) {
+            var logInfo = logsInfo[i];
+            var pictureHtml = '';
+            if (logInfo.picture_url != null) {
+                pictureHtml = '<div class="picture" style="background-image: url(\'' + logInfo.picture_url + '\')"></div>';
+            }
+            var html = [
+                '<a href="' + logInfo.url + '">',
+                '<div class="nearby-log default-box-shadow">',
+                pictureHtml,
+                '<p class="location">' + logInfo.city + ', ' + logInfo.country + '</p>',
+                '<p class="distance">' + logInfo.distance + ' km away, by ' + $('<span>').text(logInfo.full_name).html() + '</p>',
+                '<p class="description">' + $('<span>').text(logInfo.description).html() + '</p>',
+                '</div>',
+                '</a>'
+            ].join('\n');
+            _config.nearbyLogsContainer.append(html);
+        }
+    }
+
+    return {
+        init: init
+    };
+}());
+
 //--------------------Home page modules/functions go here------------------------
 
 function scrollToPopularCities() {
@@ -1769,12 +2386,14 @@ $(document).ready(function () {
     var currentUrl = window.location.href;
     if (currentUrl.indexOf('/user/') > -1) {
         UserTabNavigationHandler.init();
+        LogPagesHandler.init();
         WorldMapModal.init();
         FollowerHandler.init();
         handleAlbums();
         handleLogs();
     }
     else if (currentUrl.indexOf('/album/') > -1) {
+        LogPagesHandler.init();
         handleLogs();
         handleAlbums();
         WorldMapModal.init();
@@ -1791,6 +2410,8 @@ $(document).ready(function () {
     else if (currentUrl.indexOf('/city/') > -1) {
         CityTabNavigationHandler.init();
         CityWeatherForecastHandler.init();
+        CityNearbyLogsHandler.init();
+        LogPagesHandler.init();
         handleLogs();
     }
     else if (currentUrl.indexOf('/mytravelog/', currentUrl.length - '/mytravelog/'.length) > -1) {
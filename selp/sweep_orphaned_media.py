@@ -0,0 +1,33 @@
+import os
+import sys
+import django
+
+__author__ = 'Manas'
+
+
+def sweep_orphaned_media(reclaim):
+    # setup django environment
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "selp.settings")
+    from mytravelog.utils.media_sweep import find_orphaned_files, reclaim_orphaned_files
+    django.setup()
+
+    # files left behind by requests that died midway, or by pictures deleted before tombstones existed, aren't
+    # recorded anywhere, so they are found by comparing the media directories against the database. Files
+    # modified within the last hour are skipped, since their pictures may still be being saved
+    orphaned_files = find_orphaned_files(60 * 60)
+    if reclaim:
+        return len(orphaned_files), reclaim_orphaned_files([name for name, size in orphaned_files])
+    for name, size in orphaned_files:
+        print name + " (" + str(size) + " bytes)"
+    return len(orphaned_files), sum(size for name, size in orphaned_files)
+
+if __name__ == "__main__":
+
+    reclaim = '--reclaim' in sys.argv[1:]
+    file_count, total_size = sweep_orphaned_media(reclaim)
+    if reclaim:
+        print str(file_count) + " orphaned media files were deleted, reclaiming " + str(total_size) + " bytes."
+    else:
+        print str(file_count) + " orphaned media files were found, taking up " + str(total_size) + " bytes."
+        print "Run this script with --reclaim to delete them."
+    print "End of orphaned media sweep script."
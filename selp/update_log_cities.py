@@ -0,0 +1,30 @@
+import os
+import django
+
+__author__ = 'Manas'
+
+
+def update_log_cities():
+    # setup django environment
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "selp.settings")
+    from mytravelog.models.city import City
+    from mytravelog.models.log import Log
+    django.setup()
+
+    # find the nearest city of every log, and only move the logs whose city has changed, keeping the logs that
+    # are not near any city in the city they were posted in
+    moved_log_count = 0
+    for log_id, latitude, longitude, city_id in Log.objects.values_list('id', 'latitude', 'longitude', 'city_id'):
+        nearest_city_id = City.objects.get_nearest_city_id(latitude, longitude)
+        if nearest_city_id is not None and nearest_city_id != city_id:
+            # saved one by one, so that city visits and country rollups follow the log
+            log = Log.objects.get(id=log_id)
+            log.city_id = nearest_city_id
+            log.save(update_fields=['city'])
+            moved_log_count += 1
+    return moved_log_count
+
+if __name__ == "__main__":
+
+    print str(update_log_cities()) + " logs were moved to their nearest city."
+    print "End of log city script."
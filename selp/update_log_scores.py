@@ -7,14 +7,17 @@ if __name__ == "__main__":
     # setup django environment
     os.environ.setdefault("DJANGO_SETTINGS_MODULE", "selp.settings")
 
+    from mytravelog.models.grid_cell_rollup import GridCellRollup
     from mytravelog.models.log import Log
 
     django.setup()
 
-    # get all logs and score them
-    all_logs = Log.objects.all()
-    for log_to_score in all_logs:
-        log_to_score.score = log_to_score.get_log_score()
-        log_to_score.save()
+    # score all logs, only writing the scores that changed
+    changed_count = Log.objects.update_scores()
 
-    print "End of log scoring script."
\ No newline at end of file
+    # scores are updated without saving the logs, and some of them may have decreased, so pick the top log of each
+    # map cluster again
+    GridCellRollup.objects.rebuild_rollups()
+
+    print str(changed_count) + " log scores updated."
+    print "End of log scoring script."
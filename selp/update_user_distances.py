@@ -0,0 +1,19 @@
+import os
+import django
+
+__author__ = 'Manas'
+
+
+def update_user_distances():
+    # setup django environment
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "selp.settings")
+    from mytravelog.models.user_profile import UserProfile
+    django.setup()
+
+    # distances are extended whenever a log is posted, so this only repairs any drift, e.g. after logs were imported
+    UserProfile.objects.update_distance_travelled()
+
+if __name__ == "__main__":
+
+    update_user_distances()
+    print "End of user distance script."
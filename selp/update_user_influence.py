@@ -0,0 +1,43 @@
+from itertools import chain
+import os
+import django
+import numpy as np
+
+__author__ = 'Manas'
+
+
+def update_user_influence():
+    # setup django environment
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "selp.settings")
+    from django.db import transaction
+    from mytravelog.models.follower import Follower
+    from mytravelog.models.user_profile import UserProfile
+    from mytravelog.utils.influence import compute_pagerank
+    django.setup()
+
+    # get all user profile ids along with their previous influence, which is used to warm-start the computation
+    profiles = np.array(list(UserProfile.objects.order_by('id').values_list('id', 'influence')), dtype=np.float64)
+    if len(profiles) == 0:
+        return
+    profile_ids = profiles[:, 0].astype(np.int64)
+    previous_influence = profiles[:, 1]
+
+    # map each follower edge onto positions in profile_ids
+    edges = np.fromiter(chain.from_iterable(Follower.objects.get_follower_edges()), dtype=np.int64)
+    edges = edges.reshape(-1, 2)
+    sources = np.searchsorted(profile_ids, edges[:, 0])
+    targets = np.searchsorted(profile_ids, edges[:, 1])
+
+    # influence is stored relative to an average user, i.e. an average user has an influence of 1
+    ranks = compute_pagerank(sources, targets, len(profile_ids), initial_ranks=previous_influence)
+    influence = ranks * len(profile_ids)
+
+    # only touch the influence column so that counters updated in the meantime are not overwritten
+    with transaction.atomic():
+        for profile_id, value in zip(profile_ids.tolist(), influence.tolist()):
+            UserProfile.objects.filter(id=profile_id).update(influence=round(value, 7))
+
+if __name__ == "__main__":
+
+    update_user_influence()
+    print "End of user influence script."
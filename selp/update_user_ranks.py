@@ -20,7 +20,8 @@ def update_user_ranks():
     all_user_profiles = sorted(all_user_profiles, key=lambda x: x.score, reverse=True)
     for user_profile in all_user_profiles:
         user_profile.rank = rank
-        user_profile.save()
+        # only save the rank, since travel stats may have been updated while scoring
+        user_profile.save(update_fields=['rank'])
         rank += 1
 
 if __name__ == "__main__":